@@ -1,5 +1,5 @@
 from typing import Any, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
 from sqlalchemy.orm import Session, joinedload
 
 from app.db.session import get_db
@@ -8,9 +8,16 @@ from app.models.bom_header import BOMHeader
 from app.schemas.bom_schema import (
     BOMHeaderCreate,
     BOMHeaderUpdate,
-    BOMHeaderResponse
+    BOMHeaderResponse,
+    BOMBulkRecalculate,
+    BOMBulkRecalculateResult,
+    BOMSimulationRequest,
+    BOMSimulationResult,
+    BOMImportResult
 )
 from app.services.bom_service import BOMService
+from app.services.bom_simulation_service import simulate_bom
+from app.services.import_bom_excel import import_boms, resolve_year
 
 router = APIRouter()
 
@@ -59,6 +66,55 @@ def create_bom(
         # Bắt các lỗi không mong muốn khác
         raise HTTPException(status_code=400, detail=str(e))
 
+# -------------------------------------------------------------------
+# 2b. TÍNH LẠI HÀNG LOẠT (Đổi hao hụt / co rút cho nhiều BOM)
+# -------------------------------------------------------------------
+@router.post("/bulk-recalculate", response_model=BOMBulkRecalculateResult)
+def bulk_recalculate_boms(
+    bulk_in: BOMBulkRecalculate,
+    db: Session = Depends(get_db)
+) -> Any:
+    """
+    Áp dụng thông số header mới (VD: tỷ lệ hao hụt / co rút năm mới) cho mọi BOM theo bộ lọc sản phẩm
+    và tính lại định mức của toàn bộ chi tiết trong 1 transaction.
+    """
+    return BOMService.bulk_recalculate(db=db, bulk_in=bulk_in)
+
+# -------------------------------------------------------------------
+# 2c. MÔ PHỎNG ĐỊNH MỨC (Không lưu DB)
+# -------------------------------------------------------------------
+@router.post("/simulate", response_model=BOMSimulationResult)
+def simulate_bom_endpoint(
+    sim_in: BOMSimulationRequest,
+    db: Session = Depends(get_db)
+) -> Any:
+    """
+    Tính thử định mức trên header + details gửi lên, hoặc trên BOM có sẵn (bom_id) kèm các thay đổi.
+    Không ghi gì vào DB; trả về chi tiết đã tính và chênh lệch so với BOM gốc.
+    """
+    return simulate_bom(db=db, sim_in=sim_in)
+
+# -------------------------------------------------------------------
+# 2d. IMPORT BOM TỪ FILE EXCEL (Mỗi sheet = 1 sản phẩm)
+# -------------------------------------------------------------------
+@router.post("/import", response_model=BOMImportResult)
+def import_boms_from_excel(
+    file: UploadFile = File(...),
+    applicable_year: Optional[int] = Query(None, description="Năm áp dụng (để trống = lấy năm trong tên file)"),
+    dry_run: bool = Query(False, description="True: chỉ kiểm tra file, trả về báo cáo theo từng sheet, không ghi"),
+    db: Session = Depends(get_db)
+) -> Any:
+    """
+    Import BOM Yarn từ file Excel (.xlsx / .xlsm), tên sheet = mã sản phẩm.
+    Đọc K3 (trọng lượng mục tiêu), F18 / F19 (hao hụt / co rút) và dòng sợi 5-17 (cột A, B, D, E, F, H).
+    - Sản phẩm chưa có được tạo mới; (sản phẩm, năm) đã có BOM thì cập nhật và thay toàn bộ chi tiết.
+    - File lỗi bất kỳ sheet nào -> không ghi sheet nào (400, kèm báo cáo sheet lỗi).
+    """
+    if not (file.filename or "").lower().endswith((".xlsx", ".xlsm")):
+        raise HTTPException(status_code=400, detail="Chỉ hỗ trợ file .xlsx hoặc .xlsm")
+    year = resolve_year(file.filename, applicable_year)
+    return import_boms(db, file.file.read(), year, dry_run=dry_run)
+
 # -------------------------------------------------------------------
 # 3. LẤY CHI TIẾT 1 BOM (Theo ID)
 # -------------------------------------------------------------------
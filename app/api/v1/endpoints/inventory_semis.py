@@ -26,7 +26,7 @@ def read_inventory(
     Get list of items currently IN STOCK.
     (These are items that have been imported but not yet exported).
     """
-    return inventory_semi_service.get_inventory(db, skip, limit)
+    return inventory_semi_service.get_inventory(db, skip, limit, load_schema=ImportDetailResponse)
 
 
 # =================================================================
@@ -42,7 +42,7 @@ def read_import_tickets(
     """
     List all Import Tickets (History of goods coming in).
     """
-    return inventory_semi_service.get_import_tickets(db, skip, limit)
+    return inventory_semi_service.get_import_tickets(db, skip, limit, load_schema=ImportTicketResponse)
 
 
 @router.get("/imports/{ticket_id}", response_model=ImportTicketResponse, tags=["Semi-Finished Imports"])
@@ -53,7 +53,7 @@ def read_import_ticket(
     """
     Get details of a specific Import Ticket.
     """
-    ticket = inventory_semi_service.get_import_ticket_by_id(db, ticket_id)
+    ticket = inventory_semi_service.get_import_ticket_by_id(db, ticket_id, load_schema=ImportTicketResponse)
     if not ticket:
         raise HTTPException(status_code=404, detail="Import ticket not found")
     return ticket
@@ -85,7 +85,7 @@ def read_export_tickets(
     """
     List all Export Tickets (History of goods going out).
     """
-    return inventory_semi_service.get_export_tickets(db, skip, limit)
+    return inventory_semi_service.get_export_tickets(db, skip, limit, load_schema=ExportTicketResponse)
 
 
 @router.get("/exports/{ticket_id}", response_model=ExportTicketResponse, tags=["Semi-Finished Exports"])
@@ -96,7 +96,7 @@ def read_export_ticket(
     """
     Get details of a specific Export Ticket.
     """
-    ticket = inventory_semi_service.get_export_ticket_by_id(db, ticket_id)
+    ticket = inventory_semi_service.get_export_ticket_by_id(db, ticket_id, load_schema=ExportTicketResponse)
     if not ticket:
         raise HTTPException(status_code=404, detail="Export ticket not found")
     return ticket
@@ -1,13 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Query
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Response
 from sqlalchemy.orm import Session
 from typing import Dict, Any, List, Optional
+from datetime import date, datetime
 
 from app.api import deps
+from app.db.pagination import set_next_cursor
+from app.db.export import ExportFormat
 from app.schemas.inventory_schema import (
     InventoryStockResponse, 
-    InventoryAdjustment
+    InventoryStockListResponse,
+    InventoryAdjustment,
+    InventoryTransactionResponse,
+    InventoryBalanceResponse,
+    InventorySnapshotResponse,
+    AllocationRequest,
+    AllocationResponse,
+    ReservationCreate,
+    ReservationResponse,
+    MaterialTotalsRequest,
+    MaterialStockTotal,
+    LowStockItem,
+    StockAgingReport,
+    ValuationReport
 )
+from app.models.inventory_reservation import ReservationStatus
 from app.services.inventory_service import InventoryService
+from app.services.inventory_allocation_service import InventoryAllocationService
+from app.services.inventory_reservation_service import InventoryReservationService
+from app.services.inventory_summary_service import InventorySummaryService
+from app.services.inventory_aging_service import InventoryAgingService
+from app.services.inventory_valuation_service import InventoryValuationService
 
 router = APIRouter()
 
@@ -16,20 +38,57 @@ router = APIRouter()
 def read_inventories(
     skip: int = 0,
     limit: int = 100,
-    search: Optional[str] = Query(None, description="Tìm theo Material Code/Name hoặc Batch No"),
+    search: Optional[str] = Query(None, description="Tìm theo Material Code hoặc Batch No"),
     warehouse_id: Optional[int] = Query(None, description="Lọc theo ID kho"),
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (lấy từ header X-Next-Cursor)"),
+    export_format: Optional[ExportFormat] = Query(None, alias="format", description="xlsx | csv: tải toàn bộ kết quả lọc ra file"),
+    response: Response = None,
     db: Session = Depends(deps.get_db)
 ):
     """
-    Lấy danh sách tồn kho chi tiết (hỗ trợ phân trang, tìm kiếm, lọc).
+    Lấy danh sách tồn kho (hỗ trợ phân trang, tìm kiếm, lọc), kèm object batch / warehouse / material.
+    Truyền `format=xlsx|csv` để tải toàn bộ kết quả (bỏ qua skip/limit/cursor).
+    Màn hình chỉ cần cột phẳng nên dùng GET /inventorys/flat (nhẹ hơn).
     """
     service = InventoryService(db)
-    return service.get_multi(
+    if export_format:
+        return service.export_list(export_format, search=search, warehouse_id=warehouse_id)
+    items = service.get_multi(
         skip=skip, 
         limit=limit, 
         search=search, 
-        warehouse_id=warehouse_id
+        warehouse_id=warehouse_id,
+        cursor=cursor,
+        load_schema=InventoryStockResponse
     )
+    set_next_cursor(response, items)
+    return items
+
+# --- 0b. GET ALL INVENTORY (DẠNG PHẲNG TỪ VIEW) ---
+@router.get("/flat", response_model=List[InventoryStockListResponse])
+def read_inventories_flat(
+    skip: int = 0,
+    limit: int = 100,
+    search: Optional[str] = Query(None, description="Tìm theo Material Code hoặc Batch No"),
+    warehouse_id: Optional[int] = Query(None, description="Lọc theo ID kho"),
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (lấy từ header X-Next-Cursor)"),
+    response: Response = None,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Danh sách tồn kho dạng phẳng (đọc từ view v_inventory_stock_list, 1 query mỗi trang).
+    Mỗi dòng đã có mã vật tư, tên kho, mã lô, số cuộn, pallet, NCC.
+    """
+    service = InventoryService(db)
+    items = service.get_list(
+        skip=skip, 
+        limit=limit, 
+        search=search, 
+        warehouse_id=warehouse_id,
+        cursor=cursor
+    )
+    set_next_cursor(response, items)
+    return items
 
 # --- 1. GET STOCK BY BATCH ---
 @router.get("/stock/{warehouse_id}/{batch_id}", response_model=InventoryStockResponse)
@@ -60,6 +119,85 @@ def read_total_stock_by_material(
     service = InventoryService(db)
     return service.get_total_stock_by_material(material_id)
 
+# --- 2b. TỔNG TỒN NHIỀU VẬT TƯ (1 LẦN GỌI) ---
+@router.post("/totals", response_model=List[MaterialStockTotal])
+def read_total_stock_by_materials(
+    request: MaterialTotalsRequest,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Tổng tồn (On Hand / Reserved / Available) của nhiều vật tư, đọc từ bảng tổng hợp.
+    Kết quả theo đúng thứ tự material_ids, vật tư chưa có tồn trả về 0.
+    """
+    service = InventorySummaryService(db)
+    return service.get_totals(request.material_ids, by_warehouse=request.by_warehouse)
+
+# --- 2c. CẢNH BÁO TỒN DƯỚI ĐỊNH MỨC ---
+@router.get("/below-minimum", response_model=List[LowStockItem])
+def read_below_minimum(
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Vật tư có tồn khả dụng thấp hơn định mức tối thiểu (min_stock_level), thiếu nhiều nhất xếp trước.
+    """
+    service = InventorySummaryService(db)
+    return service.get_below_minimum(skip=skip, limit=limit)
+
+# --- 2d. TUỔI TỒN / HÀNG CHẬM LUÂN CHUYỂN ---
+@router.get("/aging", response_model=StockAgingReport)
+def read_stock_aging(
+    as_of: Optional[date] = Query(None, description="Ngày tính tuổi tồn (mặc định hôm nay)"),
+    material_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    flagged_only: bool = Query(False, description="Chỉ lấy dòng tồn chết / chậm luân chuyển"),
+    window_days: int = Query(90, gt=0, description="Số ngày tính lượng xuất (vòng quay)"),
+    dead_stock_days: int = Query(180, gt=0, description="Quá số ngày này không xuất = tồn chết"),
+    slow_moving_cover_days: int = Query(120, gt=0, description="Tồn đủ dùng quá số ngày này = chậm luân chuyển"),
+    refresh: bool = Query(False, description="Bỏ qua cache trong ngày, tính lại"),
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Tuổi tồn theo nhóm 0-30 / 31-90 / 91-180 / >180 ngày, vòng quay và cờ tồn chết theo Vật tư - Kho.
+    Kết quả được cache theo ngày.
+    """
+    service = InventoryAgingService(db)
+    return service.get_aging_report(
+        as_of=as_of,
+        material_id=material_id,
+        warehouse_id=warehouse_id,
+        flagged_only=flagged_only,
+        window_days=window_days,
+        dead_stock_days=dead_stock_days,
+        slow_moving_cover_days=slow_moving_cover_days,
+        refresh=refresh
+    )
+
+# --- 2e. ĐỊNH GIÁ TỒN KHO ---
+@router.get("/valuation", response_model=ValuationReport)
+def read_inventory_valuation(
+    material_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Giá trị tồn kho theo Vật tư - Kho: theo giá từng lô nhập (FIFO) và theo giá bình quân di động.
+    """
+    service = InventoryValuationService(db)
+    return service.get_report(material_id=material_id, warehouse_id=warehouse_id)
+
+@router.post("/valuation/revalue", response_model=Dict[str, int])
+def revalue_purchase_order(
+    po_id: int = Query(..., description="PO vừa được sửa giá / tỷ giá"),
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Định giá lại các lô nhập theo PO và chạy lại giá bình quân các vật tư liên quan từ sổ cái.
+    """
+    service = InventoryValuationService(db)
+    return service.revalue_purchase_order(po_id)
+
 # --- 3. ADJUST STOCK (STOCK TAKE) ---
 @router.post("/adjust", response_model=InventoryStockResponse)
 def adjust_stock(
@@ -75,4 +213,140 @@ def adjust_stock(
     except HTTPException as e:
         raise e
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- 4. LỊCH SỬ BIẾN ĐỘNG (SỔ CÁI) ---
+@router.get("/transactions", response_model=List[InventoryTransactionResponse])
+def read_inventory_transactions(
+    skip: int = 0,
+    limit: int = 100,
+    material_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    batch_id: Optional[int] = None,
+    from_date: Optional[datetime] = None,
+    to_date: Optional[datetime] = None,
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (lấy từ header X-Next-Cursor)"),
+    response: Response = None,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Lịch sử nhập / xuất / điều chỉnh tồn kho (append-only journal).
+    """
+    service = InventoryService(db)
+    items = service.get_transactions(
+        skip=skip,
+        limit=limit,
+        material_id=material_id,
+        warehouse_id=warehouse_id,
+        batch_id=batch_id,
+        from_date=from_date,
+        to_date=to_date,
+        cursor=cursor
+    )
+    set_next_cursor(response, items)
+    return items
+
+# --- 5. TỒN KHO TẠI THỜI ĐIỂM ---
+@router.get("/balance-as-of", response_model=List[InventoryBalanceResponse])
+def read_balance_as_of(
+    as_of: datetime = Query(..., description="Thời điểm cần xem tồn (VD: 2026-01-31T23:59:59)"),
+    material_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Tồn kho theo lô tại một thời điểm trong quá khứ (dựa trên Snapshot gần nhất + Sổ cái).
+    """
+    service = InventoryService(db)
+    return service.get_balance_as_of(as_of=as_of, material_id=material_id, warehouse_id=warehouse_id)
+
+# --- 6. CHỐT SNAPSHOT ---
+@router.post("/snapshots", response_model=InventorySnapshotResponse)
+def create_inventory_snapshot(db: Session = Depends(deps.get_db)):
+    """
+    Chốt số dư tồn kho hiện tại (chạy định kỳ để truy vấn tồn quá khứ luôn nhanh).
+    """
+    service = InventoryService(db)
+    return service.create_snapshot()
+
+# --- 7. DỰNG LẠI BẢNG TỒN TỪ SỔ CÁI ---
+@router.post("/rebuild", response_model=Dict[str, int])
+def rebuild_inventory_stocks(db: Session = Depends(deps.get_db)):
+    """
+    Tính lại quantity_on_hand của toàn bộ inventory_stocks từ sổ cái (dùng khi nghi ngờ lệch số).
+    """
+    service = InventoryService(db)
+    return service.rebuild_stock_projection()
+
+# --- 8. PHÂN BỔ TỒN KHO (FEFO) ---
+@router.post("/allocate", response_model=AllocationResponse)
+def allocate_stock(
+    request: AllocationRequest,
+    dry_run: bool = Query(False, description="True: chỉ lập kế hoạch, không giữ chỗ"),
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Phân bổ tồn kho cho nhiều dòng nhu cầu cùng lúc (VD: kế hoạch lên sợi cả ngày).
+    Chỉ lấy lô QC Pass còn hạn, hết hạn trước lấy trước, có thể ưu tiên kho.
+    """
+    service = InventoryAllocationService(db)
+    return service.allocate(request, reserve=not dry_run)
+
+# --- 9. PHIẾU GIỮ CHỖ CÓ HẠN ---
+@router.post("/reservations", response_model=ReservationResponse)
+def create_reservation(
+    reservation_in: ReservationCreate,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Giữ chỗ tồn kho (phân bổ FEFO như /allocate) kèm người giữ và hạn giữ.
+    Quá expires_at mà chưa xuất thì sweeper tự trả lại tồn khả dụng.
+    Xuất kho theo phiếu: truyền reservation_id khi tạo phiếu xuất.
+    """
+    service = InventoryReservationService(db)
+    return service.create(reservation_in)
+
+@router.get("/reservations", response_model=List[ReservationResponse])
+def read_reservations(
+    skip: int = 0,
+    limit: int = 100,
+    owner: Optional[str] = None,
+    status: Optional[ReservationStatus] = None,
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (lấy từ header X-Next-Cursor)"),
+    response: Response = None,
+    db: Session = Depends(deps.get_db)
+):
+    service = InventoryReservationService(db)
+    items = service.get_multi(skip=skip, limit=limit, owner=owner, status=status, cursor=cursor)
+    set_next_cursor(response, items)
+    return items
+
+@router.post("/reservations/sweep", response_model=Dict[str, int])
+def sweep_expired_reservations(db: Session = Depends(deps.get_db)):
+    """
+    Trả lại ngay các phiếu giữ chỗ đã hết hạn (bình thường sweeper nền tự chạy định kỳ).
+    """
+    service = InventoryReservationService(db)
+    return {"expired": service.release_expired()}
+
+@router.get("/reservations/{reservation_id}", response_model=ReservationResponse)
+def read_reservation(
+    reservation_id: int,
+    db: Session = Depends(deps.get_db)
+):
+    service = InventoryReservationService(db)
+    item = service.get(reservation_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Reservation not found.")
+    return item
+
+@router.post("/reservations/{reservation_id}/release", response_model=ReservationResponse)
+def release_reservation(
+    reservation_id: int,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Hủy giữ chỗ: trả lại tồn khả dụng ngay.
+    """
+    service = InventoryReservationService(db)
+    return service.release(reservation_id)
\ No newline at end of file
@@ -6,12 +6,14 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.schemas.machine_log_schema import MachineLogResponse
 from app.api import deps
+from app.models.machine import MachineArea
 from app.schemas.machine_schema import (
     MachineResponse,
     MachineCreate,
     MachineUpdate,
+    MachineFloorMap,
 )
-from app.services import machine_service
+from app.services import machine_service, machine_line_occupancy_service
 
 router = APIRouter()
 
@@ -31,6 +33,20 @@ def read_machines(
     return machine_service.get_machines(db, skip=skip, limit=limit)
 
 
+# =========================
+# SƠ ĐỒ XƯỞNG (LINE ĐANG CHẠY)
+# =========================
+@router.get("/floor-map", response_model=List[MachineFloorMap])
+def read_floor_map(
+    area: Optional[MachineArea] = None,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Trạng thái từng line (1..total_lines) của mọi máy: phiếu rổ / rổ / lô / sản phẩm đang chạy.
+    """
+    return machine_line_occupancy_service.get_floor_map(db, area=area)
+
+
 # =========================
 # CREATE
 # =========================
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict
 from datetime import date
 
 from app.api import deps
+from app.db.pagination import set_next_cursor
+from app.db.export import ExportFormat
 from app.schemas.material_export_schema import (
     MaterialExportCreate, 
     MaterialExportUpdate, 
@@ -34,6 +36,9 @@ def read_exports(
     receiver_id: Optional[int] = None,
     from_date: Optional[date] = None,
     to_date: Optional[date] = None,
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (lấy từ header X-Next-Cursor)"),
+    export_format: Optional[ExportFormat] = Query(None, alias="format", description="xlsx | csv: tải toàn bộ kết quả lọc ra file"),
+    response: Response = None,
     db: Session = Depends(deps.get_db)
 ):
     service = MaterialExportService(db)
@@ -45,7 +50,13 @@ def read_exports(
         from_date=from_date,
         to_date=to_date
     )
-    return service.get_multi(skip=skip, limit=limit, filter_param=filters)
+    if export_format:
+        return service.export(export_format, filters)
+    items = service.get_multi(
+        skip=skip, limit=limit, filter_param=filters, cursor=cursor, load_schema=MaterialExportResponse
+    )
+    set_next_cursor(response, items)
+    return items
 
 @router.post("/", response_model=MaterialExportResponse)
 def create_export(export_in: MaterialExportCreate, db: Session = Depends(deps.get_db)):
@@ -55,7 +66,7 @@ def create_export(export_in: MaterialExportCreate, db: Session = Depends(deps.ge
 @router.get("/{id}", response_model=MaterialExportResponse)
 def read_export_detail(id: int, db: Session = Depends(deps.get_db)):
     service = MaterialExportService(db)
-    item = service.get(id)
+    item = service.get(id, load_schema=MaterialExportResponse)
     if not item:
         raise HTTPException(status_code=404, detail="Not found")
     return item
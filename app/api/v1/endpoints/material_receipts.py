@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, UploadFile, File
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict
 from datetime import date
 
 from app.api import deps
+from app.db.pagination import set_next_cursor
+from app.db.export import ExportFormat
 from app.schemas.material_receipt_schema import (
     MaterialReceiptCreate, 
     MaterialReceiptUpdate, 
@@ -11,7 +13,8 @@ from app.schemas.material_receipt_schema import (
     MaterialReceiptDetailCreate,
     MaterialReceiptDetailUpdate,
     MaterialReceiptDetailResponse,
-    MaterialReceiptFilter
+    MaterialReceiptFilter,
+    PackingListImportResult
 )
 from app.services.material_receipt_service import MaterialReceiptService
 
@@ -37,6 +40,9 @@ def read_receipts(
     declaration_id: Optional[int] = Query(None),
     from_date: Optional[date] = None,
     to_date: Optional[date] = None,
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (lấy từ header X-Next-Cursor)"),
+    export_format: Optional[ExportFormat] = Query(None, alias="format", description="xlsx | csv: tải toàn bộ kết quả lọc ra file"),
+    response: Response = None,
     db: Session = Depends(deps.get_db)
 ):
     service = MaterialReceiptService(db)
@@ -47,7 +53,13 @@ def read_receipts(
         from_date=from_date,
         to_date=to_date
     )
-    return service.get_multi(skip=skip, limit=limit, filter_param=filter_params)
+    if export_format:
+        return service.export(export_format, filter_params)
+    items = service.get_multi(
+        skip=skip, limit=limit, filter_param=filter_params, cursor=cursor, load_schema=MaterialReceiptResponse
+    )
+    set_next_cursor(response, items)
+    return items
 
 @router.post("/", response_model=MaterialReceiptResponse)
 def create_receipt(
@@ -63,7 +75,7 @@ def read_receipt(
     db: Session = Depends(deps.get_db)
 ):
     service = MaterialReceiptService(db)
-    item = service.get(receipt_id)
+    item = service.get(receipt_id, load_schema=MaterialReceiptResponse)
     if not item:
         raise HTTPException(status_code=404, detail="Phiếu nhập không tồn tại.")
     return item
@@ -96,6 +108,23 @@ def add_receipt_detail(
     service = MaterialReceiptService(db)
     return service.add_detail(receipt_id=receipt_id, detail_in=detail_in)
 
+@router.post("/{receipt_id}/packing-list", response_model=PackingListImportResult)
+def import_packing_list(
+    receipt_id: int,
+    file: UploadFile = File(...),
+    dry_run: bool = Query(False, description="True: chỉ kiểm tra file, trả về lỗi theo từng dòng, không ghi"),
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Nhập packing list của NCC (.xlsx / .csv, mỗi dòng 1 lô) vào phiếu nhập.
+    Cột bắt buộc: material_code (hoặc material_id), received_quantity_kg.
+    Cột tùy chọn: supplier_batch_no, po_quantity_kg, po_quantity_cones, received_quantity_cones,
+    number_of_pallets, origin_country, location, manufacture_date, expiry_date, note.
+    File lỗi bất kỳ dòng nào -> không ghi dòng nào (400, kèm danh sách lỗi).
+    """
+    service = MaterialReceiptService(db)
+    return service.import_packing_list(receipt_id, file.filename, file.file.read(), dry_run=dry_run)
+
 @router.put("/details/{detail_id}", response_model=MaterialReceiptDetailResponse)
 def update_receipt_detail(
     detail_id: int, 
@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+
+from app.api import deps
+from app.db.pagination import set_next_cursor
+from app.models.purchase_order_match import MatchStatus
+from app.schemas.purchase_order_match_schema import PurchaseOrderMatchResponse, PurchaseOrderMatchSummary
+from app.services.purchase_order_match_service import PurchaseOrderMatchService
+
+router = APIRouter()
+
+# --- 1. DANH SÁCH SAI LỆCH ---
+@router.get("/", response_model=List[PurchaseOrderMatchResponse])
+def read_purchase_order_matches(
+    skip: int = 0,
+    limit: int = 100,
+    status: Optional[MatchStatus] = None,
+    mismatch_only: bool = Query(True, description="Chỉ lấy dòng sai lệch (bỏ qua khi lọc theo status)"),
+    po_id: Optional[int] = None,
+    vendor_id: Optional[int] = None,
+    material_id: Optional[int] = None,
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (lấy từ header X-Next-Cursor)"),
+    response: Response = None,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Đối chiếu 3 bên PO - Tờ khai - Phiếu nhập theo (PO, vật tư).
+    Mặc định chỉ trả về dòng sai lệch (khai vượt PO, nhận vượt khai, vật tư ngoài PO).
+    """
+    service = PurchaseOrderMatchService(db)
+    items = service.get_multi(
+        skip=skip,
+        limit=limit,
+        status=status,
+        mismatch_only=mismatch_only,
+        po_id=po_id,
+        vendor_id=vendor_id,
+        material_id=material_id,
+        cursor=cursor
+    )
+    set_next_cursor(response, items)
+    return items
+
+# --- 2. TỔNG HỢP THEO TRẠNG THÁI ---
+@router.get("/summary", response_model=PurchaseOrderMatchSummary)
+def read_purchase_order_match_summary(
+    vendor_id: Optional[int] = None,
+    db: Session = Depends(deps.get_db)
+):
+    service = PurchaseOrderMatchService(db)
+    return service.get_summary(vendor_id=vendor_id)
+
+# --- 3. TÍNH LẠI TOÀN BỘ ---
+@router.post("/rebuild", response_model=Dict[str, int])
+def rebuild_purchase_order_matches(db: Session = Depends(deps.get_db)):
+    """
+    Tính lại toàn bộ bảng đối chiếu (job đối soát hằng đêm đã chạy, endpoint này để chạy tay
+    khi mới triển khai hoặc sau khi chỉnh dữ liệu trực tiếp trong DB).
+    """
+    return PurchaseOrderMatchService(db).rebuild()
\ No newline at end of file
@@ -1,17 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict
 from datetime import date
 
 from app.api import deps
+from app.db.pagination import set_next_cursor
 from app.models.purchase_order import POStatus
 from app.schemas.purchase_order_schema import (
     POHeaderCreate, 
     POHeaderUpdate, 
     POHeaderResponse, 
-    PODetailCreate
+    PODetailCreate,
+    PODetailUpdate
 )
 from app.services.purchase_order_service import PurchaseOrderService
+from app.services.purchase_order_receiving_service import PurchaseOrderReceivingService
 
 router = APIRouter()
 
@@ -34,18 +37,23 @@ def read_purchase_orders(
     status: Optional[POStatus] = None,
     from_date: Optional[date] = None,
     to_date: Optional[date] = None,
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (lấy từ header X-Next-Cursor)"),
+    response: Response = None,
     db: Session = Depends(deps.get_db)
 ):
     service = PurchaseOrderService(db)
-    return service.get_multi(
+    items = service.get_multi(
         skip=skip, 
         limit=limit, 
         search=search, 
         vendor_id=vendor_id, 
         status=status,
         from_date=from_date,
-        to_date=to_date
+        to_date=to_date,
+        cursor=cursor
     )
+    set_next_cursor(response, items)
+    return items
 
 @router.post("/", response_model=POHeaderResponse)
 def create_purchase_order(
@@ -92,6 +100,27 @@ def add_purchase_order_item(
         
     return service.add_item(po_id=po_id, item_in=item_in)
 
+@router.put("/{po_id}/items/{detail_id}", response_model=POHeaderResponse)
+def update_purchase_order_item(
+    po_id: int,
+    detail_id: int,
+    item_in: PODetailUpdate,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Sửa dòng PO (số lượng / đơn giá). Các lô đã nhập theo PO được định giá lại.
+    """
+    service = PurchaseOrderService(db)
+    return service.update_item(po_id=po_id, detail_id=detail_id, item_in=item_in)
+
+@router.post("/reconcile", response_model=Dict[str, int])
+def reconcile_purchase_orders(db: Session = Depends(deps.get_db)):
+    """
+    Đối soát SL đã nhận + trạng thái của toàn bộ PO chưa hủy theo phiếu nhập
+    (job nền chạy hằng đêm, endpoint này để chạy tay khi cần).
+    """
+    return PurchaseOrderReceivingService(db).reconcile()
+
 @router.get("/by-number/{po_number}", response_model=POHeaderResponse)
 def read_purchase_order_by_number(
     po_number: str, 
@@ -0,0 +1,121 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, UploadFile, File
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from app.api import deps
+from app.db.pagination import set_next_cursor
+from app.models.stock_count import StockCountStatus
+from app.schemas.stock_count_schema import (
+    StockCountCreate,
+    StockCountSessionResponse,
+    StockCountSubmit,
+    StockCountSubmitResult,
+    StockCountVarianceReport,
+    StockCountPostResult
+)
+from app.services.stock_count_service import StockCountService
+
+router = APIRouter()
+
+# --- 1. TẠO PHIÊN KIỂM KÊ (CHỐT SỐ SỔ SÁCH) ---
+@router.post("/", response_model=StockCountSessionResponse)
+def create_stock_count(
+    obj_in: StockCountCreate,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Mở phiên kiểm kê cho 1 kho: chốt tồn sổ sách của từng lô tại thời điểm này.
+    """
+    service = StockCountService(db)
+    return service.create(obj_in)
+
+# --- 2. DANH SÁCH PHIÊN ---
+@router.get("/", response_model=List[StockCountSessionResponse])
+def read_stock_counts(
+    skip: int = 0,
+    limit: int = 100,
+    warehouse_id: Optional[int] = None,
+    status: Optional[StockCountStatus] = None,
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (lấy từ header X-Next-Cursor)"),
+    response: Response = None,
+    db: Session = Depends(deps.get_db)
+):
+    service = StockCountService(db)
+    items = service.get_multi(skip=skip, limit=limit, warehouse_id=warehouse_id, status=status, cursor=cursor)
+    set_next_cursor(response, items)
+    return items
+
+@router.get("/{session_id}", response_model=StockCountSessionResponse)
+def read_stock_count(
+    session_id: int,
+    db: Session = Depends(deps.get_db)
+):
+    service = StockCountService(db)
+    session = service.get(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Stock count session not found")
+    return session
+
+# --- 3. NHẬP SỐ ĐẾM (JSON) ---
+@router.post("/{session_id}/counts", response_model=StockCountSubmitResult)
+def submit_stock_counts(
+    session_id: int,
+    obj_in: StockCountSubmit,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Nhập số đếm hàng loạt (theo batch_id hoặc mã lô nội bộ quét từ barcode).
+    """
+    service = StockCountService(db)
+    return service.submit_counts(session_id, obj_in)
+
+# --- 4. NHẬP SỐ ĐẾM (FILE CSV) ---
+@router.post("/{session_id}/counts/upload", response_model=StockCountSubmitResult)
+def upload_stock_counts(
+    session_id: int,
+    file: UploadFile = File(...),
+    accumulate: bool = Query(False, description="True: cộng dồn vào số đã đếm"),
+    counted_by: Optional[str] = Query(None),
+    db: Session = Depends(deps.get_db)
+):
+    """
+    File CSV gồm cột batch_code (hoặc batch_id) và counted_quantity (hoặc quantity).
+    """
+    service = StockCountService(db)
+    entries = service.parse_csv(file.file.read())
+    return service.submit_counts(
+        session_id,
+        StockCountSubmit(entries=entries, accumulate=accumulate, counted_by=counted_by)
+    )
+
+# --- 5. BÁO CÁO CHÊNH LỆCH ---
+@router.get("/{session_id}/variances", response_model=StockCountVarianceReport)
+def read_stock_count_variances(
+    session_id: int,
+    only_variance: bool = Query(False, description="Chỉ lấy dòng có chênh lệch"),
+    db: Session = Depends(deps.get_db)
+):
+    service = StockCountService(db)
+    return service.get_variance_report(session_id, only_variance=only_variance)
+
+# --- 6. GHI SỔ ĐIỀU CHỈNH ---
+@router.post("/{session_id}/post", response_model=StockCountPostResult)
+def post_stock_count(
+    session_id: int,
+    zero_uncounted: bool = Query(False, description="Lô không đếm được coi như tồn = 0"),
+    db: Session = Depends(deps.get_db)
+):
+    """
+    Ghi toàn bộ chênh lệch (Đếm - Số chốt) vào sổ tồn kho trong 1 transaction và đóng phiên.
+    """
+    service = StockCountService(db)
+    return service.post(session_id, zero_uncounted=zero_uncounted)
+
+# --- 7. HỦY PHIÊN ---
+@router.post("/{session_id}/cancel", response_model=StockCountSessionResponse)
+def cancel_stock_count(
+    session_id: int,
+    db: Session = Depends(deps.get_db)
+):
+    service = StockCountService(db)
+    return service.cancel(session_id)
\ No newline at end of file
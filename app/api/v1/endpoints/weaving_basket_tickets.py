@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
 from app.api import deps
+from app.db.pagination import set_next_cursor
+from app.db.export import ExportFormat
 from app.schemas.weaving_basket_ticket_schema import (
     WeavingTicketResponse,
     WeavingTicketCreate,
@@ -19,12 +21,23 @@ router = APIRouter()
 def read_weaving_tickets(
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (lấy từ header X-Next-Cursor)"),
+    export_format: Optional[ExportFormat] = Query(None, alias="format", description="xlsx | csv: tải toàn bộ phiếu ra file"),
+    response: Response = None,
     db: Session = Depends(deps.get_db)
 ):
     """
     Get list of weaving basket tickets (paginated, sorted by newest).
+    Pass `cursor` (from the X-Next-Cursor header) instead of `skip` to scroll deep lists.
+    Pass `format=xlsx|csv` to download every ticket as a file (skip/limit/cursor are ignored).
     """
-    return weaving_basket_ticket_service.get_tickets(db, skip, limit)
+    if export_format:
+        return weaving_basket_ticket_service.export_tickets(db, export_format)
+    items = weaving_basket_ticket_service.get_tickets(
+        db, skip, limit, cursor=cursor, load_schema=WeavingTicketResponse
+    )
+    set_next_cursor(response, items)
+    return items
 
 
 # =========================
@@ -39,6 +52,9 @@ def search_weaving_tickets(
     is_finished: Optional[bool] = Query(None, description="True: Finished (Has Time Out), False: In Progress"),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (lấy từ header X-Next-Cursor)"),
+    export_format: Optional[ExportFormat] = Query(None, alias="format", description="xlsx | csv: tải toàn bộ kết quả lọc ra file"),
+    response: Response = None,
     db: Session = Depends(deps.get_db)
 ):
     """
@@ -47,8 +63,14 @@ def search_weaving_tickets(
     - All tickets by a specific machine.
     - All tickets handled by a specific employee.
     - Tickets that are currently in progress (is_finished=False).
+    Pass `format=xlsx|csv` to download all matching tickets as a file.
     """
-    return weaving_basket_ticket_service.search_tickets(
+    if export_format:
+        return weaving_basket_ticket_service.export_tickets(
+            db, export_format,
+            code=code, product_id=product_id, machine_id=machine_id, employee_id=employee_id, is_finished=is_finished
+        )
+    items = weaving_basket_ticket_service.search_tickets(
         db=db,
         code=code,
         product_id=product_id,
@@ -56,8 +78,12 @@ def search_weaving_tickets(
         employee_id=employee_id,
         is_finished=is_finished,
         skip=skip,
-        limit=limit
+        limit=limit,
+        cursor=cursor,
+        load_schema=WeavingTicketResponse
     )
+    set_next_cursor(response, items)
+    return items
 
 
 # =========================
@@ -71,7 +97,7 @@ def read_weaving_ticket(
     """
     Get specific ticket details by ID.
     """
-    ticket = weaving_basket_ticket_service.get_ticket_by_id(db, ticket_id)
+    ticket = weaving_basket_ticket_service.get_ticket_by_id(db, ticket_id, load_schema=WeavingTicketResponse)
     if not ticket:
         raise HTTPException(status_code=404, detail="Weaving basket ticket not found")
     return ticket
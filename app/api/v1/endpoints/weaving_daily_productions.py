@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import date
 
 from app.api import deps
+from app.db.pagination import set_next_cursor
 from app.schemas.weaving_daily_production_schema import (
     WeavingProductionResponse,
     WeavingProductionCreate,
@@ -21,14 +22,18 @@ router = APIRouter()
 def read_productions(
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (lấy từ header X-Next-Cursor)"),
+    response: Response = None,
     db: Session = Depends(deps.get_db)
 ):
     """
     Lấy danh sách sản lượng dệt (Mặc định sắp xếp ngày mới nhất).
     """
-    return weaving_daily_production_service.get_productions(
-        db, skip=skip, limit=limit
+    items = weaving_daily_production_service.get_productions(
+        db, skip=skip, limit=limit, cursor=cursor
     )
+    set_next_cursor(response, items)
+    return items
 
 
 # =========================
@@ -42,20 +47,43 @@ def search_productions(
     to_date: Optional[date] = None,     # Lọc đến ngày
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (lấy từ header X-Next-Cursor)"),
+    response: Response = None,
     db: Session = Depends(deps.get_db)
 ):
     """
     Tìm kiếm nâng cao: Theo từ khóa sản phẩm, ID sản phẩm, hoặc khoảng thời gian.
     """
-    return weaving_daily_production_service.search_productions(
+    items = weaving_daily_production_service.search_productions(
         db=db,
         keyword=keyword,
         product_id=product_id,
         from_date=from_date,
         to_date=to_date,
         skip=skip,
-        limit=limit
+        limit=limit,
+        cursor=cursor
     )
+    set_next_cursor(response, items)
+    return items
+
+
+# =========================
+# VERIFY (ĐỐI SOÁT SỐ LIỆU)
+# =========================
+@router.get("/verify")
+def verify_productions(
+    from_date: date,
+    to_date: date,
+    db: Session = Depends(deps.get_db)
+):
+    """
+    So sánh sản lượng đang lưu (hàng đợi nền tính lại sau mỗi lần sửa / xóa phiếu) với kết quả tính lại toàn bộ từ phiếu.
+    Dòng sai lệch có thể sửa bằng /calculate-manual.
+    """
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="from_date must be before to_date")
+    return weaving_daily_production_service.verify_daily_production(db, from_date, to_date)
 
 
 # =========================
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import date
 
 from app.api import deps
+from app.db.pagination import set_next_cursor
 from app.schemas.yarn_lot_schema import (
     YarnLotResponse,
     YarnLotDetail,   # Dùng cho xem chi tiết
@@ -21,9 +22,13 @@ router = APIRouter()
 def read_yarn_lots(
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (lấy từ header X-Next-Cursor)"),
+    response: Response = None,
     db: Session = Depends(deps.get_db)
 ):
-    return yarn_lot_service.get_yarn_lots(db, skip, limit)
+    items = yarn_lot_service.get_yarn_lots(db, skip, limit, cursor=cursor)
+    set_next_cursor(response, items)
+    return items
 
 # =========================
 # SEARCH (Tìm kiếm đa điều kiện)
@@ -38,9 +43,11 @@ def search_yarn_lots(
     to_date: Optional[date] = None,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (lấy từ header X-Next-Cursor)"),
+    response: Response = None,
     db: Session = Depends(deps.get_db)
 ):
-    return yarn_lot_service.search_yarn_lots(
+    items = yarn_lot_service.search_yarn_lots(
         db=db,
         lot_code=lot_code,
         yarn_id=yarn_id,
@@ -49,8 +56,11 @@ def search_yarn_lots(
         from_date=from_date,
         to_date=to_date,
         skip=skip,
-        limit=limit
+        limit=limit,
+        cursor=cursor
     )
+    set_next_cursor(response, items)
+    return items
 
 # =========================
 # GET DETAIL (Xem chi tiết theo ID)
@@ -31,7 +31,9 @@ from app.api.v1.endpoints import (
     material_receipts,
     iqc_results,
     inventorys,
-    material_exports
+    material_exports,
+    stock_counts,
+    purchase_order_matches
 )
 
 api_router = APIRouter()
@@ -69,4 +71,6 @@ api_router.include_router(batches.router, prefix="/batches", tags=["Batches"])
 api_router.include_router(iqc_results.router, prefix="/iqc-results", tags=["Iqc Results"])
 api_router.include_router(inventorys.router, prefix="/inventorys", tags=["Inventorys"])
 api_router.include_router(material_exports.router, prefix="/material-exports", tags=["Material Exports"])
+api_router.include_router(stock_counts.router, prefix="/stock-counts", tags=["Stock Counts"])
+api_router.include_router(purchase_order_matches.router, prefix="/po-matches", tags=["PO Matches"])
 
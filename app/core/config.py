@@ -11,6 +11,16 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     DATABASE_URL: str
 
+    # Phiếu giữ chỗ tồn kho: thời hạn mặc định (phút) và chu kỳ quét trả lại phiếu hết hạn (giây, 0 = tắt)
+    RESERVATION_TTL_MINUTES: int = 120
+    RESERVATION_SWEEP_INTERVAL_SECONDS: float = 60.0
+
+    # Giờ chạy đối soát SL đã nhận / trạng thái PO hằng đêm (0-23, -1 = tắt)
+    PO_RECONCILE_HOUR: int = 2
+
+    # Gom các phiếu rổ sửa / xóa trong bấy nhiêu giây rồi mới tính lại sản lượng ngày (0 = tính ngay sau commit)
+    WEAVING_PRODUCTION_DEBOUNCE_SECONDS: float = 2.0
+
     # 3. Cấu hình mới của Pydantic v2
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -21,7 +21,7 @@ from app.models.dye_color import DyeColor
 from app.models.user import User
 from app.models.log import Log
 from app.models.inventory_semi import SemiFinishedImportTicket, SemiFinishedImportDetail, SemiFinishedExportTicket, SemiFinishedExportDetail
-from app.models.weaving_daily_production import WeavingDailyProduction
+from app.models.weaving_daily_production import WeavingDailyProduction, WeavingDailyProductionMachine
 from app.models.bom_header import BOMHeader  # noqa
 from app.models.bom_detail import BOMDetail 
 from app.models.purchase_order import PurchaseOrderHeader,PurchaseOrderDetail
@@ -31,5 +31,12 @@ from app.models.material_receipt import MaterialReceipt,MaterialReceiptDetail
 from app.models.batch import Batch     
 from app.models.iqc_result import IQCResult     
 from app.models.inventory import InventoryStock    
+from app.models.inventory_summary import InventoryMaterialSummary, InventoryWarehouseSummary
+from app.models.inventory_transaction import InventoryTransaction, InventorySnapshot, InventorySnapshotLine
 from app.models.material_export import MaterialExport,MaterialExportDetail
-from app.models.machine_log import MachineLog
\ No newline at end of file
+from app.models.inventory_reservation import InventoryReservation, InventoryReservationLine
+from app.models.stock_count import StockCountSession, StockCountLine
+from app.models.purchase_order_match import PurchaseOrderMatch
+from app.models.machine_line_occupancy import MachineLineOccupancy
+from app.models.machine_log import MachineLog
+from app.models.document_sequence import DocumentSequence
\ No newline at end of file
@@ -0,0 +1,105 @@
+import csv
+import enum
+import io
+import tempfile
+from datetime import datetime
+from typing import Any, Iterable, Iterator, Sequence, Tuple
+from urllib.parse import quote
+
+from fastapi.responses import StreamingResponse
+from openpyxl import Workbook
+from sqlalchemy.orm import Query
+
+# Số dòng mỗi lần lấy từ server-side cursor
+EXPORT_BATCH_SIZE = 2000
+# Kích thước mỗi chunk gửi về client
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+_MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+class ExportFormat(str, enum.Enum):
+    XLSX = "xlsx"
+    CSV = "csv"
+
+
+def _cell(value: Any):
+    """Giá trị ghi ra file: Enum -> value, còn lại giữ nguyên (openpyxl tự định dạng ngày / số)"""
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+def _iter_rows(query: Query) -> Iterator[list]:
+    """Duyệt kết quả theo từng lô bằng server-side cursor (yield_per -> stream_results), không load hết vào RAM"""
+    for row in query.yield_per(EXPORT_BATCH_SIZE):
+        yield [_cell(v) for v in row]
+
+
+def _csv_chunks(headers: Sequence[str], rows: Iterable[list]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM để Excel mở đúng tiếng Việt
+    buffer.write("\ufeff")
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue().encode("utf-8")
+
+
+def _xlsx_chunks(headers: Sequence[str], rows: Iterable[list], sheet_title: str) -> Iterator[bytes]:
+    """
+    Workbook write_only: openpyxl ghi từng dòng ra file XML tạm, không giữ cell trong RAM.
+    File .xlsx (zip) được ghi ra file tạm rồi đọc trả về theo chunk.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title[:31])
+    sheet.append(list(headers))
+    for row in rows:
+        sheet.append(row)
+
+    with tempfile.TemporaryFile() as tmp:
+        workbook.save(tmp)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(EXPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def stream_export(
+    query: Query,
+    columns: Sequence[Tuple[str, Any]],
+    fmt: ExportFormat,
+    filename: str
+) -> StreamingResponse:
+    """
+    Xuất toàn bộ kết quả của query (đã lọc, đã sắp xếp) ra file Excel / CSV dạng stream.
+    - columns: [(tiêu đề cột, biểu thức SQL), ...] -> query chỉ lấy đúng các cột này (không dựng ORM object).
+    - Bộ nhớ không tăng theo số dòng: đọc theo lô bằng server-side cursor, ghi dần ra file / response.
+
+    VD: return stream_export(query, RECEIPT_EXPORT_COLUMNS, ExportFormat.XLSX, "phieu_nhap")
+    """
+    fmt = ExportFormat(fmt)
+    headers = [title for title, _ in columns]
+    rows = _iter_rows(query.with_entities(*[expr for _, expr in columns]))
+
+    if fmt == ExportFormat.CSV:
+        body = _csv_chunks(headers, rows)
+    else:
+        body = _xlsx_chunks(headers, rows, filename)
+
+    full_name = f"{filename}_{datetime.now():%Y%m%d_%H%M%S}.{fmt.value}"
+    return StreamingResponse(
+        body,
+        media_type=_MEDIA_TYPES[fmt.value],
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(full_name)}"}
+    )
\ No newline at end of file
@@ -0,0 +1,85 @@
+import typing
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence, Tuple, Type
+
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload
+
+# Độ sâu tối đa khi dò quan hệ theo schema (tránh vòng lặp header <-> details)
+MAX_LOAD_DEPTH = 6
+
+
+def _nested_schema(annotation: Any) -> Optional[Type[BaseModel]]:
+    """Lấy schema con từ kiểu của field: X, Optional[X], List[X], List[Optional[X]]..."""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    for arg in typing.get_args(annotation):
+        nested = _nested_schema(arg)
+        if nested is not None:
+            return nested
+    return None
+
+
+def _loader(parent, attr, uselist: bool):
+    """1-n -> selectinload (1 query cho cả trang), n-1 -> joinedload (JOIN vào query cha)"""
+    if parent is None:
+        return selectinload(attr) if uselist else joinedload(attr)
+    return parent.selectinload(attr) if uselist else parent.joinedload(attr)
+
+
+def _path_options(model, path: str, parent) -> List[Any]:
+    """Option cho chuỗi quan hệ dạng 'batch.receipt_detail.header'"""
+    options = []
+    for name in path.split("."):
+        rel = inspect(model).relationships[name]
+        parent = _loader(parent, getattr(model, name), rel.uselist)
+        options.append(parent)
+        model = rel.mapper.class_
+    return options
+
+
+def _walk(model, schema: Type[BaseModel], parent, depth: int) -> List[Any]:
+    if depth > MAX_LOAD_DEPTH:
+        return []
+
+    relationships = inspect(model).relationships
+    # Property trong model cần quan hệ nào (VD: InventoryStock.supplier_short_name)
+    property_loads = getattr(model, "__property_loads__", {})
+
+    options = []
+    for name, field in schema.model_fields.items():
+        if name in relationships:
+            rel = relationships[name]
+            loader = _loader(parent, getattr(model, name), rel.uselist)
+            options.append(loader)
+
+            nested = _nested_schema(field.annotation)
+            if nested is not None:
+                options.extend(_walk(rel.mapper.class_, nested, loader, depth + 1))
+        elif name in property_loads:
+            for path in property_loads[name]:
+                options.extend(_path_options(model, path, parent))
+    return options
+
+
+@lru_cache(maxsize=None)
+def _schema_load_options(model, schema: Type[BaseModel], extra: Tuple[str, ...]) -> Tuple[Any, ...]:
+    options = _walk(model, schema, None, 0)
+    for path in extra:
+        options.extend(_path_options(model, path, None))
+    return tuple(options)
+
+
+def schema_load_options(model, schema: Type[BaseModel], extra: Sequence[str] = ()) -> Tuple[Any, ...]:
+    """
+    Sinh loader options (selectinload/joinedload) cho đúng đồ thị quan hệ mà response schema sẽ đọc,
+    để serialize không bị lazy-load từng dòng (N+1).
+    - Field của schema trùng tên relationship -> eager load, dò tiếp vào schema con.
+    - Field trùng tên @property của model -> load các quan hệ khai báo trong model.__property_loads__.
+    - extra: thêm các đường dẫn quan hệ dạng 'a.b.c' nếu cần.
+    Kết quả được cache theo (model, schema).
+
+    VD: query.options(*schema_load_options(MaterialReceipt, MaterialReceiptResponse))
+    """
+    return _schema_load_options(model, schema, tuple(extra))
\ No newline at end of file
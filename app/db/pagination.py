@@ -0,0 +1,121 @@
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, or_, false
+from sqlalchemy.orm import Query
+
+# Header trả về cursor của trang kế tiếp (không có header = đã hết dữ liệu)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class CursorPage(list):
+    """List kết quả kèm cursor của trang kế tiếp (endpoint vẫn trả về List như cũ)"""
+    next_cursor: Optional[str] = None
+
+
+# =========================
+# MÃ HÓA / GIẢI MÃ CURSOR
+# =========================
+def _encode_value(value: Any):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any):
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = [_decode_value(v) for v in json.loads(raw)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+    if len(values) != size:
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+    return values
+
+
+# =========================
+# PHÂN TRANG KEYSET
+# =========================
+def _is_nullable(column) -> bool:
+    prop = getattr(column, "property", None)
+    columns = getattr(prop, "columns", None)
+    return bool(columns and columns[0].nullable)
+
+
+def _after(column, value, descending: bool):
+    """Điều kiện 'đứng sau value' theo chiều sắp xếp (NULL được coi là nhỏ nhất, như MySQL)"""
+    nullable = _is_nullable(column)
+    if value is None:
+        return column.isnot(None) if not descending else None
+    if descending:
+        return or_(column < value, column.is_(None)) if nullable else column < value
+    return column > value
+
+
+def _keyset_filter(order: Sequence[Tuple[Any, bool]], values: Sequence[Any]):
+    """(c1 sau v1) OR (c1 = v1 AND ((c2 sau v2) OR (c2 = v2 AND ...)))"""
+    condition = None
+    for (column, descending), value in reversed(list(zip(order, values))):
+        after = _after(column, value, descending)
+        equal = column.is_(None) if value is None else column == value
+        if condition is not None:
+            tail = and_(equal, condition)
+            condition = or_(after, tail) if after is not None else tail
+        else:
+            condition = after if after is not None else false()
+    return condition
+
+
+def paginate(
+    query: Query,
+    order: Sequence[Tuple[Any, bool]],
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None
+) -> CursorPage:
+    """
+    Phân trang cho các API danh sách.
+    - order: [(cột, giảm dần?), ...], cột cuối phải là khóa chính để thứ tự là duy nhất.
+    - cursor: lấy trang sau vị trí cursor (keyset, không phải quét bỏ `skip` dòng). Có cursor thì bỏ qua skip.
+    - Không có cursor: phân trang offset như cũ (skip/limit).
+    Trả về CursorPage, next_cursor = None khi đã hết dữ liệu.
+    """
+    if cursor:
+        query = query.filter(_keyset_filter(order, decode_cursor(cursor, len(order))))
+    elif skip:
+        query = query.offset(skip)
+
+    query = query.order_by(*[column.desc() if descending else column.asc() for column, descending in order])
+    rows = query.limit(limit + 1).all()
+
+    page = CursorPage(rows[:limit])
+    if len(rows) > limit and page:
+        last = page[-1]
+        page.next_cursor = encode_cursor([getattr(last, column.key) for column, _ in order])
+    return page
+
+
+def set_next_cursor(response: Response, items) -> None:
+    """Gắn cursor trang kế tiếp vào header response (dùng trong endpoint)"""
+    next_cursor = getattr(items, "next_cursor", None)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
\ No newline at end of file
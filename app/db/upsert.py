@@ -0,0 +1,34 @@
+from typing import Dict, List
+
+from sqlalchemy import Table
+from sqlalchemy.orm import Session
+
+
+def upsert_increment(db: Session, table: Table, key_columns: List[str], rows: List[Dict]):
+    """
+    INSERT ... nếu chưa có, ngược lại CỘNG DỒN các cột còn lại (col = col + giá trị mới) - 1 câu lệnh nguyên tử.
+    - key_columns: các cột thuộc UniqueConstraint dùng để nhận biết dòng trùng.
+    - rows: list dict có cùng tập khóa (cột khóa + cột cộng dồn).
+    Hỗ trợ MySQL (ON DUPLICATE KEY UPDATE) và SQLite (ON CONFLICT DO UPDATE).
+    """
+    if not rows:
+        return
+
+    inc_columns = [c for c in rows[0].keys() if c not in key_columns]
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        stmt = stmt.on_duplicate_key_update(
+            {c: table.c[c] + stmt.inserted[c] for c in inc_columns}
+        )
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[c] for c in key_columns],
+            set_={c: table.c[c] + stmt.excluded[c] for c in inc_columns}
+        )
+
+    db.execute(stmt, rows)
@@ -1,7 +1,7 @@
 import enum
 from typing import TYPE_CHECKING, Optional, cast
 
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Enum, Boolean, DateTime, Text
+from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Enum, Boolean, DateTime, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.base_class import Base
@@ -33,6 +33,9 @@ class Batch(Base):
 
     # Liên kết khóa ngoại
     receipt_detail_id = Column(Integer, ForeignKey("material_receipt_details.detail_id"), nullable=True)
+
+    # Giá vốn 1 đơn vị (quy đổi VND = đơn giá PO x tỷ giá), xem InventoryValuationService
+    unit_cost = Column(Float, nullable=True)
     
     qc_status = Column(Enum(BatchQCStatus), default=BatchQCStatus.PENDING)
     qc_note = Column(String(255), nullable=True)
@@ -51,6 +54,11 @@ class Batch(Base):
     # trong context của SQLAlchemy model. Ta sẽ xử lý bằng cast bên dưới.
     receipt_detail = relationship("MaterialReceiptDetail", lazy="joined")
 
+    # Quan hệ cần eager load khi response đọc property receipt_number (xem app/db/loading.py)
+    __property_loads__ = {
+        "receipt_number": ["receipt_detail.header"],
+    }
+
     # [YÊU CẦU 1] Property ảo lấy số phiếu nhập
     @property
     def receipt_number(self) -> Optional[str]:
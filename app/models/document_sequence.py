@@ -0,0 +1,30 @@
+import enum
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from app.db.base_class import Base
+
+# Các loại chứng từ được cấp số tự động
+class DocumentType(str, enum.Enum):
+    MATERIAL_RECEIPT = "MATERIAL_RECEIPT"   # Phiếu nhập: YYYY/MM-XXX
+    MATERIAL_EXPORT = "MATERIAL_EXPORT"     # Phiếu xuất: YYYYMM-XXXX
+    BATCH = "BATCH"                         # Lô nội bộ: VYYXXXX
+    PURCHASE_ORDER = "PURCHASE_ORDER"       # Đơn mua hàng: VXXXXXXXX
+
+# Bảng bộ đếm số chứng từ: mỗi (Loại chứng từ - Kỳ) có đúng 1 dòng
+class DocumentSequence(Base):
+    __tablename__ = "document_sequences"
+
+    id = Column(Integer, primary_key=True, index=True)
+    doc_type = Column(String(30), nullable=False)
+
+    # Kỳ đánh số (VD: "202601", "26"). Chuỗi rỗng = đánh số liên tục không theo kỳ
+    period = Column(String(10), nullable=False, default="")
+
+    # Số cuối cùng đã cấp
+    last_value = Column(Integer, nullable=False, default=0)
+
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('doc_type', 'period', name='uix_doc_type_period'),
+    )
\ No newline at end of file
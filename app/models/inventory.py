@@ -1,5 +1,5 @@
 from typing import Optional
-from sqlalchemy import Column, Integer, Float, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy import Column, Integer, Float, ForeignKey, DateTime, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.base_class import Base
@@ -26,6 +26,8 @@ class InventoryStock(Base):
     # Ràng buộc duy nhất: Một Lô hàng ở trong Một Kho chỉ có 1 dòng tồn kho
     __table_args__ = (
         UniqueConstraint('material_id', 'warehouse_id', 'batch_id', name='uix_stock_loc_batch'),
+        # Danh sách tồn kho sắp xếp theo lần cập nhật gần nhất (phân trang keyset)
+        Index('ix_inventory_stocks_last_updated', 'last_updated', 'id'),
     )
 
     # Relationships
@@ -33,6 +35,13 @@ class InventoryStock(Base):
     warehouse = relationship("Warehouse")
     batch = relationship("Batch")
 
+    # Quan hệ cần eager load khi response đọc các property bên dưới (xem app/db/loading.py)
+    __property_loads__ = {
+        "received_quantity_cones": ["batch.receipt_detail"],
+        "number_of_pallets": ["batch.receipt_detail"],
+        "supplier_short_name": ["batch.receipt_detail.header.po_header.vendor"],
+    }
+
      # --- [MỚI] PROPERTY MAPPING DỮ LIỆU TỪ BẢNG LIÊN QUAN ---
     
     @property
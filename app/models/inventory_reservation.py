@@ -0,0 +1,56 @@
+import enum
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime, Enum, Index
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.db.base_class import Base
+
+class ReservationStatus(str, enum.Enum):
+    ACTIVE = "Active"       # Đang giữ chỗ (đã cộng vào inventory_stocks.quantity_reserved)
+    CONSUMED = "Consumed"   # Đã chuyển thành phiếu xuất
+    RELEASED = "Released"   # Hủy giữ chỗ bằng tay
+    EXPIRED = "Expired"     # Hết hạn, được sweeper trả lại tồn khả dụng
+
+# 1. Header phiếu giữ chỗ: ai giữ, giữ cho chứng từ nào, giữ tới khi nào
+class InventoryReservation(Base):
+    __tablename__ = "inventory_reservations"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    owner = Column(String(100), nullable=False, index=True)   # Người / bộ phận giữ chỗ
+    status = Column(Enum(ReservationStatus), nullable=False, default=ReservationStatus.ACTIVE)
+
+    # Chứng từ gốc (VD: "WorkSchedule" - 12)
+    reference_type = Column(String(50), nullable=True)
+    reference_id = Column(Integer, nullable=True)
+    note = Column(String(255), nullable=True)
+
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    closed_at = Column(DateTime, nullable=True)   # Thời điểm xuất / hủy / hết hạn
+
+    # Phiếu xuất đã tiêu thụ phiếu giữ chỗ này
+    export_id = Column(Integer, ForeignKey("material_exports.id", ondelete="SET NULL"), nullable=True)
+
+    __table_args__ = (
+        # Sweeper: WHERE status = 'ACTIVE' AND expires_at <= now
+        Index('ix_inv_reservation_status_expires', 'status', 'expires_at'),
+    )
+
+    lines = relationship("InventoryReservationLine", back_populates="reservation", cascade="all, delete-orphan")
+
+# 2. Chi tiết giữ chỗ: mỗi dòng là 1 phần của 1 dòng tồn (Vật tư - Kho - Lô)
+class InventoryReservationLine(Base):
+    __tablename__ = "inventory_reservation_lines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    reservation_id = Column(Integer, ForeignKey("inventory_reservations.id", ondelete="CASCADE"), nullable=False, index=True)
+    stock_id = Column(Integer, ForeignKey("inventory_stocks.id"), nullable=False, index=True)
+
+    material_id = Column(Integer, ForeignKey("materials.id"), nullable=False)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.warehouse_id"), nullable=False)
+    batch_id = Column(Integer, ForeignKey("batches.batch_id"), nullable=False)
+
+    quantity = Column(Float, nullable=False)                  # Số lượng giữ chỗ
+    consumed_quantity = Column(Float, nullable=False, default=0.0)  # Số lượng đã xuất thực tế
+
+    reservation = relationship("InventoryReservation", back_populates="lines")
\ No newline at end of file
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, Float, ForeignKey
+from app.db.base_class import Base
+
+# Bảng tổng hợp tồn kho (materialized), được cộng dồn mỗi lần tồn thay đổi
+# (post_movements / giữ chỗ / trả giữ chỗ) -> đọc tổng tồn không cần SUM trên inventory_stocks.
+# Lệch số: InventorySummaryService.rebuild() dựng lại từ inventory_stocks.
+
+# 1. Tổng tồn theo Vật tư (mọi kho, mọi lô)
+class InventoryMaterialSummary(Base):
+    __tablename__ = "inventory_material_summaries"
+
+    material_id = Column(Integer, ForeignKey("materials.id"), primary_key=True)
+
+    quantity_on_hand = Column(Float, nullable=False, default=0.0)
+    quantity_reserved = Column(Float, nullable=False, default=0.0)
+
+    # Giá vốn bình quân di động (VND / đơn vị) và giá trị tồn theo giá bình quân
+    average_unit_cost = Column(Float, nullable=False, default=0.0)
+    stock_value = Column(Float, nullable=False, default=0.0)
+
+# 2. Tổng tồn theo Vật tư - Kho (mọi lô)
+class InventoryWarehouseSummary(Base):
+    __tablename__ = "inventory_warehouse_summaries"
+
+    material_id = Column(Integer, ForeignKey("materials.id"), primary_key=True)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.warehouse_id"), primary_key=True)
+
+    quantity_on_hand = Column(Float, nullable=False, default=0.0)
+    quantity_reserved = Column(Float, nullable=False, default=0.0)
\ No newline at end of file
@@ -0,0 +1,66 @@
+import enum
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime, Enum, Index
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.db.base_class import Base
+
+class InventoryTransactionType(str, enum.Enum):
+    OPENING = "Opening"         # Số dư đầu kỳ (khởi tạo sổ từ inventory_stocks cũ)
+    RECEIPT = "Receipt"         # Nhập kho
+    EXPORT = "Export"           # Xuất kho
+    ADJUSTMENT = "Adjustment"   # Điều chỉnh / Kiểm kê
+    REVERSAL = "Reversal"       # Hủy chứng từ (hoàn tác nhập/xuất)
+
+# 1. Sổ cái biến động tồn kho (CHỈ GHI THÊM, không sửa/xóa)
+# inventory_stocks là bảng tổng hợp (projection) của sổ này.
+class InventoryTransaction(Base):
+    __tablename__ = "inventory_transactions"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Không đặt ForeignKey: lô/phiếu có thể bị xóa nhưng lịch sử vẫn phải giữ nguyên
+    material_id = Column(Integer, nullable=False, index=True)
+    warehouse_id = Column(Integer, nullable=False)
+    batch_id = Column(Integer, nullable=False, index=True)
+
+    quantity_delta = Column(Float, nullable=False, comment="Dương: tăng tồn, Âm: giảm tồn")
+    transaction_type = Column(Enum(InventoryTransactionType), nullable=False)
+
+    # Chứng từ gốc (VD: "MaterialReceipt" - 15)
+    reference_type = Column(String(50), nullable=True)
+    reference_id = Column(Integer, nullable=True)
+    note = Column(String(255), nullable=True)
+
+    created_at = Column(DateTime, server_default=func.now(), nullable=False, index=True)
+
+    __table_args__ = (
+        Index('ix_inv_txn_reference', 'reference_type', 'reference_id'),
+    )
+
+# 2. Header Snapshot: chốt số dư định kỳ để truy vấn tồn tại thời điểm không phải quét cả sổ
+class InventorySnapshot(Base):
+    __tablename__ = "inventory_snapshots"
+
+    snapshot_id = Column(Integer, primary_key=True, index=True)
+    snapshot_at = Column(DateTime, nullable=False, index=True)
+
+    # Snapshot đã bao gồm mọi giao dịch có id <= giá trị này
+    last_transaction_id = Column(Integer, nullable=False, default=0)
+
+    created_at = Column(DateTime, server_default=func.now())
+
+    lines = relationship("InventorySnapshotLine", back_populates="snapshot", cascade="all, delete-orphan")
+
+# 3. Detail Snapshot: số dư từng bộ 3 (Vật tư - Kho - Lô) tại thời điểm chốt
+class InventorySnapshotLine(Base):
+    __tablename__ = "inventory_snapshot_lines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_id = Column(Integer, ForeignKey("inventory_snapshots.snapshot_id", ondelete="CASCADE"), nullable=False, index=True)
+
+    material_id = Column(Integer, nullable=False)
+    warehouse_id = Column(Integer, nullable=False)
+    batch_id = Column(Integer, nullable=False)
+    quantity_on_hand = Column(Float, nullable=False, default=0.0)
+
+    snapshot = relationship("InventorySnapshot", back_populates="lines")
\ No newline at end of file
@@ -0,0 +1,76 @@
+from sqlalchemy import Column, Integer, Float, String, Date, DateTime, MetaData, Table, text
+from app.db.base_class import Base
+
+# View chỉ đọc -> khai báo trên MetaData riêng để create_all / autogenerate không tạo bảng thật
+view_metadata = MetaData()
+
+# Danh sách tồn kho dạng phẳng: mỗi dòng tồn kho đã kèm sẵn mã vật tư, kho, mã lô,
+# số cuộn / pallet (từ chi tiết phiếu nhập) và tên NCC (qua PO) - không cần chuỗi joinedload.
+# Migration f3a6b8d05c21 giữ bản chụp của câu SELECT này (migration không import code app):
+# sửa view thì sửa ở đây VÀ thêm migration mới tạo lại view với cùng câu SELECT.
+INVENTORY_STOCK_VIEW_SELECT = """
+SELECT
+    s.id AS id,
+    s.material_id AS material_id,
+    s.warehouse_id AS warehouse_id,
+    s.batch_id AS batch_id,
+    s.quantity_on_hand AS quantity_on_hand,
+    s.quantity_reserved AS quantity_reserved,
+    s.last_updated AS last_updated,
+    m.material_code AS material_code,
+    m.material_type AS material_type,
+    w.warehouse_name AS warehouse_name,
+    b.internal_batch_code AS internal_batch_code,
+    b.supplier_batch_no AS supplier_batch_no,
+    b.location AS location,
+    b.expiry_date AS expiry_date,
+    b.qc_status AS qc_status,
+    COALESCE(d.received_quantity_cones, 0) AS received_quantity_cones,
+    COALESCE(d.number_of_pallets, 0) AS number_of_pallets,
+    r.receipt_number AS receipt_number,
+    COALESCE(sp.short_name, sp.supplier_name) AS supplier_short_name
+FROM inventory_stocks s
+JOIN materials m ON m.id = s.material_id
+JOIN warehouses w ON w.warehouse_id = s.warehouse_id
+JOIN batches b ON b.batch_id = s.batch_id
+LEFT JOIN material_receipt_details d ON d.detail_id = b.receipt_detail_id
+LEFT JOIN material_receipts r ON r.receipt_id = d.receipt_id
+LEFT JOIN purchase_orders po ON po.po_id = r.po_header_id
+LEFT JOIN suppliers sp ON sp.supplier_id = po.vendor_id
+"""
+
+
+class InventoryStockView(Base):
+    __table__ = Table(
+        "v_inventory_stock_list",
+        view_metadata,
+        Column("id", Integer, primary_key=True),
+        Column("material_id", Integer),
+        Column("warehouse_id", Integer),
+        Column("batch_id", Integer),
+        Column("quantity_on_hand", Float),
+        Column("quantity_reserved", Float),
+        Column("last_updated", DateTime),
+        Column("material_code", String(50)),
+        Column("material_type", String(100)),
+        Column("warehouse_name", String(100)),
+        Column("internal_batch_code", String(50)),
+        Column("supplier_batch_no", String(100)),
+        Column("location", String(10)),
+        Column("expiry_date", Date),
+        Column("qc_status", String(20)),
+        Column("received_quantity_cones", Integer),
+        Column("number_of_pallets", Integer),
+        Column("receipt_number", String(50)),
+        Column("supplier_short_name", String(255)),
+    )
+
+
+def create_inventory_views(bind):
+    """Tạo view (dùng cho môi trường khởi tạo bằng create_all, production tạo qua Alembic)"""
+    if bind.dialect.name == "sqlite":
+        ddl = f"CREATE VIEW IF NOT EXISTS v_inventory_stock_list AS {INVENTORY_STOCK_VIEW_SELECT}"
+    else:
+        ddl = f"CREATE OR REPLACE VIEW v_inventory_stock_list AS {INVENTORY_STOCK_VIEW_SELECT}"
+    with bind.begin() as conn:
+        conn.execute(text(ddl))
\ No newline at end of file
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
+from app.db.base_class import Base
+
+# Line máy đang chạy: mỗi (máy, line) tối đa 1 dòng, trỏ tới phiếu rổ dệt chưa ra rổ.
+# Thêm khi mở phiếu (vào rổ), xóa khi đóng phiếu (ra rổ) trong cùng transaction với phiếu.
+# Unique (machine_id, machine_line): 2 phiếu cùng lên 1 line sẽ bị DB chặn thay vì chạy đua.
+class MachineLineOccupancy(Base):
+    __tablename__ = "machine_line_occupancy"
+
+    id = Column(Integer, primary_key=True, index=True)
+    machine_id = Column(Integer, ForeignKey("machines.machine_id"), nullable=False)
+    machine_line = Column(Integer, nullable=False)
+
+    ticket_id = Column(Integer, ForeignKey("weaving_basket_tickets.id", ondelete="CASCADE"), nullable=False, unique=True)
+    basket_id = Column(Integer, ForeignKey("baskets.basket_id"), nullable=True)
+    batch_id = Column(Integer, ForeignKey("batches.batch_id"), nullable=True)
+    product_id = Column(Integer, ForeignKey("products.product_id"), nullable=True)
+
+    occupied_since = Column(DateTime, nullable=True)   # Giờ vào rổ của phiếu
+
+    ticket = relationship("WeavingBasketTicket")
+
+    __table_args__ = (
+        UniqueConstraint('machine_id', 'machine_line', name='uix_machine_line_occupancy'),
+    )
\ No newline at end of file
@@ -0,0 +1,40 @@
+import enum
+from sqlalchemy import Column, Integer, Float, ForeignKey, DateTime, Enum, UniqueConstraint
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.db.base_class import Base
+
+class MatchStatus(str, enum.Enum):
+    MATCHED = "Matched"               # Đặt = Khai = Nhận
+    PENDING = "Pending"               # Đang về: Đặt >= Khai >= Nhận (chưa đủ nhưng không lệch)
+    OVER_DECLARED = "OverDeclared"    # Khai vượt SL đặt
+    OVER_RECEIVED = "OverReceived"    # Nhận vượt SL khai (nhận hàng chưa khai / khai thiếu)
+    NOT_ON_PO = "NotOnPO"             # Vật tư có trên tờ khai / phiếu nhập nhưng không có trên PO
+
+# Các trạng thái cần xử lý (danh sách sai lệch)
+MISMATCH_STATUSES = (MatchStatus.OVER_DECLARED, MatchStatus.OVER_RECEIVED, MatchStatus.NOT_ON_PO)
+
+# Đối chiếu 3 bên PO - Tờ khai - Phiếu nhập: mỗi (PO, vật tư) 1 dòng, tính lại khi 1 trong 3 chứng từ thay đổi
+class PurchaseOrderMatch(Base):
+    __tablename__ = "po_match_lines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    po_id = Column(Integer, ForeignKey("purchase_orders.po_id", ondelete="CASCADE"), nullable=False)
+    material_id = Column(Integer, ForeignKey("materials.id"), nullable=False, index=True)
+
+    ordered_quantity = Column(Float, nullable=False, default=0.0)    # Tổng SL trên PO
+    declared_quantity = Column(Float, nullable=False, default=0.0)   # Tổng SL trên tờ khai
+    received_quantity = Column(Float, nullable=False, default=0.0)   # Tổng SL thực nhập (Kg)
+
+    declared_variance = Column(Float, nullable=False, default=0.0)   # Khai - Đặt
+    received_variance = Column(Float, nullable=False, default=0.0)   # Nhận - Khai
+
+    status = Column(Enum(MatchStatus), nullable=False, index=True)
+    matched_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    po_header = relationship("PurchaseOrderHeader")
+    material = relationship("Material")
+
+    __table_args__ = (
+        UniqueConstraint('po_id', 'material_id', name='uix_po_match_material'),
+    )
\ No newline at end of file
@@ -0,0 +1,45 @@
+import enum
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime, Enum, UniqueConstraint
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.db.base_class import Base
+
+class StockCountStatus(str, enum.Enum):
+    OPEN = "Open"             # Đang kiểm kê (nhận số đếm)
+    POSTED = "Posted"         # Đã ghi điều chỉnh chênh lệch vào sổ
+    CANCELLED = "Cancelled"   # Hủy, không điều chỉnh
+
+# 1. Phiên kiểm kê: chốt số tồn sổ sách của 1 kho tại thời điểm bắt đầu đếm
+class StockCountSession(Base):
+    __tablename__ = "stock_count_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.warehouse_id"), nullable=False, index=True)
+    status = Column(Enum(StockCountStatus), nullable=False, default=StockCountStatus.OPEN)
+
+    note = Column(String(255), nullable=True)
+    created_by = Column(String(50), nullable=True)
+
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)   # Thời điểm chốt số sổ sách
+    posted_at = Column(DateTime, nullable=True)
+
+    warehouse = relationship("Warehouse")
+
+# 2. Dòng kiểm kê: mỗi lô 1 dòng, số sổ sách (chốt) và số đếm thực tế
+class StockCountLine(Base):
+    __tablename__ = "stock_count_lines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("stock_count_sessions.id", ondelete="CASCADE"), nullable=False)
+
+    material_id = Column(Integer, ForeignKey("materials.id"), nullable=False)
+    batch_id = Column(Integer, ForeignKey("batches.batch_id"), nullable=False)
+
+    expected_quantity = Column(Float, nullable=False, default=0.0)   # Tồn sổ sách lúc chốt (lô phát sinh khi đếm = 0)
+    counted_quantity = Column(Float, nullable=True)                  # NULL = chưa đếm
+    counted_by = Column(String(50), nullable=True)
+    counted_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint('session_id', 'batch_id', name='uix_count_session_batch'),
+    )
\ No newline at end of file
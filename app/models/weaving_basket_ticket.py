@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Date, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Date, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
 import datetime
@@ -50,4 +50,11 @@ class WeavingBasketTicket(Base):
     inspections = relationship("WeavingInspection", back_populates="ticket")
     
     # [NEW] Relationship để truy cập thông tin Batch từ Ticket
-    batch = relationship("Batch")
\ No newline at end of file
+    batch = relationship("Batch")
+
+    # Index phục vụ lọc theo thời gian ra rổ (sản lượng ngày) và tìm phiếu đang chạy theo line máy / rổ
+    __table_args__ = (
+        Index('ix_ticket_time_out_product', 'time_out', 'product_id'),
+        Index('ix_ticket_machine_line_time_out', 'machine_id', 'machine_line', 'time_out'),
+        Index('ix_ticket_basket_time_out', 'basket_id', 'time_out'),
+    )
\ No newline at end of file
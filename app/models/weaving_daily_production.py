@@ -29,4 +29,20 @@ class WeavingDailyProduction(Base):
     # Constraint: Một ngày + một sản phẩm chỉ được có 1 dòng dữ liệu
     __table_args__ = (
         UniqueConstraint('date', 'product_id', name='uix_date_product'),
+    )
+
+
+# Bảng thành viên (ngày, sản phẩm, máy): số phiếu đã ra rổ của máy cho sản phẩm trong ngày.
+# active_machine_lines = số dòng của (ngày, sản phẩm) trong bảng này.
+class WeavingDailyProductionMachine(Base):
+    __tablename__ = "weaving_daily_production_machines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    date = Column(Date, nullable=False)
+    product_id = Column(Integer, ForeignKey("products.product_id"), nullable=False)
+    machine_id = Column(Integer, ForeignKey("machines.machine_id"), nullable=False)
+    ticket_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('date', 'product_id', 'machine_id', name='uix_date_product_machine'),
     )
\ No newline at end of file
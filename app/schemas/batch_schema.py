@@ -40,6 +40,7 @@ class BatchUpdate(BaseModel):
 class BatchResponse(BatchBase):
     batch_id: int
     internal_batch_code: str
+    unit_cost: Optional[float] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
     
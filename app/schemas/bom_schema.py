@@ -119,4 +119,119 @@ class BOMHeaderResponse(BaseModel):
         return f"BOM Năm {self.applicable_year}"
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# ==========================================
+# 3. TÍNH LẠI HÀNG LOẠT (ĐỔI THÔNG SỐ HEADER THEO BỘ LỌC SẢN PHẨM)
+# ==========================================
+
+class BOMBulkRecalculate(BaseModel):
+    """Bộ lọc BOM + thông số header mới (để trống = giữ nguyên, chỉ tính lại)"""
+    product_code: Optional[str] = None
+    product_ids: Optional[List[int]] = None
+    applicable_year: Optional[int] = None
+    is_active: Optional[bool] = True
+
+    target_weight_gm: Optional[float] = None
+    total_scrap_rate: Optional[float] = None
+    total_shrinkage_rate: Optional[float] = None
+
+class BOMBulkRecalculateResult(BaseModel):
+    boms_updated: int = 0
+    details_updated: int = 0
+
+# ==========================================
+# 4. MÔ PHỎNG ĐỊNH MỨC (KHÔNG LƯU DB)
+# ==========================================
+
+class BOMDetailSimChange(BaseModel):
+    """Sửa thử 1 dòng của BOM gốc (để trống = giữ nguyên)"""
+    detail_id: int
+    component_type: Optional[BOMComponentType] = None
+    threads: Optional[int] = None
+    yarn_type_name: Optional[str] = None
+    twisted: Optional[float] = None
+    crossweave_rate: Optional[float] = None
+    actual_length_cm: Optional[float] = None
+
+class BOMSimulationRequest(BaseModel):
+    """
+    - Không có bom_id: tính trên header + details gửi lên (bắt buộc target_weight_gm, details).
+    - Có bom_id: lấy BOM gốc, ghi đè thông số header gửi lên, rồi
+      thay toàn bộ chi tiết (details) hoặc sửa / xóa / thêm dòng (detail_changes, remove_detail_ids, add_details).
+    """
+    bom_id: Optional[int] = None
+
+    target_weight_gm: Optional[float] = None
+    total_scrap_rate: Optional[float] = None
+    total_shrinkage_rate: Optional[float] = None
+
+    details: Optional[List[BOMDetailCreate]] = None
+    detail_changes: List[BOMDetailSimChange] = []
+    remove_detail_ids: List[int] = []
+    add_details: List[BOMDetailCreate] = []
+
+class BOMSimulatedDetail(BaseModel):
+    detail_id: Optional[int] = None   # Dòng của BOM gốc (None = dòng mới)
+    component_type: BOMComponentType
+    material_id: Optional[int] = None
+    threads: int
+    yarn_type_name: str
+    yarn_dtex: float
+    twisted: float
+    crossweave_rate: float
+    actual_length_cm: float
+
+    weight_per_yarn_gm: float
+    actual_weight_cal: float
+    weight_percentage: float
+    bom_gm: float
+
+    # Chênh lệch so với số đang lưu của dòng gốc (None = dòng mới / không có BOM gốc)
+    delta_weight_per_yarn_gm: Optional[float] = None
+    delta_weight_percentage: Optional[float] = None
+    delta_bom_gm: Optional[float] = None
+
+class BOMSimulationResult(BaseModel):
+    bom_id: Optional[int] = None
+    target_weight_gm: float
+    total_scrap_rate: float
+    total_shrinkage_rate: float
+
+    total_bom_gm: float
+    base_total_bom_gm: Optional[float] = None
+    delta_total_bom_gm: Optional[float] = None
+
+    details: List[BOMSimulatedDetail] = []
+    removed_detail_ids: List[int] = []
+    cached: bool = False
+
+# ==========================================
+# 5. IMPORT BOM TỪ FILE EXCEL
+# ==========================================
+
+class BOMImportSheetResult(BaseModel):
+    sheet_name: str
+    status: str                          # "create" / "update" / "skipped" / "error"
+    product_id: Optional[int] = None     # None = sản phẩm mới (chưa ghi hoặc dry run)
+    new_product: bool = False
+    bom_id: Optional[int] = None
+    target_weight_gm: Optional[float] = None
+    total_scrap_rate: Optional[float] = None
+    total_shrinkage_rate: Optional[float] = None
+    detail_count: int = 0
+    total_bom_gm: Optional[float] = None
+    errors: List[str] = []
+    warnings: List[str] = []
+
+class BOMImportResult(BaseModel):
+    applicable_year: int
+    dry_run: bool
+    total_sheets: int = 0
+    valid_sheets: int = 0
+    error_sheets: int = 0
+    products_created: int = 0
+    boms_created: int = 0
+    boms_updated: int = 0
+    details_imported: int = 0
+    sheets: List[BOMImportSheetResult] = []
\ No newline at end of file
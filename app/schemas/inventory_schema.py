@@ -1,5 +1,9 @@
 from pydantic import BaseModel, computed_field, Field
-from typing import Optional
+from typing import Dict, List, Optional
+from datetime import date, datetime
+
+from app.models.inventory_transaction import InventoryTransactionType
+from app.models.inventory_reservation import ReservationStatus
 
 # Import các Schema cần thiết để hiển thị thông tin chi tiết (Nested)
 from app.schemas.batch_schema import BatchResponse
@@ -34,10 +38,260 @@ class InventoryStockResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# Schema danh sách tồn kho dạng phẳng (đọc từ view v_inventory_stock_list)
+class InventoryStockListResponse(BaseModel):
+    id: int
+    material_id: int
+    warehouse_id: int
+    batch_id: int
+
+    quantity_on_hand: float
+    quantity_reserved: float
+    last_updated: Optional[datetime] = None
+
+    material_code: str
+    material_type: Optional[str] = None
+    warehouse_name: str
+    internal_batch_code: str
+    supplier_batch_no: Optional[str] = None
+    location: Optional[str] = None
+    expiry_date: Optional[date] = None
+    qc_status: Optional[str] = None
+
+    received_quantity_cones: int = Field(default=0)
+    number_of_pallets: int = Field(default=0)
+    receipt_number: Optional[str] = None
+    supplier_short_name: Optional[str] = None
+
+    @computed_field
+    def available_quantity(self) -> float:
+        return self.quantity_on_hand - self.quantity_reserved
+
+    class Config:
+        from_attributes = True
+
 # Schema dùng cho Kiểm kê kho (Điều chỉnh số lượng bằng tay)
 class InventoryAdjustment(BaseModel):
     material_id: int
     warehouse_id: int
     batch_id: int
     new_quantity: float
-    reason: Optional[str] = None
\ No newline at end of file
+    reason: Optional[str] = None
+
+# Schema dùng cho ghi sổ tồn kho hàng loạt (Nhập / Xuất / Điều chỉnh)
+# Mỗi dòng là 1 biến động: quantity_delta > 0 là tăng, < 0 là giảm
+class InventoryMovement(BaseModel):
+    material_id: int
+    warehouse_id: int
+    batch_id: int
+    quantity_delta: float
+
+    # Thông tin ghi sổ cái (inventory_transactions)
+    transaction_type: InventoryTransactionType = InventoryTransactionType.ADJUSTMENT
+    reference_type: Optional[str] = None
+    reference_id: Optional[int] = None
+    note: Optional[str] = None
+
+# Schema hiển thị lịch sử biến động (Sổ cái)
+class InventoryTransactionResponse(BaseModel):
+    id: int
+    material_id: int
+    warehouse_id: int
+    batch_id: int
+    quantity_delta: float
+    transaction_type: InventoryTransactionType
+    reference_type: Optional[str] = None
+    reference_id: Optional[int] = None
+    note: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+# Schema tồn kho tại 1 thời điểm (Point-in-time)
+class InventoryBalanceResponse(BaseModel):
+    material_id: int
+    warehouse_id: int
+    batch_id: int
+    quantity_on_hand: float
+
+# Schema thông tin 1 lần chốt Snapshot
+class InventorySnapshotResponse(BaseModel):
+    snapshot_id: int
+    snapshot_at: datetime
+    last_transaction_id: int
+    line_count: int = 0
+
+    class Config:
+        from_attributes = True
+
+# =========================================================
+# PHÂN BỔ TỒN KHO (FEFO)
+# =========================================================
+
+# 1 dòng nhu cầu: cần `quantity` của vật tư, có thể chỉ định kho
+class AllocationDemand(BaseModel):
+    material_id: int
+    quantity: float = Field(..., gt=0)
+    warehouse_id: Optional[int] = None   # Bắt buộc lấy từ kho này (để trống = kho nào cũng được)
+    reference: Optional[str] = None      # VD: "Máy 5 - Line 2" (để đối chiếu kết quả)
+
+class AllocationRequest(BaseModel):
+    lines: List[AllocationDemand]
+    # Thứ tự ưu tiên kho khi dòng nhu cầu không chỉ định kho (kho đứng trước được lấy trước)
+    preferred_warehouse_ids: List[int] = []
+    # False: hạn dùng là tiêu chí chính (FEFO), kho ưu tiên chỉ để phân định lô cùng hạn
+    # True: lấy hết kho ưu tiên trước, trong mỗi kho vẫn theo FEFO
+    warehouse_first: bool = False
+    # True: thiếu hàng vẫn giữ phần có được; False: thiếu 1 dòng là hủy cả lần phân bổ
+    allow_partial: bool = False
+
+# 1 dòng kết quả: lấy `quantity` từ lô batch_id ở kho warehouse_id cho dòng nhu cầu line_index
+class AllocationLine(BaseModel):
+    line_index: int
+    material_id: int
+    warehouse_id: int
+    batch_id: int
+    stock_id: int
+    quantity: float
+    expiry_date: Optional[date] = None
+
+class AllocationShortage(BaseModel):
+    line_index: int
+    material_id: int
+    requested: float
+    allocated: float
+    missing: float
+
+class AllocationResponse(BaseModel):
+    allocations: List[AllocationLine] = []
+    shortages: List[AllocationShortage] = []
+    reserved: bool = False   # False = chỉ lập kế hoạch (dry run), chưa giữ chỗ
+
+# =========================================================
+# PHIẾU GIỮ CHỖ (RESERVATION CÓ HẠN)
+# =========================================================
+
+# Tạo phiếu giữ chỗ = phân bổ FEFO như /allocate + lưu lại người giữ và hạn giữ
+class ReservationCreate(AllocationRequest):
+    owner: str
+    ttl_minutes: Optional[int] = Field(None, gt=0)   # Để trống = RESERVATION_TTL_MINUTES
+    reference_type: Optional[str] = None
+    reference_id: Optional[int] = None
+    note: Optional[str] = None
+
+class ReservationLineResponse(BaseModel):
+    id: int
+    stock_id: int
+    material_id: int
+    warehouse_id: int
+    batch_id: int
+    quantity: float
+    consumed_quantity: float
+
+    class Config:
+        from_attributes = True
+
+class ReservationResponse(BaseModel):
+    id: int
+    owner: str
+    status: ReservationStatus
+    reference_type: Optional[str] = None
+    reference_id: Optional[int] = None
+    note: Optional[str] = None
+    expires_at: datetime
+    created_at: datetime
+    closed_at: Optional[datetime] = None
+    export_id: Optional[int] = None
+    lines: List[ReservationLineResponse] = []
+
+    class Config:
+        from_attributes = True
+
+# =========================================================
+# TỔNG TỒN THEO VẬT TƯ (BẢNG TỔNG HỢP)
+# =========================================================
+
+class MaterialTotalsRequest(BaseModel):
+    material_ids: List[int]
+    by_warehouse: bool = False   # True: kèm tổng tồn từng kho
+
+class WarehouseStockTotal(BaseModel):
+    warehouse_id: int
+    total_on_hand: float
+    total_reserved: float
+    total_available: float
+
+class MaterialStockTotal(BaseModel):
+    material_id: int
+    total_on_hand: float
+    total_reserved: float
+    total_available: float
+    warehouses: Optional[List[WarehouseStockTotal]] = None
+
+# Vật tư có tồn khả dụng dưới định mức tối thiểu (Material.min_stock_level)
+class LowStockItem(BaseModel):
+    material_id: int
+    material_code: str
+    material_type: Optional[str] = None
+    min_stock_level: float
+    total_on_hand: float
+    total_reserved: float
+    total_available: float
+    shortage: float   # Cần bổ sung thêm bao nhiêu để đạt định mức
+
+# =========================================================
+# TUỔI TỒN / HÀNG CHẬM LUÂN CHUYỂN
+# =========================================================
+
+class StockAgingItem(BaseModel):
+    material_id: int
+    warehouse_id: int
+    material_code: str
+    warehouse_name: str
+    quantity_on_hand: float
+    batch_count: int
+
+    # Số lượng tồn theo nhóm tuổi (ngày kể từ ngày nhập lô)
+    age_0_30: float
+    age_31_90: float
+    age_91_180: float
+    age_over_180: float
+
+    average_age_days: float          # Tuổi bình quân gia quyền theo số lượng
+    oldest_age_days: float
+    last_export_date: Optional[date] = None
+    days_since_last_export: Optional[int] = None
+    issued_in_window: float          # Lượng xuất trong window_days
+    turnover_ratio: Optional[float] = None
+    days_of_cover: Optional[float] = None   # Tồn đủ dùng bao nhiêu ngày theo tốc độ xuất hiện tại
+    is_dead_stock: bool
+    is_slow_moving: bool
+
+class StockAgingReport(BaseModel):
+    as_of: date
+    window_days: int
+    dead_stock_days: int
+    totals: Dict[str, float]
+    items: List[StockAgingItem] = []
+
+# =========================================================
+# ĐỊNH GIÁ TỒN KHO
+# =========================================================
+
+class ValuationLine(BaseModel):
+    material_id: int
+    material_code: str
+    warehouse_id: int
+    warehouse_name: str
+    quantity_on_hand: float
+    fifo_value: float              # Theo giá nhập của từng lô
+    average_unit_cost: float       # Giá bình quân di động của vật tư
+    moving_average_value: float
+    uncosted_quantity: float       # Số lượng thuộc lô chưa có giá (không gắn PO) - tính theo giá bình quân
+
+class ValuationReport(BaseModel):
+    total_quantity: float
+    total_fifo_value: float
+    total_moving_average_value: float
+    lines: List[ValuationLine] = []
\ No newline at end of file
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+from datetime import datetime
 from app.models.machine import MachineStatus, MachineArea  # Import Enum từ model
 
 class MachineBase(BaseModel):
@@ -34,4 +35,27 @@ class MachineStatusUpdate(BaseModel):
     # Mình sửa từ 'str' thành 'MachineStatus' để validate chặt chẽ hơn
     status: MachineStatus 
     reason: Optional[str] = None
-    image_url: Optional[str] = None
\ No newline at end of file
+    image_url: Optional[str] = None
+
+# --- SƠ ĐỒ XƯỞNG: TRẠNG THÁI TỪNG LINE ---
+class MachineLineState(BaseModel):
+    machine_line: int
+    busy: bool = False
+    ticket_id: Optional[int] = None
+    ticket_code: Optional[str] = None
+    basket_id: Optional[int] = None
+    basket_code: Optional[str] = None
+    batch_id: Optional[int] = None
+    internal_batch_code: Optional[str] = None
+    product_id: Optional[int] = None
+    item_code: Optional[str] = None
+    occupied_since: Optional[datetime] = None
+
+class MachineFloorMap(BaseModel):
+    machine_id: int
+    machine_name: str
+    area: Optional[MachineArea] = None
+    status: MachineStatus
+    total_lines: int = 0
+    busy_lines: int = 0
+    lines: List[MachineLineState] = []
\ No newline at end of file
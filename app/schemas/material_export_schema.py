@@ -40,6 +40,8 @@ class MaterialExportBase(BaseModel):
 
 class MaterialExportCreate(MaterialExportBase):
     details: List[MaterialExportDetailCreate]
+    # Xuất theo phiếu giữ chỗ: phần giữ chỗ được chuyển thành xuất kho, phần dư được trả lại
+    reservation_id: Optional[int] = None
 
 class MaterialExportUpdate(BaseModel):
     export_date: Optional[date] = None
@@ -104,4 +104,31 @@ class MaterialReceiptFilter(BaseModel):
     po_id: Optional[int] = None
     declaration_id: Optional[int] = None
     from_date: Optional[date] = None
-    to_date: Optional[date] = None
\ No newline at end of file
+    to_date: Optional[date] = None
+
+# --- NHẬP PACKING LIST (HÀNG LOẠT) ---
+class PackingListRowError(BaseModel):
+    row: int                         # Số dòng trong file (dòng tiêu đề = 1)
+    column: Optional[str] = None
+    message: str
+
+class PackingListLine(BaseModel):
+    row: int
+    material_id: int
+    material_code: str
+    supplier_batch_no: Optional[str] = None
+    received_quantity_kg: float
+    received_quantity_cones: int = 0
+    number_of_pallets: int = 0
+    expiry_date: Optional[date] = None
+    internal_batch_code: Optional[str] = None   # Chỉ có khi đã ghi (dry_run = False)
+
+class PackingListImportResult(BaseModel):
+    receipt_id: int
+    dry_run: bool
+    total_rows: int = 0
+    valid_rows: int = 0
+    imported_rows: int = 0
+    total_quantity_kg: float = 0.0
+    errors: List[PackingListRowError] = []
+    lines: List[PackingListLine] = []
\ No newline at end of file
@@ -0,0 +1,37 @@
+from pydantic import BaseModel
+from typing import Dict, Optional
+from datetime import datetime
+
+from app.models.purchase_order_match import MatchStatus
+
+# --- DÒNG ĐỐI CHIẾU PO - TỜ KHAI - PHIẾU NHẬP ---
+class PurchaseOrderMatchResponse(BaseModel):
+    id: int
+    po_id: int
+    po_number: str
+    vendor_id: Optional[int] = None
+    material_id: int
+    material_code: str
+
+    ordered_quantity: float
+    declared_quantity: float
+    received_quantity: float
+    declared_variance: float    # Khai - Đặt
+    received_variance: float    # Nhận - Khai
+
+    status: MatchStatus
+    matched_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# --- TỔNG HỢP ---
+class MatchStatusCount(BaseModel):
+    lines: int = 0
+    purchase_orders: int = 0
+
+class PurchaseOrderMatchSummary(BaseModel):
+    total_lines: int = 0
+    mismatch_lines: int = 0
+    mismatch_purchase_orders: int = 0
+    by_status: Dict[MatchStatus, MatchStatusCount] = {}
\ No newline at end of file
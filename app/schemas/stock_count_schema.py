@@ -0,0 +1,66 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+
+from app.models.stock_count import StockCountStatus
+
+# --- PHIÊN KIỂM KÊ ---
+class StockCountCreate(BaseModel):
+    warehouse_id: int
+    material_ids: Optional[List[int]] = None   # Để trống = kiểm kê toàn bộ kho
+    note: Optional[str] = None
+    created_by: Optional[str] = None
+
+class StockCountSessionResponse(BaseModel):
+    id: int
+    warehouse_id: int
+    status: StockCountStatus
+    note: Optional[str] = None
+    created_by: Optional[str] = None
+    created_at: datetime
+    posted_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# --- NHẬP SỐ ĐẾM (HÀNG LOẠT) ---
+class StockCountEntry(BaseModel):
+    batch_id: Optional[int] = None
+    batch_code: Optional[str] = None   # Mã lô nội bộ (quét barcode)
+    counted_quantity: float = Field(..., ge=0)
+
+class StockCountSubmit(BaseModel):
+    entries: List[StockCountEntry]
+    # False: số đếm ghi đè số cũ; True: cộng dồn (đếm nhiều lượt / nhiều người cùng 1 lô)
+    accumulate: bool = False
+    counted_by: Optional[str] = None
+
+class StockCountSubmitResult(BaseModel):
+    updated: int = 0             # Dòng có trong số chốt
+    inserted: int = 0            # Lô phát sinh (có hàng nhưng sổ sách không có)
+    unknown_batches: List[str] = []   # Mã lô không tìm thấy
+
+# --- BÁO CÁO CHÊNH LỆCH ---
+class StockCountVarianceLine(BaseModel):
+    line_id: int
+    material_id: int
+    material_code: str
+    batch_id: int
+    internal_batch_code: str
+    expected_quantity: float
+    counted_quantity: Optional[float] = None
+    variance: Optional[float] = None   # Đếm - Sổ sách (NULL nếu chưa đếm)
+
+class StockCountVarianceReport(BaseModel):
+    session_id: int
+    total_lines: int
+    counted_lines: int
+    uncounted_lines: int
+    variance_lines: int
+    total_variance: float
+    lines: List[StockCountVarianceLine] = []
+
+class StockCountPostResult(BaseModel):
+    session: StockCountSessionResponse
+    adjusted_lines: int
+    total_variance: float
\ No newline at end of file
@@ -6,11 +6,14 @@ from datetime import datetime
 
 # Import Model và Schema
 from app.models.batch import Batch, BatchQCStatus
+from app.models.document_sequence import DocumentType
 from app.schemas.batch_schema import BatchCreate, BatchUpdate
+from app.services.document_sequence_service import DocumentSequenceService
 
 class BatchService:
     def __init__(self, db: Session):
         self.db = db
+        self.sequence_service = DocumentSequenceService(db)
 
     def get(self, batch_id: int) -> Optional[Batch]:
         return self.db.query(Batch).filter(Batch.batch_id == batch_id).first()
@@ -58,49 +61,63 @@ class BatchService:
         return query.order_by(desc(Batch.created_at)).offset(skip).limit(limit).all()
 
     # Hàm sinh mã lô nội bộ tự động: V[YY]0001 (VD: V260001)
-    def generate_next_batch_code(self) -> str:
-        # 1. Lấy 2 số cuối của năm hiện tại (VD: 2026 -> "26")
-        current_year = datetime.now().strftime("%y")
-        prefix = f"V{current_year}" # VD: V26
-
-        # 2. Tìm mã lô lớn nhất trong năm nay (Bắt đầu bằng V26...)
-        last_batch = self.db.query(Batch)\
+    # Số lấy từ bộ đếm document_sequences (kỳ = 2 số cuối của năm), cấp theo block cho từng worker
+    # nên các đợt nhập hàng dồn dập không tranh chấp khóa và không phải quét index mã lô.
+    def _find_last_batch_seq(self, prefix: str) -> int:
+        """Số thứ tự lớn nhất đang có trong năm - chỉ dùng 1 lần để khởi tạo bộ đếm của năm mới"""
+        last_batch = self.db.query(Batch.internal_batch_code)\
             .filter(Batch.internal_batch_code.like(f"{prefix}%"))\
             .order_by(desc(Batch.internal_batch_code))\
             .first()
-        
         if not last_batch:
-            # Chưa có lô nào trong năm nay, bắt đầu từ 0001
-            return f"{prefix}0001"
-        
+            return 0
         try:
-            # Lấy mã hiện tại (VD: V260001)
-            current_code = last_batch.internal_batch_code
-            
-            # Cắt bỏ phần prefix (V26) để lấy phần số thứ tự (0001)
-            # len(prefix) = 3 (V + 2 số năm)
-            sequence_part = current_code[len(prefix):] 
-            
-            # Tăng lên 1
-            next_number = int(sequence_part) + 1
-            
-            # Format lại: Prefix + 4 chữ số (đệm số 0)
-            # VD: V26 + 0002
-            return f"{prefix}{next_number:04d}"
+            return int(last_batch[0][len(prefix):])
         except (ValueError, IndexError):
-            # Trường hợp dữ liệu cũ không đúng format, return mã an toàn mặc định
-            return f"{prefix}0001"
+            return 0
 
-    def create(self, obj_in: BatchCreate) -> Batch:
-        # 1. Sinh mã lô nội bộ nếu chưa có
+    def generate_next_batch_code(self) -> str:
+        current_year = datetime.now().strftime("%y")
+        prefix = f"V{current_year}" # VD: V26
+        next_number = self.sequence_service.next_from_block(
+            DocumentType.BATCH, current_year, seed=lambda: self._find_last_batch_seq(prefix)
+        )
+        return f"{prefix}{next_number:04d}"
+
+    def allocate_batch_codes(self, count: int) -> List[str]:
+        """
+        Cấp 1 lần nhiều mã lô liên tiếp (dùng cho nhập hàng loạt).
+        Mã trùng với lô nhập tay đúng định dạng được bỏ qua và cấp bù (1 query kiểm tra mỗi đợt).
+        """
+        current_year = datetime.now().strftime("%y")
+        prefix = f"V{current_year}"
+        codes: List[str] = []
+        while len(codes) < count:
+            numbers = self.sequence_service.allocate(
+                DocumentType.BATCH, current_year, count=count - len(codes), seed=lambda: self._find_last_batch_seq(prefix)
+            )
+            block = [f"{prefix}{n:04d}" for n in numbers]
+            taken = {
+                code for (code,) in self.db.query(Batch.internal_batch_code).filter(Batch.internal_batch_code.in_(block))
+            }
+            codes.extend(code for code in block if code not in taken)
+        return codes
+
+    def create(self, obj_in: BatchCreate, commit: bool = True) -> Batch:
+        """
+        param commit: Nếu False thì chỉ flush (dùng trong Transaction lớn như tạo Phiếu nhập).
+        """
+        # 1. Sinh mã lô nội bộ nếu chưa có (mã từ bộ đếm không bao giờ cấp trùng giữa các request)
         internal_code = obj_in.internal_batch_code
         if not internal_code:
             internal_code = self.generate_next_batch_code()
+            # Chỉ trùng khi có mã lô được nhập tay đúng định dạng -> bỏ qua số đó, lấy số kế tiếp
+            while self.get_by_internal_code(internal_code):
+                internal_code = self.generate_next_batch_code()
 
-        # 2. Kiểm tra trùng mã nội bộ (Double check)
-        if self.get_by_internal_code(internal_code):
-             # Nếu trùng (do race condition), thử sinh lại hoặc báo lỗi
-             raise HTTPException(status_code=400, detail=f"Mã lô nội bộ {internal_code} đã tồn tại. Vui lòng thử lại.")
+        # 2. Kiểm tra trùng mã nội bộ do người dùng nhập
+        elif self.get_by_internal_code(internal_code):
+             raise HTTPException(status_code=400, detail=f"Mã lô nội bộ {internal_code} đã tồn tại.")
 
         # 3. Tạo object Batch
         db_obj = Batch(
@@ -124,8 +141,11 @@ class BatchService:
         )
         
         self.db.add(db_obj)
-        self.db.commit()
-        self.db.refresh(db_obj)
+        if commit:
+            self.db.commit()
+            self.db.refresh(db_obj)
+        else:
+            self.db.flush()
         return db_obj
 
     def update(self, db_obj: Batch, obj_in: BatchUpdate) -> Batch:
@@ -0,0 +1,83 @@
+from functools import lru_cache
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from app.models.bom_detail import BOMComponentType
+
+# Số chữ số thập phân khi lưu kết quả (giống BOMService._execute_bom_calculations)
+BOM_ROUND_DIGITS = 4
+
+# Cột kết quả của calculate_boms
+BOM_RESULT_FIELDS = ["weight_per_yarn_gm", "actual_weight_cal", "weight_percentage", "bom_gm"]
+
+
+@lru_cache(maxsize=4096)
+def parse_dtex(yarn_type_name: Optional[str]) -> float:
+    """dtex = 5 ký tự đầu của mã sợi (VD: "03300-PES-WEISS" -> 3300), không đọc được -> 0"""
+    try:
+        return float((yarn_type_name or "")[:5])
+    except ValueError:
+        return 0.0
+
+
+def to_float_array(values: Iterable, default: float) -> np.ndarray:
+    """Mảng float từ cột DB (Decimal / None), None -> default"""
+    return np.array([default if v is None else float(v) for v in values], dtype=float)
+
+
+def is_filling(component_types: Iterable) -> np.ndarray:
+    """Sợi ngang FILLING chỉ tính 1/2 trọng lượng thực tế"""
+    return np.array([
+        str(getattr(t, "value", t) or "").upper().strip() == BOMComponentType.FILLING.value
+        for t in component_types
+    ], dtype=bool)
+
+
+def _round(values: np.ndarray) -> np.ndarray:
+    """Làm tròn giống round() của Python (np.round lệch 1 đơn vị ở một số giá trị .5)"""
+    return np.array([round(v, BOM_ROUND_DIGITS) for v in values.tolist()], dtype=float)
+
+
+def calculate_boms(
+    bom_index: np.ndarray,
+    threads: np.ndarray,
+    dtex: np.ndarray,
+    twisted: np.ndarray,
+    crossweave_rate: np.ndarray,
+    actual_length_cm: np.ndarray,
+    filling: np.ndarray,
+    target_weight_gm: np.ndarray,
+    total_scrap_rate: np.ndarray,
+    total_shrinkage_rate: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    Tính định mức cho nhiều BOM cùng lúc bằng phép toán trên mảng (cùng công thức Excel với
+    BOMService._execute_bom_calculations, không lặp từng dòng).
+    - Mảng theo dòng chi tiết: bom_index (vị trí BOM của dòng, 0..n-1), threads, dtex, twisted,
+      crossweave_rate, actual_length_cm, filling (bool).
+    - Mảng theo BOM (vị trí = bom_index): target_weight_gm, total_scrap_rate, total_shrinkage_rate.
+    Trả về {weight_per_yarn_gm, actual_weight_cal, weight_percentage, bom_gm} theo dòng chi tiết, đã làm tròn.
+    """
+    scrap = 1 + total_scrap_rate[bom_index] / 100
+    shrinkage = 1 + total_shrinkage_rate[bom_index] / 100
+
+    # Trọng lượng lý thuyết (Cột G)
+    weight_theoretical = (threads * dtex * twisted * (1 + crossweave_rate / 100)) / 10000 * scrap * shrinkage
+
+    # Trọng lượng thực tế (Cột I, hệ số 11000), sợi FILLING chia 2
+    actual_cal = (actual_length_cm / 100) * (dtex / 11000) * threads
+    actual_cal = np.where(filling, actual_cal / 2, actual_cal)
+
+    # Tỷ trọng % trong BOM (Cột J) và định mức g/m (Cột K)
+    total_actual_cal = np.bincount(bom_index, weights=actual_cal, minlength=len(target_weight_gm))[bom_index]
+    safe_total = np.where(total_actual_cal > 0, total_actual_cal, 1.0)
+    percentage = np.where(total_actual_cal > 0, actual_cal / safe_total * 100, 0.0)
+    bom_gm = percentage / 100 * target_weight_gm[bom_index] * scrap
+
+    return {
+        "weight_per_yarn_gm": _round(weight_theoretical),
+        "actual_weight_cal": _round(actual_cal),
+        "weight_percentage": _round(percentage),
+        "bom_gm": _round(bom_gm),
+    }
\ No newline at end of file
@@ -0,0 +1,94 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Dict, List, Optional, Union
+
+from openpyxl import load_workbook
+
+# Module này chỉ phụ thuộc openpyxl để process con (spawn) import nhanh, không kéo theo DB / models.
+
+# Vị trí ô trên mỗi sheet BOM (mỗi sheet = 1 sản phẩm, tên sheet = mã sản phẩm)
+TARGET_WEIGHT_CELL = (3, 11)     # K3
+SCRAP_RATE_CELL = (18, 6)        # F18
+SHRINKAGE_RATE_CELL = (19, 6)    # F19
+DETAIL_FIRST_ROW = 5             # Danh sách sợi: dòng 5 -> 17
+DETAIL_LAST_ROW = 17
+# Cột của dòng sợi: A loại, B số sợi, D mã sợi, E xoắn, F độ dôi, H chiều dài thực tế
+DETAIL_COLUMNS = {"component": 1, "threads": 2, "yarn_type_name": 4, "twisted": 5, "crossweave_rate": 6, "actual_length_cm": 8}
+
+# Chỉ đọc tới ô xa nhất cần dùng (K19), read_only dừng parse XML sau dòng này
+LAST_ROW = max(TARGET_WEIGHT_CELL[0], SCRAP_RATE_CELL[0], SHRINKAGE_RATE_CELL[0], DETAIL_LAST_ROW)
+LAST_COLUMN = max(TARGET_WEIGHT_CELL[1], SCRAP_RATE_CELL[1], SHRINKAGE_RATE_CELL[1], *DETAIL_COLUMNS.values())
+
+# Ít sheet hơn ngưỡng này thì đọc luôn trong process hiện tại (khởi động process con tốn hơn phần tiết kiệm được)
+PARALLEL_MIN_SHEETS = 16
+
+Source = Union[str, bytes]
+
+
+def _open(source: Source):
+    return load_workbook(
+        io.BytesIO(source) if isinstance(source, bytes) else source,
+        read_only=True, data_only=True, keep_links=False
+    )
+
+
+def _cell(grid: List[tuple], cell: tuple) -> Any:
+    row, column = cell
+    if row > len(grid) or column > len(grid[row - 1]):
+        return None
+    return grid[row - 1][column - 1]
+
+
+def _read_sheet(ws) -> Dict[str, Any]:
+    """Giá trị thô (chưa kiểm tra) của 1 sheet BOM"""
+    grid = list(ws.iter_rows(min_row=1, max_row=LAST_ROW, max_col=LAST_COLUMN, values_only=True))
+    lines = []
+    for row in range(DETAIL_FIRST_ROW, DETAIL_LAST_ROW + 1):
+        line = {name: _cell(grid, (row, column)) for name, column in DETAIL_COLUMNS.items()}
+        line["row"] = row
+        lines.append(line)
+    return {
+        "target_weight_gm": _cell(grid, TARGET_WEIGHT_CELL),
+        "total_scrap_rate": _cell(grid, SCRAP_RATE_CELL),
+        "total_shrinkage_rate": _cell(grid, SHRINKAGE_RATE_CELL),
+        "lines": lines,
+    }
+
+
+def _read_all(workbook, sheet_names: List[str]) -> List[Dict[str, Any]]:
+    return [{"sheet_name": name, **_read_sheet(workbook[name])} for name in sheet_names]
+
+
+def read_sheets(source: Source, sheet_names: List[str]) -> List[Dict[str, Any]]:
+    """Mở workbook 1 lần (read_only) và đọc các sheet được giao -> [{sheet_name, target_weight_gm, ..., lines}]"""
+    workbook = _open(source)
+    try:
+        return _read_all(workbook, sheet_names)
+    finally:
+        workbook.close()
+
+
+def read_workbook(source: Source, workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Đọc mọi sheet BOM của workbook (giữ thứ tự sheet).
+    Nhiều sheet -> chia đều cho `workers` process (mặc định = số CPU), mỗi process mở workbook 1 lần
+    và đọc phần sheet của mình. workers = 1 hoặc ít sheet: đọc tuần tự trên workbook đã mở.
+    """
+    workbook = _open(source)
+    try:
+        names = list(workbook.sheetnames)
+        workers = min(workers or os.cpu_count() or 1, len(names))
+        if workers <= 1 or len(names) < PARALLEL_MIN_SHEETS:
+            return _read_all(workbook, names)
+    finally:
+        workbook.close()
+
+    chunks = [names[i::workers] for i in range(workers)]
+    # spawn: không fork process web server đang chạy nhiều thread
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        results = list(pool.map(read_sheets, [source] * workers, chunks))
+
+    by_name = {sheet["sheet_name"]: sheet for chunk in results for sheet in chunk}
+    return [by_name[name] for name in names]
\ No newline at end of file
@@ -1,6 +1,9 @@
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, update, bindparam
 from fastapi import HTTPException
+from typing import Dict, List
+
+import numpy as np
 
 # Import Models
 from app.models.bom_header import BOMHeader
@@ -8,7 +11,9 @@ from app.models.bom_detail import BOMDetail
 from app.models.product import Product
 
 # Import Schemas
-from app.schemas.bom_schema import BOMHeaderCreate, BOMHeaderUpdate, BOMDetailCreate
+from app.schemas.bom_schema import BOMHeaderCreate, BOMHeaderUpdate, BOMDetailCreate, BOMBulkRecalculate
+from app.services import bom_calculator
+from app.services.bom_simulation_service import invalidate_simulations
 
 class BOMService:
     
@@ -187,6 +192,7 @@ class BOMService:
             db_bom.bom_details = new_details
 
         db.commit()
+        invalidate_simulations([bom_id])
         db.refresh(db_bom)
         return db_bom
 
@@ -196,6 +202,7 @@ class BOMService:
         if db_bom:
             db.delete(db_bom)
             db.commit()
+            invalidate_simulations([bom_id])
             return True
         return False
 
@@ -204,12 +211,21 @@ class BOMService:
         """
         Tìm kiếm BOM theo Product Code và Năm (Thay vì bom_code)
         """
-        query = db.query(BOMHeader).join(Product)
+        query = BOMService._filter_boms(db.query(BOMHeader), product_code=product_code, year=year, is_active=is_active)
+        return query.options(joinedload(BOMHeader.bom_details)).all()
+
+    @staticmethod
+    def _filter_boms(query, product_code: str = None, year: int = None, is_active: bool = None, product_ids: List[int] = None):
+        """Bộ lọc BOM dùng chung cho tìm kiếm và tính lại hàng loạt"""
+        query = query.join(Product, Product.product_id == BOMHeader.product_id)
 
         # Filter theo Product Code
         if product_code:
             # Giả sử trường code trong Product là item_code
             query = query.filter(Product.item_code.ilike(f"%{product_code}%")) 
+
+        if product_ids:
+            query = query.filter(BOMHeader.product_id.in_(product_ids))
         
         # Filter theo Năm (Exact match)
         if year:
@@ -218,4 +234,100 @@ class BOMService:
         if is_active is not None:
             query = query.filter(BOMHeader.is_active == is_active)
 
-        return query.options(joinedload(BOMHeader.bom_details)).all()
\ No newline at end of file
+        return query
+
+    @staticmethod
+    def bulk_recalculate(db: Session, bulk_in: BOMBulkRecalculate) -> Dict[str, int]:
+        """
+        Đổi thông số header (hao hụt / co rút / trọng lượng mục tiêu) cho mọi BOM theo bộ lọc sản phẩm
+        và tính lại toàn bộ chi tiết trong 1 transaction:
+        - 1 query header, 1 query chi tiết, tính bằng NumPy (bom_calculator.calculate_boms).
+        - 1 lệnh UPDATE header + 1 lệnh UPDATE executemany cho chi tiết.
+        Không đổi thông số nào = chỉ tính lại theo thông số hiện tại.
+        """
+        changes = bulk_in.model_dump(include={"target_weight_gm", "total_scrap_rate", "total_shrinkage_rate"}, exclude_none=True)
+
+        headers = BOMService._filter_boms(
+            db.query(
+                BOMHeader.bom_id,
+                BOMHeader.target_weight_gm,
+                BOMHeader.total_scrap_rate,
+                BOMHeader.total_shrinkage_rate
+            ),
+            product_code=bulk_in.product_code,
+            year=bulk_in.applicable_year,
+            is_active=bulk_in.is_active,
+            product_ids=bulk_in.product_ids
+        ).order_by(BOMHeader.bom_id).all()
+        if not headers:
+            return {"boms_updated": 0, "details_updated": 0}
+
+        bom_ids = [h.bom_id for h in headers]
+        position = {bom_id: i for i, bom_id in enumerate(bom_ids)}
+
+        target = bom_calculator.to_float_array((h.target_weight_gm for h in headers), 0.0)
+        scrap = bom_calculator.to_float_array((h.total_scrap_rate for h in headers), 0.0)
+        shrinkage = bom_calculator.to_float_array((h.total_shrinkage_rate for h in headers), 0.0)
+        if "target_weight_gm" in changes:
+            target[:] = changes["target_weight_gm"]
+        if "total_scrap_rate" in changes:
+            scrap[:] = changes["total_scrap_rate"]
+        if "total_shrinkage_rate" in changes:
+            shrinkage[:] = changes["total_shrinkage_rate"]
+
+        details = db.query(
+            BOMDetail.detail_id,
+            BOMDetail.bom_id,
+            BOMDetail.component_type,
+            BOMDetail.threads,
+            BOMDetail.yarn_dtex,
+            BOMDetail.yarn_type_name,
+            BOMDetail.twisted,
+            BOMDetail.crossweave_rate,
+            BOMDetail.actual_length_cm
+        ).filter(BOMDetail.bom_id.in_(bom_ids)).order_by(BOMDetail.bom_id, BOMDetail.detail_id).all()
+
+        if changes:
+            header_table = BOMHeader.__table__
+            db.execute(update(header_table).where(header_table.c.bom_id.in_(bom_ids)).values(**changes))
+
+        if details:
+            # dtex: lấy giá trị đã lưu, chưa có thì tách từ mã sợi
+            dtex = np.array([
+                float(d.yarn_dtex) if d.yarn_dtex is not None else bom_calculator.parse_dtex(d.yarn_type_name)
+                for d in details
+            ], dtype=float)
+            results = bom_calculator.calculate_boms(
+                bom_index=np.array([position[d.bom_id] for d in details], dtype=np.intp),
+                threads=bom_calculator.to_float_array((d.threads for d in details), 0.0),
+                dtex=dtex,
+                twisted=bom_calculator.to_float_array((d.twisted for d in details), 1.0),
+                crossweave_rate=bom_calculator.to_float_array((d.crossweave_rate for d in details), 0.0),
+                actual_length_cm=bom_calculator.to_float_array((d.actual_length_cm for d in details), 0.0),
+                filling=bom_calculator.is_filling(d.component_type for d in details),
+                target_weight_gm=target,
+                total_scrap_rate=scrap,
+                total_shrinkage_rate=shrinkage
+            )
+
+            columns = {name: results[name].tolist() for name in bom_calculator.BOM_RESULT_FIELDS}
+            dtex_values = dtex.tolist()
+            detail_table = BOMDetail.__table__
+            db.execute(
+                update(detail_table).where(detail_table.c.detail_id == bindparam("_detail_id")).values(
+                    yarn_dtex=bindparam("_yarn_dtex"),
+                    **{name: bindparam(f"_{name}") for name in bom_calculator.BOM_RESULT_FIELDS}
+                ),
+                [
+                    {
+                        "_detail_id": d.detail_id,
+                        "_yarn_dtex": dtex_values[i],
+                        **{f"_{name}": columns[name][i] for name in bom_calculator.BOM_RESULT_FIELDS}
+                    }
+                    for i, d in enumerate(details)
+                ]
+            )
+
+        db.commit()
+        invalidate_simulations(bom_ids)
+        return {"boms_updated": len(bom_ids), "details_updated": len(details)}
\ No newline at end of file
@@ -0,0 +1,186 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.models.bom_header import BOMHeader
+from app.models.bom_detail import BOMDetail
+from app.schemas.bom_schema import (
+    BOMDetailCreate,
+    BOMSimulationRequest,
+    BOMSimulatedDetail,
+    BOMSimulationResult
+)
+from app.services import bom_calculator
+
+# Cache kết quả mô phỏng theo hash của input (LRU, giới hạn số phần tử)
+SIMULATION_CACHE_SIZE = 512
+# Cache nằm trong từng process: BOM bị sửa ở worker khác chỉ được cập nhật sau tối đa TTL
+SIMULATION_CACHE_TTL_SECONDS = 600
+
+# {hash input: (bom_id gốc, hết hạn lúc, kết quả)}
+_cache: "OrderedDict[str, Tuple[Optional[int], float, BOMSimulationResult]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_key(sim_in: BOMSimulationRequest) -> str:
+    return hashlib.sha256(sim_in.model_dump_json().encode()).hexdigest()
+
+
+def invalidate_simulations(bom_ids: Optional[Iterable[int]] = None) -> None:
+    """Xóa cache mô phỏng của các BOM vừa bị sửa / xóa (None = xóa hết)"""
+    with _cache_lock:
+        if bom_ids is None:
+            _cache.clear()
+            return
+        bom_ids = set(bom_ids)
+        for key in [k for k, v in _cache.items() if v[0] in bom_ids]:
+            del _cache[key]
+
+
+def _base_detail(d: BOMDetail) -> BOMDetailCreate:
+    return BOMDetailCreate(
+        component_type=d.component_type,
+        material_id=d.material_id,
+        threads=d.threads or 0,
+        yarn_type_name=d.yarn_type_name or "",
+        twisted=1.0 if d.twisted is None else float(d.twisted),
+        crossweave_rate=float(d.crossweave_rate or 0.0),
+        actual_length_cm=float(d.actual_length_cm or 0.0)
+    )
+
+
+def _load_base(db: Session, sim_in: BOMSimulationRequest):
+    """
+    Ghép BOM cần tính: [(detail_id gốc hoặc None, chi tiết)], thông số header, các dòng gốc.
+    Chỉ đọc DB (2 query), không ghi gì.
+    """
+    if sim_in.bom_id is None:
+        if sim_in.target_weight_gm is None or sim_in.details is None:
+            raise HTTPException(status_code=400, detail="Cần bom_id hoặc target_weight_gm + details để mô phỏng")
+        header = {
+            "target_weight_gm": sim_in.target_weight_gm,
+            "total_scrap_rate": sim_in.total_scrap_rate or 0.0,
+            "total_shrinkage_rate": sim_in.total_shrinkage_rate or 0.0,
+        }
+        return [(None, d) for d in sim_in.details], header, {}
+
+    db_bom = db.query(BOMHeader).filter(BOMHeader.bom_id == sim_in.bom_id).first()
+    if not db_bom:
+        raise HTTPException(status_code=404, detail="BOM not found")
+    base_rows = db.query(BOMDetail).filter(BOMDetail.bom_id == sim_in.bom_id).order_by(BOMDetail.detail_id).all()
+    base = {d.detail_id: d for d in base_rows}
+
+    header = {
+        "target_weight_gm": float(db_bom.target_weight_gm or 0.0),
+        "total_scrap_rate": float(db_bom.total_scrap_rate or 0.0),
+        "total_shrinkage_rate": float(db_bom.total_shrinkage_rate or 0.0),
+    }
+    header.update(sim_in.model_dump(include=set(header), exclude_none=True))
+
+    # Thay toàn bộ chi tiết -> không ghép được theo dòng, chỉ so tổng định mức
+    if sim_in.details is not None:
+        return [(None, d) for d in sim_in.details], header, base
+
+    unknown = {c.detail_id for c in sim_in.detail_changes} | set(sim_in.remove_detail_ids)
+    unknown -= set(base)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Chi tiết ID {sorted(unknown)} không thuộc BOM {sim_in.bom_id}"
+        )
+
+    changes = {c.detail_id: c.model_dump(exclude={"detail_id"}, exclude_none=True) for c in sim_in.detail_changes}
+    removed = set(sim_in.remove_detail_ids)
+    lines = []
+    for detail_id, d in base.items():
+        if detail_id in removed:
+            continue
+        line = _base_detail(d)
+        if detail_id in changes:
+            line = BOMDetailCreate(**{**line.model_dump(exclude={"yarn_dtex"}), **changes[detail_id]})
+        lines.append((detail_id, line))
+    lines.extend((None, d) for d in sim_in.add_details)
+    return lines, header, base
+
+
+def _delta(new: float, old) -> Optional[float]:
+    return None if old is None else round(new - float(old), bom_calculator.BOM_ROUND_DIGITS)
+
+
+def _simulate(db: Session, sim_in: BOMSimulationRequest) -> BOMSimulationResult:
+    lines, header, base = _load_base(db, sim_in)
+
+    details: List[BOMSimulatedDetail] = []
+    if lines:
+        items = [d for _, d in lines]
+        results = bom_calculator.calculate_boms(
+            bom_index=np.zeros(len(items), dtype=np.intp),
+            threads=np.array([d.threads for d in items], dtype=float),
+            dtex=np.array([d.yarn_dtex for d in items], dtype=float),
+            twisted=np.array([d.twisted for d in items], dtype=float),
+            crossweave_rate=np.array([d.crossweave_rate for d in items], dtype=float),
+            actual_length_cm=np.array([d.actual_length_cm for d in items], dtype=float),
+            filling=bom_calculator.is_filling(d.component_type for d in items),
+            target_weight_gm=np.array([header["target_weight_gm"]], dtype=float),
+            total_scrap_rate=np.array([header["total_scrap_rate"]], dtype=float),
+            total_shrinkage_rate=np.array([header["total_shrinkage_rate"]], dtype=float)
+        )
+        columns = {name: results[name].tolist() for name in bom_calculator.BOM_RESULT_FIELDS}
+
+        for i, (detail_id, d) in enumerate(lines):
+            computed = {name: columns[name][i] for name in bom_calculator.BOM_RESULT_FIELDS}
+            old = base.get(detail_id)
+            details.append(BOMSimulatedDetail(
+                detail_id=detail_id,
+                **d.model_dump(),
+                **computed,
+                delta_weight_per_yarn_gm=_delta(computed["weight_per_yarn_gm"], old.weight_per_yarn_gm) if old else None,
+                delta_weight_percentage=_delta(computed["weight_percentage"], old.weight_percentage) if old else None,
+                delta_bom_gm=_delta(computed["bom_gm"], old.bom_gm) if old else None
+            ))
+
+    total_bom_gm = round(sum(d.bom_gm for d in details), bom_calculator.BOM_ROUND_DIGITS)
+    base_total = None
+    if sim_in.bom_id is not None:
+        base_total = round(sum(float(d.bom_gm or 0.0) for d in base.values()), bom_calculator.BOM_ROUND_DIGITS)
+
+    kept = {d.detail_id for d in details}
+    return BOMSimulationResult(
+        bom_id=sim_in.bom_id,
+        **header,
+        total_bom_gm=total_bom_gm,
+        base_total_bom_gm=base_total,
+        delta_total_bom_gm=_delta(total_bom_gm, base_total),
+        details=details,
+        removed_detail_ids=[detail_id for detail_id in base if detail_id not in kept]
+    )
+
+
+def simulate_bom(db: Session, sim_in: BOMSimulationRequest) -> BOMSimulationResult:
+    """
+    Chạy công thức định mức trên BOM gửi lên (hoặc BOM gốc + thay đổi) hoàn toàn trong bộ nhớ, không ghi DB.
+    - delta_*: chênh lệch so với số đang lưu của dòng gốc / tổng định mức gốc.
+    - Kết quả cache theo hash của input -> chỉnh đi chỉnh lại trên UI trả về ngay (cached = True).
+    """
+    key = _cache_key(sim_in)
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[1] > now:
+            _cache.move_to_end(key)
+            return entry[2].model_copy(update={"cached": True})
+
+    result = _simulate(db, sim_in)
+
+    with _cache_lock:
+        _cache[key] = (sim_in.bom_id, now + SIMULATION_CACHE_TTL_SECONDS, result)
+        _cache.move_to_end(key)
+        while len(_cache) > SIMULATION_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
\ No newline at end of file
@@ -0,0 +1,143 @@
+import threading
+from sqlalchemy.orm import Session
+from sqlalchemy import update, insert, select, case, create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import NullPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.models.document_sequence import DocumentSequence, DocumentType
+
+# Block số đã cấp sẵn cho tiến trình hiện tại: {(doc_type, period): [[số kế tiếp, số cuối block], ...]}
+_block_lock = threading.Lock()
+_blocks: Dict[Tuple[str, str], List[List[int]]] = {}
+
+# Engine không pool dùng để xin block: không chiếm connection của pool chung
+# (pool đầy thì các request đang giữ connection vẫn xin được block mới)
+_engine_lock = threading.Lock()
+_autonomous_engines: Dict[str, Engine] = {}
+
+
+def _autonomous_engine(bind) -> Engine:
+    engine = bind.engine
+    key = engine.url.render_as_string(hide_password=False)
+    with _engine_lock:
+        if key not in _autonomous_engines:
+            _autonomous_engines[key] = create_engine(engine.url, poolclass=NullPool)
+        return _autonomous_engines[key]
+
+class DocumentSequenceService:
+    """
+    Cấp số chứng từ từ bảng bộ đếm document_sequences (thay cho LIKE 'prefix%' ORDER BY DESC).
+    - allocate(): tăng bộ đếm nguyên tử trong transaction của người gọi -> liên tục, không nhảy số.
+    - next_from_block(): lấy từ block cấp sẵn cho tiến trình -> không tranh chấp khóa,
+      đổi lại có thể nhảy số nếu tiến trình dừng giữa chừng (dùng cho mã nội bộ như mã lô).
+    - seed: hàm trả về số lớn nhất đang có trong bảng chứng từ, chỉ gọi 1 lần khi kỳ mới chưa có bộ đếm.
+    """
+    table = DocumentSequence.__table__
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _key_filter(self, doc_type: DocumentType, period: str):
+        return (self.table.c.doc_type == doc_type.value) & (self.table.c.period == period)
+
+    def _get_last_value(self, doc_type: DocumentType, period: str) -> Optional[int]:
+        return self.db.execute(
+            select(self.table.c.last_value).where(self._key_filter(doc_type, period))
+        ).scalar()
+
+    def _ensure_counter(self, doc_type: DocumentType, period: str, seed: Optional[Callable[[], int]]):
+        """Tạo dòng bộ đếm cho kỳ mới (an toàn khi 2 request cùng tạo: bên thua bỏ qua lỗi trùng)"""
+        start_value = seed() if seed else 0
+        try:
+            with self.db.begin_nested():
+                self.db.execute(
+                    insert(self.table).values(doc_type=doc_type.value, period=period, last_value=start_value or 0)
+                )
+        except IntegrityError:
+            pass
+
+    def allocate(
+        self,
+        doc_type: DocumentType,
+        period: str = "",
+        count: int = 1,
+        seed: Optional[Callable[[], int]] = None
+    ) -> range:
+        """
+        Cấp `count` số liên tiếp. Dòng bộ đếm bị khóa tới khi người gọi commit/rollback,
+        nên rollback thì số được trả lại -> không nhảy số.
+        """
+        stmt = update(self.table)\
+            .where(self._key_filter(doc_type, period))\
+            .values(last_value=self.table.c.last_value + count)
+
+        if self.db.execute(stmt).rowcount == 0:
+            self._ensure_counter(doc_type, period, seed)
+            self.db.execute(stmt)
+
+        last_value = self._get_last_value(doc_type, period)
+        return range(last_value - count + 1, last_value + 1)
+
+    def peek(self, doc_type: DocumentType, period: str = "", seed: Optional[Callable[[], int]] = None) -> int:
+        """Xem trước số kế tiếp (không cấp số) - dùng cho các API /next-number"""
+        last_value = self._get_last_value(doc_type, period)
+        if last_value is None:
+            last_value = seed() if seed else 0
+        return (last_value or 0) + 1
+
+    def sync_to(self, doc_type: DocumentType, period: str, value: int, seed: Optional[Callable[[], int]] = None):
+        """
+        Đẩy bộ đếm lên tối thiểu `value` khi chứng từ được tạo với số do người dùng nhập
+        (VD: lấy từ /next-number rồi gửi lên), để lần cấp sau không bị trùng.
+        """
+        stmt = update(self.table)\
+            .where(self._key_filter(doc_type, period))\
+            .values(last_value=case((self.table.c.last_value < value, value), else_=self.table.c.last_value))
+
+        if self.db.execute(stmt).rowcount == 0:
+            self._ensure_counter(doc_type, period, seed)
+            self.db.execute(stmt)
+
+    def next_from_block(
+        self,
+        doc_type: DocumentType,
+        period: str = "",
+        block_size: int = 50,
+        seed: Optional[Callable[[], int]] = None
+    ) -> int:
+        """
+        Lấy 1 số từ block cấp sẵn của tiến trình (worker).
+        Hết block thì xin block mới bằng 1 transaction riêng (connection riêng, ngoài khóa tiến trình),
+        commit ngay để giải phóng khóa dòng bộ đếm.
+        SQLite khóa cả file khi ghi, transaction riêng sẽ chờ chính request đang gọi -> cấp luôn
+        trong transaction của người gọi (như allocate), không dùng block.
+        """
+        if self.db.get_bind().dialect.name == "sqlite":
+            return self.allocate(doc_type, period, 1, seed).start
+
+        key = (doc_type.value, period)
+        while True:
+            with _block_lock:
+                blocks = _blocks.setdefault(key, [])
+                while blocks and blocks[0][0] > blocks[0][1]:
+                    blocks.pop(0)
+                if blocks:
+                    value = blocks[0][0]
+                    blocks[0][0] += 1
+                    return value
+
+            # Không giữ _block_lock khi chờ DB: dòng bộ đếm có thể đang bị 1 transaction allocate() khóa
+            numbers = self._allocate_autonomous(doc_type, period, block_size, seed)
+            with _block_lock:
+                _blocks.setdefault(key, []).append([numbers.start, numbers.stop - 1])
+
+    def _allocate_autonomous(
+        self, doc_type: DocumentType, period: str, count: int, seed: Optional[Callable[[], int]]
+    ) -> range:
+        """Cấp số trong 1 Session riêng (không dính transaction của request hiện tại)"""
+        with Session(bind=_autonomous_engine(self.db.get_bind())) as session:
+            numbers = DocumentSequenceService(session).allocate(doc_type, period, count, seed)
+            session.commit()
+            return numbers
\ No newline at end of file
@@ -1,91 +1,377 @@
-import pandas as pd
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import bindparam, func, insert, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.db.session import SessionLocal, engine
+
+from app.db.session import SessionLocal
+from app.db.base import Base  # Nạp đủ models để mapper resolve quan hệ khi chạy CLI
 from app.models.product import Product
-from app.services.bom_service import BOMService
-from app.schemas.bom_schema import BOMHeaderCreate, BOMDetailCreate
-from app.models.bom_detail import BOMComponentType
-from app.db.base import Base
+from app.models.bom_header import BOMHeader
+from app.models.bom_detail import BOMDetail, BOMComponentType
+from app.schemas.bom_schema import BOMDetailCreate
+from app.services import bom_calculator
+from app.services.bom_excel_reader import Source, read_workbook
+from app.services.bom_simulation_service import invalidate_simulations
 
-def import_bom_from_excel(file_path: str):
-    db: Session = SessionLocal()
+_COMPONENT_TYPES = {t.value: t for t in BOMComponentType}
+_ITEM_CODE_LENGTH = Product.__table__.c.item_code.type.length
+_YARN_TYPE_LENGTH = BOMDetail.__table__.c.yarn_type_name.type.length
+
+
+def map_excel_to_enum(excel_name: Any) -> Optional[BOMComponentType]:
+    """Tên loại sợi trong Excel (Ground, Grd. Marker, Catch cord, 2nd Filling...) -> Enum, không nhận ra -> None"""
+    return _COMPONENT_TYPES.get(str(excel_name or "").strip().upper())
+
+
+def resolve_year(filename: Optional[str], applicable_year: Optional[int]) -> int:
+    """Năm áp dụng: tham số truyền vào, không có thì lấy năm trong tên file (VD: "BOM YARN 2025.xlsm")"""
+    if applicable_year:
+        return applicable_year
+    match = re.search(r"(?<!\d)(20\d{2})(?!\d)", filename or "")
+    if not match:
+        raise HTTPException(status_code=400, detail="Cần applicable_year (tên file không chứa năm áp dụng).")
+    return int(match.group(1))
+
+
+def _is_blank(value: Any) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _number(value: Any, default: Optional[float] = None) -> Optional[float]:
+    if _is_blank(value):
+        return default
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(str(value).strip().replace(",", "."))
+
+
+# =========================
+# KIỂM TRA TỪNG SHEET (không ghi DB)
+# =========================
+def _validate_sheet(raw: Dict[str, Any]) -> Tuple[Dict[str, Any], List[BOMDetailCreate]]:
+    report: Dict[str, Any] = {"sheet_name": raw["sheet_name"], "status": "create", "errors": [], "warnings": []}
+    errors, warnings = report["errors"], report["warnings"]
+
+    item_code = raw["sheet_name"].strip()
+    if not item_code:
+        errors.append("Tên sheet (mã sản phẩm) trống")
+    elif len(item_code) > _ITEM_CODE_LENGTH:
+        errors.append(f"Tên sheet dài quá {_ITEM_CODE_LENGTH} ký tự")
+
+    header = {}
+    invalid_cells = set()
+    for name, cell, default in (
+        ("target_weight_gm", "K3", None),
+        ("total_scrap_rate", "F18", 0.0),
+        ("total_shrinkage_rate", "F19", 0.0),
+    ):
+        try:
+            header[name] = _number(raw[name], default)
+        except ValueError:
+            header[name] = None
+            invalid_cells.add(name)
+            errors.append(f"Ô {cell}: '{raw[name]}' không phải số")
+    report.update(header)
+
+    details: List[BOMDetailCreate] = []
+    for line in raw["lines"]:
+        row = line["row"]
+        if _is_blank(line["yarn_type_name"]):
+            continue
+        try:
+            threads = _number(line["threads"], 0.0)
+        except ValueError:
+            errors.append(f"Dòng {row}: số sợi '{line['threads']}' không phải số")
+            continue
+        # Chỉ lấy dòng có số sợi > 0 và có mã sợi
+        if threads <= 0:
+            continue
+        if not threads.is_integer():
+            errors.append(f"Dòng {row}: số sợi {threads:g} phải là số nguyên")
+            continue
+
+        yarn_type_name = str(line["yarn_type_name"]).strip()
+        if len(yarn_type_name) > _YARN_TYPE_LENGTH:
+            errors.append(f"Dòng {row}: mã sợi dài quá {_YARN_TYPE_LENGTH} ký tự")
+            continue
+
+        component_type = map_excel_to_enum(line["component"])
+        if component_type is None:
+            component_type = BOMComponentType.GROUND
+            warnings.append(f"Dòng {row}: loại sợi '{line['component']}' không nhận ra, tính là GROUND")
+
+        values = {}
+        for name, column, default in (("twisted", "E", 1.0), ("crossweave_rate", "F", 0.0), ("actual_length_cm", "H", 0.0)):
+            try:
+                values[name] = _number(line[name], default)
+            except ValueError:
+                errors.append(f"Dòng {row}: ô {column}{row} '{line[name]}' không phải số")
+        if len(values) < 3:
+            continue
+
+        try:
+            details.append(BOMDetailCreate(
+                component_type=component_type,
+                threads=int(threads),
+                yarn_type_name=yarn_type_name,
+                **values
+            ))
+        except ValidationError as e:
+            errors.append(f"Dòng {row}: {e.errors()[0]['msg']}")
+
+    target_weight = header["target_weight_gm"]
+    if target_weight is None and not details and not errors:
+        # Sheet không có dữ liệu BOM (VD: sheet hướng dẫn / tổng hợp) -> bỏ qua
+        report["status"] = "skipped"
+        warnings.append("Sheet không có trọng lượng mục tiêu (K3) và dòng sợi nào, bỏ qua")
+        return report, []
+
+    if "target_weight_gm" not in invalid_cells:
+        if target_weight is None:
+            errors.append("Ô K3: thiếu trọng lượng mục tiêu")
+        elif target_weight <= 0:
+            errors.append("Ô K3: trọng lượng mục tiêu phải > 0")
+    if not details and not errors:
+        errors.append("Không có dòng sợi nào (dòng 5-17 cần số sợi > 0 và mã sợi)")
+
+    if errors:
+        report["status"] = "error"
+    report["detail_count"] = len(details)
+    return report, details
+
+
+def _calculate(sheets: List[Tuple[Dict[str, Any], List[BOMDetailCreate]]]) -> List[Dict[str, Any]]:
+    """Tính định mức cho mọi sheet hợp lệ cùng lúc -> danh sách dòng chi tiết (có sheet_index)"""
+    items = [(i, d) for i, (_, details) in enumerate(sheets) for d in details]
+    if not items:
+        return []
+    reports = [report for report, _ in sheets]
+    results = bom_calculator.calculate_boms(
+        bom_index=np.array([i for i, _ in items], dtype=np.intp),
+        threads=np.array([d.threads for _, d in items], dtype=float),
+        dtex=np.array([d.yarn_dtex for _, d in items], dtype=float),
+        twisted=np.array([d.twisted for _, d in items], dtype=float),
+        crossweave_rate=np.array([d.crossweave_rate for _, d in items], dtype=float),
+        actual_length_cm=np.array([d.actual_length_cm for _, d in items], dtype=float),
+        filling=bom_calculator.is_filling(d.component_type for _, d in items),
+        target_weight_gm=np.array([r["target_weight_gm"] for r in reports], dtype=float),
+        total_scrap_rate=np.array([r["total_scrap_rate"] for r in reports], dtype=float),
+        total_shrinkage_rate=np.array([r["total_shrinkage_rate"] for r in reports], dtype=float)
+    )
+    columns = {name: results[name].tolist() for name in bom_calculator.BOM_RESULT_FIELDS}
+
+    rows = []
+    for k, (i, d) in enumerate(items):
+        rows.append({
+            "sheet_index": i,
+            **d.model_dump(),
+            **{name: columns[name][k] for name in bom_calculator.BOM_RESULT_FIELDS}
+        })
+    totals = np.bincount(
+        np.array([i for i, _ in items], dtype=np.intp), weights=results["bom_gm"], minlength=len(sheets)
+    )
+    for report, total in zip(reports, totals.tolist()):
+        report["total_bom_gm"] = round(total, bom_calculator.BOM_ROUND_DIGITS)
+    return rows
+
+
+# =========================
+# IMPORT
+# =========================
+def import_boms(
+    db: Session,
+    source: Source,
+    applicable_year: int,
+    dry_run: bool = False,
+    workers: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Import BOM từ file Excel (mỗi sheet = 1 sản phẩm, tên sheet = mã sản phẩm).
+    - Đọc đúng các ô cần dùng bằng openpyxl read_only, nhiều sheet thì đọc song song bằng process pool.
+    - Kiểm tra toàn bộ file trước khi ghi, trả về báo cáo theo từng sheet.
+    - dry_run=True: chỉ kiểm tra + tính thử, không ghi gì.
+    - Ghi thật: có sheet lỗi thì trả 400 kèm báo cáo, không ghi sheet nào.
+      Sản phẩm mới, header và chi tiết được insert hàng loạt trong 1 transaction;
+      (sản phẩm, năm) đã có BOM thì cập nhật header, tăng version và thay toàn bộ chi tiết.
+    """
     try:
-        # Đọc tất cả các sheet (sheet_name=None trả về dict {sheet_name: dataframe})
-        excel_data = pd.read_excel(file_path, sheet_name=None, header=None)
-
-        for sheet_name, df in excel_data.items():
-            print(f"--- Đang xử lý sản phẩm: {sheet_name} ---")
-
-            # 1. Kiểm tra hoặc tạo Product
-            product = db.query(Product).filter(Product.item_code == sheet_name).first()
-            if not product:
-                product = Product(item_code=sheet_name, note=f"Imported from {sheet_name}")
-                db.add(product)
-                db.commit()
-                db.refresh(product)
-
-            # 2. Thu thập thông số Header (Dựa trên tọa độ ô trong ảnh)
-            # Lưu ý: pandas index bắt đầu từ 0 (Hàng 1 -> index 0, Cột A -> index 0)
-            target_weight = df.iloc[2, 10]  # Ô K3 (Row 3, Col K)
-            scrap_rate = df.iloc[17, 5]     # Ô F18 (Row 18, Col F)
-            shrinkage_rate = df.iloc[18, 5] # Ô F19 (Row 19, Col F)
-
-            # 3. Duyệt danh sách sợi (Dòng 5 đến 17)
-            bom_details = []
-            # Bắt đầu từ hàng index 4 (Dòng 5 thực tế)
-            for i in range(4, 17):
-                comp_name = str(df.iloc[i, 0]).strip() # Cột A: Loại (Ground, Binder...)
-                threads = df.iloc[i, 1]                # Cột B: Threads
-                yarn_type = df.iloc[i, 3]               # Cột D: Type (Mã sợi)
-                
-                # Chỉ xử lý nếu có số lượng sợi > 0 và có mã sợi
-                if pd.notna(threads) and threads > 0 and pd.notna(yarn_type):
-                    # Mapping tên từ Excel sang Enum của chúng ta
-                    comp_type = map_excel_to_enum(comp_name)
-                    
-                    detail = BOMDetailCreate(
-                        component_type=comp_type,
-                        threads=int(threads),
-                        yarn_type_name=str(yarn_type),
-                        twisted=float(df.iloc[i, 4]) if pd.notna(df.iloc[i, 4]) else 1.0, # Cột E
-                        crossweave_rate=float(df.iloc[i, 5]) if pd.notna(df.iloc[i, 5]) else 0.0, # Cột F
-                        actual_length_cm=float(df.iloc[i, 7]) if pd.notna(df.iloc[i, 7]) else 0.0 # Cột H
-                    )
-                    bom_details.append(detail)
-
-            # 4. Gọi Service để tính toán và lưu vào DB
-            bom_in = BOMHeaderCreate(
-                product_id=product.product_id,
-                bom_code=f"BOM-{sheet_name}-AUTO",
-                bom_name=f"BOM tự động import cho {sheet_name}",
-                target_weight_gm=float(target_weight) if pd.notna(target_weight) else 0.0,
-                total_scrap_rate=float(scrap_rate) if pd.notna(scrap_rate) else 0.0,
-                total_shrinkage_rate=float(shrinkage_rate) if pd.notna(shrinkage_rate) else 0.0,
-                details=bom_details
-            )
+        workbook = read_workbook(source, workers=workers)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Không đọc được file Excel.")
+    sheets = [_validate_sheet(raw) for raw in workbook]
+
+    # Trùng mã sản phẩm giữa các sheet (khác nhau ở khoảng trắng / hoa thường)
+    seen: Dict[str, str] = {}
+    for report, _ in sheets:
+        if report["status"] in ("skipped", "error"):
+            continue
+        key = report["sheet_name"].strip().lower()
+        if key in seen:
+            report["errors"].append(f"Trùng mã sản phẩm với sheet '{seen[key]}'")
+            report["status"] = "error"
+        else:
+            seen[key] = report["sheet_name"]
+
+    valid = [(report, details) for report, details in sheets if report["status"] not in ("skipped", "error")]
+    detail_rows = _calculate(valid)
+
+    # Sản phẩm / BOM đã có: 2 query cho cả file
+    codes = [report["sheet_name"].strip() for report, _ in valid]
+    products = {}
+    if codes:
+        products = {
+            p.item_code.lower(): p.product_id
+            for p in db.query(Product.product_id, Product.item_code).filter(Product.item_code.in_(codes))
+        }
+    existing_boms = {}
+    if products:
+        existing_boms = dict(db.query(BOMHeader.product_id, BOMHeader.bom_id).filter(
+            BOMHeader.product_id.in_(products.values()),
+            BOMHeader.applicable_year == applicable_year
+        ).all())
+    for report, _ in valid:
+        product_id = products.get(report["sheet_name"].strip().lower())
+        report["product_id"] = product_id
+        report["new_product"] = product_id is None
+        report["bom_id"] = existing_boms.get(product_id)
+        report["status"] = "update" if report["bom_id"] else "create"
 
-            BOMService.create_bom(db, bom_in)
-            print(f"Thành công: Đã import BOM cho {sheet_name}")
+    reports = [report for report, _ in sheets]
+    errors = [r for r in reports if r["status"] == "error"]
+    result = {
+        "applicable_year": applicable_year,
+        "dry_run": dry_run,
+        "total_sheets": len(reports),
+        "valid_sheets": len(valid),
+        "error_sheets": len(errors),
+        "sheets": reports
+    }
+
+    if dry_run or errors or not valid:
+        db.rollback()
+        if errors and not dry_run:
+            raise HTTPException(
+                status_code=400,
+                detail={"message": f"File có {len(errors)} sheet lỗi, chưa ghi sheet nào.", "sheets": errors}
+            )
+        return result
 
+    try:
+        counts = _write_boms(db, applicable_year, [report for report, _ in valid], detail_rows)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Sản phẩm / BOM vừa được tạo bởi thao tác khác, vui lòng import lại.")
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
-        print(f"Lỗi khi import: {e}")
         db.rollback()
+        raise HTTPException(status_code=500, detail=f"Lỗi hệ thống khi import BOM: {str(e)}")
+
+    invalidate_simulations(counts.pop("updated_bom_ids"))
+    result.update(counts)
+    return result
+
+
+def _write_boms(db: Session, applicable_year: int, reports: List[Dict[str, Any]], detail_rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Ghi hàng loạt: sản phẩm mới -> header mới / cập nhật header cũ -> thay chi tiết. Không commit."""
+    # 1. Sản phẩm mới (1 INSERT), lấy lại ID theo mã
+    new_codes = [r["sheet_name"].strip() for r in reports if r["product_id"] is None]
+    if new_codes:
+        db.execute(insert(Product), [{"item_code": code, "note": f"Imported from {code}"} for code in new_codes])
+        created = {
+            p.item_code.lower(): p.product_id
+            for p in db.query(Product.product_id, Product.item_code).filter(Product.item_code.in_(new_codes))
+        }
+        for r in reports:
+            if r["product_id"] is None:
+                r["product_id"] = created[r["sheet_name"].strip().lower()]
+
+    header_fields = ("target_weight_gm", "total_scrap_rate", "total_shrinkage_rate")
+
+    # 2. Header mới (1 INSERT), lấy lại bom_id theo (sản phẩm, năm)
+    new_headers = [r for r in reports if r["bom_id"] is None]
+    if new_headers:
+        db.execute(insert(BOMHeader), [
+            {
+                "product_id": r["product_id"],
+                "applicable_year": applicable_year,
+                **{name: r[name] for name in header_fields},
+                "version": 1,
+                "is_active": True
+            }
+            for r in new_headers
+        ])
+        bom_ids = dict(db.query(BOMHeader.product_id, BOMHeader.bom_id).filter(
+            BOMHeader.product_id.in_([r["product_id"] for r in new_headers]),
+            BOMHeader.applicable_year == applicable_year
+        ).all())
+        for r in new_headers:
+            r["bom_id"] = bom_ids[r["product_id"]]
+
+    # 3. Header đã có: cập nhật thông số + tăng version (1 UPDATE executemany), xóa chi tiết cũ (1 DELETE)
+    updated = [r for r in reports if r["status"] == "update"]
+    if updated:
+        header_table = BOMHeader.__table__
+        db.execute(
+            update(header_table).where(header_table.c.bom_id == bindparam("_bom_id")).values(
+                version=func.coalesce(header_table.c.version, 0) + 1,
+                **{name: bindparam(f"_{name}") for name in header_fields}
+            ),
+            [{"_bom_id": r["bom_id"], **{f"_{name}": r[name] for name in header_fields}} for r in updated]
+        )
+        db.query(BOMDetail).filter(
+            BOMDetail.bom_id.in_([r["bom_id"] for r in updated])
+        ).delete(synchronize_session=False)
+
+    # 4. Chi tiết của mọi sheet (1 INSERT)
+    if detail_rows:
+        db.execute(insert(BOMDetail), [
+            {"bom_id": reports[row["sheet_index"]]["bom_id"], **{k: v for k, v in row.items() if k != "sheet_index"}}
+            for row in detail_rows
+        ])
+
+    return {
+        "products_created": len(new_codes),
+        "boms_created": len(new_headers),
+        "boms_updated": len(updated),
+        "details_imported": len(detail_rows),
+        "updated_bom_ids": [r["bom_id"] for r in updated]
+    }
+
+
+def import_bom_from_excel(file_path: str, applicable_year: Optional[int] = None, dry_run: bool = False, workers: Optional[int] = None) -> Dict[str, Any]:
+    db: Session = SessionLocal()
+    try:
+        return import_boms(db, file_path, resolve_year(file_path, applicable_year), dry_run=dry_run, workers=workers)
     finally:
         db.close()
 
-def map_excel_to_enum(excel_name: str) -> BOMComponentType:
-    """Hàm chuyển đổi tên tiếng Anh trong Excel sang Enum của Backend"""
-    mapping = {
-        "Ground": BOMComponentType.GROUND,
-        "Grd. Marker": BOMComponentType.GRD_MARKER,
-        "Edge": BOMComponentType.EDGE,
-        "Binder": BOMComponentType.BINDER,
-        "Stuffer": BOMComponentType.STUFFER,
-        "Catch cord": BOMComponentType.CATCH_CORD,
-        "Filling": BOMComponentType.FILLING,
-        "2nd Filling": BOMComponentType.SECOND_FILLING
-    }
-    return mapping.get(excel_name, BOMComponentType.GROUND)
 
 if __name__ == "__main__":
-    import_bom_from_excel("/app/static/BOM YARN 2025.xlsm")
\ No newline at end of file
+    # Lệnh chạy tay:
+    #   python -m app.services.import_bom_excel "/app/static/BOM YARN 2025.xlsm" [--year 2025] [--dry-run] [--workers 4]
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Import BOM Yarn từ file Excel (mỗi sheet = 1 sản phẩm)")
+    parser.add_argument("file_path", nargs="?", default="/app/static/BOM YARN 2025.xlsm")
+    parser.add_argument("--year", type=int, default=None, help="Năm áp dụng (mặc định lấy từ tên file)")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ kiểm tra, không ghi DB")
+    parser.add_argument("--workers", type=int, default=None, help="Số process đọc sheet (mặc định = số CPU)")
+    args = parser.parse_args()
+
+    try:
+        report = import_bom_from_excel(args.file_path, args.year, dry_run=args.dry_run, workers=args.workers)
+    except HTTPException as e:
+        print(json.dumps(e.detail, ensure_ascii=False, indent=2, default=str))
+        raise SystemExit(1)
+    print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
\ No newline at end of file
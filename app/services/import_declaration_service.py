@@ -1,7 +1,7 @@
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import or_
 from fastapi import HTTPException
-from typing import List, Optional
+from typing import Iterable, List, Optional
 from datetime import date
 
 from app.models.import_declaration import ImportDeclaration, ImportDeclarationDetail, ImportType
@@ -11,6 +11,7 @@ from app.schemas.import_declaration_schema import (
     ImportDetailCreate,
     ImportDetailUpdate # Cần thêm schema này trong file schema
 )
+from app.services.purchase_order_match_service import PurchaseOrderMatchService
 
 class ImportDeclarationService:
     def __init__(self, db: Session):
@@ -21,6 +22,12 @@ class ImportDeclarationService:
             joinedload(ImportDeclaration.details).joinedload(ImportDeclarationDetail.material)
         ).filter(ImportDeclaration.id == id).first()
 
+    def _refresh_match(self, declaration_id: int, before: Iterable[int] = ()):
+        """Đối chiếu lại PO - Tờ khai - Phiếu nhập cho các PO của tờ khai (trước và sau khi sửa)"""
+        self.db.flush()
+        match_service = PurchaseOrderMatchService(self.db)
+        match_service.refresh({*before, *match_service.po_ids_for_declarations([declaration_id])})
+
     def get_by_no(self, declaration_no: str) -> Optional[ImportDeclaration]:
         return self.db.query(ImportDeclaration).filter(ImportDeclaration.declaration_no == declaration_no).first()
 
@@ -81,6 +88,7 @@ class ImportDeclarationService:
                     hs_code_actual=detail.hs_code_actual
                 )
                 self.db.add(db_detail)
+            self._refresh_match(db_obj.id)
         
         self.db.commit()
         return self.get(db_obj.id)
@@ -99,7 +107,9 @@ class ImportDeclarationService:
         obj = self.get(id)
         if not obj:
             raise HTTPException(status_code=404, detail="Tờ khai không tồn tại.")
+        po_ids = PurchaseOrderMatchService(self.db).po_ids_for_declarations([id])
         self.db.delete(obj)
+        self._refresh_match(id, before=po_ids)
         self.db.commit()
         return True
 
@@ -118,6 +128,7 @@ class ImportDeclarationService:
             hs_code_actual=detail_in.hs_code_actual
         )
         self.db.add(db_detail)
+        self._refresh_match(declaration_id)
         self.db.commit()
         self.db.refresh(db_detail)
         return db_detail
@@ -127,11 +138,13 @@ class ImportDeclarationService:
         if not db_detail:
             raise HTTPException(status_code=404, detail="Chi tiết không tồn tại.")
 
+        po_ids = PurchaseOrderMatchService(self.db).po_ids_for_declarations([db_detail.declaration_id])
         update_data = detail_in.dict(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_detail, field, value)
             
         self.db.add(db_detail)
+        self._refresh_match(db_detail.declaration_id, before=po_ids)
         self.db.commit()
         self.db.refresh(db_detail)
         return db_detail
@@ -141,6 +154,8 @@ class ImportDeclarationService:
         if not db_detail:
             raise HTTPException(status_code=404, detail="Chi tiết không tồn tại.")
             
+        po_ids = PurchaseOrderMatchService(self.db).po_ids_for_declarations([db_detail.declaration_id])
         self.db.delete(db_detail)
+        self._refresh_match(db_detail.declaration_id, before=po_ids)
         self.db.commit()
         return True
\ No newline at end of file
@@ -0,0 +1,239 @@
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from app.models.inventory import InventoryStock
+from app.models.inventory_transaction import InventoryTransaction, InventoryTransactionType
+from app.models.batch import Batch
+from app.models.material import Material
+from app.models.material_receipt import MaterialReceipt, MaterialReceiptDetail
+from app.models.warehouse import Warehouse
+
+# Nhóm tuổi tồn (ngày): 0-30 / 31-90 / 91-180 / >180
+AGING_BUCKETS = ["age_0_30", "age_31_90", "age_91_180", "age_over_180"]
+AGING_BUCKET_EDGES = [30, 90, 180]
+
+# Kết quả tính theo ngày: {(as_of, window_days, dead_stock_days, slow_moving_cover_days): DataFrame}
+_cache: Dict[Tuple, pd.DataFrame] = {}
+_cache_lock = threading.Lock()
+
+
+def compute_aging(
+    df: pd.DataFrame,
+    exports: pd.DataFrame,
+    as_of: date,
+    window_days: int = 90,
+    dead_stock_days: int = 180,
+    slow_moving_cover_days: int = 120
+) -> pd.DataFrame:
+    """
+    Tính tuổi tồn theo Vật tư - Kho từ bảng dòng tồn theo lô (toàn bộ bằng phép toán trên mảng, không lặp từng dòng).
+    df (dòng tồn theo lô) cần các cột: material_id, warehouse_id, material_code, warehouse_name, quantity_on_hand,
+    receipt_date, batch_created_at.
+    exports (lịch sử xuất theo Vật tư - Kho, gồm cả lô đã xuất hết) cần các cột: material_id, warehouse_id,
+    last_export_at, issued_in_window.
+    - Ngày nhập của lô = ngày phiếu nhập, không có thì lấy ngày tạo lô.
+    - turnover_ratio = lượng xuất trong window_days / tồn hiện tại.
+    - days_of_cover = tồn hiện tại / lượng xuất bình quân 1 ngày trong window_days.
+    - is_dead_stock: lô cũ nhất đã quá dead_stock_days và không xuất lần nào trong dead_stock_days.
+    - is_slow_moving: chưa tới mức tồn chết nhưng đủ dùng quá slow_moving_cover_days (hoặc không xuất trong kỳ).
+    """
+    if df.empty:
+        return pd.DataFrame(columns=[
+            "material_id", "warehouse_id", "material_code", "warehouse_name", "quantity_on_hand", "batch_count",
+            *AGING_BUCKETS, "average_age_days", "oldest_age_days", "last_export_date", "days_since_last_export",
+            "issued_in_window", "turnover_ratio", "days_of_cover", "is_dead_stock", "is_slow_moving"
+        ])
+
+    as_of_ts = pd.Timestamp(as_of)
+    qty = df["quantity_on_hand"].to_numpy(dtype=float)
+
+    received = pd.to_datetime(df["receipt_date"]).fillna(pd.to_datetime(df["batch_created_at"]).dt.normalize())
+    age = (as_of_ts - received).dt.days.fillna(0).to_numpy(dtype=float).clip(min=0)
+
+    # searchsorted(side="left"): 30 -> nhóm 0, 31 -> nhóm 1, ..., 181 -> nhóm 3
+    bucket = np.searchsorted(AGING_BUCKET_EDGES, age, side="left")
+
+    rows = pd.DataFrame({
+        "material_id": df["material_id"].to_numpy(),
+        "warehouse_id": df["warehouse_id"].to_numpy(),
+        "material_code": df["material_code"].to_numpy(),
+        "warehouse_name": df["warehouse_name"].to_numpy(),
+        "quantity_on_hand": qty,
+        "age_x_qty": age * qty,
+        "age": age,
+    })
+    for index, name in enumerate(AGING_BUCKETS):
+        rows[name] = np.where(bucket == index, qty, 0.0)
+
+    grouped = rows.groupby(["material_id", "warehouse_id"], sort=True).agg(
+        material_code=("material_code", "first"),
+        warehouse_name=("warehouse_name", "first"),
+        quantity_on_hand=("quantity_on_hand", "sum"),
+        batch_count=("quantity_on_hand", "size"),
+        **{name: (name, "sum") for name in AGING_BUCKETS},
+        age_x_qty=("age_x_qty", "sum"),
+        oldest_age_days=("age", "max"),
+    ).reset_index()
+
+    # Ghép lịch sử xuất sau khi gộp: lượng xuất của lô đã hết tồn vẫn được tính cho Vật tư - Kho
+    exports = exports.reindex(columns=["material_id", "warehouse_id", "last_export_at", "issued_in_window"]).astype(
+        {"material_id": grouped["material_id"].dtype, "warehouse_id": grouped["warehouse_id"].dtype}
+    )
+    grouped = grouped.merge(exports, on=["material_id", "warehouse_id"], how="left")
+    grouped["last_export_at"] = pd.to_datetime(grouped["last_export_at"])
+    grouped["issued_in_window"] = grouped["issued_in_window"].fillna(0).astype(float)
+
+    on_hand = grouped["quantity_on_hand"].to_numpy(dtype=float)
+    issued = grouped["issued_in_window"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        grouped["average_age_days"] = np.where(on_hand > 0, grouped["age_x_qty"].to_numpy() / on_hand, 0.0)
+        grouped["turnover_ratio"] = np.where(on_hand > 0, issued / on_hand, np.nan)
+        grouped["days_of_cover"] = np.where(issued > 0, on_hand / (issued / window_days), np.nan)
+
+    days_since_export = (as_of_ts - grouped["last_export_at"].dt.normalize()).dt.days
+    grouped["days_since_last_export"] = days_since_export
+    grouped["last_export_date"] = grouped["last_export_at"].dt.date
+
+    no_recent_export = days_since_export.isna().to_numpy() | (days_since_export.fillna(0).to_numpy() > dead_stock_days)
+    dead = (on_hand > 0) & no_recent_export & (grouped["oldest_age_days"].to_numpy() > dead_stock_days)
+    slow = (on_hand > 0) & ~dead & (
+        (issued <= 0) | (np.nan_to_num(grouped["days_of_cover"].to_numpy(), nan=0.0) > slow_moving_cover_days)
+    )
+    grouped["is_dead_stock"] = dead
+    grouped["is_slow_moving"] = slow
+
+    return grouped.drop(columns=["age_x_qty", "last_export_at"])
+
+
+class InventoryAgingService:
+    """
+    Phân tích tuổi tồn / hàng chậm luân chuyển / tồn chết theo Vật tư - Kho.
+    - 1 query lấy toàn bộ dòng tồn > 0 kèm ngày nhập, 1 query lịch sử xuất gộp sẵn theo Vật tư - Kho từ sổ cái
+      (không join dòng tồn: lô đã xuất hết vẫn được tính).
+    - Tính toán vectorized bằng pandas/NumPy (compute_aging).
+    - Kết quả được cache theo ngày (as_of + tham số), refresh=True để tính lại.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _load_frames(self, as_of: date, window_days: int) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """(dòng tồn theo lô, lịch sử xuất theo Vật tư - Kho)"""
+        window_start = datetime.combine(as_of - timedelta(days=window_days), datetime.min.time())
+        as_of_end = datetime.combine(as_of + timedelta(days=1), datetime.min.time())
+
+        stock_stmt = select(
+            InventoryStock.material_id,
+            InventoryStock.warehouse_id,
+            Material.material_code,
+            Warehouse.warehouse_name,
+            InventoryStock.quantity_on_hand,
+            MaterialReceipt.receipt_date,
+            Batch.created_at.label("batch_created_at")
+        ).join(
+            Batch, Batch.batch_id == InventoryStock.batch_id
+        ).join(
+            Material, Material.id == InventoryStock.material_id
+        ).join(
+            Warehouse, Warehouse.warehouse_id == InventoryStock.warehouse_id
+        ).outerjoin(
+            MaterialReceiptDetail, MaterialReceiptDetail.detail_id == Batch.receipt_detail_id
+        ).outerjoin(
+            MaterialReceipt, MaterialReceipt.receipt_id == MaterialReceiptDetail.receipt_id
+        ).where(InventoryStock.quantity_on_hand > 0)
+
+        # Lịch sử xuất: lần xuất gần nhất + tổng xuất trong kỳ (quantity_delta âm = xuất)
+        exports_stmt = select(
+            InventoryTransaction.material_id,
+            InventoryTransaction.warehouse_id,
+            func.max(InventoryTransaction.created_at).label("last_export_at"),
+            func.sum(case(
+                (InventoryTransaction.created_at >= window_start, -InventoryTransaction.quantity_delta),
+                else_=0.0
+            )).label("issued_in_window")
+        ).where(
+            InventoryTransaction.transaction_type == InventoryTransactionType.EXPORT,
+            InventoryTransaction.created_at < as_of_end
+        ).group_by(
+            InventoryTransaction.material_id,
+            InventoryTransaction.warehouse_id
+        )
+
+        frames = []
+        for stmt in (stock_stmt, exports_stmt):
+            result = self.db.execute(stmt)
+            frames.append(pd.DataFrame(result.fetchall(), columns=list(result.keys())))
+        return frames[0], frames[1]
+
+    def get_aging_frame(
+        self,
+        as_of: Optional[date] = None,
+        window_days: int = 90,
+        dead_stock_days: int = 180,
+        slow_moving_cover_days: int = 120,
+        refresh: bool = False
+    ) -> pd.DataFrame:
+        as_of = as_of or date.today()
+        key = (as_of, window_days, dead_stock_days, slow_moving_cover_days)
+
+        with _cache_lock:
+            cached = None if refresh else _cache.get(key)
+        if cached is not None:
+            return cached
+
+        stock, exports = self._load_frames(as_of, window_days)
+        frame = compute_aging(
+            stock,
+            exports,
+            as_of,
+            window_days=window_days,
+            dead_stock_days=dead_stock_days,
+            slow_moving_cover_days=slow_moving_cover_days
+        )
+        with _cache_lock:
+            # Chỉ giữ kết quả của ngày hiện tại (ngày cũ bỏ đi để cache không phình)
+            for old_key in [k for k in _cache if k[0] != as_of]:
+                del _cache[old_key]
+            _cache[key] = frame
+        return frame
+
+    def get_aging_report(
+        self,
+        as_of: Optional[date] = None,
+        material_id: Optional[int] = None,
+        warehouse_id: Optional[int] = None,
+        flagged_only: bool = False,
+        window_days: int = 90,
+        dead_stock_days: int = 180,
+        slow_moving_cover_days: int = 120,
+        refresh: bool = False
+    ) -> Dict[str, Any]:
+        as_of = as_of or date.today()
+        frame = self.get_aging_frame(as_of, window_days, dead_stock_days, slow_moving_cover_days, refresh=refresh)
+
+        if material_id is not None:
+            frame = frame[frame["material_id"] == material_id]
+        if warehouse_id is not None:
+            frame = frame[frame["warehouse_id"] == warehouse_id]
+        if flagged_only:
+            frame = frame[frame["is_dead_stock"] | frame["is_slow_moving"]]
+
+        totals = {name: float(frame[name].sum()) for name in ["quantity_on_hand", *AGING_BUCKETS]}
+        totals["dead_stock_quantity"] = float(frame.loc[frame["is_dead_stock"], "quantity_on_hand"].sum())
+        totals["slow_moving_quantity"] = float(frame.loc[frame["is_slow_moving"], "quantity_on_hand"].sum())
+
+        # NaN / NaT -> None để trả JSON
+        items: List[Dict[str, Any]] = frame.astype(object).where(frame.notna(), None).to_dict("records")
+        return {
+            "as_of": as_of,
+            "window_days": window_days,
+            "dead_stock_days": dead_stock_days,
+            "totals": totals,
+            "items": items
+        }
\ No newline at end of file
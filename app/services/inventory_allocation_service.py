@@ -0,0 +1,193 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import case, func, update, bindparam, or_
+from fastapi import HTTPException
+from typing import Dict, List, Optional, Tuple
+from datetime import date
+
+from app.models.inventory import InventoryStock
+from app.models.batch import Batch, BatchQCStatus
+from app.services.inventory_summary_service import InventorySummaryService
+from app.schemas.inventory_schema import (
+    AllocationRequest,
+    AllocationLine,
+    AllocationShortage,
+    AllocationResponse
+)
+
+class InventoryAllocationService:
+    """
+    Phân bổ tồn kho cho nhiều dòng nhu cầu trong 1 lần gọi (VD: kế hoạch lên sợi cả ngày).
+    - 1 query lấy toàn bộ lô ứng viên của mọi vật tư: chỉ lô QC PASS, còn hạn, còn khả dụng.
+    - Thứ tự FEFO: hết hạn trước xuất trước (lô không có hạn dùng xếp sau cùng),
+      ưu tiên kho theo preferred_warehouse_ids, cùng hạn thì lô cũ (batch_id nhỏ) trước.
+    - Ghi giữ chỗ bằng 1 lệnh UPDATE (executemany) cho tất cả các dòng tồn bị đụng tới.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _load_candidates(
+        self,
+        material_ids: List[int],
+        warehouse_ids: Optional[List[int]],
+        preferred_warehouse_ids: List[int],
+        warehouse_first: bool,
+        as_of: date,
+        lock: bool
+    ):
+        available = func.coalesce(InventoryStock.quantity_on_hand, 0.0) - func.coalesce(InventoryStock.quantity_reserved, 0.0)
+
+        query = self.db.query(
+            InventoryStock.id,
+            InventoryStock.material_id,
+            InventoryStock.warehouse_id,
+            InventoryStock.batch_id,
+            available.label("available"),
+            Batch.expiry_date
+        ).join(Batch, Batch.batch_id == InventoryStock.batch_id).filter(
+            InventoryStock.material_id.in_(material_ids),
+            Batch.qc_status == BatchQCStatus.PASS,
+            Batch.is_active.isnot(False),
+            or_(Batch.expiry_date.is_(None), Batch.expiry_date >= as_of),
+            available > 0
+        )
+        if warehouse_ids is not None:
+            query = query.filter(InventoryStock.warehouse_id.in_(warehouse_ids))
+
+        # Kho ưu tiên: theo vị trí trong danh sách, kho không có trong danh sách xếp sau
+        warehouse_rank = []
+        if preferred_warehouse_ids:
+            warehouse_rank = [case(
+                {wh_id: rank for rank, wh_id in enumerate(preferred_warehouse_ids)},
+                value=InventoryStock.warehouse_id,
+                else_=len(preferred_warehouse_ids)
+            )]
+
+        # Lô có hạn dùng trước (hết hạn sớm nhất trước), lô không có hạn sau cùng
+        fefo = [Batch.expiry_date.is_(None), Batch.expiry_date]
+        if warehouse_first:
+            sort_keys = [*warehouse_rank, *fefo]
+        else:
+            sort_keys = [*fefo, *warehouse_rank]
+
+        query = query.order_by(
+            InventoryStock.material_id,
+            *sort_keys,
+            InventoryStock.batch_id,
+            InventoryStock.warehouse_id
+        )
+        if lock:
+            # Khóa các dòng tồn ứng viên tới khi commit để 2 lần phân bổ không cùng lấy 1 phần tồn
+            query = query.with_for_update(of=InventoryStock)
+
+        return query.all()
+
+    def allocate(
+        self,
+        request: AllocationRequest,
+        reserve: bool = True,
+        commit: bool = True,
+        as_of: Optional[date] = None
+    ) -> AllocationResponse:
+        """
+        Lập kế hoạch phân bổ và (nếu reserve=True) cộng quantity_reserved cho các dòng tồn được chọn.
+        reserve=False: chỉ trả về kế hoạch (dry run), không ghi gì.
+        """
+        if not request.lines:
+            return AllocationResponse()
+
+        as_of = as_of or date.today()
+        material_ids = sorted({line.material_id for line in request.lines})
+
+        # Dòng nào cũng chỉ định kho -> chỉ cần lấy ứng viên ở các kho đó
+        warehouse_ids = None
+        if all(line.warehouse_id for line in request.lines):
+            warehouse_ids = sorted({line.warehouse_id for line in request.lines})
+
+        candidates = self._load_candidates(
+            material_ids, warehouse_ids, request.preferred_warehouse_ids, request.warehouse_first, as_of, lock=reserve
+        )
+
+        by_material: Dict[int, list] = {}
+        remaining: Dict[int, float] = {}
+        for row in candidates:
+            by_material.setdefault(row.material_id, []).append(row)
+            remaining[row.id] = row.available
+
+        allocations: List[AllocationLine] = []
+        shortages: List[AllocationShortage] = []
+
+        # Dòng chỉ định kho được xử lý trước để không bị dòng "kho nào cũng được" lấy mất hàng
+        order = sorted(range(len(request.lines)), key=lambda i: request.lines[i].warehouse_id is None)
+        for index in order:
+            line = request.lines[index]
+            need = line.quantity
+
+            for row in by_material.get(line.material_id, []):
+                if need <= 0.0001:
+                    break
+                if line.warehouse_id and row.warehouse_id != line.warehouse_id:
+                    continue
+                free = remaining[row.id]
+                if free <= 0.0001:
+                    continue
+
+                take = min(free, need)
+                remaining[row.id] = free - take
+                need -= take
+                allocations.append(AllocationLine(
+                    line_index=index,
+                    material_id=row.material_id,
+                    warehouse_id=row.warehouse_id,
+                    batch_id=row.batch_id,
+                    stock_id=row.id,
+                    quantity=take,
+                    expiry_date=row.expiry_date
+                ))
+
+            if need > 0.0001:
+                shortages.append(AllocationShortage(
+                    line_index=index,
+                    material_id=line.material_id,
+                    requested=line.quantity,
+                    allocated=line.quantity - need,
+                    missing=need
+                ))
+
+        allocations.sort(key=lambda a: a.line_index)
+        shortages.sort(key=lambda s: s.line_index)
+
+        if shortages and not request.allow_partial:
+            if reserve and commit:
+                self.db.rollback()
+            detail = "; ".join(
+                f"Dòng {s.line_index + 1} (Vật tư ID {s.material_id}): thiếu {s.missing:g}" for s in shortages
+            )
+            raise HTTPException(status_code=400, detail=f"Không đủ tồn kho khả dụng (QC Pass, còn hạn) để phân bổ. {detail}")
+
+        if reserve and allocations:
+            self._apply_reservations(allocations)
+            if commit:
+                self.db.commit()
+
+        return AllocationResponse(allocations=allocations, shortages=shortages, reserved=reserve)
+
+    def _apply_reservations(self, allocations: List[AllocationLine]):
+        """1 lệnh UPDATE executemany cộng quantity_reserved (gộp theo dòng tồn, sắp theo id) + cộng bảng tổng hợp"""
+        per_stock: Dict[int, float] = {}
+        for a in allocations:
+            per_stock[a.stock_id] = per_stock.get(a.stock_id, 0.0) + a.quantity
+
+        table = InventoryStock.__table__
+        self.db.execute(
+            update(table)
+            .where(table.c.id == bindparam("_stock_id"))
+            .values(quantity_reserved=func.coalesce(table.c.quantity_reserved, 0.0) + bindparam("_qty")),
+            [{"_stock_id": stock_id, "_qty": qty} for stock_id, qty in sorted(per_stock.items())]
+        )
+
+        per_warehouse: Dict[Tuple[int, int], float] = {}
+        for a in allocations:
+            key = (a.material_id, a.warehouse_id)
+            per_warehouse[key] = per_warehouse.get(key, 0.0) + a.quantity
+        InventorySummaryService(self.db).apply_deltas(reserved=per_warehouse)
\ No newline at end of file
@@ -0,0 +1,246 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import case, func, select, update
+from fastapi import HTTPException
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.db.loading import schema_load_options
+from app.db.pagination import CursorPage, paginate
+from app.models.inventory import InventoryStock
+from app.models.inventory_reservation import InventoryReservation, InventoryReservationLine, ReservationStatus
+from app.schemas.inventory_schema import ReservationCreate, ReservationResponse
+from app.services.inventory_allocation_service import InventoryAllocationService
+from app.services.inventory_summary_service import InventorySummaryService
+
+class InventoryReservationService:
+    """
+    Phiếu giữ chỗ tồn kho có chủ sở hữu và hạn giữ.
+    - Tạo phiếu: phân bổ FEFO (InventoryAllocationService) + lưu từng dòng tồn được giữ.
+    - Phiếu rời trạng thái ACTIVE (xuất / hủy / hết hạn) trả lại toàn bộ số đã cộng vào quantity_reserved.
+    - release_expired(): sweeper chạy định kỳ, trả lại hàng loạt phiếu hết hạn bằng lệnh UPDATE theo tập.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    # =========================
+    # ĐỌC
+    # =========================
+    def get(self, reservation_id: int) -> Optional[InventoryReservation]:
+        return self.db.query(InventoryReservation).options(
+            *schema_load_options(InventoryReservation, ReservationResponse)
+        ).filter(InventoryReservation.id == reservation_id).first()
+
+    def get_multi(
+        self,
+        skip: int = 0,
+        limit: int = 100,
+        owner: Optional[str] = None,
+        status: Optional[ReservationStatus] = None,
+        cursor: Optional[str] = None
+    ) -> CursorPage:
+        query = self.db.query(InventoryReservation).options(
+            *schema_load_options(InventoryReservation, ReservationResponse)
+        )
+        if owner:
+            query = query.filter(InventoryReservation.owner == owner)
+        if status:
+            query = query.filter(InventoryReservation.status == status)
+        return paginate(query, [(InventoryReservation.id, True)], skip=skip, limit=limit, cursor=cursor)
+
+    # =========================
+    # TẠO PHIẾU GIỮ CHỖ
+    # =========================
+    def create(self, obj_in: ReservationCreate) -> InventoryReservation:
+        try:
+            # Giữ chỗ trong transaction hiện tại, commit chung với phiếu bên dưới
+            result = InventoryAllocationService(self.db).allocate(obj_in, reserve=True, commit=False)
+        except HTTPException:
+            self.db.rollback()
+            raise
+        if not result.allocations:
+            self.db.rollback()
+            raise HTTPException(status_code=400, detail="Không có tồn kho khả dụng để giữ chỗ.")
+
+        ttl_minutes = obj_in.ttl_minutes or settings.RESERVATION_TTL_MINUTES
+        reservation = InventoryReservation(
+            owner=obj_in.owner,
+            status=ReservationStatus.ACTIVE,
+            reference_type=obj_in.reference_type,
+            reference_id=obj_in.reference_id,
+            note=obj_in.note,
+            expires_at=datetime.now() + timedelta(minutes=ttl_minutes),
+            lines=[
+                InventoryReservationLine(
+                    stock_id=a.stock_id,
+                    material_id=a.material_id,
+                    warehouse_id=a.warehouse_id,
+                    batch_id=a.batch_id,
+                    quantity=a.quantity,
+                    consumed_quantity=0.0
+                )
+                for a in result.allocations
+            ]
+        )
+        self.db.add(reservation)
+        try:
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            raise HTTPException(status_code=500, detail=f"Lỗi hệ thống khi lưu phiếu giữ chỗ: {str(e)}")
+        return self.get(reservation.id)
+
+    # =========================
+    # HỦY / XUẤT THEO PHIẾU
+    # =========================
+    def _lock_active(self, reservation_id: int, now: datetime) -> InventoryReservation:
+        """Khóa phiếu (SELECT ... FOR UPDATE) để sweeper và phiếu xuất không cùng xử lý 1 phiếu"""
+        reservation = self.db.query(InventoryReservation).filter(
+            InventoryReservation.id == reservation_id
+        ).with_for_update().populate_existing().first()
+        if not reservation:
+            raise HTTPException(status_code=404, detail=f"Không tìm thấy phiếu giữ chỗ ID {reservation_id}")
+        if reservation.status != ReservationStatus.ACTIVE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Phiếu giữ chỗ {reservation_id} không còn hiệu lực (Trạng thái: {reservation.status.value})"
+            )
+        if reservation.expires_at <= now:
+            raise HTTPException(status_code=400, detail=f"Phiếu giữ chỗ {reservation_id} đã hết hạn.")
+        return reservation
+
+    def release(self, reservation_id: int) -> InventoryReservation:
+        """Hủy giữ chỗ bằng tay: trả lại tồn khả dụng ngay"""
+        now = datetime.now()
+        reservation = self._lock_active(reservation_id, now)
+        self._unreserve([reservation.id])
+        reservation.status = ReservationStatus.RELEASED
+        reservation.closed_at = now
+        self.db.commit()
+        return self.get(reservation.id)
+
+    def consume(
+        self,
+        reservation_id: int,
+        issued: Dict[Tuple[int, int, int], float],
+        export_id: int
+    ) -> InventoryReservation:
+        """
+        Chuyển phiếu giữ chỗ thành xuất kho, chạy trong transaction của phiếu xuất (KHÔNG commit).
+        issued: {(material_id, warehouse_id, batch_id): số lượng xuất}.
+        Dòng giữ chỗ được ghi nhận consumed_quantity theo số thực xuất, phần còn lại được trả về tồn khả dụng.
+        """
+        now = datetime.now()
+        reservation = self._lock_active(reservation_id, now)
+
+        remaining = dict(issued)
+        for line in sorted(reservation.lines, key=lambda l: l.id):
+            key = (line.material_id, line.warehouse_id, line.batch_id)
+            take = min(line.quantity, remaining.get(key, 0.0))
+            line.consumed_quantity = take
+            if take > 0:
+                remaining[key] -= take
+
+        self._unreserve([reservation.id])
+        reservation.status = ReservationStatus.CONSUMED
+        reservation.closed_at = now
+        reservation.export_id = export_id
+        return reservation
+
+    # =========================
+    # SWEEPER: TRẢ LẠI PHIẾU HẾT HẠN
+    # =========================
+    def release_expired(self, now: Optional[datetime] = None, batch_size: int = 500) -> int:
+        """
+        Trả lại các phiếu ACTIVE đã quá expires_at, mỗi lô batch_size phiếu / 1 transaction:
+        1 SELECT ... FOR UPDATE SKIP LOCKED lấy id, 1 UPDATE trừ quantity_reserved theo tập (+ bảng tổng hợp), 1 UPDATE trạng thái.
+        SKIP LOCKED: phiếu đang được xuất / hủy ở request khác thì bỏ qua, lần quét sau xử lý.
+        Trả về số phiếu đã trả lại.
+        """
+        now = now or datetime.now()
+        total = 0
+        while True:
+            ids = [
+                row.id for row in self.db.query(InventoryReservation.id).filter(
+                    InventoryReservation.status == ReservationStatus.ACTIVE,
+                    InventoryReservation.expires_at <= now
+                ).order_by(
+                    InventoryReservation.expires_at,
+                    InventoryReservation.id
+                ).limit(batch_size).with_for_update(skip_locked=True).all()
+            ]
+            if not ids:
+                break
+
+            self._unreserve(ids)
+            table = InventoryReservation.__table__
+            self.db.execute(
+                update(table)
+                .where(table.c.id.in_(ids))
+                .values(status=ReservationStatus.EXPIRED, closed_at=now)
+            )
+            self.db.commit()
+            total += len(ids)
+
+            if len(ids) < batch_size:
+                break
+        return total
+
+    def _unreserve(self, reservation_ids: List[int]) -> None:
+        """
+        1 lệnh UPDATE trừ quantity_reserved của mọi dòng tồn thuộc các phiếu (gộp theo dòng tồn bằng subquery).
+        Không để quantity_reserved âm (dữ liệu giữ chỗ cũ có thể đã bị sửa tay); bảng tổng hợp cũng chỉ trừ
+        phần thực sự được trả lại ở từng dòng tồn: min(đang giữ, số giữ của phiếu).
+        """
+        stocks = InventoryStock.__table__
+        lines = InventoryReservationLine.__table__
+
+        per_stock = (
+            select(lines.c.stock_id, func.sum(lines.c.quantity).label("quantity"))
+            .where(lines.c.reservation_id.in_(reservation_ids))
+            .group_by(lines.c.stock_id)
+            .subquery()
+        )
+        current = func.coalesce(stocks.c.quantity_reserved, 0.0)
+        actually_released = case(
+            (current <= 0, 0.0),
+            (current < per_stock.c.quantity, current),
+            else_=per_stock.c.quantity
+        )
+
+        # Bảng tổng hợp: trừ theo Vật tư - Kho (1 query GROUP BY, đọc trước khi UPDATE dòng tồn)
+        per_warehouse = {
+            (r.material_id, r.warehouse_id): -r.quantity
+            for r in self.db.execute(
+                select(stocks.c.material_id, stocks.c.warehouse_id, func.sum(actually_released).label("quantity"))
+                .join(per_stock, per_stock.c.stock_id == stocks.c.id)
+                .group_by(stocks.c.material_id, stocks.c.warehouse_id)
+            )
+        }
+        InventorySummaryService(self.db).apply_deltas(reserved=per_warehouse)
+
+        released = select(func.coalesce(func.sum(lines.c.quantity), 0.0)).where(
+            lines.c.stock_id == stocks.c.id,
+            lines.c.reservation_id.in_(reservation_ids)
+        ).scalar_subquery()
+        new_reserved = current - released
+
+        self.db.execute(
+            update(stocks)
+            .where(stocks.c.id.in_(
+                select(lines.c.stock_id).where(lines.c.reservation_id.in_(reservation_ids))
+            ))
+            .values(quantity_reserved=case((new_reserved < 0, 0.0), else_=new_reserved))
+        )
+
+if __name__ == "__main__":
+    # Lệnh chạy tay / cron (khi không bật sweeper trong ứng dụng):
+    #   python -m app.services.inventory_reservation_service sweep
+    from app.db.session import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print({"expired": InventoryReservationService(db).release_expired()})
+    finally:
+        db.close()
\ No newline at end of file
@@ -0,0 +1,57 @@
+import logging
+import threading
+from typing import Optional
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.inventory_reservation_service import InventoryReservationService
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# SWEEPER TRẢ LẠI PHIẾU GIỮ CHỖ HẾT HẠN (CHẠY NỀN)
+# =========================
+# Cứ RESERVATION_SWEEP_INTERVAL_SECONDS giây quét 1 lần. Chạy nhiều worker cùng lúc vẫn an toàn
+# vì release_expired() dùng FOR UPDATE SKIP LOCKED và chỉ đổi phiếu còn ACTIVE.
+
+_stop_event = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+
+def sweep_once() -> int:
+    db = SessionLocal()
+    try:
+        return InventoryReservationService(db).release_expired()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"⚠️ Lỗi trả lại phiếu giữ chỗ hết hạn: {e}")
+        return 0
+    finally:
+        db.close()
+
+
+def _run(interval: float):
+    while not _stop_event.wait(interval):
+        released = sweep_once()
+        if released:
+            logger.info(f"Đã trả lại {released} phiếu giữ chỗ hết hạn")
+
+
+def start():
+    """Khởi động sweeper (gọi 1 lần khi ứng dụng startup, interval = 0 thì không chạy)"""
+    global _worker
+    interval = settings.RESERVATION_SWEEP_INTERVAL_SECONDS
+    if interval <= 0 or (_worker is not None and _worker.is_alive()):
+        return
+    _stop_event.clear()
+    _worker = threading.Thread(target=_run, args=(interval,), name="inventory-reservation-sweeper", daemon=True)
+    _worker.start()
+
+
+def stop():
+    """Dừng sweeper (gọi khi shutdown)"""
+    global _worker
+    _stop_event.set()
+    if _worker is not None:
+        _worker.join(timeout=30)
+        _worker = None
\ No newline at end of file
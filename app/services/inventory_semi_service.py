@@ -13,22 +13,29 @@ from app.models.weaving_basket_ticket import WeavingBasketTicket
 from app.schemas.inventory_semi_schema import (
     ImportTicketCreate, ExportTicketCreate
 )
+from app.db.loading import schema_load_options
 
 # =======================================================
 # A. IMPORT SERVICES (NHẬP KHO)
 # =======================================================
 
-def get_import_tickets(db: Session, skip: int = 0, limit: int = 100):
+def _with_loads(query, model, load_schema: Optional[type]):
+    """Eager load các quan hệ mà response schema cần (details, weaving_ticket, employee...)"""
+    if load_schema:
+        query = query.options(*schema_load_options(model, load_schema))
+    return query
+
+def get_import_tickets(db: Session, skip: int = 0, limit: int = 100, load_schema: Optional[type] = None):
     return (
-        db.query(SemiFinishedImportTicket)
+        _with_loads(db.query(SemiFinishedImportTicket), SemiFinishedImportTicket, load_schema)
         .order_by(desc(SemiFinishedImportTicket.import_date))
         .offset(skip)
         .limit(limit)
         .all()
     )
 
-def get_import_ticket_by_id(db: Session, ticket_id: int):
-    return db.query(SemiFinishedImportTicket).filter(SemiFinishedImportTicket.id == ticket_id).first()
+def get_import_ticket_by_id(db: Session, ticket_id: int, load_schema: Optional[type] = None):
+    return _with_loads(db.query(SemiFinishedImportTicket), SemiFinishedImportTicket, load_schema).filter(SemiFinishedImportTicket.id == ticket_id).first()
 
 def create_import_ticket(db: Session, ticket_in: ImportTicketCreate):
     # 1. Check duplicate Code
@@ -83,17 +90,17 @@ def create_import_ticket(db: Session, ticket_in: ImportTicketCreate):
 # B. EXPORT SERVICES (XUẤT KHO)
 # =======================================================
 
-def get_export_tickets(db: Session, skip: int = 0, limit: int = 100):
+def get_export_tickets(db: Session, skip: int = 0, limit: int = 100, load_schema: Optional[type] = None):
     return (
-        db.query(SemiFinishedExportTicket)
+        _with_loads(db.query(SemiFinishedExportTicket), SemiFinishedExportTicket, load_schema)
         .order_by(desc(SemiFinishedExportTicket.export_date))
         .offset(skip)
         .limit(limit)
         .all()
     )
 
-def get_export_ticket_by_id(db: Session, ticket_id: int):
-    return db.query(SemiFinishedExportTicket).filter(SemiFinishedExportTicket.id == ticket_id).first()
+def get_export_ticket_by_id(db: Session, ticket_id: int, load_schema: Optional[type] = None):
+    return _with_loads(db.query(SemiFinishedExportTicket), SemiFinishedExportTicket, load_schema).filter(SemiFinishedExportTicket.id == ticket_id).first()
 
 def create_export_ticket(db: Session, ticket_in: ExportTicketCreate):
     """
@@ -155,10 +162,10 @@ def create_export_ticket(db: Session, ticket_in: ExportTicketCreate):
 # C. INVENTORY SERVICE (TỒN KHO)
 # =======================================================
 
-def get_inventory(db: Session, skip: int = 0, limit: int = 100):
+def get_inventory(db: Session, skip: int = 0, limit: int = 100, load_schema: Optional[type] = None):
     """Lấy danh sách các rổ đang tồn trong kho (IN_STOCK)"""
     return (
-        db.query(SemiFinishedImportDetail)
+        _with_loads(db.query(SemiFinishedImportDetail), SemiFinishedImportDetail, load_schema)
         .filter(SemiFinishedImportDetail.status == StockStatus.IN_STOCK)
         .order_by(desc(SemiFinishedImportDetail.id))
         .offset(skip)
@@ -1,66 +1,139 @@
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, or_, desc
+from sqlalchemy import func, or_, desc, tuple_, update, insert, bindparam
 from fastapi import HTTPException
-from typing import List, Dict, Any
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Any, Tuple, Optional
+from datetime import datetime
 
 from app.models.inventory import InventoryStock
-from app.models.material import Material
+from app.models.inventory_view import InventoryStockView
+from app.models.inventory_transaction import (
+    InventoryTransaction,
+    InventorySnapshot,
+    InventorySnapshotLine,
+    InventoryTransactionType
+)
 from app.models.batch import Batch
 # Import các model liên quan để join
 from app.models.material_receipt import MaterialReceiptDetail, MaterialReceipt
 from app.models.purchase_order import PurchaseOrderHeader
 from app.models.supplier import Supplier
 
-from app.schemas.inventory_schema import InventoryAdjustment
+from app.schemas.inventory_schema import (
+    InventoryAdjustment,
+    InventoryMovement,
+    InventoryStockResponse,
+    AllocationRequest,
+    AllocationDemand
+)
+from app.services.inventory_allocation_service import InventoryAllocationService
+from app.services.inventory_summary_service import InventorySummaryService
+from app.services.inventory_valuation_service import InventoryValuationService
+from app.db.pagination import CursorPage, paginate
+from app.db.loading import schema_load_options
+from app.db.export import ExportFormat, stream_export
+
+# Cột file xuất danh sách tồn kho
+INVENTORY_EXPORT_COLUMNS = [
+    ("Mã vật tư", InventoryStockView.material_code),
+    ("Loại vật tư", InventoryStockView.material_type),
+    ("Kho", InventoryStockView.warehouse_name),
+    ("Mã lô", InventoryStockView.internal_batch_code),
+    ("Lô NCC", InventoryStockView.supplier_batch_no),
+    ("Vị trí", InventoryStockView.location),
+    ("Hạn dùng", InventoryStockView.expiry_date),
+    ("QC", InventoryStockView.qc_status),
+    ("Tồn (kg)", InventoryStockView.quantity_on_hand),
+    ("Giữ chỗ (kg)", InventoryStockView.quantity_reserved),
+    ("Số cuộn", InventoryStockView.received_quantity_cones),
+    ("Số pallet", InventoryStockView.number_of_pallets),
+    ("Phiếu nhập", InventoryStockView.receipt_number),
+    ("NCC", InventoryStockView.supplier_short_name),
+    ("Cập nhật", InventoryStockView.last_updated),
+]
 
 class InventoryService:
     def __init__(self, db: Session):
         self.db = db
 
+    # --- LẤY DANH SÁCH TỒN KHO DẠNG PHẲNG (từ view, không cần join/eager load) ---
+    def _list_query(self, search: str = None, warehouse_id: int = None):
+        query = self.db.query(InventoryStockView)
+
+        if warehouse_id:
+            query = query.filter(InventoryStockView.warehouse_id == warehouse_id)
+
+        if search:
+            search_term = f"%{search}%"
+            query = query.filter(
+                or_(
+                    InventoryStockView.material_code.ilike(search_term),
+                    InventoryStockView.supplier_batch_no.ilike(search_term),
+                    InventoryStockView.internal_batch_code.ilike(search_term)
+                )
+            )
+        return query
+
+    def get_list(
+        self,
+        skip: int = 0,
+        limit: int = 100,
+        search: str = None,
+        warehouse_id: int = None,
+        cursor: str = None
+    ) -> List[InventoryStockView]:
+        """
+        Danh sách tồn kho cho màn hình list/search: mỗi dòng đã có sẵn mã vật tư, kho, mã lô,
+        số cuộn, pallet và NCC (view v_inventory_stock_list) -> 1 query, không nhân bản dòng.
+        """
+        return paginate(
+            self._list_query(search, warehouse_id),
+            [(InventoryStockView.last_updated, True), (InventoryStockView.id, True)],
+            skip=skip, limit=limit, cursor=cursor
+        )
+
+    def export_list(self, fmt: ExportFormat, search: str = None, warehouse_id: int = None) -> StreamingResponse:
+        """Xuất toàn bộ danh sách tồn kho (cùng bộ lọc với get_list) ra Excel / CSV"""
+        query = self._list_query(search, warehouse_id).order_by(
+            InventoryStockView.material_code, InventoryStockView.internal_batch_code, InventoryStockView.id
+        )
+        return stream_export(query, INVENTORY_EXPORT_COLUMNS, fmt, "ton_kho")
+
     # --- [MỚI] LẤY DANH SÁCH TỒN KHO (Phân trang & Tìm kiếm) ---
     def get_multi(
         self, 
         skip: int = 0, 
         limit: int = 100, 
         search: str = None, 
-        warehouse_id: int = None
+        warehouse_id: int = None,
+        cursor: str = None,
+        load_schema: Optional[type] = InventoryStockResponse
     ) -> List[InventoryStock]:
         """
         Lấy danh sách tồn kho.
+        - Lọc / tìm kiếm / phân trang (keyset) trên view v_inventory_stock_list: chỉ lấy id của trang,
+          không join chuỗi quan hệ để lọc.
+        - load_schema: response schema sẽ serialize kết quả -> eager load đúng các quan hệ schema cần
+          (Inventory -> Batch -> ReceiptDetail -> Header -> PO -> Supplier, Material -> Unit...) cho các id đó.
         """
-        query = self.db.query(InventoryStock)
-
-        # [TỐI ƯU] Eager Load các relationship sâu để lấy dữ liệu cho Property
-        # Inventory -> Batch -> ReceiptDetail -> Header -> PO -> Supplier
-        query = query.options(
-            joinedload(InventoryStock.material),
-            joinedload(InventoryStock.warehouse),
-            joinedload(InventoryStock.batch)
-                .joinedload(Batch.receipt_detail)
-                .joinedload(MaterialReceiptDetail.header)
-                .joinedload(MaterialReceipt.po_header)
-                .joinedload(PurchaseOrderHeader.vendor)
+        page = paginate(
+            self._list_query(search, warehouse_id).with_entities(InventoryStockView.id, InventoryStockView.last_updated),
+            [(InventoryStockView.last_updated, True), (InventoryStockView.id, True)],
+            skip=skip, limit=limit, cursor=cursor
         )
+        ids = [row.id for row in page]
+        if not ids:
+            return page
 
-        # Filter Warehouse
-        if warehouse_id:
-            query = query.filter(InventoryStock.warehouse_id == warehouse_id)
+        query = self.db.query(InventoryStock).filter(InventoryStock.id.in_(ids))
+        if load_schema:
+            query = query.options(*schema_load_options(InventoryStock, load_schema))
+        by_id = {stock.id: stock for stock in query}
 
-        # Search Logic
-        if search:
-            search_term = f"%{search}%"
-            # Cần join rõ ràng để filter (dù đã options joinedload ở trên dùng để select)
-            query = query.join(InventoryStock.material).join(InventoryStock.batch)
-            
-            query = query.filter(
-                or_(
-                    Material.material_code.ilike(search_term),
-                    Batch.supplier_batch_no.ilike(search_term),
-                    Batch.internal_batch_code.ilike(search_term)
-                )
-            )
-        
-        return query.order_by(desc(InventoryStock.last_updated)).offset(skip).limit(limit).all()
+        # Giữ đúng thứ tự trang của view
+        items = CursorPage(by_id[stock_id] for stock_id in ids if stock_id in by_id)
+        items.next_cursor = page.next_cursor
+        return items
 
     def get_stock_by_batch(self, warehouse_id: int, batch_id: int) -> InventoryStock:
         return self.db.query(InventoryStock).filter(
@@ -72,116 +145,402 @@ class InventoryService:
         ).first()
 
     def get_total_stock_by_material(self, material_id: int) -> Dict[str, Any]:
-        """Tính tổng tồn kho của 1 loại sợi ở tất cả các kho và các lô"""
-        result = self.db.query(
-            func.sum(InventoryStock.quantity_on_hand).label("total_on_hand"),
-            func.sum(InventoryStock.quantity_reserved).label("total_reserved")
-        ).filter(InventoryStock.material_id == material_id).first()
-        
-        if not result:
-            return {
-                "material_id": material_id,
-                "total_on_hand": 0.0,
-                "total_reserved": 0.0,
-                "total_available": 0.0
-            }
+        """Tổng tồn kho của 1 loại sợi ở tất cả các kho và các lô (đọc từ bảng tổng hợp)"""
+        return InventorySummaryService(self.db).get_totals([material_id])[0]
 
-        on_hand = result.total_on_hand if result.total_on_hand is not None else 0.0
-        reserved = result.total_reserved if result.total_reserved is not None else 0.0
-        
-        return {
-            "material_id": material_id,
-            "total_on_hand": on_hand,
-            "total_reserved": reserved,
-            "total_available": on_hand - reserved
+    def post_movements(self, movements: List[InventoryMovement], allow_negative: bool = True) -> None:
+        """
+        Ghi sổ nhiều biến động tồn kho trong transaction hiện tại (KHÔNG commit).
+        - Gộp các dòng trùng bộ 3 (Vật tư - Kho - Lô) thành 1 delta.
+        - 1 query lấy toàn bộ dòng InventoryStock đã có.
+        - 1 lệnh UPDATE (executemany) cộng dồn delta + 1 lệnh INSERT cho các dòng chưa có.
+        - Mọi biến động đều được ghi thêm vào sổ cái inventory_transactions.
+        param allow_negative: False -> khóa dòng tồn & kiểm tra đủ tồn trước khi trừ, UPDATE chỉ trừ khi còn đủ tồn
+        (dùng cho xuất kho).
+        """
+        deltas: Dict[Tuple[int, int, int], float] = {}
+        for m in movements:
+            key = (m.material_id, m.warehouse_id, m.batch_id)
+            deltas[key] = deltas.get(key, 0.0) + m.quantity_delta
+
+        if not deltas:
+            return
+
+        # Đẩy các thay đổi đang chờ (Batch mới, Detail mới...) xuống DB trước khi ghi tồn
+        self.db.flush()
+
+        query = self.db.query(InventoryStock).filter(
+            tuple_(
+                InventoryStock.material_id,
+                InventoryStock.warehouse_id,
+                InventoryStock.batch_id
+            ).in_(sorted(deltas.keys()))
+        )
+        if not allow_negative:
+            # [CHỐNG XUẤT ÂM] Khóa dòng (SELECT ... FOR UPDATE) theo thứ tự cố định
+            # để 2 phiếu xuất cùng lô phải chờ nhau, không cùng vượt qua bước kiểm tra tồn.
+            # populate_existing: lấy số mới nhất từ DB sau khi đã giữ khóa.
+            query = query.order_by(
+                InventoryStock.material_id,
+                InventoryStock.warehouse_id,
+                InventoryStock.batch_id
+            ).with_for_update().populate_existing()
+
+        existing: Dict[Tuple[int, int, int], InventoryStock] = {
+            (s.material_id, s.warehouse_id, s.batch_id): s for s in query.all()
         }
 
+        if not allow_negative:
+            for key, delta in deltas.items():
+                if delta >= 0:
+                    continue
+                stock = existing.get(key)
+                current_qty = (stock.quantity_on_hand or 0.0) if stock else 0.0
+                if current_qty + delta < -0.0001:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Không đủ tồn kho cho Batch ID {key[2]}. Tồn: {current_qty}, Xuất: {-delta}"
+                    )
+
+        # 1. Dòng đã có: cộng dồn trực tiếp trên DB (sắp theo id để thứ tự khóa luôn cố định)
+        rows_to_update = sorted(
+            ({"_stock_id": stock.id, "_delta": deltas[key]} for key, stock in existing.items()),
+            key=lambda r: r["_stock_id"]
+        )
+        if rows_to_update:
+            table = InventoryStock.__table__
+            new_qty = func.coalesce(table.c.quantity_on_hand, 0.0) + bindparam("_delta")
+            statement = update(table).where(table.c.id == bindparam("_stock_id"))
+            if not allow_negative:
+                # [CHỐNG XUẤT ÂM] Trừ có điều kiện ngay trong UPDATE: tồn đã bị phiếu khác trừ sau bước kiểm tra
+                # (DB không có khóa dòng như SQLite) -> dòng không được sửa -> báo lỗi, caller rollback.
+                statement = statement.where(or_(bindparam("_delta") >= 0, new_qty >= -0.0001))
+            result = self.db.execute(statement.values(quantity_on_hand=new_qty), rows_to_update)
+            if not allow_negative and result.rowcount != len(rows_to_update):
+                raise HTTPException(
+                    status_code=400,
+                    detail="Không đủ tồn kho: tồn vừa bị phiếu khác trừ. Vui lòng thử lại."
+                )
+            # Object trong Session đã cũ -> expire để lần đọc sau lấy lại từ DB
+            for stock in existing.values():
+                self.db.expire(stock)
+
+        # 2. Dòng chưa có: bulk insert
+        rows_to_insert = [
+            {
+                "material_id": key[0],
+                "warehouse_id": key[1],
+                "batch_id": key[2],
+                "quantity_on_hand": delta,
+                "quantity_reserved": 0.0
+            }
+            for key, delta in deltas.items() if key not in existing
+        ]
+        if rows_to_insert:
+            self.db.execute(insert(InventoryStock), rows_to_insert)
+
+        # 3. Cộng dồn bảng tổng hợp theo Vật tư / Vật tư - Kho (kèm giá bình quân di động)
+        summary_deltas: Dict[Tuple[int, int], float] = {}
+        for (material_id, warehouse_id, _), delta in deltas.items():
+            summary_deltas[(material_id, warehouse_id)] = summary_deltas.get((material_id, warehouse_id), 0.0) + delta
+        valuation = InventoryValuationService(self.db).value_movements(movements)
+        InventorySummaryService(self.db).apply_deltas(on_hand=summary_deltas, valuation=valuation)
+
+        # 4. Ghi sổ cái (mỗi biến động 1 dòng, bỏ qua delta = 0)
+        journal_rows = [
+            {
+                "material_id": m.material_id,
+                "warehouse_id": m.warehouse_id,
+                "batch_id": m.batch_id,
+                "quantity_delta": m.quantity_delta,
+                "transaction_type": m.transaction_type,
+                "reference_type": m.reference_type,
+                "reference_id": m.reference_id,
+                "note": m.note
+            }
+            for m in movements if m.quantity_delta != 0
+        ]
+        if journal_rows:
+            self.db.execute(insert(InventoryTransaction), journal_rows)
+
     def increase_stock(self, material_id: int, warehouse_id: int, batch_id: int, quantity: float, commit: bool = True):
         """
-        Tăng/Giảm tồn kho.
-        param commit: Nếu True thì commit ngay (dùng cho API lẻ). Nếu False thì chỉ flush (dùng cho Transaction lớn).
+        Tăng/Giảm tồn kho 1 lô (bọc lại post_movements).
+        param commit: Nếu True thì commit ngay (dùng cho API lẻ). Nếu False thì chỉ ghi trong Transaction lớn.
         """
-        stock = self.db.query(InventoryStock).filter(
-            InventoryStock.material_id == material_id,
-            InventoryStock.warehouse_id == warehouse_id,
-            InventoryStock.batch_id == batch_id
-        ).first()
-
-        if not stock:
-            stock = InventoryStock(
+        self.post_movements([
+            InventoryMovement(
                 material_id=material_id,
                 warehouse_id=warehouse_id,
                 batch_id=batch_id,
-                quantity_on_hand=0.0,
-                quantity_reserved=0.0
+                quantity_delta=quantity
             )
-            self.db.add(stock)
-        
-        current_qty = stock.quantity_on_hand or 0.0
-        stock.quantity_on_hand = current_qty + quantity
-        
+        ])
+
         if commit:
             self.db.commit()
-            self.db.refresh(stock)
-        else:
-            self.db.flush() # Chỉ đẩy xuống DB để check constraint, chưa chốt
-            
-        return stock
 
-    def reserve_stock(self, material_id: int, quantity_needed: float):
-        stocks = self.db.query(InventoryStock).filter(
+        return self.db.query(InventoryStock).filter(
             InventoryStock.material_id == material_id,
-            InventoryStock.quantity_on_hand > InventoryStock.quantity_reserved
-        ).order_by(InventoryStock.batch_id.asc()).all()
-
-        remaining_need = quantity_needed
-        reserved_logs = []
-
-        for stock in stocks:
-            if remaining_need <= 0:
-                break
-            
-            on_hand = stock.quantity_on_hand or 0.0
-            reserved = stock.quantity_reserved or 0.0
-            available = on_hand - reserved
-            
-            if available <= 0:
-                continue
-
-            take = min(available, remaining_need)
-            
-            stock.quantity_reserved = reserved + take
-            remaining_need -= take
-            
-            reserved_logs.append({
-                "batch_id": stock.batch_id,
-                "reserved_qty": take
-            })
-            self.db.add(stock)
-
-        if remaining_need > 0.001:
-            self.db.rollback() 
-            raise HTTPException(status_code=400, detail=f"Không đủ tồn kho khả dụng để giữ chỗ. Thiếu {remaining_need}")
-        
-        self.db.commit()
-        return reserved_logs
+            InventoryStock.warehouse_id == warehouse_id,
+            InventoryStock.batch_id == batch_id
+        ).first()
+
+    def reserve_stock(self, material_id: int, quantity_needed: float, warehouse_id: int = None):
+        """
+        Giữ chỗ cho 1 vật tư (giữ lại cho code cũ) - dùng bộ phân bổ FEFO:
+        chỉ lấy lô QC PASS, còn hạn, hết hạn trước giữ trước.
+        Phân bổ nhiều dòng 1 lần: InventoryAllocationService.allocate().
+        """
+        result = InventoryAllocationService(self.db).allocate(
+            AllocationRequest(lines=[
+                AllocationDemand(material_id=material_id, quantity=quantity_needed, warehouse_id=warehouse_id)
+            ])
+        )
+        return [
+            {"batch_id": a.batch_id, "reserved_qty": a.quantity}
+            for a in result.allocations
+        ]
 
     def adjust_stock(self, adjustment: InventoryAdjustment):
         stock = self.get_stock_by_batch(adjustment.warehouse_id, adjustment.batch_id)
-        if not stock:
-            if adjustment.new_quantity > 0:
-                stock = self.increase_stock(
-                    material_id=adjustment.material_id, 
-                    warehouse_id=adjustment.warehouse_id, 
-                    batch_id=adjustment.batch_id, 
-                    quantity=adjustment.new_quantity
-                )
-            else:
-                raise HTTPException(status_code=404, detail="Không tìm thấy dữ liệu tồn kho để điều chỉnh.")
+        if not stock and adjustment.new_quantity <= 0:
+            raise HTTPException(status_code=404, detail="Không tìm thấy dữ liệu tồn kho để điều chỉnh.")
+
+        # Quy đổi số kiểm kê thành delta để ghi sổ qua cùng 1 đường
+        current_qty = (stock.quantity_on_hand or 0.0) if stock else 0.0
+        self.post_movements([
+            InventoryMovement(
+                material_id=stock.material_id if stock else adjustment.material_id,
+                warehouse_id=adjustment.warehouse_id,
+                batch_id=adjustment.batch_id,
+                quantity_delta=adjustment.new_quantity - current_qty,
+                transaction_type=InventoryTransactionType.ADJUSTMENT,
+                note=adjustment.reason
+            )
+        ])
+        self.db.commit()
+
+        return self.get_stock_by_batch(adjustment.warehouse_id, adjustment.batch_id)
+
+    # =========================================================================
+    # SỔ CÁI TỒN KHO: LỊCH SỬ, SNAPSHOT, TỒN TẠI THỜI ĐIỂM, REBUILD
+    # =========================================================================
+
+    def get_transactions(
+        self,
+        skip: int = 0,
+        limit: int = 100,
+        material_id: int = None,
+        warehouse_id: int = None,
+        batch_id: int = None,
+        from_date: datetime = None,
+        to_date: datetime = None,
+        cursor: str = None
+    ) -> List[InventoryTransaction]:
+        """Lịch sử biến động tồn kho (mới nhất lên đầu)"""
+        query = self.db.query(InventoryTransaction)
+
+        if material_id:
+            query = query.filter(InventoryTransaction.material_id == material_id)
+        if warehouse_id:
+            query = query.filter(InventoryTransaction.warehouse_id == warehouse_id)
+        if batch_id:
+            query = query.filter(InventoryTransaction.batch_id == batch_id)
+        if from_date:
+            query = query.filter(InventoryTransaction.created_at >= from_date)
+        if to_date:
+            query = query.filter(InventoryTransaction.created_at < to_date)
+
+        return paginate(query, [(InventoryTransaction.id, True)], skip=skip, limit=limit, cursor=cursor)
+
+    def _sum_transactions(
+        self,
+        after_transaction_id: int,
+        up_to_transaction_id: int = None,
+        as_of: datetime = None,
+        material_id: int = None,
+        warehouse_id: int = None
+    ) -> Dict[Tuple[int, int, int], float]:
+        """Cộng dồn delta của sổ cái theo bộ 3 (Vật tư - Kho - Lô) trong khoảng id chỉ định"""
+        query = self.db.query(
+            InventoryTransaction.material_id,
+            InventoryTransaction.warehouse_id,
+            InventoryTransaction.batch_id,
+            func.sum(InventoryTransaction.quantity_delta).label("qty")
+        ).filter(InventoryTransaction.id > after_transaction_id)
+
+        if up_to_transaction_id is not None:
+            query = query.filter(InventoryTransaction.id <= up_to_transaction_id)
+        if as_of:
+            query = query.filter(InventoryTransaction.created_at <= as_of)
+        if material_id:
+            query = query.filter(InventoryTransaction.material_id == material_id)
+        if warehouse_id:
+            query = query.filter(InventoryTransaction.warehouse_id == warehouse_id)
+
+        rows = query.group_by(
+            InventoryTransaction.material_id,
+            InventoryTransaction.warehouse_id,
+            InventoryTransaction.batch_id
+        ).all()
+        return {(r.material_id, r.warehouse_id, r.batch_id): (r.qty or 0.0) for r in rows}
+
+    def _get_snapshot_lines(
+        self, snapshot: Optional[InventorySnapshot], material_id: int = None, warehouse_id: int = None
+    ) -> Dict[Tuple[int, int, int], float]:
+        if not snapshot:
+            return {}
+        query = self.db.query(InventorySnapshotLine).filter(InventorySnapshotLine.snapshot_id == snapshot.snapshot_id)
+        if material_id:
+            query = query.filter(InventorySnapshotLine.material_id == material_id)
+        if warehouse_id:
+            query = query.filter(InventorySnapshotLine.warehouse_id == warehouse_id)
+        return {(l.material_id, l.warehouse_id, l.batch_id): l.quantity_on_hand for l in query.all()}
+
+    def get_balance_as_of(self, as_of: datetime, material_id: int = None, warehouse_id: int = None) -> List[Dict[str, Any]]:
+        """
+        Tồn kho tại thời điểm as_of (VD: cuối tháng).
+        = Snapshot gần nhất trước as_of + các giao dịch phát sinh sau snapshot đó đến as_of.
+        """
+        snapshot = self.db.query(InventorySnapshot)\
+            .filter(InventorySnapshot.snapshot_at <= as_of)\
+            .order_by(desc(InventorySnapshot.snapshot_at))\
+            .first()
+
+        balances = self._get_snapshot_lines(snapshot, material_id, warehouse_id)
+        deltas = self._sum_transactions(
+            after_transaction_id=snapshot.last_transaction_id if snapshot else 0,
+            as_of=as_of,
+            material_id=material_id,
+            warehouse_id=warehouse_id
+        )
+        for key, qty in deltas.items():
+            balances[key] = balances.get(key, 0.0) + qty
+
+        return [
+            {"material_id": k[0], "warehouse_id": k[1], "batch_id": k[2], "quantity_on_hand": qty}
+            for k, qty in sorted(balances.items())
+            if abs(qty) > 0.0001
+        ]
+
+    def create_snapshot(self) -> Dict[str, Any]:
+        """
+        Chốt số dư hiện tại vào inventory_snapshots.
+        Chỉ cộng thêm các giao dịch phát sinh sau snapshot trước đó (không quét lại cả sổ).
+        Nên chạy định kỳ (VD: cron cuối ngày / cuối tháng).
+        """
+        previous = self.db.query(InventorySnapshot).order_by(desc(InventorySnapshot.last_transaction_id)).first()
+        last_id = self.db.query(func.max(InventoryTransaction.id)).scalar() or 0
+
+        balances = self._get_snapshot_lines(previous)
+        deltas = self._sum_transactions(
+            after_transaction_id=previous.last_transaction_id if previous else 0,
+            up_to_transaction_id=last_id
+        )
+        for key, qty in deltas.items():
+            balances[key] = balances.get(key, 0.0) + qty
+
+        snapshot = InventorySnapshot(snapshot_at=datetime.now(), last_transaction_id=last_id)
+        self.db.add(snapshot)
+        self.db.flush()
+
+        lines = [
+            {
+                "snapshot_id": snapshot.snapshot_id,
+                "material_id": k[0],
+                "warehouse_id": k[1],
+                "batch_id": k[2],
+                "quantity_on_hand": qty
+            }
+            for k, qty in balances.items() if abs(qty) > 0.0001
+        ]
+        if lines:
+            self.db.execute(insert(InventorySnapshotLine), lines)
+
+        self.db.commit()
+        return {
+            "snapshot_id": snapshot.snapshot_id,
+            "snapshot_at": snapshot.snapshot_at,
+            "last_transaction_id": last_id,
+            "line_count": len(lines)
+        }
+
+    def rebuild_stock_projection(self) -> Dict[str, int]:
+        """
+        Dựng lại quantity_on_hand của inventory_stocks từ sổ cái (lệnh sửa lỗi lệch số).
+        Không đụng tới quantity_reserved. Bảng tổng hợp tồn được dựng lại sau cùng.
+        """
+        ledger = self._sum_transactions(after_transaction_id=0)
+
+        current = {
+            (r.material_id, r.warehouse_id, r.batch_id): r
+            for r in self.db.query(
+                InventoryStock.id,
+                InventoryStock.material_id,
+                InventoryStock.warehouse_id,
+                InventoryStock.batch_id,
+                InventoryStock.quantity_on_hand
+            ).all()
+        }
+
+        # 1. Dòng đã có: chỉ ghi những dòng bị lệch
+        rows_to_update = []
+        for key, row in current.items():
+            expected = ledger.get(key, 0.0)
+            if abs((row.quantity_on_hand or 0.0) - expected) > 0.0001:
+                rows_to_update.append({"id": row.id, "quantity_on_hand": expected})
+        if rows_to_update:
+            self.db.execute(update(InventoryStock), rows_to_update)
+
+        # 2. Dòng có trong sổ nhưng thiếu ở bảng tổng hợp (bỏ qua lô đã bị xóa)
+        missing = {k: qty for k, qty in ledger.items() if k not in current and abs(qty) > 0.0001}
+        rows_to_insert = []
+        if missing:
+            live_batch_ids = {
+                b.batch_id for b in self.db.query(Batch.batch_id).filter(
+                    Batch.batch_id.in_({k[2] for k in missing})
+                ).all()
+            }
+            rows_to_insert = [
+                {
+                    "material_id": k[0],
+                    "warehouse_id": k[1],
+                    "batch_id": k[2],
+                    "quantity_on_hand": qty,
+                    "quantity_reserved": 0.0
+                }
+                for k, qty in missing.items() if k[2] in live_batch_ids
+            ]
+            if rows_to_insert:
+                self.db.execute(insert(InventoryStock), rows_to_insert)
+
+        # 3. Bảng tổng hợp theo Vật tư / Kho cũng dựng lại theo số mới
+        summary = InventorySummaryService(self.db).rebuild()
+        InventoryValuationService(self.db).replay()
+
+        self.db.commit()
+        return {
+            "updated": len(rows_to_update),
+            "inserted": len(rows_to_insert),
+            "summary_materials": summary["materials"]
+        }
+
+
+if __name__ == "__main__":
+    # Lệnh chạy tay / cron:
+    #   python -m app.services.inventory_service rebuild
+    #   python -m app.services.inventory_service snapshot
+    import sys
+    from app.db.session import SessionLocal
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "rebuild"
+    db = SessionLocal()
+    try:
+        service = InventoryService(db)
+        if command == "snapshot":
+            print(service.create_snapshot())
         else:
-            stock.quantity_on_hand = adjustment.new_quantity
-            self.db.add(stock)
-            self.db.commit()
-            self.db.refresh(stock)
-        
-        return stock
\ No newline at end of file
+            print(service.rebuild_stock_projection())
+    finally:
+        db.close()
\ No newline at end of file
@@ -0,0 +1,193 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select, delete, insert, update, bindparam
+from typing import Dict, List, Optional, Tuple
+
+from app.db.upsert import upsert_increment
+from app.models.inventory import InventoryStock
+from app.models.inventory_summary import InventoryMaterialSummary, InventoryWarehouseSummary
+from app.models.material import Material
+
+class InventorySummaryService:
+    """
+    Bảng tổng hợp tồn theo Vật tư và theo Vật tư - Kho.
+    - apply_deltas(): gọi trong cùng transaction với mọi thay đổi inventory_stocks, cộng dồn bằng
+      INSERT ... ON DUPLICATE KEY UPDATE (2 câu lệnh executemany, không đọc trước).
+    - Đọc tổng tồn / cảnh báo dưới định mức chỉ là tra theo khóa chính, không SUM lúc đọc.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    # =========================
+    # GHI: CỘNG DỒN THEO BIẾN ĐỘNG
+    # =========================
+    def apply_deltas(
+        self,
+        on_hand: Optional[Dict[Tuple[int, int], float]] = None,
+        reserved: Optional[Dict[Tuple[int, int], float]] = None,
+        valuation: Optional[Dict[int, Tuple[float, float]]] = None
+    ) -> None:
+        """
+        Cộng dồn thay đổi vào bảng tổng hợp (KHÔNG commit).
+        on_hand / reserved: {(material_id, warehouse_id): delta}
+        valuation: {material_id: (stock_value, average_unit_cost)} - giá trị mới (ghi đè), xem InventoryValuationService
+        """
+        on_hand = on_hand or {}
+        reserved = reserved or {}
+
+        per_warehouse: Dict[Tuple[int, int], List[float]] = {}
+        for key, delta in on_hand.items():
+            per_warehouse.setdefault(key, [0.0, 0.0])[0] += delta
+        for key, delta in reserved.items():
+            per_warehouse.setdefault(key, [0.0, 0.0])[1] += delta
+
+        per_material: Dict[int, List[float]] = {}
+        for (material_id, _), (d_on_hand, d_reserved) in per_warehouse.items():
+            totals = per_material.setdefault(material_id, [0.0, 0.0])
+            totals[0] += d_on_hand
+            totals[1] += d_reserved
+
+        # Sắp theo khóa để thứ tự khóa dòng luôn cố định giữa các transaction
+        upsert_increment(
+            self.db,
+            InventoryWarehouseSummary.__table__,
+            ["material_id", "warehouse_id"],
+            [
+                {"material_id": k[0], "warehouse_id": k[1], "quantity_on_hand": v[0], "quantity_reserved": v[1]}
+                for k, v in sorted(per_warehouse.items()) if v[0] or v[1]
+            ]
+        )
+        upsert_increment(
+            self.db,
+            InventoryMaterialSummary.__table__,
+            ["material_id"],
+            [
+                {"material_id": k, "quantity_on_hand": v[0], "quantity_reserved": v[1]}
+                for k, v in sorted(per_material.items()) if v[0] or v[1]
+            ]
+        )
+
+        if valuation:
+            table = InventoryMaterialSummary.__table__
+            self.db.execute(
+                update(table)
+                .where(table.c.material_id == bindparam("_material_id"))
+                .values(stock_value=bindparam("_value"), average_unit_cost=bindparam("_average")),
+                [
+                    {"_material_id": material_id, "_value": value, "_average": average}
+                    for material_id, (value, average) in sorted(valuation.items())
+                ]
+            )
+
+    def rebuild(self) -> Dict[str, int]:
+        """
+        Dựng lại 2 bảng tổng hợp từ inventory_stocks (KHÔNG commit) - dùng khi nghi ngờ lệch số.
+        Giá bình quân cần chạy lại sau đó: InventoryValuationService.replay().
+        """
+        on_hand = func.coalesce(func.sum(InventoryStock.quantity_on_hand), 0.0)
+        reserved = func.coalesce(func.sum(InventoryStock.quantity_reserved), 0.0)
+
+        self.db.execute(delete(InventoryWarehouseSummary))
+        self.db.execute(delete(InventoryMaterialSummary))
+
+        warehouse_rows = self.db.execute(
+            insert(InventoryWarehouseSummary).from_select(
+                ["material_id", "warehouse_id", "quantity_on_hand", "quantity_reserved"],
+                select(InventoryStock.material_id, InventoryStock.warehouse_id, on_hand, reserved)
+                .group_by(InventoryStock.material_id, InventoryStock.warehouse_id)
+            )
+        ).rowcount
+        material_rows = self.db.execute(
+            insert(InventoryMaterialSummary).from_select(
+                ["material_id", "quantity_on_hand", "quantity_reserved"],
+                select(InventoryStock.material_id, on_hand, reserved)
+                .group_by(InventoryStock.material_id)
+            )
+        ).rowcount
+        return {"materials": material_rows, "warehouses": warehouse_rows}
+
+    # =========================
+    # ĐỌC
+    # =========================
+    @staticmethod
+    def _totals(material_id: int, on_hand: Optional[float], reserved: Optional[float]) -> Dict:
+        on_hand = on_hand or 0.0
+        reserved = reserved or 0.0
+        return {
+            "material_id": material_id,
+            "total_on_hand": on_hand,
+            "total_reserved": reserved,
+            "total_available": on_hand - reserved
+        }
+
+    def get_totals(self, material_ids: List[int], by_warehouse: bool = False) -> List[Dict]:
+        """
+        Tổng tồn của nhiều vật tư trong 1 lần gọi (giữ đúng thứ tự material_ids,
+        vật tư chưa có tồn trả về 0). by_warehouse=True: kèm chi tiết từng kho (thêm 1 query).
+        """
+        material_ids = list(dict.fromkeys(material_ids))
+        if not material_ids:
+            return []
+
+        rows = {
+            r.material_id: r for r in self.db.query(InventoryMaterialSummary).filter(
+                InventoryMaterialSummary.material_id.in_(material_ids)
+            ).all()
+        }
+        results = []
+        for material_id in material_ids:
+            row = rows.get(material_id)
+            results.append(self._totals(
+                material_id,
+                row.quantity_on_hand if row else 0.0,
+                row.quantity_reserved if row else 0.0
+            ))
+
+        if by_warehouse:
+            warehouses: Dict[int, List[Dict]] = {}
+            for r in self.db.query(InventoryWarehouseSummary).filter(
+                InventoryWarehouseSummary.material_id.in_(material_ids)
+            ).order_by(InventoryWarehouseSummary.material_id, InventoryWarehouseSummary.warehouse_id).all():
+                item = self._totals(r.material_id, r.quantity_on_hand, r.quantity_reserved)
+                item["warehouse_id"] = r.warehouse_id
+                warehouses.setdefault(r.material_id, []).append(item)
+            for item in results:
+                item["warehouses"] = warehouses.get(item["material_id"], [])
+
+        return results
+
+    def get_below_minimum(self, skip: int = 0, limit: int = 100) -> List[Dict]:
+        """
+        Vật tư có tồn khả dụng (On Hand - Reserved) thấp hơn Material.min_stock_level.
+        Vật tư chưa từng có tồn cũng được liệt kê (khả dụng = 0). Thiếu nhiều nhất xếp trước.
+        """
+        on_hand = func.coalesce(InventoryMaterialSummary.quantity_on_hand, 0.0)
+        reserved = func.coalesce(InventoryMaterialSummary.quantity_reserved, 0.0)
+        available = on_hand - reserved
+        shortage = Material.min_stock_level - available
+
+        rows = self.db.query(
+            Material.id,
+            Material.material_code,
+            Material.material_type,
+            Material.min_stock_level,
+            on_hand.label("total_on_hand"),
+            reserved.label("total_reserved"),
+            shortage.label("shortage")
+        ).outerjoin(
+            InventoryMaterialSummary, InventoryMaterialSummary.material_id == Material.id
+        ).filter(
+            Material.min_stock_level > 0,
+            available < Material.min_stock_level
+        ).order_by(shortage.desc(), Material.id).offset(skip).limit(limit).all()
+
+        return [
+            {
+                **self._totals(r.id, r.total_on_hand, r.total_reserved),
+                "material_code": r.material_code,
+                "material_type": r.material_type,
+                "min_stock_level": r.min_stock_level,
+                "shortage": r.shortage
+            }
+            for r in rows
+        ]
\ No newline at end of file
@@ -0,0 +1,253 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import case, func, select, update
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.models.inventory import InventoryStock
+from app.models.inventory_summary import InventoryMaterialSummary
+from app.models.inventory_transaction import InventoryTransaction, InventoryTransactionType
+from app.models.batch import Batch
+from app.models.material import Material
+from app.models.warehouse import Warehouse
+from app.models.material_receipt import MaterialReceipt, MaterialReceiptDetail
+from app.models.purchase_order import PurchaseOrderHeader, PurchaseOrderDetail
+from app.schemas.inventory_schema import InventoryMovement
+from app.services.inventory_summary_service import InventorySummaryService
+
+# Biến động ghi theo giá của chính lô (nhập / hoàn tác nhập / số dư đầu kỳ).
+# Các biến động còn lại (xuất, kiểm kê) ghi theo giá bình quân hiện tại.
+BATCH_COSTED_TYPES = {
+    InventoryTransactionType.RECEIPT,
+    InventoryTransactionType.REVERSAL,
+    InventoryTransactionType.OPENING,
+}
+
+
+def _po_unit_cost():
+    """
+    Giá vốn của lô (subquery tương quan theo Batch.receipt_detail_id):
+    đơn giá bình quân các dòng PO cùng vật tư x tỷ giá của PO.
+    """
+    return select(
+        func.sum(PurchaseOrderDetail.unit_price * PurchaseOrderDetail.quantity)
+        * func.max(func.coalesce(PurchaseOrderHeader.exchange_rate, 1.0))
+        / func.nullif(func.sum(PurchaseOrderDetail.quantity), 0)
+    ).select_from(MaterialReceiptDetail).join(
+        MaterialReceipt, MaterialReceipt.receipt_id == MaterialReceiptDetail.receipt_id
+    ).join(
+        PurchaseOrderHeader, PurchaseOrderHeader.po_id == MaterialReceipt.po_header_id
+    ).join(
+        PurchaseOrderDetail,
+        (PurchaseOrderDetail.po_id == PurchaseOrderHeader.po_id)
+        & (PurchaseOrderDetail.material_id == MaterialReceiptDetail.material_id)
+    ).where(
+        MaterialReceiptDetail.detail_id == Batch.receipt_detail_id
+    ).scalar_subquery()
+
+
+def _apply_movement(state: List[float], quantity_delta: float, batch_cost: Optional[float]) -> None:
+    """Bình quân di động: state = [số lượng, giá trị, giá bình quân], cập nhật tại chỗ"""
+    quantity, value, average = state
+    if batch_cost is not None:
+        value += quantity_delta * batch_cost
+    else:
+        value += quantity_delta * average
+    quantity += quantity_delta
+
+    if quantity > 0.0001:
+        value = max(value, 0.0)
+        if batch_cost is not None:
+            average = value / quantity
+    else:
+        # Hết tồn: giá trị về 0, giữ giá bình quân cuối để ghi các biến động sau
+        value = 0.0
+        if batch_cost is not None and quantity_delta > 0:
+            average = batch_cost
+    state[:] = [quantity, value, average]
+
+
+class InventoryValuationService:
+    """
+    Định giá tồn kho.
+    - Giá lô (FIFO theo lô): Batch.unit_cost lấy từ dòng PO của phiếu nhập (đơn giá x tỷ giá).
+    - Giá bình quân di động theo vật tư: cập nhật mỗi lần post_movements (value_movements),
+      lưu ở inventory_material_summaries (average_unit_cost, stock_value).
+    - Báo cáo định giá: 1 câu GROUP BY trên toàn bộ tồn kho.
+    - Sửa giá PO: revalue_purchase_order() tính lại giá lô (1 UPDATE) và chạy lại bình quân từ sổ cái.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    # =========================
+    # GIÁ LÔ
+    # =========================
+    def cost_batches(
+        self,
+        batch_ids: Optional[Iterable[int]] = None,
+        po_id: Optional[int] = None,
+        only_missing: bool = False
+    ) -> int:
+        """1 lệnh UPDATE gán Batch.unit_cost theo dòng PO (lô không gắn PO giữ nguyên NULL)"""
+        stmt = update(Batch).values(unit_cost=_po_unit_cost())
+        if batch_ids is not None:
+            batch_ids = sorted(set(batch_ids))
+            if not batch_ids:
+                return 0
+            stmt = stmt.where(Batch.batch_id.in_(batch_ids))
+        if po_id is not None:
+            stmt = stmt.where(Batch.receipt_detail_id.in_(
+                select(MaterialReceiptDetail.detail_id).join(
+                    MaterialReceipt, MaterialReceipt.receipt_id == MaterialReceiptDetail.receipt_id
+                ).where(MaterialReceipt.po_header_id == po_id)
+            ))
+        if only_missing:
+            stmt = stmt.where(Batch.unit_cost.is_(None))
+        return self.db.execute(stmt.execution_options(synchronize_session=False)).rowcount
+
+    # =========================
+    # BÌNH QUÂN DI ĐỘNG (THEO TỪNG LẦN GHI SỔ)
+    # =========================
+    def value_movements(self, movements: List[InventoryMovement]) -> Dict[int, Tuple[float, float]]:
+        """
+        Tính giá trị tồn / giá bình quân mới của các vật tư bị đụng tới (gọi trong post_movements, KHÔNG commit).
+        Trả về {material_id: (stock_value, average_unit_cost)} để InventorySummaryService.apply_deltas ghi.
+        """
+        movements = [m for m in movements if m.quantity_delta != 0]
+        if not movements:
+            return {}
+
+        # 1. Giá lô cho các dòng nhập (lô mới tạo chưa có giá thì lấy từ PO)
+        costed_batch_ids = {m.batch_id for m in movements if m.transaction_type in BATCH_COSTED_TYPES}
+        batch_costs: Dict[int, Optional[float]] = {}
+        if costed_batch_ids:
+            self.cost_batches(costed_batch_ids, only_missing=True)
+            batch_costs = {
+                r.batch_id: r.unit_cost for r in self.db.query(Batch.batch_id, Batch.unit_cost).filter(
+                    Batch.batch_id.in_(costed_batch_ids)
+                ).all()
+            }
+
+        # 2. Trạng thái hiện tại (khóa dòng tổng hợp tới khi commit để 2 phiếu không cùng tính trên số cũ)
+        material_ids = sorted({m.material_id for m in movements})
+        state: Dict[int, List[float]] = {material_id: [0.0, 0.0, 0.0] for material_id in material_ids}
+        for r in self.db.query(
+            InventoryMaterialSummary.material_id,
+            InventoryMaterialSummary.quantity_on_hand,
+            InventoryMaterialSummary.stock_value,
+            InventoryMaterialSummary.average_unit_cost
+        ).filter(
+            InventoryMaterialSummary.material_id.in_(material_ids)
+        ).order_by(InventoryMaterialSummary.material_id).with_for_update().all():
+            state[r.material_id] = [r.quantity_on_hand or 0.0, r.stock_value or 0.0, r.average_unit_cost or 0.0]
+
+        # 3. Ghi từng biến động theo thứ tự
+        for m in movements:
+            cost = batch_costs.get(m.batch_id) if m.transaction_type in BATCH_COSTED_TYPES else None
+            _apply_movement(state[m.material_id], m.quantity_delta, cost)
+
+        return {material_id: (s[1], s[2]) for material_id, s in state.items()}
+
+    def replay(self, material_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        Tính lại giá bình quân từ đầu sổ cái (1 query đọc sổ cái kèm giá lô, KHÔNG commit).
+        Dùng sau khi sửa giá lô / dựng lại bảng tổng hợp. Trả về số vật tư đã cập nhật.
+        """
+        query = self.db.query(
+            InventoryTransaction.material_id,
+            InventoryTransaction.batch_id,
+            InventoryTransaction.transaction_type,
+            InventoryTransaction.quantity_delta,
+            Batch.unit_cost
+        ).outerjoin(Batch, Batch.batch_id == InventoryTransaction.batch_id)
+        if material_ids is not None:
+            material_ids = sorted(set(material_ids))
+            if not material_ids:
+                return 0
+            query = query.filter(InventoryTransaction.material_id.in_(material_ids))
+
+        state: Dict[int, List[float]] = {}
+        for r in query.order_by(InventoryTransaction.id).yield_per(5000):
+            cost = r.unit_cost if r.transaction_type in BATCH_COSTED_TYPES else None
+            _apply_movement(state.setdefault(r.material_id, [0.0, 0.0, 0.0]), r.quantity_delta, cost)
+
+        InventorySummaryService(self.db).apply_deltas(
+            valuation={material_id: (s[1], s[2]) for material_id, s in state.items()}
+        )
+        return len(state)
+
+    def revalue_purchase_order(self, po_id: int, commit: bool = True) -> Dict[str, int]:
+        """Sửa giá / tỷ giá PO: tính lại giá các lô nhập theo PO rồi chạy lại bình quân của các vật tư liên quan"""
+        batches = self.cost_batches(po_id=po_id)
+        material_ids = [
+            r.material_id for r in self.db.query(MaterialReceiptDetail.material_id).join(
+                MaterialReceipt, MaterialReceipt.receipt_id == MaterialReceiptDetail.receipt_id
+            ).filter(MaterialReceipt.po_header_id == po_id).distinct().all()
+        ]
+        materials = self.replay(material_ids)
+        if commit:
+            self.db.commit()
+        return {"batches": batches, "materials": materials}
+
+    # =========================
+    # BÁO CÁO ĐỊNH GIÁ
+    # =========================
+    def get_report(self, material_id: Optional[int] = None, warehouse_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Định giá tồn kho theo Vật tư - Kho trong 1 query:
+        - fifo_value: từng lô tính theo giá nhập của chính lô (lô chưa có giá dùng giá bình quân).
+        - moving_average_value: số lượng x giá bình quân di động của vật tư.
+        """
+        average = func.coalesce(InventoryMaterialSummary.average_unit_cost, 0.0)
+        on_hand = func.coalesce(InventoryStock.quantity_on_hand, 0.0)
+
+        query = self.db.query(
+            InventoryStock.material_id,
+            Material.material_code,
+            InventoryStock.warehouse_id,
+            Warehouse.warehouse_name,
+            func.sum(on_hand).label("quantity_on_hand"),
+            func.sum(on_hand * func.coalesce(Batch.unit_cost, average)).label("fifo_value"),
+            func.max(average).label("average_unit_cost"),
+            func.sum(case((Batch.unit_cost.is_(None), on_hand), else_=0.0)).label("uncosted_quantity")
+        ).join(
+            Batch, Batch.batch_id == InventoryStock.batch_id
+        ).join(
+            Material, Material.id == InventoryStock.material_id
+        ).join(
+            Warehouse, Warehouse.warehouse_id == InventoryStock.warehouse_id
+        ).outerjoin(
+            InventoryMaterialSummary, InventoryMaterialSummary.material_id == InventoryStock.material_id
+        ).filter(InventoryStock.quantity_on_hand != 0)
+
+        if material_id is not None:
+            query = query.filter(InventoryStock.material_id == material_id)
+        if warehouse_id is not None:
+            query = query.filter(InventoryStock.warehouse_id == warehouse_id)
+
+        rows = query.group_by(
+            InventoryStock.material_id,
+            Material.material_code,
+            InventoryStock.warehouse_id,
+            Warehouse.warehouse_name
+        ).order_by(InventoryStock.material_id, InventoryStock.warehouse_id).all()
+
+        lines = [
+            {
+                "material_id": r.material_id,
+                "material_code": r.material_code,
+                "warehouse_id": r.warehouse_id,
+                "warehouse_name": r.warehouse_name,
+                "quantity_on_hand": r.quantity_on_hand,
+                "fifo_value": r.fifo_value or 0.0,
+                "average_unit_cost": r.average_unit_cost or 0.0,
+                "moving_average_value": (r.quantity_on_hand or 0.0) * (r.average_unit_cost or 0.0),
+                "uncosted_quantity": r.uncosted_quantity or 0.0
+            }
+            for r in rows
+        ]
+        return {
+            "total_quantity": sum(line["quantity_on_hand"] for line in lines),
+            "total_fifo_value": sum(line["fifo_value"] for line in lines),
+            "total_moving_average_value": sum(line["moving_average_value"] for line in lines),
+            "lines": lines
+        }
\ No newline at end of file
@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 from typing import Any, Dict, Optional
 from app.models.log import Log
 from app.schemas.log_schema import LogCreate
+from app.db.pagination import paginate
 
 class LogService:
     def create_log(
@@ -38,11 +39,11 @@ class LogService:
             db.rollback()
             return None
 
-    def get_logs(self, db: Session, skip: int = 0, limit: int = 100, user_id: int = None):
+    def get_logs(self, db: Session, skip: int = 0, limit: int = 100, user_id: int = None, cursor: str = None):
         query = db.query(Log)
         if user_id:
             query = query.filter(Log.user_id == user_id)
         # Sắp xếp mới nhất lên đầu
-        return query.order_by(Log.timestamp.desc()).offset(skip).limit(limit).all()
+        return paginate(query, [(Log.timestamp, True), (Log.id, True)], skip=skip, limit=limit, cursor=cursor)
 
 log_service = LogService()
\ No newline at end of file
@@ -0,0 +1,155 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import insert, select, delete
+from sqlalchemy.exc import IntegrityError
+from fastapi import HTTPException
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.models.machine import Machine, MachineArea
+from app.models.machine_line_occupancy import MachineLineOccupancy
+from app.models.weaving_basket_ticket import WeavingBasketTicket
+from app.models.basket import Basket
+from app.models.batch import Batch
+from app.models.product import Product
+
+MachineLine = Tuple[int, int]   # (machine_id, machine_line)
+
+# ============================
+# KIỂM TRA LINE ĐANG CHẠY
+# ============================
+
+def get_busy_lines(db: Session, machine_lines: Iterable[MachineLine]) -> Set[MachineLine]:
+    """Các (máy, line) đang có phiếu rổ chưa ra rổ - 1 query trên bảng occupancy"""
+    machine_lines = {(m, l) for m, l in machine_lines if m and l}
+    if not machine_lines:
+        return set()
+    rows = db.query(MachineLineOccupancy.machine_id, MachineLineOccupancy.machine_line).filter(
+        MachineLineOccupancy.machine_id.in_({m for m, _ in machine_lines}),
+        MachineLineOccupancy.machine_line.in_({l for _, l in machine_lines})
+    )
+    return {(r.machine_id, r.machine_line) for r in rows} & machine_lines
+
+# ============================
+# MỞ / ĐÓNG LINE (cùng transaction với phiếu rổ, không commit)
+# ============================
+
+def _insert(db: Session, statement):
+    """Vi phạm unique (máy, line) = line đã có phiếu khác -> rollback cả transaction, báo lỗi 400"""
+    try:
+        db.execute(statement)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Line máy đang có phiếu rổ dệt chưa ra rổ. Vui lòng hạ rổ trước.")
+
+def _occupy_select(condition):
+    return insert(MachineLineOccupancy).from_select(
+        ["machine_id", "machine_line", "ticket_id", "basket_id", "batch_id", "product_id", "occupied_since"],
+        select(
+            WeavingBasketTicket.machine_id,
+            WeavingBasketTicket.machine_line,
+            WeavingBasketTicket.id,
+            WeavingBasketTicket.basket_id,
+            WeavingBasketTicket.batch_id,
+            WeavingBasketTicket.product_id,
+            WeavingBasketTicket.time_in
+        ).where(
+            condition,
+            WeavingBasketTicket.machine_line.isnot(None),
+            WeavingBasketTicket.time_out.is_(None)
+        )
+    )
+
+def occupy_tickets_by_code(db: Session, codes: List[str]):
+    """Giữ line cho các phiếu mới tạo (insert hàng loạt, chưa có id trong session) - 1 lệnh INSERT ... SELECT"""
+    if codes:
+        _insert(db, _occupy_select(WeavingBasketTicket.code.in_(codes)))
+
+def release_tickets(db: Session, ticket_ids: Iterable[int]):
+    """Trả line của các phiếu (ra rổ / xóa phiếu)"""
+    ticket_ids = sorted({t for t in ticket_ids if t})
+    if ticket_ids:
+        db.execute(delete(MachineLineOccupancy).where(MachineLineOccupancy.ticket_id.in_(ticket_ids)))
+
+def sync_ticket(db: Session, ticket: WeavingBasketTicket):
+    """
+    Đồng bộ line theo phiếu sau khi tạo / sửa (phiếu đã flush):
+    phiếu đang mở -> giữ line theo máy/line/rổ/lô hiện tại, phiếu đã ra rổ -> trả line.
+    """
+    release_tickets(db, [ticket.id])
+    if ticket.time_out is None and ticket.machine_line:
+        _insert(db, _occupy_select(WeavingBasketTicket.id == ticket.id))
+
+# ============================
+# SƠ ĐỒ XƯỞNG
+# ============================
+
+def get_floor_map(db: Session, area: Optional[MachineArea] = None) -> List[Dict]:
+    """
+    Trạng thái từng line của mọi máy (1 query: máy LEFT JOIN line đang chạy + phiếu / rổ / lô / sản phẩm).
+    Line không có dòng occupancy = trống. Line đang chạy nhưng vượt total_lines vẫn được liệt kê.
+    """
+    query = db.query(
+        Machine.machine_id,
+        Machine.machine_name,
+        Machine.area,
+        Machine.status,
+        Machine.total_lines,
+        MachineLineOccupancy.machine_line,
+        MachineLineOccupancy.ticket_id,
+        WeavingBasketTicket.code.label("ticket_code"),
+        MachineLineOccupancy.basket_id,
+        Basket.basket_code,
+        MachineLineOccupancy.batch_id,
+        Batch.internal_batch_code,
+        MachineLineOccupancy.product_id,
+        Product.item_code,
+        MachineLineOccupancy.occupied_since
+    ).outerjoin(
+        MachineLineOccupancy, MachineLineOccupancy.machine_id == Machine.machine_id
+    ).outerjoin(
+        WeavingBasketTicket, WeavingBasketTicket.id == MachineLineOccupancy.ticket_id
+    ).outerjoin(
+        Basket, Basket.basket_id == MachineLineOccupancy.basket_id
+    ).outerjoin(
+        Batch, Batch.batch_id == MachineLineOccupancy.batch_id
+    ).outerjoin(
+        Product, Product.product_id == MachineLineOccupancy.product_id
+    )
+    if area:
+        query = query.filter(Machine.area == area)
+
+    machines: Dict[int, Dict] = {}
+    occupied: Dict[int, Dict[int, Dict]] = {}
+    for r in query.order_by(Machine.machine_id, MachineLineOccupancy.machine_line):
+        if r.machine_id not in machines:
+            machines[r.machine_id] = {
+                "machine_id": r.machine_id,
+                "machine_name": r.machine_name,
+                "area": r.area,
+                "status": r.status,
+                "total_lines": r.total_lines or 0,
+                "busy_lines": 0,
+                "lines": []
+            }
+            occupied[r.machine_id] = {}
+        if r.machine_line is not None:
+            occupied[r.machine_id][r.machine_line] = {
+                "machine_line": r.machine_line,
+                "busy": True,
+                "ticket_id": r.ticket_id,
+                "ticket_code": r.ticket_code,
+                "basket_id": r.basket_id,
+                "basket_code": r.basket_code,
+                "batch_id": r.batch_id,
+                "internal_batch_code": r.internal_batch_code,
+                "product_id": r.product_id,
+                "item_code": r.item_code,
+                "occupied_since": r.occupied_since
+            }
+
+    for machine_id, machine in machines.items():
+        busy = occupied[machine_id]
+        line_numbers = sorted(set(range(1, machine["total_lines"] + 1)) | set(busy))
+        machine["lines"] = [busy.get(line, {"machine_line": line, "busy": False}) for line in line_numbers]
+        machine["busy_lines"] = len(busy)
+
+    return list(machines.values())
\ No newline at end of file
@@ -1,14 +1,25 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, desc
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import or_, desc, insert
 from fastapi import HTTPException
-from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import time
+import re
 
 # Models
 from app.models.material_export import MaterialExport, MaterialExportDetail
 from app.models.weaving_basket_ticket import WeavingBasketTicket
 from app.models.basket import Basket, BasketStatus
+from app.models.inventory_transaction import InventoryTransactionType
+from app.models.document_sequence import DocumentType
+from app.models.material import Material
+from app.models.batch import Batch
+from app.models.warehouse import Warehouse
+from app.models.employee import Employee
+from app.models.department import Department
+from app.models.machine import Machine
+from app.models.product import Product
 
 # Schemas
 from app.schemas.material_export_schema import (
@@ -16,62 +27,98 @@ from app.schemas.material_export_schema import (
     MaterialExportUpdate, 
     MaterialExportFilter
 )
+from app.schemas.inventory_schema import InventoryMovement
 
 # Services
 from app.services.inventory_service import InventoryService
+from app.services.document_sequence_service import DocumentSequenceService
+from app.services.inventory_reservation_service import InventoryReservationService
+from app.services import machine_line_occupancy_service
+from app.db.pagination import paginate
+from app.db.loading import schema_load_options
+from app.db.export import ExportFormat, stream_export
+
+# Cột file xuất phiếu xuất kho (mỗi dòng chi tiết 1 dòng). Alias người xuất / người nhận được tạo lúc xuất:
+# aliased() ở mức module sẽ cấu hình mapper khi chưa import đủ models.
+def _material_export_columns(exporter, receiver):
+    return [
+        ("Số phiếu", MaterialExport.export_code),
+        ("Ngày xuất", MaterialExport.export_date),
+        ("Kho", Warehouse.warehouse_name),
+        ("Bộ phận", Department.department_name),
+        ("Người xuất", exporter.full_name),
+        ("Người nhận", receiver.full_name),
+        ("Mã vật tư", Material.material_code),
+        ("Mã lô", Batch.internal_batch_code),
+        ("Số lượng (kg)", MaterialExportDetail.quantity),
+        ("Máy", Machine.machine_name),
+        ("Line", MaterialExportDetail.machine_line),
+        ("Sản phẩm", Product.item_code),
+        ("Ghi chú", MaterialExportDetail.note),
+    ]
 
 class MaterialExportService:
     def __init__(self, db: Session):
         self.db = db
         self.inventory_service = InventoryService(db)
+        self.sequence_service = DocumentSequenceService(db)
 
     # ============================
     # AUTO GEN CODE
     # ============================
-    def generate_next_export_code(self) -> str:
-        """
-        Sinh mã phiếu xuất theo định dạng: YYYYMM-XXXX
-        Ví dụ: 202601-0001, 202601-0002
-        """
-        now = datetime.now()
-        # Tạo tiền tố: NămTháng (VD: 202601)
-        prefix = now.strftime("%Y%m")
-        
-        # Tìm phiếu xuất mới nhất trong tháng này
-        # SQL: SELECT export_code FROM material_exports WHERE export_code LIKE '202601-%' ORDER BY export_code DESC LIMIT 1
-        last_export = self.db.query(MaterialExport)\
+    # Định dạng: YYYYMM-XXXX (VD: 202601-0001, 202601-0002)
+    # Số được cấp từ bảng bộ đếm document_sequences theo kỳ YYYYMM (không quét bảng phiếu xuất).
+
+    def _find_last_export_seq(self, prefix: str) -> int:
+        """Số thứ tự lớn nhất đang có trong tháng - chỉ dùng 1 lần để khởi tạo bộ đếm của kỳ mới"""
+        last_export = self.db.query(MaterialExport.export_code)\
             .filter(MaterialExport.export_code.like(f"{prefix}-%"))\
             .order_by(desc(MaterialExport.export_code))\
             .first()
-        
         if not last_export:
-            # Chưa có phiếu nào trong tháng -> Bắt đầu 0001
-            return f"{prefix}-0001"
-        
+            return 0
         try:
-            # Lấy mã cũ: "202601-0015"
-            last_code = last_export.export_code
-            # Tách chuỗi lấy phần số đuôi
-            parts = last_code.split('-')
-            last_seq = int(parts[1]) # 15
-            
-            new_seq = last_seq + 1 # 16
-            
-            # Format lại thành 4 chữ số (0016)
-            return f"{prefix}-{new_seq:04d}"
+            return int(last_export[0].split('-')[1])
         except (IndexError, ValueError):
-            # Fallback nếu dữ liệu cũ sai định dạng
-            return f"{prefix}-0001"
+            return 0
+
+    def generate_next_export_code(self) -> str:
+        """Xem trước mã phiếu xuất tiếp theo (không giữ số)"""
+        prefix = datetime.now().strftime("%Y%m")
+        next_seq = self.sequence_service.peek(
+            DocumentType.MATERIAL_EXPORT, prefix, seed=lambda: self._find_last_export_seq(prefix)
+        )
+        return f"{prefix}-{next_seq:04d}"
+
+    def _allocate_export_code(self) -> str:
+        """Cấp mã phiếu xuất chính thức trong transaction hiện tại"""
+        prefix = datetime.now().strftime("%Y%m")
+        next_seq = self.sequence_service.allocate(
+            DocumentType.MATERIAL_EXPORT, prefix, seed=lambda: self._find_last_export_seq(prefix)
+        )[0]
+        return f"{prefix}-{next_seq:04d}"
+
+    def _sync_export_sequence(self, export_code: str):
+        """Mã do người dùng nhập đúng định dạng YYYYMM-XXXX -> đẩy bộ đếm lên để không cấp trùng"""
+        match = re.fullmatch(r"(\d{6})-(\d+)", export_code)
+        if match:
+            prefix = match.group(1)
+            self.sequence_service.sync_to(
+                DocumentType.MATERIAL_EXPORT, prefix, int(match.group(2)),
+                seed=lambda: self._find_last_export_seq(prefix)
+            )
 
     # ============================
     # GET / SEARCH
     # ============================
-    def get(self, export_id: int) -> Optional[MaterialExport]:
-        return self.db.query(MaterialExport).filter(MaterialExport.id == export_id).first()
-
-    def get_multi(self, skip: int = 0, limit: int = 100, filter_param: Optional[MaterialExportFilter] = None):
+    def get(self, export_id: int, load_schema: Optional[type] = None) -> Optional[MaterialExport]:
         query = self.db.query(MaterialExport)
-        
+        if load_schema:
+            query = query.options(*schema_load_options(MaterialExport, load_schema))
+        return query.filter(MaterialExport.id == export_id).first()
+
+    @staticmethod
+    def _apply_filters(query, filter_param: Optional[MaterialExportFilter]):
         if filter_param:
             if filter_param.warehouse_id:
                 query = query.filter(MaterialExport.warehouse_id == filter_param.warehouse_id)
@@ -91,8 +138,47 @@ class MaterialExportService:
                         MaterialExport.note.ilike(term)
                     )
                 )
+        return query
+
+    def get_multi(self, skip: int = 0, limit: int = 100, filter_param: Optional[MaterialExportFilter] = None, cursor: Optional[str] = None, load_schema: Optional[type] = None):
+        query = self.db.query(MaterialExport)
+        # Eager load đúng đồ thị quan hệ mà response schema cần (tránh N+1 khi serialize)
+        if load_schema:
+            query = query.options(*schema_load_options(MaterialExport, load_schema))
+        query = self._apply_filters(query, filter_param)
 
-        return query.order_by(desc(MaterialExport.export_date)).offset(skip).limit(limit).all()
+        return paginate(
+            query,
+            [(MaterialExport.export_date, True), (MaterialExport.id, True)],
+            skip=skip, limit=limit, cursor=cursor
+        )
+
+    def export(self, fmt: ExportFormat, filter_param: Optional[MaterialExportFilter] = None) -> StreamingResponse:
+        """Xuất phiếu xuất kho (mỗi dòng chi tiết 1 dòng, kèm thông tin phiếu) ra Excel / CSV"""
+        exporter, receiver = aliased(Employee), aliased(Employee)
+        query = self.db.query(MaterialExportDetail).join(
+            MaterialExport, MaterialExport.id == MaterialExportDetail.export_id
+        ).join(
+            Warehouse, Warehouse.warehouse_id == MaterialExport.warehouse_id
+        ).join(
+            Material, Material.id == MaterialExportDetail.material_id
+        ).join(
+            Batch, Batch.batch_id == MaterialExportDetail.batch_id
+        ).outerjoin(
+            exporter, exporter.employee_id == MaterialExport.exporter_id
+        ).outerjoin(
+            receiver, receiver.employee_id == MaterialExport.receiver_id
+        ).outerjoin(
+            Department, Department.department_id == MaterialExport.department_id
+        ).outerjoin(
+            Machine, Machine.machine_id == MaterialExportDetail.machine_id
+        ).outerjoin(
+            Product, Product.product_id == MaterialExportDetail.product_id
+        )
+        query = self._apply_filters(query, filter_param).order_by(
+            MaterialExport.export_date.desc(), MaterialExport.id.desc(), MaterialExportDetail.detail_id
+        )
+        return stream_export(query, _material_export_columns(exporter, receiver), fmt, "phieu_xuat")
 
     # ============================
     # CREATE
@@ -100,14 +186,19 @@ class MaterialExportService:
     def create_export(self, obj_in: MaterialExportCreate) -> MaterialExport:
         # [UPDATED] Tự động sinh mã nếu không có hoặc là "AUTO"
         if not obj_in.export_code or obj_in.export_code.strip().upper() == "AUTO":
-            obj_in.export_code = self.generate_next_export_code()
+            obj_in.export_code = self._allocate_export_code()
+        else:
+            self._sync_export_sequence(obj_in.export_code)
 
         # Kiểm tra trùng mã phiếu
         existing = self.db.query(MaterialExport).filter(MaterialExport.export_code == obj_in.export_code).first()
         if existing:
              raise HTTPException(status_code=400, detail=f"Mã phiếu xuất {obj_in.export_code} đã tồn tại.")
 
-        # 1. Tạo Header Phiếu Xuất
+        # 1. PREFETCH + KIỂM TRA (trong bộ nhớ, chưa ghi gì)
+        baskets, claimed_baskets = self._validate_export_lines(obj_in.details)
+
+        # 2. GHI PHIẾU: header, rồi chi tiết + phiếu rổ dệt mỗi loại 1 lệnh INSERT (executemany)
         db_export = MaterialExport(
             export_code=obj_in.export_code,
             export_date=obj_in.export_date or datetime.now().date(),
@@ -122,88 +213,66 @@ class MaterialExportService:
         self.db.add(db_export)
         self.db.flush() # Flush để lấy ID phiếu xuất
 
-        # 2. Xử lý từng dòng chi tiết
-        for detail_in in obj_in.details:
-            
-            # --- VALIDATION: KIỂM TRA RỔ ---
-            if detail_in.basket_id:
-                basket = self.db.query(Basket).get(detail_in.basket_id)
-                if not basket:
-                    raise HTTPException(status_code=404, detail=f"Không tìm thấy Rổ ID {detail_in.basket_id}")
-                if basket.status != BasketStatus.READY:
-                    raise HTTPException(status_code=400, detail=f"Rổ {basket.basket_code} không sẵn sàng (Trạng thái: {basket.status})")
+        self.db.execute(insert(MaterialExportDetail), [
+            {
+                "export_id": db_export.id,
+                "material_id": detail_in.material_id,
+                "batch_id": detail_in.batch_id,
+                "quantity": detail_in.quantity,
 
-            # --- VALIDATION: KIỂM TRA MÁY VÀ LINE ---
-            if detail_in.machine_id and detail_in.machine_line:
-                # Kiểm tra xem máy/line này có đang chạy phiếu nào khác không
-                existing_ticket = self.db.query(WeavingBasketTicket).filter(
-                    WeavingBasketTicket.machine_id == detail_in.machine_id,
-                    WeavingBasketTicket.machine_line == detail_in.machine_line,
-                    WeavingBasketTicket.time_out.is_(None) # Chưa kết thúc
-                ).first()
-                
-                if existing_ticket:
-                      raise HTTPException(
-                        status_code=400, 
-                        detail=f"Máy {detail_in.machine_id} Line {detail_in.machine_line} đang hoạt động. Vui lòng hạ rổ trước."
-                    )
+                # Thông tin sản xuất
+                "machine_id": detail_in.machine_id,
+                "machine_line": detail_in.machine_line,
+                "product_id": detail_in.product_id,
+                "standard_id": detail_in.standard_id,
+                "basket_id": detail_in.basket_id,
+
+                "note": detail_in.note
+            }
+            for detail_in in obj_in.details
+        ])
+
+        # Tự động tạo phiếu rổ dệt cho dòng lên máy
+        ticket_rows = [
+            self._auto_weaving_ticket_row(header_in=obj_in, detail_in=detail_in)
+            for detail_in in obj_in.details
+            if detail_in.machine_id and detail_in.product_id
+        ]
+        if ticket_rows:
+            self.db.execute(insert(WeavingBasketTicket), ticket_rows)
+            # Giữ line máy cho các phiếu vừa tạo (unique theo máy/line -> 2 phiếu cùng line bị DB chặn)
+            machine_line_occupancy_service.occupy_tickets_by_code(self.db, [row["code"] for row in ticket_rows])
+
+        # Rổ đã lên máy -> IN_USE (ghi cùng lần flush khi trừ tồn)
+        for basket_id in claimed_baskets:
+            baskets[basket_id].status = BasketStatus.IN_USE
 
-            # --- A. TẠO DETAIL XUẤT KHO ---
-            db_detail = MaterialExportDetail(
-                export_id=db_export.id,
+        # Biến động trừ tồn kho (ghi sổ 1 lần bên dưới)
+        movements: List[InventoryMovement] = [
+            InventoryMovement(
                 material_id=detail_in.material_id,
+                warehouse_id=obj_in.warehouse_id,
                 batch_id=detail_in.batch_id,
-                quantity=detail_in.quantity,
-                
-                # Thông tin sản xuất
-                machine_id=detail_in.machine_id,
-                machine_line=detail_in.machine_line,
-                product_id=detail_in.product_id,
-                standard_id=detail_in.standard_id,
-                basket_id=detail_in.basket_id,
-                
-                note=detail_in.note
+                quantity_delta=-detail_in.quantity,
+                transaction_type=InventoryTransactionType.EXPORT,
+                reference_type="MaterialExport",
+                reference_id=db_export.id
             )
-            self.db.add(db_detail)
+            for detail_in in obj_in.details
+        ]
 
-            # --- B. TRỪ TỒN KHO ---
-            try:
-                # Kiểm tra số lượng tồn trước
-                stock = self.inventory_service.get_stock_by_batch(obj_in.warehouse_id, detail_in.batch_id)
-                current_qty = stock.quantity_on_hand if stock else 0.0
-                
-                if current_qty < detail_in.quantity:
-                    raise HTTPException(
-                        status_code=400, 
-                        detail=f"Không đủ tồn kho cho Batch ID {detail_in.batch_id}. Tồn: {current_qty}, Xuất: {detail_in.quantity}"
-                    )
+        # 3. XUẤT THEO PHIẾU GIỮ CHỖ: chuyển phần giữ chỗ thành xuất kho (cùng transaction với phiếu xuất)
+        if obj_in.reservation_id:
+            issued: Dict[Tuple[int, int, int], float] = {}
+            for m in movements:
+                key = (m.material_id, m.warehouse_id, m.batch_id)
+                issued[key] = issued.get(key, 0.0) - m.quantity_delta
+            InventoryReservationService(self.db).consume(obj_in.reservation_id, issued, export_id=db_export.id)
 
-                # Gọi hàm trừ kho (truyền số âm)
-                self.inventory_service.increase_stock(
-                    material_id=detail_in.material_id,
-                    warehouse_id=obj_in.warehouse_id,
-                    batch_id=detail_in.batch_id,
-                    quantity= -detail_in.quantity 
-                )
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Lỗi kho: {str(e)}")
+        # 4. TRỪ TỒN KHO: 1 query lấy các dòng tồn, kiểm tra đủ tồn & ghi sổ toàn bộ dòng trong 1 lần
+        self.inventory_service.post_movements(movements, allow_negative=False)
 
-            # --- C. TỰ ĐỘNG TẠO PHIẾU RỔ DỆT ---
-            if (detail_in.machine_id and detail_in.product_id):
-                
-                self._create_auto_weaving_ticket(
-                    header_in=obj_in,
-                    detail_in=detail_in
-                )
-                
-                # Cập nhật trạng thái rổ -> IN_USE
-                if detail_in.basket_id:
-                    basket_to_update = self.db.query(Basket).get(detail_in.basket_id)
-                    if basket_to_update:
-                        basket_to_update.status = BasketStatus.IN_USE
-                        self.db.add(basket_to_update)
-
-        # 3. COMMIT TOÀN BỘ
+        # 5. COMMIT TOÀN BỘ
         try:
             self.db.commit()
             self.db.refresh(db_export)
@@ -212,32 +281,74 @@ class MaterialExportService:
             self.db.rollback()
             raise HTTPException(status_code=500, detail=f"Lỗi hệ thống khi lưu phiếu xuất: {str(e)}")
 
-    def _create_auto_weaving_ticket(self, header_in: MaterialExportCreate, detail_in):
-        """Hàm nội bộ: Sinh phiếu rổ dệt"""
+    def _validate_export_lines(self, details) -> Tuple[Dict[int, Basket], List[int]]:
+        """
+        Kiểm tra rổ và máy/line của mọi dòng với dữ liệu lấy trước (1 query IN (...) mỗi loại):
+        - Rổ phải tồn tại và đang READY, 1 rổ chỉ lên máy ở 1 dòng.
+        - Máy/line chưa có phiếu rổ dệt đang chạy (bảng machine_line_occupancy),
+          kể cả phiếu sinh từ dòng trước trong cùng phiếu xuất.
+        Trả về (rổ theo id, danh sách rổ sẽ chuyển IN_USE).
+        """
+        basket_ids = {d.basket_id for d in details if d.basket_id}
+        baskets: Dict[int, Basket] = {}
+        if basket_ids:
+            baskets = {b.basket_id: b for b in self.db.query(Basket).filter(Basket.basket_id.in_(basket_ids))}
+
+        machine_lines = {(d.machine_id, d.machine_line) for d in details if d.machine_id and d.machine_line}
+        busy_lines = machine_line_occupancy_service.get_busy_lines(self.db, machine_lines)
+
+        claimed_baskets: List[int] = []
+        for detail_in in details:
+            # --- VALIDATION: KIỂM TRA RỔ ---
+            if detail_in.basket_id:
+                basket = baskets.get(detail_in.basket_id)
+                if not basket:
+                    raise HTTPException(status_code=404, detail=f"Không tìm thấy Rổ ID {detail_in.basket_id}")
+                status = BasketStatus.IN_USE if detail_in.basket_id in claimed_baskets else basket.status
+                if status != BasketStatus.READY:
+                    raise HTTPException(status_code=400, detail=f"Rổ {basket.basket_code} không sẵn sàng (Trạng thái: {status})")
+
+            # --- VALIDATION: KIỂM TRA MÁY VÀ LINE ---
+            if detail_in.machine_id and detail_in.machine_line:
+                if (detail_in.machine_id, detail_in.machine_line) in busy_lines:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Máy {detail_in.machine_id} Line {detail_in.machine_line} đang hoạt động. Vui lòng hạ rổ trước."
+                    )
+
+            # Dòng lên máy (sinh phiếu rổ dệt) giữ máy/line và rổ cho các dòng sau
+            if detail_in.machine_id and detail_in.product_id:
+                if detail_in.machine_line:
+                    busy_lines.add((detail_in.machine_id, detail_in.machine_line))
+                if detail_in.basket_id:
+                    claimed_baskets.append(detail_in.basket_id)
+
+        return baskets, claimed_baskets
+
+    def _auto_weaving_ticket_row(self, header_in: MaterialExportCreate, detail_in) -> Dict:
+        """Hàm nội bộ: Dữ liệu phiếu rổ dệt sinh tự động (insert hàng loạt trong create_export)"""
         timestamp = int(time.time())
         ticket_code = f"WBT-{detail_in.basket_id}-{timestamp}"
-        yarn_lot_id = detail_in.batch_id 
-
-        new_ticket = WeavingBasketTicket(
-            code=ticket_code,
-            product_id=detail_in.product_id,
-            standard_id=None,
-            machine_id=detail_in.machine_id,
-            machine_line=detail_in.machine_line,
-            
-            yarn_load_date=header_in.export_date,
-            batch_id=detail_in.batch_id,
-            basket_id=None,
-            
-            time_in=datetime.now(),
-            employee_in_id=None,
-            
-            number_of_knots=0,
-            gross_weight=0.0,
-            net_weight=0.0,
-            length_meters=0.0
-        )
-        self.db.add(new_ticket)
+
+        return {
+            "code": ticket_code,
+            "product_id": detail_in.product_id,
+            "standard_id": None,
+            "machine_id": detail_in.machine_id,
+            "machine_line": detail_in.machine_line,
+
+            "yarn_load_date": header_in.export_date,
+            "batch_id": detail_in.batch_id,
+            "basket_id": None,
+
+            "time_in": datetime.now(),
+            "employee_in_id": None,
+
+            "number_of_knots": 0,
+            "gross_weight": 0.0,
+            "net_weight": 0.0,
+            "length_meters": 0.0
+        }
 
     # ... (Các hàm update, delete giữ nguyên)
     # ============================
@@ -266,14 +377,19 @@ class MaterialExportService:
             raise HTTPException(status_code=404, detail="Phiếu xuất không tồn tại")
 
         # Duyệt qua các dòng chi tiết để hoàn tác
+        movements: List[InventoryMovement] = []
         for detail in db_obj.details:
-            # 1. HOÀN TRẢ TỒN KHO
-            self.inventory_service.increase_stock(
+            # 1. HOÀN TRẢ TỒN KHO (Cộng số dương để trả lại kho, ghi sổ 1 lần bên dưới)
+            movements.append(InventoryMovement(
                 material_id=detail.material_id,
                 warehouse_id=db_obj.warehouse_id,
                 batch_id=detail.batch_id,
-                quantity=detail.quantity # Cộng số dương để trả lại kho
-            )
+                quantity_delta=detail.quantity,
+                transaction_type=InventoryTransactionType.REVERSAL,
+                reference_type="MaterialExport",
+                reference_id=db_obj.id,
+                note="Hủy phiếu xuất"
+            ))
 
             # 2. HỦY PHIẾU RỔ DỆT & TRẢ RỔ VỀ READY
             if detail.basket_id:
@@ -290,6 +406,7 @@ class MaterialExportService:
                             status_code=400, 
                             detail=f"Không thể hủy phiếu xuất. Rổ {detail.basket_id} đã có ghi nhận sản lượng."
                         )
+                    machine_line_occupancy_service.release_tickets(self.db, [ticket.id])
                     self.db.delete(ticket)
                 
                 # Trả trạng thái rổ về READY
@@ -298,6 +415,8 @@ class MaterialExportService:
                     basket.status = BasketStatus.READY
                     self.db.add(basket)
 
+        self.inventory_service.post_movements(movements)
+
         self.db.delete(db_obj)
         self.db.commit()
         return {"message": "Đã hủy phiếu xuất thành công."}
\ No newline at end of file
@@ -1,14 +1,25 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, desc
+from sqlalchemy import or_, desc, func, insert
 from fastapi import HTTPException
-from typing import List, Optional
-from datetime import datetime
+from fastapi.responses import StreamingResponse
+from openpyxl import load_workbook
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import date, datetime
+import csv
+import io
+import re
 
 # Models
 from app.models.material_receipt import MaterialReceipt, MaterialReceiptDetail
-from app.models.purchase_order import PurchaseOrderDetail, POStatus, PurchaseOrderHeader
+from app.models.purchase_order import PurchaseOrderHeader
 from app.models.batch import Batch, BatchQCStatus
 from app.models.inventory import InventoryStock
+from app.models.inventory_reservation import InventoryReservationLine
+from app.models.stock_count import StockCountLine
+from app.models.inventory_transaction import InventoryTransactionType
+from app.models.document_sequence import DocumentType
+from app.models.material import Material
+from app.models.warehouse import Warehouse
 
 # Schemas
 from app.schemas.material_receipt_schema import (
@@ -19,28 +30,165 @@ from app.schemas.material_receipt_schema import (
     MaterialReceiptFilter
 )
 from app.schemas.batch_schema import BatchCreate
+from app.schemas.inventory_schema import InventoryMovement
 from app.services.batch_service import BatchService
 from app.services.inventory_service import InventoryService
+from app.services.inventory_summary_service import InventorySummaryService
+from app.services.document_sequence_service import DocumentSequenceService
+from app.services.purchase_order_receiving_service import PurchaseOrderReceivingService
+from app.services.purchase_order_match_service import PurchaseOrderMatchService
+from app.db.pagination import paginate
+from app.db.loading import schema_load_options
+from app.db.export import ExportFormat, stream_export
+
+# Cột file xuất phiếu nhập (mỗi dòng chi tiết 1 dòng)
+RECEIPT_EXPORT_COLUMNS = [
+    ("Số phiếu", MaterialReceipt.receipt_number),
+    ("Ngày nhập", MaterialReceipt.receipt_date),
+    ("Kho", Warehouse.warehouse_name),
+    ("Số PO", PurchaseOrderHeader.po_number),
+    ("Container", MaterialReceipt.container_no),
+    ("Seal", MaterialReceipt.seal_no),
+    ("Mã vật tư", Material.material_code),
+    ("Lô NCC", MaterialReceiptDetail.supplier_batch_no),
+    ("SL chứng từ (kg)", MaterialReceiptDetail.po_quantity_kg),
+    ("SL thực nhập (kg)", MaterialReceiptDetail.received_quantity_kg),
+    ("Số cuộn", MaterialReceiptDetail.received_quantity_cones),
+    ("Số pallet", MaterialReceiptDetail.number_of_pallets),
+    ("Xuất xứ", MaterialReceiptDetail.origin_country),
+    ("Vị trí", MaterialReceiptDetail.location),
+    ("Ghi chú", MaterialReceiptDetail.note),
+    ("Người tạo", MaterialReceipt.created_by),
+]
+
+# Cột file packing list: tên trường -> các tiêu đề được chấp nhận (không phân biệt hoa thường).
+# Tiêu đề tiếng Việt trùng với file xuất phiếu nhập -> file xuất ra có thể sửa rồi nhập lại.
+PACKING_LIST_COLUMNS = {
+    "material_code": ("material_code", "mã vật tư"),
+    "material_id": ("material_id",),
+    "supplier_batch_no": ("supplier_batch_no", "lô ncc"),
+    "po_quantity_kg": ("po_quantity_kg", "sl chứng từ (kg)"),
+    "po_quantity_cones": ("po_quantity_cones", "số cuộn chứng từ"),
+    "received_quantity_kg": ("received_quantity_kg", "sl thực nhập (kg)"),
+    "received_quantity_cones": ("received_quantity_cones", "số cuộn"),
+    "number_of_pallets": ("number_of_pallets", "số pallet"),
+    "origin_country": ("origin_country", "xuất xứ"),
+    "location": ("location", "vị trí"),
+    "manufacture_date": ("manufacture_date", "ngày sản xuất"),
+    "expiry_date": ("expiry_date", "hạn dùng"),
+    "note": ("note", "ghi chú"),
+}
+_PACKING_LIST_NUMBERS = {
+    "po_quantity_kg": float,
+    "po_quantity_cones": int,
+    "received_quantity_kg": float,
+    "received_quantity_cones": int,
+    "number_of_pallets": int,
+}
+_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y")
+
+
+def _read_packing_list(filename: str, content: bytes) -> List[Dict[str, Any]]:
+    """Đọc file packing list (.xlsx / .csv) -> list dict theo tên trường, kèm số dòng trong file (_row)"""
+    name = (filename or "").lower()
+    if name.endswith((".xlsx", ".xlsm")):
+        try:
+            workbook = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Không đọc được file Excel.")
+        try:
+            rows = list(workbook.worksheets[0].iter_rows(values_only=True))
+        finally:
+            workbook.close()
+    elif name.endswith(".csv"):
+        try:
+            rows = list(csv.reader(io.StringIO(content.decode("utf-8-sig"))))
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="File CSV phải mã hóa UTF-8.")
+    else:
+        raise HTTPException(status_code=400, detail="Chỉ hỗ trợ file .xlsx hoặc .csv")
+
+    if not rows:
+        raise HTTPException(status_code=400, detail="File packing list rỗng.")
+
+    aliases = {alias: field for field, names in PACKING_LIST_COLUMNS.items() for alias in names}
+    columns = [aliases.get(str(h).strip().lower()) if h is not None else None for h in rows[0]]
+    if "received_quantity_kg" not in columns or not {"material_code", "material_id"} & set(columns):
+        raise HTTPException(
+            status_code=400,
+            detail="File packing list cần cột material_code (hoặc material_id) và received_quantity_kg."
+        )
+
+    records = []
+    for row_no, values in enumerate(rows[1:], start=2):
+        if all(v is None or str(v).strip() == "" for v in values):
+            continue
+        record: Dict[str, Any] = {"_row": row_no}
+        for field, value in zip(columns, values):
+            if field:
+                value = value.strip() if isinstance(value, str) else value
+                record[field] = None if value == "" else value
+        records.append(record)
+    return records
+
+
+def _to_text(value: Any) -> Optional[str]:
+    """Ô Excel kiểu số (VD: mã lô 240115 -> 240115.0) đưa về đúng chuỗi đã gõ"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _to_number(value: Any, cast: type):
+    if value is None:
+        return None
+    number = float(value)
+    if cast is int:
+        if not number.is_integer():
+            raise ValueError(value)
+        return int(number)
+    return number
+
+
+def _to_date(value: Any) -> Optional[date]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value), fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(value)
+
 
 class MaterialReceiptService:
     def __init__(self, db: Session):
         self.db = db
         self.batch_service = BatchService(db)
         self.inventory_service = InventoryService(db)
+        self.sequence_service = DocumentSequenceService(db)
 
     # =========================================================================
     # QUẢN LÝ PHIẾU NHẬP (HEADER)
     # =========================================================================
     
-    def get(self, receipt_id: int) -> Optional[MaterialReceipt]:
-        return self.db.query(MaterialReceipt).filter(MaterialReceipt.receipt_id == receipt_id).first()
+    def get(self, receipt_id: int, load_schema: Optional[type] = None) -> Optional[MaterialReceipt]:
+        query = self.db.query(MaterialReceipt)
+        if load_schema:
+            query = query.options(*schema_load_options(MaterialReceipt, load_schema))
+        return query.filter(MaterialReceipt.receipt_id == receipt_id).first()
 
     def get_by_number(self, receipt_number: str) -> Optional[MaterialReceipt]:
         return self.db.query(MaterialReceipt).filter(MaterialReceipt.receipt_number == receipt_number).first()
 
-    def get_multi(self, skip: int = 0, limit: int = 100, filter_param: Optional[MaterialReceiptFilter] = None) -> List[MaterialReceipt]:
-        query = self.db.query(MaterialReceipt)
-
+    @staticmethod
+    def _apply_filters(query, filter_param: Optional[MaterialReceiptFilter]):
         if filter_param:
             if filter_param.po_id:
                 query = query.filter(MaterialReceipt.po_header_id == filter_param.po_id)
@@ -59,10 +207,44 @@ class MaterialReceiptService:
                         MaterialReceipt.seal_no.ilike(search)
                     )
                 )
+        return query
 
-        return query.order_by(desc(MaterialReceipt.receipt_date)).offset(skip).limit(limit).all()
+    def get_multi(self, skip: int = 0, limit: int = 100, filter_param: Optional[MaterialReceiptFilter] = None, cursor: Optional[str] = None, load_schema: Optional[type] = None) -> List[MaterialReceipt]:
+        query = self.db.query(MaterialReceipt)
+        # Eager load đúng đồ thị quan hệ mà response schema cần (tránh N+1 khi serialize)
+        if load_schema:
+            query = query.options(*schema_load_options(MaterialReceipt, load_schema))
+        query = self._apply_filters(query, filter_param)
+
+        return paginate(
+            query,
+            [(MaterialReceipt.receipt_date, True), (MaterialReceipt.receipt_id, True)],
+            skip=skip, limit=limit, cursor=cursor
+        )
+
+    def export(self, fmt: ExportFormat, filter_param: Optional[MaterialReceiptFilter] = None) -> StreamingResponse:
+        """Xuất phiếu nhập (mỗi dòng chi tiết 1 dòng, kèm thông tin phiếu) ra Excel / CSV"""
+        query = self.db.query(MaterialReceiptDetail).join(
+            MaterialReceipt, MaterialReceipt.receipt_id == MaterialReceiptDetail.receipt_id
+        ).join(
+            Warehouse, Warehouse.warehouse_id == MaterialReceipt.warehouse_id
+        ).join(
+            Material, Material.id == MaterialReceiptDetail.material_id
+        ).outerjoin(
+            PurchaseOrderHeader, PurchaseOrderHeader.po_id == MaterialReceipt.po_header_id
+        )
+        query = self._apply_filters(query, filter_param).order_by(
+            MaterialReceipt.receipt_date.desc(), MaterialReceipt.receipt_id.desc(), MaterialReceiptDetail.detail_id
+        )
+        return stream_export(query, RECEIPT_EXPORT_COLUMNS, fmt, "phieu_nhap")
 
     def create(self, obj_in: MaterialReceiptCreate) -> MaterialReceipt:
+        # Tự động cấp số phiếu nếu để trống hoặc "AUTO"
+        if not obj_in.receipt_number or obj_in.receipt_number.strip().upper() == "AUTO":
+            obj_in.receipt_number = self._allocate_receipt_number()
+        else:
+            self._sync_receipt_sequence(obj_in.receipt_number)
+
         if self.get_by_number(obj_in.receipt_number):
             raise HTTPException(status_code=400, detail=f"Mã phiếu nhập {obj_in.receipt_number} đã tồn tại.")
 
@@ -80,21 +262,28 @@ class MaterialReceiptService:
         self.db.add(db_header)
         self.db.flush() 
 
+        # Gom toàn bộ biến động tồn kho, ghi sổ 1 lần trong cùng transaction
+        movements: List[InventoryMovement] = []
         if obj_in.details:
             for detail_in in obj_in.details:
-                new_detail = self._create_detail_instance(db_header.receipt_id, detail_in, db_header.po_header_id)
+                new_detail = self._create_detail_instance(db_header.receipt_id, detail_in)
                 self.db.flush() 
-                batch = self._sync_batch_for_detail(new_detail)
+                batch = self._sync_batch_for_detail(new_detail, commit=False)
                 if batch:
-                    self.inventory_service.increase_stock(
+                    movements.append(InventoryMovement(
                         material_id=new_detail.material_id,
                         warehouse_id=db_header.warehouse_id,
                         batch_id=batch.batch_id,
-                        quantity=new_detail.received_quantity_kg
-                    )
+                        quantity_delta=new_detail.received_quantity_kg,
+                        transaction_type=InventoryTransactionType.RECEIPT,
+                        reference_type="MaterialReceipt",
+                        reference_id=db_header.receipt_id
+                    ))
+
+        self.inventory_service.post_movements(movements)
 
         if obj_in.po_header_id:
-            self._check_and_close_po(obj_in.po_header_id)
+            self._refresh_po(obj_in.po_header_id)
 
         self.db.commit()
         self.db.refresh(db_header)
@@ -105,6 +294,8 @@ class MaterialReceiptService:
         if not db_obj:
             raise HTTPException(status_code=404, detail="Phiếu nhập không tồn tại.")
 
+        old_po_id = db_obj.po_header_id
+        old_declaration_id = db_obj.declaration_id
         update_data = obj_in.dict(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_obj, field, value)
@@ -114,44 +305,72 @@ class MaterialReceiptService:
         
         # Đồng bộ lại Batch nếu cần
         for detail in db_obj.details:
-            self._sync_batch_for_detail(detail)
+            self._sync_batch_for_detail(detail, commit=False)
+
+        # Đổi PO / tờ khai của phiếu -> tính lại cả PO cũ và PO mới
+        if old_po_id != db_obj.po_header_id or old_declaration_id != db_obj.declaration_id:
+            self._refresh_po(
+                old_po_id, db_obj.po_header_id,
+                declaration_ids=(old_declaration_id, db_obj.declaration_id)
+            )
 
         self.db.commit()
         self.db.refresh(db_obj)
         return db_obj
 
+    def _ensure_batches_deletable(self, detail_ids: List[int]):
+        """
+        Lô / dòng tồn của phiếu đã được giữ chỗ (kể cả phiếu giữ chỗ đã xuất / hủy / hết hạn)
+        hoặc đã vào phiếu kiểm kê thì không xóa được: các dòng đó còn tham chiếu tới lô và dòng tồn.
+        """
+        if not detail_ids:
+            return
+        reserved = self.db.query(Batch.internal_batch_code).join(
+            InventoryReservationLine, InventoryReservationLine.batch_id == Batch.batch_id
+        ).filter(Batch.receipt_detail_id.in_(detail_ids)).distinct().all()
+        if reserved:
+            codes = ", ".join(sorted(code for (code,) in reserved))
+            raise HTTPException(
+                status_code=400,
+                detail=f"Không thể xóa: lô {codes} đã có phiếu giữ chỗ tồn kho."
+            )
+
+        counted = self.db.query(Batch.internal_batch_code).join(
+            StockCountLine, StockCountLine.batch_id == Batch.batch_id
+        ).filter(Batch.receipt_detail_id.in_(detail_ids)).distinct().all()
+        if counted:
+            codes = ", ".join(sorted(code for (code,) in counted))
+            raise HTTPException(
+                status_code=400,
+                detail=f"Không thể xóa: lô {codes} đã có trong phiếu kiểm kê."
+            )
+
     def delete(self, receipt_id: int):
         db_obj = self.get(receipt_id)
         if not db_obj:
             raise HTTPException(status_code=404, detail="Phiếu nhập không tồn tại.")
         
         receipt: MaterialReceipt = db_obj
+        self._ensure_batches_deletable([d.detail_id for d in receipt.details])
 
         # Duyệt qua từng chi tiết để dọn dẹp dữ liệu liên quan
         if receipt.details:
             for detail in receipt.details:
-                # 1. Revert PO Quantity (Trả lại số lượng cho đơn mua hàng)
-                if receipt.po_header_id:
-                    self._update_po_received_quantity(
-                        po_id=receipt.po_header_id,
-                        material_id=detail.material_id, 
-                        quantity_delta_kg= -detail.received_quantity_kg 
-                    )
-                
-                # 2. Xóa InventoryStock & Batch
+                # 1. Xóa InventoryStock & Batch (ghi bút toán hoàn tác vào sổ cái trước khi xóa)
                 batch = self.db.query(Batch).filter(Batch.receipt_detail_id == detail.detail_id).first()
                 if batch:
                     stock = self.db.query(InventoryStock).filter(InventoryStock.batch_id == batch.batch_id).first()
                     if stock:
+                        self._reverse_stock(stock, receipt.receipt_id)
                         self.db.delete(stock)
                     self.db.delete(batch)
 
-        # 3. Cập nhật trạng thái PO
-        if receipt.po_header_id:
-            self._check_and_close_po(receipt.po_header_id)
-
-        # 4. Xóa phiếu nhập
+        # 2. Xóa phiếu nhập
         self.db.delete(receipt)
+
+        # 3. Tính lại SL đã nhận / trạng thái PO (sau khi xóa)
+        if receipt.po_header_id:
+            self._refresh_po(receipt.po_header_id)
         
         self.db.commit()
         return {"message": "Đã xóa phiếu nhập, cập nhật lại PO và xóa tồn kho liên quan."}
@@ -171,23 +390,26 @@ class MaterialReceiptService:
         receipt: MaterialReceipt = receipt_obj
 
         # 1. Tạo Detail
-        new_detail = self._create_detail_instance(receipt.receipt_id, detail_in, receipt.po_header_id)
+        new_detail = self._create_detail_instance(receipt.receipt_id, detail_in)
         self.db.flush()
 
         # 2. Tạo Batch
-        batch = self._sync_batch_for_detail(new_detail)
+        batch = self._sync_batch_for_detail(new_detail, commit=False)
 
         # 3. Tăng Inventory
         if batch:
-            self.inventory_service.increase_stock(
+            self.inventory_service.post_movements([InventoryMovement(
                 material_id=new_detail.material_id,
                 warehouse_id=receipt.warehouse_id,
                 batch_id=batch.batch_id,
-                quantity=new_detail.received_quantity_kg
-            )
+                quantity_delta=new_detail.received_quantity_kg,
+                transaction_type=InventoryTransactionType.RECEIPT,
+                reference_type="MaterialReceipt",
+                reference_id=receipt.receipt_id
+            )])
         
         if receipt.po_header_id:
-             self._check_and_close_po(receipt.po_header_id)
+            self._refresh_po(receipt.po_header_id)
 
         self.db.commit()
         self.db.refresh(new_detail)
@@ -219,24 +441,23 @@ class MaterialReceiptService:
         self.db.add(db_detail)
         self.db.flush()
 
-        # 3. Update PO
-        if receipt.po_header_id and qty_delta != 0:
-            self._update_po_received_quantity(
-                po_id=receipt.po_header_id,
-                material_id=db_detail.material_id,
-                quantity_delta_kg=qty_delta
-            )
-            self._check_and_close_po(receipt.po_header_id)
+        # 3. Update PO (SL hoặc vật tư đổi)
+        if receipt.po_header_id and (qty_delta != 0 or "material_id" in update_data):
+            self._refresh_po(receipt.po_header_id)
 
         # 4. Update Inventory & Batch
-        batch = self._sync_batch_for_detail(db_detail)
+        batch = self._sync_batch_for_detail(db_detail, commit=False)
         if batch and qty_delta != 0:
-            self.inventory_service.increase_stock(
+            self.inventory_service.post_movements([InventoryMovement(
                 material_id=db_detail.material_id,
                 warehouse_id=receipt.warehouse_id,
                 batch_id=batch.batch_id,
-                quantity=qty_delta 
-            )
+                quantity_delta=qty_delta,
+                transaction_type=InventoryTransactionType.RECEIPT,
+                reference_type="MaterialReceipt",
+                reference_id=receipt.receipt_id,
+                note=f"Sửa chi tiết phiếu nhập #{db_detail.detail_id}"
+            )])
 
         self.db.commit()
         self.db.refresh(db_detail)
@@ -249,39 +470,280 @@ class MaterialReceiptService:
 
         receipt_obj = db_detail.header
         receipt: MaterialReceipt = receipt_obj
+        self._ensure_batches_deletable([detail_id])
         
         batch = self.db.query(Batch).filter(Batch.receipt_detail_id == detail_id).first()
 
-        # 1. Xóa InventoryStock trước
+        # 1. Xóa InventoryStock trước (ghi bút toán hoàn tác vào sổ cái trước khi xóa)
         if batch:
             stock = self.db.query(InventoryStock).filter(InventoryStock.batch_id == batch.batch_id).first()
             if stock:
+                self._reverse_stock(stock, receipt.receipt_id)
                 self.db.delete(stock)
 
-        # 2. Revert PO
-        if receipt.po_header_id:
-            self._update_po_received_quantity(
-                po_id=receipt.po_header_id,
-                material_id=db_detail.material_id,
-                quantity_delta_kg= -db_detail.received_quantity_kg 
-            )
-            self._check_and_close_po(receipt.po_header_id)
-
-        # 3. Xóa Batch
+        # 2. Xóa Batch
         if batch:
             self.db.delete(batch)
 
-        # 4. Xóa Detail
+        # 3. Xóa Detail
         self.db.delete(db_detail)
+
+        # 4. Tính lại SL đã nhận / trạng thái PO (sau khi xóa)
+        if receipt.po_header_id:
+            self._refresh_po(receipt.po_header_id)
         
         self.db.commit()
         return {"message": "Đã xóa chi tiết và cập nhật kho."}
 
+    # =========================================================================
+    # NHẬP PACKING LIST (HÀNG LOẠT)
+    # =========================================================================
+
+    def import_packing_list(self, receipt_id: int, filename: str, content: bytes, dry_run: bool = False) -> Dict:
+        """
+        Nhập packing list (.xlsx / .csv) của NCC vào phiếu nhập có sẵn (mỗi dòng = 1 lô).
+        - Kiểm tra toàn bộ file trước khi ghi (1 query tra vật tư), trả về lỗi theo từng dòng.
+        - dry_run=True: chỉ kiểm tra, không ghi gì.
+        - Ghi thật: có dòng lỗi thì trả 400 kèm danh sách lỗi, không ghi dòng nào.
+          Chi tiết phiếu, lô (mã lô cấp 1 block) và tồn kho được insert hàng loạt trong 1 transaction.
+        """
+        # Đọc & kiểm tra file không giữ khóa (dry-run / file lỗi không chặn các lần nhập khác)
+        exists = self.db.query(MaterialReceipt.receipt_id).filter(MaterialReceipt.receipt_id == receipt_id).first()
+        if not exists:
+            raise HTTPException(status_code=404, detail="Phiếu nhập Header không tồn tại.")
+
+        records = _read_packing_list(filename, content)
+        lines, errors = self._validate_packing_list(records)
+
+        result = {
+            "receipt_id": receipt_id,
+            "dry_run": dry_run,
+            "total_rows": len(records),
+            "valid_rows": len(lines),
+            "total_quantity_kg": sum(line["received_quantity_kg"] for line in lines),
+            "errors": errors,
+            "lines": lines
+        }
+
+        if dry_run or errors or not lines:
+            self.db.rollback()
+            if errors and not dry_run:
+                raise HTTPException(
+                    status_code=400,
+                    detail={"message": f"Packing list có {len(errors)} lỗi, chưa ghi dòng nào.", "errors": errors}
+                )
+            return result
+
+        # Chỉ khóa phiếu khi thật sự ghi: các lần nhập cùng 1 phiếu chạy tuần tự
+        receipt = self.db.query(MaterialReceipt).filter(
+            MaterialReceipt.receipt_id == receipt_id
+        ).populate_existing().with_for_update().first()
+        if not receipt:
+            self.db.rollback()
+            raise HTTPException(status_code=404, detail="Phiếu nhập Header không tồn tại.")
+
+        try:
+            self._insert_packing_list(receipt, lines)
+            self.db.commit()
+        except HTTPException:
+            self.db.rollback()
+            raise
+        except Exception as e:
+            self.db.rollback()
+            raise HTTPException(status_code=500, detail=f"Lỗi hệ thống khi nhập packing list: {str(e)}")
+
+        result["imported_rows"] = len(lines)
+        return result
+
+    def _validate_packing_list(self, records: List[Dict[str, Any]]) -> Tuple[List[Dict], List[Dict]]:
+        """Kiểm tra từng dòng -> (dòng hợp lệ, lỗi theo dòng). Không ghi DB."""
+        codes = {_to_text(r["material_code"]) for r in records if r.get("material_code") is not None}
+        ids = set()
+        for r in records:
+            try:
+                if r.get("material_id") is not None:
+                    ids.add(_to_number(r["material_id"], int))
+            except ValueError:
+                pass
+        materials = []
+        if codes or ids:
+            materials = self.db.query(Material.id, Material.material_code).filter(
+                or_(Material.material_code.in_(codes), Material.id.in_(ids))
+            ).all()
+        by_code = {m.material_code: m for m in materials}
+        by_id = {m.id: m for m in materials}
+
+        location_length = Batch.__table__.c.location.type.length
+        batch_no_length = Batch.__table__.c.supplier_batch_no.type.length
+
+        lines: List[Dict] = []
+        errors: List[Dict] = []
+        seen: Dict[Tuple[int, str], int] = {}
+
+        for r in records:
+            row = r["_row"]
+            row_errors = []
+
+            def error(column: Optional[str], message: str):
+                row_errors.append({"row": row, "column": column, "message": message})
+
+            # 1. Vật tư
+            material = None
+            if r.get("material_id") is not None:
+                try:
+                    material = by_id.get(_to_number(r["material_id"], int))
+                except ValueError:
+                    pass
+                if not material:
+                    error("material_id", f"Không tìm thấy vật tư ID {r['material_id']}")
+            elif r.get("material_code") is not None:
+                material = by_code.get(_to_text(r["material_code"]))
+                if not material:
+                    error("material_code", f"Không tìm thấy vật tư mã {r['material_code']}")
+            else:
+                error("material_code", "Thiếu mã vật tư")
+
+            # 2. Số lượng
+            numbers = {}
+            for field, cast in _PACKING_LIST_NUMBERS.items():
+                try:
+                    numbers[field] = _to_number(r.get(field), cast)
+                except (TypeError, ValueError):
+                    error(field, f"Giá trị không hợp lệ: {r.get(field)}")
+                    continue
+                if numbers[field] is not None and numbers[field] < 0:
+                    error(field, "Không được âm")
+
+            if "received_quantity_kg" in numbers:
+                if numbers["received_quantity_kg"] is None:
+                    error("received_quantity_kg", "Thiếu SL thực nhập (kg)")
+                elif numbers["received_quantity_kg"] <= 0:
+                    error("received_quantity_kg", "SL thực nhập phải > 0")
+
+            # 3. Ngày sản xuất / hạn dùng
+            dates = {}
+            for field in ("manufacture_date", "expiry_date"):
+                try:
+                    dates[field] = _to_date(r.get(field))
+                except ValueError:
+                    error(field, f"Ngày không hợp lệ: {r.get(field)}")
+            if dates.get("manufacture_date") and dates.get("expiry_date") and dates["expiry_date"] < dates["manufacture_date"]:
+                error("expiry_date", "Hạn dùng trước ngày sản xuất")
+
+            # 4. Lô NCC, vị trí
+            batch_no = _to_text(r.get("supplier_batch_no"))
+            if batch_no and len(batch_no) > batch_no_length:
+                error("supplier_batch_no", f"Dài quá {batch_no_length} ký tự")
+            location = _to_text(r.get("location"))
+            if location and len(location) > location_length:
+                error("location", f"Dài quá {location_length} ký tự")
+
+            if material and batch_no:
+                key = (material.id, batch_no.lower())
+                if key in seen:
+                    error("supplier_batch_no", f"Trùng lô NCC {batch_no} với dòng {seen[key]}")
+                else:
+                    seen[key] = row
+
+            if row_errors:
+                errors.extend(row_errors)
+                continue
+
+            lines.append({
+                "row": row,
+                "material_id": material.id,
+                "material_code": material.material_code,
+                "supplier_batch_no": batch_no,
+                "po_quantity_kg": numbers["po_quantity_kg"] or 0.0,
+                "po_quantity_cones": numbers["po_quantity_cones"] or 0,
+                "received_quantity_kg": numbers["received_quantity_kg"],
+                "received_quantity_cones": numbers["received_quantity_cones"] or 0,
+                "number_of_pallets": numbers["number_of_pallets"] or 0,
+                "origin_country": _to_text(r.get("origin_country")),
+                "location": location,
+                "manufacture_date": dates["manufacture_date"],
+                "expiry_date": dates["expiry_date"],
+                "note": _to_text(r.get("note"))
+            })
+
+        return lines, errors
+
+    def _insert_packing_list(self, receipt: MaterialReceipt, lines: List[Dict]):
+        """Ghi hàng loạt: 1 INSERT chi tiết, 1 block mã lô + 1 INSERT lô, 1 lần post_movements (không commit)"""
+        # 1. Chi tiết phiếu. Phiếu đang bị khóa -> các id mới của phiếu (theo thứ tự tăng) đúng thứ tự dòng
+        last_detail_id = self.db.query(func.max(MaterialReceiptDetail.detail_id)).scalar() or 0
+        self.db.execute(insert(MaterialReceiptDetail), [
+            {
+                "receipt_id": receipt.receipt_id,
+                "material_id": line["material_id"],
+                "po_quantity_kg": line["po_quantity_kg"],
+                "po_quantity_cones": line["po_quantity_cones"],
+                "received_quantity_kg": line["received_quantity_kg"],
+                "received_quantity_cones": line["received_quantity_cones"],
+                "number_of_pallets": line["number_of_pallets"],
+                "supplier_batch_no": line["supplier_batch_no"],
+                "origin_country": line["origin_country"],
+                "location": line["location"],
+                "note": line["note"]
+            }
+            for line in lines
+        ])
+        detail_ids = [
+            detail_id for (detail_id,) in self.db.query(MaterialReceiptDetail.detail_id).filter(
+                MaterialReceiptDetail.receipt_id == receipt.receipt_id,
+                MaterialReceiptDetail.detail_id > last_detail_id
+            ).order_by(MaterialReceiptDetail.detail_id)
+        ]
+        if len(detail_ids) != len(lines):
+            raise HTTPException(status_code=409, detail="Phiếu nhập đang được cập nhật đồng thời, vui lòng thử lại.")
+
+        # 2. Lô: cấp 1 block mã lô nội bộ, insert 1 lần
+        codes = self.batch_service.allocate_batch_codes(len(lines))
+        self.db.execute(insert(Batch), [
+            {
+                "internal_batch_code": code,
+                "supplier_batch_no": line["supplier_batch_no"] or f"NO-BATCH-{detail_id}",
+                "material_id": line["material_id"],
+                "manufacture_date": line["manufacture_date"],
+                "expiry_date": line["expiry_date"],
+                "origin_country": line["origin_country"],
+                "location": line["location"],
+                "receipt_detail_id": detail_id,
+                "qc_status": BatchQCStatus.PENDING,
+                "is_active": True
+            }
+            for line, detail_id, code in zip(lines, detail_ids, codes)
+        ])
+        batch_ids = dict(
+            self.db.query(Batch.internal_batch_code, Batch.batch_id).filter(Batch.internal_batch_code.in_(codes)).all()
+        )
+
+        # 3. Tồn kho + sổ cái: 1 lần ghi cho cả packing list
+        self.inventory_service.post_movements([
+            InventoryMovement(
+                material_id=line["material_id"],
+                warehouse_id=receipt.warehouse_id,
+                batch_id=batch_ids[code],
+                quantity_delta=line["received_quantity_kg"],
+                transaction_type=InventoryTransactionType.RECEIPT,
+                reference_type="MaterialReceipt",
+                reference_id=receipt.receipt_id
+            )
+            for line, code in zip(lines, codes)
+        ])
+
+        # 4. PO: tính lại SL đã nhận / trạng thái 1 lần
+        if receipt.po_header_id:
+            self._refresh_po(receipt.po_header_id)
+
+        for line, code in zip(lines, codes):
+            line["internal_batch_code"] = code
+
     # =========================================================================
     # INTERNAL HELPERS
     # =========================================================================
 
-    def _create_detail_instance(self, receipt_id: int, detail_in: MaterialReceiptDetailCreate, po_id: Optional[int]):
+    def _create_detail_instance(self, receipt_id: int, detail_in: MaterialReceiptDetailCreate):
         db_detail = MaterialReceiptDetail(
             receipt_id=receipt_id,
             material_id=detail_in.material_id,
@@ -304,17 +766,10 @@ class MaterialReceiptService:
              db_detail.origin_country = detail_in.origin_country
 
         self.db.add(db_detail)
-
-        if po_id:
-            self._update_po_received_quantity(
-                po_id=po_id,
-                material_id=detail_in.material_id,
-                quantity_delta_kg=detail_in.received_quantity_kg
-            )
         return db_detail
 
-    def _sync_batch_for_detail(self, detail: MaterialReceiptDetail) -> Optional[Batch]:
-        """Tạo/Update Batch và trả về object"""
+    def _sync_batch_for_detail(self, detail: MaterialReceiptDetail, commit: bool = True) -> Optional[Batch]:
+        """Tạo/Update Batch và trả về object (commit=False: chỉ flush trong transaction của phiếu)"""
         supplier_batch = detail.supplier_batch_no if detail.supplier_batch_no else f"NO-BATCH-{detail.detail_id}"
         
         # [FIX] Lấy thông tin an toàn bằng getattr để tránh lỗi nếu object không có thuộc tính
@@ -360,63 +815,78 @@ class MaterialReceiptService:
                 origin_country=current_origin,
                 location=current_location 
             )
-            return self.batch_service.create(batch_in)
-
-    def _update_po_received_quantity(self, po_id: int, material_id: int, quantity_delta_kg: float):
-        po_details = self.db.query(PurchaseOrderDetail).filter(
-            PurchaseOrderDetail.po_id == po_id,
-            PurchaseOrderDetail.material_id == material_id
-        ).all()
-
-        if not po_details: return
-
-        target_detail: PurchaseOrderDetail = po_details[0]
-        current = target_detail.received_quantity or 0.0
-        new_qty = current + quantity_delta_kg
-        target_detail.received_quantity = max(0.0, new_qty)
-        self.db.add(target_detail)
-
-    def _check_and_close_po(self, po_id: int):
-        po_header = self.db.query(PurchaseOrderHeader).filter(PurchaseOrderHeader.po_id == po_id).first()
-        if not po_header: return
+            return self.batch_service.create(batch_in, commit=commit)
+
+    def _reverse_stock(self, stock: InventoryStock, receipt_id: int):
+        """Ghi bút toán đưa tồn của lô về 0 trước khi xóa dòng tồn kho (giữ lịch sử trong sổ cái)"""
+        if stock.quantity_reserved:
+            # Dòng tồn bị xóa -> phần đang giữ chỗ cũng phải rời bảng tổng hợp
+            InventorySummaryService(self.db).apply_deltas(
+                reserved={(stock.material_id, stock.warehouse_id): -stock.quantity_reserved}
+            )
+        if not stock.quantity_on_hand:
+            return
+        self.inventory_service.post_movements([InventoryMovement(
+            material_id=stock.material_id,
+            warehouse_id=stock.warehouse_id,
+            batch_id=stock.batch_id,
+            quantity_delta=-stock.quantity_on_hand,
+            transaction_type=InventoryTransactionType.REVERSAL,
+            reference_type="MaterialReceipt",
+            reference_id=receipt_id,
+            note="Xóa phiếu nhập / chi tiết phiếu nhập"
+        )])
+
+    def _refresh_po(self, *po_ids: Optional[int], declaration_ids: Tuple[Optional[int], ...] = ()):
+        """
+        Tính lại SL đã nhận + trạng thái PO và bảng đối chiếu PO - Tờ khai - Phiếu nhập
+        (1 lần / PO, cuối transaction). declaration_ids: tờ khai bị đổi trên phiếu -> đối chiếu lại cả PO của tờ khai.
+        """
+        self.db.flush()
+        PurchaseOrderReceivingService(self.db).recompute(po_ids)
+        match_service = PurchaseOrderMatchService(self.db)
+        match_service.refresh({*po_ids, *match_service.po_ids_for_declarations(declaration_ids)})
 
-        all_received = True
-        has_received_any = False
-        
-        detail: PurchaseOrderDetail
-        for detail in po_header.details:
-            ordered = detail.quantity or 0.0
-            received = detail.received_quantity or 0.0
-            
-            if received > 0.01: has_received_any = True
-            if received < (ordered - 0.01): all_received = False
-        
-        if all_received:
-            po_header.status = POStatus.COMPLETED
-        elif has_received_any:
-            po_header.status = POStatus.PARTIAL
-        else:
-            if po_header.status != POStatus.DRAFT:
-                po_header.status = POStatus.CONFIRMED 
-        
-        self.db.add(po_header)
+    # =========================================================================
+    # SỐ PHIẾU NHẬP: YYYY/MM-XXX (cấp từ bộ đếm document_sequences, kỳ = YYYYMM)
+    # =========================================================================
 
-    def generate_next_receipt_number(self) -> str:
-        now = datetime.now()
-        prefix = now.strftime("%Y/%m-") 
-        
+    def _find_last_receipt_seq(self, prefix: str) -> int:
+        """Số thứ tự lớn nhất đang có trong tháng - chỉ dùng 1 lần để khởi tạo bộ đếm của kỳ mới"""
         last_receipt = self.db.query(MaterialReceipt.receipt_number)\
             .filter(MaterialReceipt.receipt_number.like(f"{prefix}%"))\
             .order_by(desc(MaterialReceipt.receipt_number))\
             .first()
-        
         if not last_receipt:
-            return f"{prefix}001"
-        
+            return 0
         try:
-            last_number_str = last_receipt[0]
-            sequence_part = last_number_str.split('-')[-1]
-            next_sequence = int(sequence_part) + 1
-            return f"{prefix}{next_sequence:03d}"
+            return int(last_receipt[0].split('-')[-1])
         except (ValueError, IndexError):
-            return f"{prefix}001"
\ No newline at end of file
+            return 0
+
+    def generate_next_receipt_number(self) -> str:
+        """Xem trước số phiếu nhập tiếp theo (không giữ số)"""
+        now = datetime.now()
+        prefix = now.strftime("%Y/%m-")
+        next_sequence = self.sequence_service.peek(
+            DocumentType.MATERIAL_RECEIPT, now.strftime("%Y%m"), seed=lambda: self._find_last_receipt_seq(prefix)
+        )
+        return f"{prefix}{next_sequence:03d}"
+
+    def _allocate_receipt_number(self) -> str:
+        now = datetime.now()
+        prefix = now.strftime("%Y/%m-")
+        next_sequence = self.sequence_service.allocate(
+            DocumentType.MATERIAL_RECEIPT, now.strftime("%Y%m"), seed=lambda: self._find_last_receipt_seq(prefix)
+        )[0]
+        return f"{prefix}{next_sequence:03d}"
+
+    def _sync_receipt_sequence(self, receipt_number: str):
+        """Số phiếu nhập tay đúng định dạng YYYY/MM-XXX -> đẩy bộ đếm lên để không cấp trùng"""
+        match = re.fullmatch(r"(\d{4})/(\d{2})-(\d+)", receipt_number)
+        if match:
+            prefix = f"{match.group(1)}/{match.group(2)}-"
+            self.sequence_service.sync_to(
+                DocumentType.MATERIAL_RECEIPT, f"{match.group(1)}{match.group(2)}", int(match.group(3)),
+                seed=lambda: self._find_last_receipt_seq(prefix)
+            )
\ No newline at end of file
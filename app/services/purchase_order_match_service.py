@@ -0,0 +1,347 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, insert, select, update, delete, bindparam, distinct
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.models.purchase_order import PurchaseOrderHeader, PurchaseOrderDetail, POStatus
+from app.models.purchase_order_match import PurchaseOrderMatch, MatchStatus, MISMATCH_STATUSES
+from app.models.import_declaration import ImportDeclarationDetail
+from app.models.material_receipt import MaterialReceipt, MaterialReceiptDetail
+from app.models.material import Material
+from app.services.purchase_order_receiving_service import RECEIVED_TOLERANCE
+from app.db.pagination import CursorPage, paginate
+
+Key = Tuple[int, int]   # (po_id, material_id)
+
+class PurchaseOrderMatchService:
+    """
+    Đối chiếu 3 bên PO - Tờ khai nhập khẩu - Phiếu nhập kho theo (PO, vật tư):
+    - SL đặt: tổng dòng PO. SL khai: tổng dòng tờ khai trỏ tới dòng PO (po_detail_id);
+      dòng tờ khai không ghi po_detail_id được tính cho PO nếu mọi phiếu nhập của tờ khai đó cùng 1 PO.
+      SL nhận: tổng chi tiết phiếu nhập của PO.
+    - Mỗi nguồn 1 query GROUP BY cho cả tập PO, kết quả lưu vào po_match_lines (chỉ ghi dòng thay đổi).
+    - Chỉ đối chiếu PO chưa hủy và đã có tờ khai (PO mua trong nước không có tờ khai -> không có dòng).
+    Gọi refresh() cho các PO bị ảnh hưởng ở cuối transaction (sau flush) khi PO / tờ khai / phiếu nhập thay đổi,
+    hoặc rebuild() để tính lại toàn bộ.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    # =========================================================================
+    # TRẠNG THÁI ĐỐI CHIẾU
+    # =========================================================================
+
+    @staticmethod
+    def _status_for(ordered: float, declared: float, received: float) -> MatchStatus:
+        if ordered <= RECEIVED_TOLERANCE and (declared > RECEIVED_TOLERANCE or received > RECEIVED_TOLERANCE):
+            return MatchStatus.NOT_ON_PO
+        if declared > ordered + RECEIVED_TOLERANCE:
+            return MatchStatus.OVER_DECLARED
+        if received > declared + RECEIVED_TOLERANCE:
+            return MatchStatus.OVER_RECEIVED
+        if abs(ordered - declared) <= RECEIVED_TOLERANCE and abs(declared - received) <= RECEIVED_TOLERANCE:
+            return MatchStatus.MATCHED
+        return MatchStatus.PENDING
+
+    # =========================================================================
+    # PO BỊ ẢNH HƯỞNG
+    # =========================================================================
+
+    def po_ids_for_declarations(self, declaration_ids: Iterable[Optional[int]]) -> Set[int]:
+        """PO liên quan tới tờ khai: qua dòng tờ khai (po_detail_id) và qua phiếu nhập gắn tờ khai"""
+        declaration_ids = sorted({d for d in declaration_ids if d})
+        if not declaration_ids:
+            return set()
+
+        by_detail = select(PurchaseOrderDetail.po_id).join(
+            ImportDeclarationDetail, ImportDeclarationDetail.po_detail_id == PurchaseOrderDetail.detail_id
+        ).where(ImportDeclarationDetail.declaration_id.in_(declaration_ids))
+        by_receipt = select(MaterialReceipt.po_header_id).where(
+            MaterialReceipt.declaration_id.in_(declaration_ids),
+            MaterialReceipt.po_header_id.isnot(None)
+        )
+        return {po_id for (po_id,) in self.db.execute(by_detail.union(by_receipt))}
+
+    # =========================================================================
+    # TÍNH LẠI
+    # =========================================================================
+
+    def _declared(self, po_ids: List[int]) -> Dict[Key, float]:
+        declared: Dict[Key, float] = {}
+
+        # 1. Dòng tờ khai có po_detail_id
+        linked = self.db.query(
+            PurchaseOrderDetail.po_id,
+            ImportDeclarationDetail.material_id,
+            func.sum(ImportDeclarationDetail.quantity).label("total")
+        ).join(
+            PurchaseOrderDetail, PurchaseOrderDetail.detail_id == ImportDeclarationDetail.po_detail_id
+        ).filter(
+            PurchaseOrderDetail.po_id.in_(po_ids)
+        ).group_by(PurchaseOrderDetail.po_id, ImportDeclarationDetail.material_id)
+        for r in linked:
+            declared[(r.po_id, r.material_id)] = r.total or 0.0
+
+        # 2. Dòng tờ khai không có po_detail_id: gán theo PO duy nhất của các phiếu nhập dùng tờ khai
+        candidate_declarations = select(MaterialReceipt.declaration_id).where(
+            MaterialReceipt.po_header_id.in_(po_ids),
+            MaterialReceipt.declaration_id.isnot(None)
+        )
+        declaration_po = select(
+            MaterialReceipt.declaration_id,
+            func.min(MaterialReceipt.po_header_id).label("po_id")
+        ).where(
+            MaterialReceipt.declaration_id.in_(candidate_declarations),
+            MaterialReceipt.po_header_id.isnot(None)
+        ).group_by(MaterialReceipt.declaration_id).having(
+            func.count(distinct(MaterialReceipt.po_header_id)) == 1
+        ).subquery()
+
+        unlinked = self.db.query(
+            declaration_po.c.po_id,
+            ImportDeclarationDetail.material_id,
+            func.sum(ImportDeclarationDetail.quantity).label("total")
+        ).join(
+            declaration_po, declaration_po.c.declaration_id == ImportDeclarationDetail.declaration_id
+        ).filter(
+            ImportDeclarationDetail.po_detail_id.is_(None)
+        ).group_by(declaration_po.c.po_id, ImportDeclarationDetail.material_id)
+        for r in unlinked:
+            key = (r.po_id, r.material_id)
+            declared[key] = declared.get(key, 0.0) + (r.total or 0.0)
+
+        return declared
+
+    def refresh(self, po_ids: Iterable[Optional[int]]) -> Dict[str, int]:
+        """
+        Tính lại dòng đối chiếu của các PO (không commit).
+        PO đã hủy / đã xóa / không còn tờ khai -> xóa dòng đối chiếu.
+        """
+        po_ids = sorted({po_id for po_id in po_ids if po_id})
+        result = {"po_checked": len(po_ids), "inserted": 0, "updated": 0, "deleted": 0}
+        if not po_ids:
+            return result
+
+        active = sorted(
+            po_id for (po_id,) in self.db.query(PurchaseOrderHeader.po_id).filter(
+                PurchaseOrderHeader.po_id.in_(po_ids),
+                PurchaseOrderHeader.status != POStatus.CANCELLED
+            )
+        )
+
+        ordered: Dict[Key, float] = {}
+        declared: Dict[Key, float] = {}
+        received: Dict[Key, float] = {}
+        if active:
+            declared = self._declared(active)
+
+            ordered = {
+                (r.po_id, r.material_id): r.total or 0.0
+                for r in self.db.query(
+                    PurchaseOrderDetail.po_id,
+                    PurchaseOrderDetail.material_id,
+                    func.sum(PurchaseOrderDetail.quantity).label("total")
+                ).filter(
+                    PurchaseOrderDetail.po_id.in_(active)
+                ).group_by(PurchaseOrderDetail.po_id, PurchaseOrderDetail.material_id)
+            }
+
+            received = {
+                (r.po_header_id, r.material_id): r.total or 0.0
+                for r in self.db.query(
+                    MaterialReceipt.po_header_id,
+                    MaterialReceiptDetail.material_id,
+                    func.sum(MaterialReceiptDetail.received_quantity_kg).label("total")
+                ).join(
+                    MaterialReceiptDetail, MaterialReceiptDetail.receipt_id == MaterialReceipt.receipt_id
+                ).filter(
+                    MaterialReceipt.po_header_id.in_(active)
+                ).group_by(MaterialReceipt.po_header_id, MaterialReceiptDetail.material_id)
+            }
+
+        # PO có tờ khai mới được đối chiếu
+        declared_pos = {po_id for po_id, _ in declared}
+        keys = {key for key in (*ordered, *declared, *received) if key[0] in declared_pos}
+
+        computed: Dict[Key, Dict] = {}
+        for key in keys:
+            o, d, r = ordered.get(key, 0.0), declared.get(key, 0.0), received.get(key, 0.0)
+            computed[key] = {
+                "ordered_quantity": o,
+                "declared_quantity": d,
+                "received_quantity": r,
+                "declared_variance": d - o,
+                "received_variance": r - d,
+                "status": self._status_for(o, d, r)
+            }
+
+        existing = self.db.query(
+            PurchaseOrderMatch.id,
+            PurchaseOrderMatch.po_id,
+            PurchaseOrderMatch.material_id,
+            PurchaseOrderMatch.ordered_quantity,
+            PurchaseOrderMatch.declared_quantity,
+            PurchaseOrderMatch.received_quantity,
+            PurchaseOrderMatch.status
+        ).filter(PurchaseOrderMatch.po_id.in_(po_ids)).all()
+
+        updates, stale = [], []
+        for row in existing:
+            values = computed.pop((row.po_id, row.material_id), None)
+            if values is None:
+                stale.append(row.id)
+                continue
+            changed = (
+                row.status != values["status"]
+                or abs(row.ordered_quantity - values["ordered_quantity"]) > 1e-9
+                or abs(row.declared_quantity - values["declared_quantity"]) > 1e-9
+                or abs(row.received_quantity - values["received_quantity"]) > 1e-9
+            )
+            if changed:
+                updates.append({"_id": row.id, **{f"_{name}": value for name, value in values.items()}})
+
+        table = PurchaseOrderMatch.__table__
+        if stale:
+            self.db.execute(delete(table).where(table.c.id.in_(stale)))
+        if updates:
+            self.db.execute(
+                update(table).where(table.c.id == bindparam("_id")).values(
+                    ordered_quantity=bindparam("_ordered_quantity"),
+                    declared_quantity=bindparam("_declared_quantity"),
+                    received_quantity=bindparam("_received_quantity"),
+                    declared_variance=bindparam("_declared_variance"),
+                    received_variance=bindparam("_received_variance"),
+                    status=bindparam("_status")
+                ),
+                updates
+            )
+        if computed:
+            self.db.execute(
+                insert(table),
+                [{"po_id": po_id, "material_id": material_id, **values} for (po_id, material_id), values in sorted(computed.items())]
+            )
+
+        result.update(inserted=len(computed), updated=len(updates), deleted=len(stale))
+        return result
+
+    def rebuild(self, batch_size: int = 500) -> Dict[str, int]:
+        """
+        Tính lại toàn bộ theo từng lô po_id, commit mỗi lô (đối soát định kỳ / lần đầu triển khai).
+        Gồm cả PO đã hủy còn sót dòng đối chiếu.
+        """
+        totals = {"po_checked": 0, "inserted": 0, "updated": 0, "deleted": 0}
+        last_id = 0
+        while True:
+            batch = [
+                po_id for (po_id,) in self.db.query(PurchaseOrderHeader.po_id).filter(
+                    PurchaseOrderHeader.po_id > last_id
+                ).order_by(PurchaseOrderHeader.po_id).limit(batch_size)
+            ]
+            if not batch:
+                break
+
+            result = self.refresh(batch)
+            self.db.commit()
+            for key, value in result.items():
+                totals[key] += value
+            last_id = batch[-1]
+
+        return totals
+
+    # =========================================================================
+    # TRA CỨU
+    # =========================================================================
+
+    def get_multi(
+        self,
+        skip: int = 0,
+        limit: int = 100,
+        status: MatchStatus = None,
+        mismatch_only: bool = True,
+        po_id: int = None,
+        vendor_id: int = None,
+        material_id: int = None,
+        cursor: str = None
+    ) -> CursorPage:
+        query = self.db.query(
+            PurchaseOrderMatch.id,
+            PurchaseOrderMatch.po_id,
+            PurchaseOrderHeader.po_number,
+            PurchaseOrderHeader.vendor_id,
+            PurchaseOrderMatch.material_id,
+            Material.material_code,
+            PurchaseOrderMatch.ordered_quantity,
+            PurchaseOrderMatch.declared_quantity,
+            PurchaseOrderMatch.received_quantity,
+            PurchaseOrderMatch.declared_variance,
+            PurchaseOrderMatch.received_variance,
+            PurchaseOrderMatch.status,
+            PurchaseOrderMatch.matched_at
+        ).join(
+            PurchaseOrderHeader, PurchaseOrderHeader.po_id == PurchaseOrderMatch.po_id
+        ).join(
+            Material, Material.id == PurchaseOrderMatch.material_id
+        )
+
+        if status:
+            query = query.filter(PurchaseOrderMatch.status == status)
+        elif mismatch_only:
+            query = query.filter(PurchaseOrderMatch.status.in_(MISMATCH_STATUSES))
+
+        if po_id:
+            query = query.filter(PurchaseOrderMatch.po_id == po_id)
+
+        if vendor_id:
+            query = query.filter(PurchaseOrderHeader.vendor_id == vendor_id)
+
+        if material_id:
+            query = query.filter(PurchaseOrderMatch.material_id == material_id)
+
+        return paginate(
+            query,
+            [(PurchaseOrderMatch.po_id, True), (PurchaseOrderMatch.id, True)],
+            skip=skip, limit=limit, cursor=cursor
+        )
+
+    def get_summary(self, vendor_id: int = None) -> Dict:
+        """Số dòng đối chiếu và số PO theo trạng thái (1 query GROUP BY)"""
+        query = self.db.query(
+            PurchaseOrderMatch.status,
+            func.count(PurchaseOrderMatch.id).label("lines"),
+            func.count(distinct(PurchaseOrderMatch.po_id)).label("pos")
+        )
+        if vendor_id:
+            query = query.join(
+                PurchaseOrderHeader, PurchaseOrderHeader.po_id == PurchaseOrderMatch.po_id
+            ).filter(PurchaseOrderHeader.vendor_id == vendor_id)
+
+        by_status = {status: {"lines": 0, "purchase_orders": 0} for status in MatchStatus}
+        for r in query.group_by(PurchaseOrderMatch.status):
+            by_status[r.status] = {"lines": r.lines, "purchase_orders": r.pos}
+
+        mismatch_pos = self.db.query(func.count(distinct(PurchaseOrderMatch.po_id))).filter(
+            PurchaseOrderMatch.status.in_(MISMATCH_STATUSES)
+        )
+        if vendor_id:
+            mismatch_pos = mismatch_pos.join(
+                PurchaseOrderHeader, PurchaseOrderHeader.po_id == PurchaseOrderMatch.po_id
+            ).filter(PurchaseOrderHeader.vendor_id == vendor_id)
+
+        return {
+            "total_lines": sum(v["lines"] for v in by_status.values()),
+            "mismatch_lines": sum(by_status[s]["lines"] for s in MISMATCH_STATUSES),
+            "mismatch_purchase_orders": mismatch_pos.scalar() or 0,
+            "by_status": by_status
+        }
+
+
+if __name__ == "__main__":
+    # Lệnh chạy tay / cron: tính lại toàn bộ bảng đối chiếu
+    #   python -m app.services.purchase_order_match_service
+    from app.db.session import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(PurchaseOrderMatchService(db).rebuild())
+    finally:
+        db.close()
\ No newline at end of file
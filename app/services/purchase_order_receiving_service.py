@@ -0,0 +1,144 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, update, bindparam
+from typing import Dict, Iterable, List, Tuple
+
+from app.models.purchase_order import PurchaseOrderHeader, PurchaseOrderDetail, POStatus
+from app.models.material_receipt import MaterialReceipt, MaterialReceiptDetail
+
+# Sai số cho phép khi so SL đã nhận với SL đặt (kg)
+RECEIVED_TOLERANCE = 0.01
+
+class PurchaseOrderReceivingService:
+    """
+    SL đã nhận và trạng thái PO tính lại từ phiếu nhập theo tập (không cộng/trừ delta từng dòng):
+    - 1 query tổng SL thực nhập theo (PO, vật tư) từ chi tiết phiếu nhập.
+    - SL của 1 vật tư dồn vào dòng PO đầu tiên của vật tư đó (các dòng trùng vật tư = 0).
+    - Chỉ ghi dòng / PO có thay đổi, bằng UPDATE executemany.
+    Gọi 1 lần cho mỗi PO bị ảnh hưởng ở cuối transaction (sau flush), hoặc đối soát định kỳ cho toàn bộ PO.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    @staticmethod
+    def _status_for(current: POStatus, lines: List[Tuple[float, float]]) -> POStatus:
+        """lines: [(SL đặt, SL đã nhận)] -> trạng thái PO"""
+        all_received = all(received >= ordered - RECEIVED_TOLERANCE for ordered, received in lines)
+        has_received_any = any(received > RECEIVED_TOLERANCE for _, received in lines)
+        if all_received:
+            return POStatus.COMPLETED
+        if has_received_any:
+            return POStatus.PARTIAL
+        return current if current == POStatus.DRAFT else POStatus.CONFIRMED
+
+    def recompute(self, po_ids: Iterable[int]) -> Dict[str, int]:
+        """
+        Tính lại SL đã nhận + trạng thái cho các PO (không commit).
+        PO đã hủy giữ nguyên trạng thái, chỉ cập nhật SL.
+        """
+        po_ids = sorted({po_id for po_id in po_ids if po_id})
+        if not po_ids:
+            return {"po_checked": 0, "lines_updated": 0, "status_updated": 0}
+
+        # 1. Tổng thực nhập theo (PO, vật tư)
+        received = {
+            (r.po_header_id, r.material_id): r.total or 0.0
+            for r in self.db.query(
+                MaterialReceipt.po_header_id,
+                MaterialReceiptDetail.material_id,
+                func.sum(MaterialReceiptDetail.received_quantity_kg).label("total")
+            ).join(
+                MaterialReceiptDetail, MaterialReceiptDetail.receipt_id == MaterialReceipt.receipt_id
+            ).filter(
+                MaterialReceipt.po_header_id.in_(po_ids)
+            ).group_by(MaterialReceipt.po_header_id, MaterialReceiptDetail.material_id)
+        }
+
+        # 2. Dòng PO hiện tại (+ trạng thái header), sắp theo detail_id để dòng đầu tiên của vật tư nhận SL
+        rows = self.db.query(
+            PurchaseOrderDetail.detail_id,
+            PurchaseOrderDetail.po_id,
+            PurchaseOrderDetail.material_id,
+            PurchaseOrderDetail.quantity,
+            PurchaseOrderDetail.received_quantity,
+            PurchaseOrderHeader.status
+        ).join(
+            PurchaseOrderHeader, PurchaseOrderHeader.po_id == PurchaseOrderDetail.po_id
+        ).filter(
+            PurchaseOrderDetail.po_id.in_(po_ids)
+        ).order_by(PurchaseOrderDetail.po_id, PurchaseOrderDetail.detail_id).all()
+
+        line_updates = []
+        per_po: Dict[int, List[Tuple[float, float]]] = {}
+        current_status: Dict[int, POStatus] = {}
+        assigned = set()
+        for r in rows:
+            key = (r.po_id, r.material_id)
+            new_received = 0.0
+            if key not in assigned:
+                assigned.add(key)
+                new_received = max(0.0, received.get(key, 0.0))
+            if abs((r.received_quantity or 0.0) - new_received) > 1e-9:
+                line_updates.append({"_detail_id": r.detail_id, "_received": new_received})
+            per_po.setdefault(r.po_id, []).append((r.quantity or 0.0, new_received))
+            current_status[r.po_id] = r.status
+
+        status_updates = []
+        for po_id, lines in per_po.items():
+            if current_status[po_id] == POStatus.CANCELLED:
+                continue
+            status = self._status_for(current_status[po_id], lines)
+            if status != current_status[po_id]:
+                status_updates.append({"_po_id": po_id, "_status": status})
+
+        # 3. Ghi phần thay đổi
+        if line_updates:
+            table = PurchaseOrderDetail.__table__
+            self.db.execute(
+                update(table).where(table.c.detail_id == bindparam("_detail_id")).values(received_quantity=bindparam("_received")),
+                line_updates
+            )
+        if status_updates:
+            table = PurchaseOrderHeader.__table__
+            self.db.execute(
+                update(table).where(table.c.po_id == bindparam("_po_id")).values(status=bindparam("_status")),
+                status_updates
+            )
+
+        return {"po_checked": len(po_ids), "lines_updated": len(line_updates), "status_updated": len(status_updates)}
+
+    def reconcile(self, batch_size: int = 500) -> Dict[str, int]:
+        """
+        Đối soát định kỳ (chạy đêm): tính lại toàn bộ PO chưa hủy theo từng lô po_id, commit mỗi lô.
+        Sửa các sai lệch do chỉnh dữ liệu tay / lỗi cũ.
+        """
+        totals = {"po_checked": 0, "lines_updated": 0, "status_updated": 0}
+        last_id = 0
+        while True:
+            query = self.db.query(PurchaseOrderHeader.po_id).filter(
+                PurchaseOrderHeader.po_id > last_id,
+                PurchaseOrderHeader.status != POStatus.CANCELLED
+            )
+            batch = [po_id for (po_id,) in query.order_by(PurchaseOrderHeader.po_id).limit(batch_size)]
+            if not batch:
+                break
+
+            result = self.recompute(batch)
+            self.db.commit()
+            for key, value in result.items():
+                totals[key] += value
+            last_id = batch[-1]
+
+        return totals
+
+
+if __name__ == "__main__":
+    # Lệnh chạy tay / cron (khi không bật job đối soát trong ứng dụng):
+    #   python -m app.services.purchase_order_receiving_service
+    from app.db.session import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(PurchaseOrderReceivingService(db).reconcile())
+    finally:
+        db.close()
\ No newline at end of file
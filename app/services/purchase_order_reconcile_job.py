@@ -0,0 +1,71 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.purchase_order_receiving_service import PurchaseOrderReceivingService
+from app.services.purchase_order_match_service import PurchaseOrderMatchService
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# JOB ĐỐI SOÁT PO HẰNG ĐÊM (CHẠY NỀN)
+# =========================
+# Mỗi ngày vào lúc PO_RECONCILE_HOUR giờ tính lại SL đã nhận + trạng thái của toàn bộ PO chưa hủy,
+# sau đó tính lại bảng đối chiếu PO - Tờ khai - Phiếu nhập.
+# Chạy trùng giữa nhiều worker chỉ tốn thêm 1 lượt tính, kết quả không đổi (tính lại từ phiếu nhập).
+
+_stop_event = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+
+def reconcile_once() -> dict:
+    db = SessionLocal()
+    try:
+        result = PurchaseOrderReceivingService(db).reconcile()
+        match = PurchaseOrderMatchService(db).rebuild()
+        result.update({f"match_{key}": value for key, value in match.items()})
+        return result
+    except Exception as e:
+        db.rollback()
+        logger.error(f"⚠️ Lỗi đối soát PO: {e}")
+        return {}
+    finally:
+        db.close()
+
+
+def _seconds_until(hour: int) -> float:
+    now = datetime.now()
+    next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+def _run(hour: int):
+    while not _stop_event.wait(_seconds_until(hour)):
+        result = reconcile_once()
+        if any(result.get(key) for key in ("lines_updated", "status_updated", "match_inserted", "match_updated", "match_deleted")):
+            logger.info(f"Đối soát PO: {result}")
+
+
+def start():
+    """Khởi động job (gọi 1 lần khi ứng dụng startup, PO_RECONCILE_HOUR < 0 thì không chạy)"""
+    global _worker
+    hour = settings.PO_RECONCILE_HOUR
+    if hour < 0 or (_worker is not None and _worker.is_alive()):
+        return
+    _stop_event.clear()
+    _worker = threading.Thread(target=_run, args=(hour % 24,), name="purchase-order-reconcile", daemon=True)
+    _worker.start()
+
+
+def stop():
+    """Dừng job (gọi khi shutdown)"""
+    global _worker
+    _stop_event.set()
+    if _worker is not None:
+        _worker.join(timeout=30)
+        _worker = None
\ No newline at end of file
@@ -3,13 +3,21 @@ from sqlalchemy import or_, desc
 from fastapi import HTTPException
 from typing import List, Optional
 from datetime import date
+import re
 
 from app.models.purchase_order import PurchaseOrderHeader, PurchaseOrderDetail, POStatus
-from app.schemas.purchase_order_schema import POHeaderCreate, POHeaderUpdate, PODetailCreate
+from app.models.document_sequence import DocumentType
+from app.schemas.purchase_order_schema import POHeaderCreate, POHeaderUpdate, PODetailCreate, PODetailUpdate
+from app.services.document_sequence_service import DocumentSequenceService
+from app.services.inventory_valuation_service import InventoryValuationService
+from app.services.purchase_order_receiving_service import PurchaseOrderReceivingService
+from app.services.purchase_order_match_service import PurchaseOrderMatchService
+from app.db.pagination import paginate
 
 class PurchaseOrderService:
     def __init__(self, db: Session):
         self.db = db
+        self.sequence_service = DocumentSequenceService(db)
 
     def get(self, po_id: int) -> Optional[PurchaseOrderHeader]:
         return self.db.query(PurchaseOrderHeader).options(
@@ -29,7 +37,8 @@ class PurchaseOrderService:
         vendor_id: int = None,
         status: POStatus = None,
         from_date: date = None,
-        to_date: date = None
+        to_date: date = None,
+        cursor: str = None
     ) -> List[PurchaseOrderHeader]:
         query = self.db.query(PurchaseOrderHeader).options(
             joinedload(PurchaseOrderHeader.vendor) 
@@ -50,39 +59,45 @@ class PurchaseOrderService:
         if search:
             query = query.filter(PurchaseOrderHeader.po_number.ilike(f"%{search}%"))
 
-        return query.order_by(PurchaseOrderHeader.order_date.desc()).offset(skip).limit(limit).all()
+        return paginate(
+            query,
+            [(PurchaseOrderHeader.order_date, True), (PurchaseOrderHeader.po_id, True)],
+            skip=skip, limit=limit, cursor=cursor
+        )
 
     # [UPDATED] Hàm sinh số PO tự động tăng dần: V00000001, V00000002...
-    def generate_next_po_number(self) -> str:
-        # Tìm số PO lớn nhất hiện tại bắt đầu bằng 'V'
-        last_po = self.db.query(PurchaseOrderHeader)\
+    # Số lấy từ bộ đếm document_sequences (đánh số liên tục, không theo kỳ).
+    def _find_last_po_seq(self) -> int:
+        """Số PO lớn nhất đang có - chỉ dùng 1 lần để khởi tạo bộ đếm"""
+        last_po = self.db.query(PurchaseOrderHeader.po_number)\
             .filter(PurchaseOrderHeader.po_number.like("V%"))\
             .order_by(desc(PurchaseOrderHeader.po_number))\
             .first()
-        
         if not last_po:
-            # Chưa có PO nào, bắt đầu từ 1
-            return "V00000001"
-        
+            return 0
         try:
-            current_code = last_po.po_number
-            # Bỏ ký tự 'V' đầu tiên để lấy phần số
-            # VD: V00000005 -> 00000005 -> 5
-            number_part = int(current_code[1:])
-            
-            # Tăng lên 1
-            next_number = number_part + 1
-            
-            # Format lại thành chuỗi có 8 chữ số, đệm số 0
-            return f"V{next_number:08d}"
+            return int(last_po[0][1:])
         except (ValueError, IndexError):
-            # Fallback an toàn nếu dữ liệu cũ không đúng chuẩn
-            return "V00000001"
+            return 0
+
+    def generate_next_po_number(self) -> str:
+        """Xem trước số PO tiếp theo (không giữ số)"""
+        next_number = self.sequence_service.peek(DocumentType.PURCHASE_ORDER, seed=self._find_last_po_seq)
+        return f"V{next_number:08d}"
+
+    def _allocate_po_number(self) -> str:
+        next_number = self.sequence_service.allocate(DocumentType.PURCHASE_ORDER, seed=self._find_last_po_seq)[0]
+        return f"V{next_number:08d}"
 
     def create(self, obj_in: POHeaderCreate) -> PurchaseOrderHeader:
         # Tự động sinh số PO nếu không có hoặc là "AUTO"
         if not obj_in.po_number or obj_in.po_number.strip().upper() == "AUTO":
-            obj_in.po_number = self.generate_next_po_number()
+            obj_in.po_number = self._allocate_po_number()
+        elif re.fullmatch(r"V\d{8}", obj_in.po_number):
+            # Số PO nhập tay đúng định dạng -> đẩy bộ đếm lên để không cấp trùng
+            self.sequence_service.sync_to(
+                DocumentType.PURCHASE_ORDER, "", int(obj_in.po_number[1:]), seed=self._find_last_po_seq
+            )
         
         # Kiểm tra trùng (Double check)
         if self.get_by_number(obj_in.po_number):
@@ -129,10 +144,20 @@ class PurchaseOrderService:
 
     def update(self, db_obj: PurchaseOrderHeader, obj_in: POHeaderUpdate) -> PurchaseOrderHeader:
         update_data = obj_in.dict(exclude_unset=True)
+        rate_changed = "exchange_rate" in update_data and update_data["exchange_rate"] != db_obj.exchange_rate
+        status_changed = "status" in update_data and update_data["status"] != db_obj.status
         for field, value in update_data.items():
             setattr(db_obj, field, value)
         
         self.db.add(db_obj)
+        if rate_changed:
+            # Đổi tỷ giá -> định giá lại các lô đã nhập theo PO (cùng transaction)
+            self.db.flush()
+            InventoryValuationService(self.db).revalue_purchase_order(db_obj.po_id, commit=False)
+        if status_changed:
+            # Hủy / mở lại PO -> bỏ / đưa lại PO vào bảng đối chiếu
+            self.db.flush()
+            PurchaseOrderMatchService(self.db).refresh([db_obj.po_id])
         self.db.commit()
         return self.get(db_obj.po_id)
 
@@ -155,9 +180,42 @@ class PurchaseOrderService:
         self.db.add(new_detail)
         
         po.total_amount += line_total
+
+        # Dòng mới làm thay đổi đơn giá bình quân của vật tư trong PO -> định giá lại lô đã nhập
+        self.db.flush()
+        InventoryValuationService(self.db).revalue_purchase_order(po_id, commit=False)
+        # ... và có thể làm PO đã đủ hàng quay lại trạng thái nhập một phần
+        PurchaseOrderReceivingService(self.db).recompute([po_id])
+        PurchaseOrderMatchService(self.db).refresh([po_id])
         
         self.db.commit()
         return self.get(po_id)
+
+    def update_item(self, po_id: int, detail_id: int, item_in: PODetailUpdate) -> PurchaseOrderHeader:
+        """Sửa dòng PO (VD: sửa đơn giá) - tính lại thành tiền và định giá lại các lô đã nhập theo PO"""
+        po = self.get(po_id)
+        if not po:
+            raise HTTPException(status_code=404, detail="PO not found")
+        detail = next((d for d in po.details if d.detail_id == detail_id), None)
+        if not detail:
+            raise HTTPException(status_code=404, detail="Không tìm thấy dòng PO.")
+
+        update_data = item_in.dict(exclude_unset=True)
+        for field, value in update_data.items():
+            setattr(detail, field, value)
+
+        old_total = detail.line_total or 0.0
+        detail.line_total = detail.quantity * detail.unit_price
+        po.total_amount = (po.total_amount or 0.0) - old_total + detail.line_total
+
+        self.db.flush()
+        InventoryValuationService(self.db).revalue_purchase_order(po_id, commit=False)
+        if "quantity" in update_data or "material_id" in update_data:
+            PurchaseOrderReceivingService(self.db).recompute([po_id])
+            PurchaseOrderMatchService(self.db).refresh([po_id])
+
+        self.db.commit()
+        return self.get(po_id)
     
     def delete(self, po_id: int):
         db_obj = self.get(po_id)
@@ -0,0 +1,320 @@
+import csv
+import io
+from sqlalchemy.orm import Session
+from sqlalchemy import func, insert, select, update, bindparam, or_
+from fastapi import HTTPException
+from typing import Dict, List, Optional
+from datetime import datetime
+
+from app.models.stock_count import StockCountSession, StockCountLine, StockCountStatus
+from app.models.inventory import InventoryStock
+from app.models.inventory_transaction import InventoryTransactionType
+from app.models.batch import Batch
+from app.models.material import Material
+from app.schemas.stock_count_schema import StockCountCreate, StockCountEntry, StockCountSubmit
+from app.schemas.inventory_schema import InventoryMovement
+from app.services.inventory_service import InventoryService
+from app.db.pagination import CursorPage, paginate
+
+class StockCountService:
+    """
+    Kiểm kê kho theo phiên.
+    - Tạo phiên: chốt tồn sổ sách của kho bằng 1 lệnh INSERT ... SELECT.
+    - Nhận số đếm hàng loạt (JSON / CSV): 1 query tra mã lô, 1 UPDATE executemany, 1 INSERT cho lô phát sinh.
+    - Chênh lệch = Đếm - Số chốt, tính trong 1 query. Ghi điều chỉnh toàn bộ qua post_movements trong 1 transaction.
+    Vì chênh lệch tính theo số chốt nên nhập / xuất phát sinh trong lúc đếm không bị ghi đè.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.inventory_service = InventoryService(db)
+
+    # =========================
+    # PHIÊN KIỂM KÊ
+    # =========================
+    def get(self, session_id: int) -> Optional[StockCountSession]:
+        return self.db.query(StockCountSession).filter(StockCountSession.id == session_id).first()
+
+    def get_multi(
+        self,
+        skip: int = 0,
+        limit: int = 100,
+        warehouse_id: Optional[int] = None,
+        status: Optional[StockCountStatus] = None,
+        cursor: Optional[str] = None
+    ) -> CursorPage:
+        query = self.db.query(StockCountSession)
+        if warehouse_id:
+            query = query.filter(StockCountSession.warehouse_id == warehouse_id)
+        if status:
+            query = query.filter(StockCountSession.status == status)
+        return paginate(query, [(StockCountSession.id, True)], skip=skip, limit=limit, cursor=cursor)
+
+    def create(self, obj_in: StockCountCreate) -> StockCountSession:
+        session = StockCountSession(
+            warehouse_id=obj_in.warehouse_id,
+            status=StockCountStatus.OPEN,
+            note=obj_in.note,
+            created_by=obj_in.created_by
+        )
+        self.db.add(session)
+        self.db.flush()
+
+        # Chốt số sổ sách: mỗi dòng tồn (khác 0) của kho thành 1 dòng kiểm kê
+        snapshot = select(
+            session.id,
+            InventoryStock.material_id,
+            InventoryStock.batch_id,
+            func.coalesce(InventoryStock.quantity_on_hand, 0.0)
+        ).where(
+            InventoryStock.warehouse_id == obj_in.warehouse_id,
+            InventoryStock.quantity_on_hand != 0
+        )
+        if obj_in.material_ids:
+            snapshot = snapshot.where(InventoryStock.material_id.in_(obj_in.material_ids))
+        self.db.execute(
+            insert(StockCountLine).from_select(
+                ["session_id", "material_id", "batch_id", "expected_quantity"], snapshot
+            )
+        )
+
+        self.db.commit()
+        self.db.refresh(session)
+        return session
+
+    def _lock_open(self, session_id: int) -> StockCountSession:
+        """Khóa phiên (các lượt nhập số đếm / ghi sổ của cùng 1 phiên chạy tuần tự)"""
+        session = self.db.query(StockCountSession).filter(
+            StockCountSession.id == session_id
+        ).with_for_update().populate_existing().first()
+        if not session:
+            raise HTTPException(status_code=404, detail="Không tìm thấy phiên kiểm kê.")
+        if session.status != StockCountStatus.OPEN:
+            raise HTTPException(status_code=400, detail=f"Phiên kiểm kê đã đóng (Trạng thái: {session.status.value})")
+        return session
+
+    def cancel(self, session_id: int) -> StockCountSession:
+        session = self._lock_open(session_id)
+        session.status = StockCountStatus.CANCELLED
+        self.db.commit()
+        self.db.refresh(session)
+        return session
+
+    # =========================
+    # NHẬP SỐ ĐẾM
+    # =========================
+    def submit_counts(self, session_id: int, obj_in: StockCountSubmit) -> Dict:
+        session = self._lock_open(session_id)
+
+        # 1. Tra mã lô -> batch_id / material_id (1 query)
+        batch_ids = {e.batch_id for e in obj_in.entries if e.batch_id is not None}
+        batch_codes = {e.batch_code.strip() for e in obj_in.entries if e.batch_id is None and e.batch_code}
+        batches = []
+        if batch_ids or batch_codes:
+            batches = self.db.query(Batch.batch_id, Batch.internal_batch_code, Batch.material_id).filter(
+                or_(Batch.batch_id.in_(batch_ids), Batch.internal_batch_code.in_(batch_codes))
+            ).all()
+        by_id = {b.batch_id: b for b in batches}
+        by_code = {b.internal_batch_code: b for b in batches}
+
+        # 2. Gộp số đếm theo lô (1 lô quét nhiều lần trong cùng 1 lượt -> cộng lại)
+        counted: Dict[int, float] = {}
+        unknown: List[str] = []
+        for e in obj_in.entries:
+            batch = by_id.get(e.batch_id) if e.batch_id is not None else by_code.get((e.batch_code or "").strip())
+            if batch is None:
+                unknown.append(str(e.batch_id) if e.batch_id is not None else (e.batch_code or ""))
+                continue
+            counted[batch.batch_id] = counted.get(batch.batch_id, 0.0) + e.counted_quantity
+
+        if not counted:
+            self.db.rollback()
+            return {"updated": 0, "inserted": 0, "unknown_batches": unknown}
+
+        existing = {
+            r.batch_id: r.id for r in self.db.query(StockCountLine.id, StockCountLine.batch_id).filter(
+                StockCountLine.session_id == session.id,
+                StockCountLine.batch_id.in_(counted.keys())
+            ).all()
+        }
+        now = datetime.now()
+
+        # 3. Dòng đã có trong số chốt: 1 UPDATE executemany
+        rows_to_update = [
+            {"_line_id": existing[batch_id], "_qty": qty}
+            for batch_id, qty in sorted(counted.items()) if batch_id in existing
+        ]
+        if rows_to_update:
+            table = StockCountLine.__table__
+            new_value = bindparam("_qty")
+            if obj_in.accumulate:
+                new_value = func.coalesce(table.c.counted_quantity, 0.0) + bindparam("_qty")
+            self.db.execute(
+                update(table)
+                .where(table.c.id == bindparam("_line_id"))
+                .values(counted_quantity=new_value, counted_by=obj_in.counted_by, counted_at=now),
+                rows_to_update
+            )
+
+        # 4. Lô có hàng nhưng không có trong số chốt: thêm dòng với số sổ sách = 0
+        rows_to_insert = [
+            {
+                "session_id": session.id,
+                "material_id": by_id[batch_id].material_id,
+                "batch_id": batch_id,
+                "expected_quantity": 0.0,
+                "counted_quantity": qty,
+                "counted_by": obj_in.counted_by,
+                "counted_at": now
+            }
+            for batch_id, qty in sorted(counted.items()) if batch_id not in existing
+        ]
+        if rows_to_insert:
+            self.db.execute(insert(StockCountLine), rows_to_insert)
+
+        self.db.commit()
+        return {"updated": len(rows_to_update), "inserted": len(rows_to_insert), "unknown_batches": unknown}
+
+    @staticmethod
+    def parse_csv(content: bytes) -> List[StockCountEntry]:
+        """
+        Đọc file CSV số đếm. Cột bắt buộc: batch_code (hoặc batch_id) và counted_quantity (hoặc quantity).
+        """
+        try:
+            text = content.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="File CSV phải mã hóa UTF-8.")
+
+        reader = csv.DictReader(io.StringIO(text))
+        fields = {f.strip().lower() for f in (reader.fieldnames or [])}
+        if not ({"batch_code", "batch_id"} & fields) or not ({"counted_quantity", "quantity"} & fields):
+            raise HTTPException(
+                status_code=400,
+                detail="File CSV cần cột batch_code (hoặc batch_id) và counted_quantity (hoặc quantity)."
+            )
+
+        entries = []
+        for line_no, raw in enumerate(reader, start=2):
+            row = {(k or "").strip().lower(): (v or "").strip() for k, v in raw.items()}
+            quantity = row.get("counted_quantity") or row.get("quantity")
+            if not quantity:
+                continue
+            try:
+                entries.append(StockCountEntry(
+                    batch_id=int(row["batch_id"]) if row.get("batch_id") else None,
+                    batch_code=row.get("batch_code") or None,
+                    counted_quantity=float(quantity)
+                ))
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Dòng {line_no} của file CSV không hợp lệ.")
+        return entries
+
+    # =========================
+    # CHÊNH LỆCH & GHI SỔ
+    # =========================
+    def get_variance_report(self, session_id: int, only_variance: bool = False) -> Dict:
+        session = self.get(session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Không tìm thấy phiên kiểm kê.")
+
+        variance = StockCountLine.counted_quantity - StockCountLine.expected_quantity
+        query = self.db.query(
+            StockCountLine.id,
+            StockCountLine.material_id,
+            Material.material_code,
+            StockCountLine.batch_id,
+            Batch.internal_batch_code,
+            StockCountLine.expected_quantity,
+            StockCountLine.counted_quantity,
+            variance.label("variance")
+        ).join(
+            Material, Material.id == StockCountLine.material_id
+        ).join(
+            Batch, Batch.batch_id == StockCountLine.batch_id
+        ).filter(StockCountLine.session_id == session_id)
+
+        rows = query.order_by(Material.material_code, Batch.internal_batch_code).all()
+
+        lines = []
+        counted_lines = variance_lines = 0
+        total_variance = 0.0
+        for r in rows:
+            if r.counted_quantity is not None:
+                counted_lines += 1
+                if abs(r.variance) > 0.0001:
+                    variance_lines += 1
+                    total_variance += r.variance
+            if only_variance and (r.variance is None or abs(r.variance) <= 0.0001):
+                continue
+            lines.append({
+                "line_id": r.id,
+                "material_id": r.material_id,
+                "material_code": r.material_code,
+                "batch_id": r.batch_id,
+                "internal_batch_code": r.internal_batch_code,
+                "expected_quantity": r.expected_quantity,
+                "counted_quantity": r.counted_quantity,
+                "variance": r.variance
+            })
+
+        return {
+            "session_id": session_id,
+            "total_lines": len(rows),
+            "counted_lines": counted_lines,
+            "uncounted_lines": len(rows) - counted_lines,
+            "variance_lines": variance_lines,
+            "total_variance": total_variance,
+            "lines": lines
+        }
+
+    def post(self, session_id: int, zero_uncounted: bool = False) -> Dict:
+        """
+        Ghi toàn bộ chênh lệch vào sổ (ADJUSTMENT) trong 1 transaction rồi đóng phiên.
+        zero_uncounted=True: lô có trong số chốt nhưng không đếm được coi như thất lạc (đếm = 0).
+        """
+        session = self._lock_open(session_id)
+
+        counted = StockCountLine.counted_quantity
+        if zero_uncounted:
+            counted = func.coalesce(StockCountLine.counted_quantity, 0.0)
+        variance = counted - StockCountLine.expected_quantity
+
+        rows = self.db.query(
+            StockCountLine.material_id,
+            StockCountLine.batch_id,
+            variance.label("variance")
+        ).filter(
+            StockCountLine.session_id == session.id,
+            variance.isnot(None),
+            func.abs(variance) > 0.0001
+        ).all()
+
+        movements = [
+            InventoryMovement(
+                material_id=r.material_id,
+                warehouse_id=session.warehouse_id,
+                batch_id=r.batch_id,
+                quantity_delta=r.variance,
+                transaction_type=InventoryTransactionType.ADJUSTMENT,
+                reference_type="StockCount",
+                reference_id=session.id,
+                note=f"Kiểm kê phiên #{session.id}"
+            )
+            for r in rows
+        ]
+        self.inventory_service.post_movements(movements)
+
+        session.status = StockCountStatus.POSTED
+        session.posted_at = datetime.now()
+        try:
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            raise HTTPException(status_code=500, detail=f"Lỗi hệ thống khi ghi sổ kiểm kê: {str(e)}")
+        self.db.refresh(session)
+
+        return {
+            "session": session,
+            "adjusted_lines": len(movements),
+            "total_variance": sum(m.quantity_delta for m in movements)
+        }
\ No newline at end of file
@@ -1,54 +1,84 @@
 import logging
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, aliased
 from sqlalchemy import desc, and_
 from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
 from typing import Optional
 from datetime import datetime
 
 # Import Models & Schemas
 from app.models.weaving_basket_ticket import WeavingBasketTicket
 from app.models.basket import Basket  # Cần import để lấy tare_weight
+from app.models.batch import Batch
+from app.models.employee import Employee
+from app.models.machine import Machine
+from app.models.product import Product
 from app.schemas.weaving_basket_ticket_schema import WeavingTicketCreate, WeavingTicketUpdate
-from app.services import weaving_daily_production_service
+from app.services import weaving_daily_production_service, weaving_daily_production_queue, machine_line_occupancy_service
+from app.db.pagination import paginate
+from app.db.loading import schema_load_options
+from app.db.export import ExportFormat, stream_export
 
 logger = logging.getLogger(__name__)
 
+# Cột file xuất phiếu rổ dệt. Alias nhân viên vào / ra được tạo lúc xuất:
+# aliased() ở mức module sẽ cấu hình mapper khi chưa import đủ models.
+def _ticket_export_columns(employee_in, employee_out):
+    return [
+        ("Mã phiếu", WeavingBasketTicket.code),
+        ("Sản phẩm", Product.item_code),
+        ("Máy", Machine.machine_name),
+        ("Line", WeavingBasketTicket.machine_line),
+        ("Ngày lên sợi", WeavingBasketTicket.yarn_load_date),
+        ("Mã lô", Batch.internal_batch_code),
+        ("Rổ", Basket.basket_code),
+        ("Giờ vào", WeavingBasketTicket.time_in),
+        ("NV vào", employee_in.full_name),
+        ("Giờ ra", WeavingBasketTicket.time_out),
+        ("NV ra", employee_out.full_name),
+        ("Tổng TL (kg)", WeavingBasketTicket.gross_weight),
+        ("TL tịnh (kg)", WeavingBasketTicket.net_weight),
+        ("Chiều dài (m)", WeavingBasketTicket.length_meters),
+        ("Số mối nối", WeavingBasketTicket.number_of_knots),
+    ]
+
 # ============================
 # READ (Get Data)
 # ============================
 
-def get_ticket_by_id(db: Session, ticket_id: int):
-    return db.query(WeavingBasketTicket).filter(WeavingBasketTicket.id == ticket_id).first()
+def _ticket_query(db: Session, load_schema: Optional[type] = None):
+    """Query phiếu rổ, eager load các quan hệ mà response schema cần (product, basket, employee_in/out...)"""
+    query = db.query(WeavingBasketTicket)
+    if load_schema:
+        query = query.options(*schema_load_options(WeavingBasketTicket, load_schema))
+    return query
+
+def get_ticket_by_id(db: Session, ticket_id: int, load_schema: Optional[type] = None):
+    return _ticket_query(db, load_schema).filter(WeavingBasketTicket.id == ticket_id).first()
 
 def get_ticket_by_code(db: Session, code: str):
     return db.query(WeavingBasketTicket).filter(WeavingBasketTicket.code == code).first()
 
-def get_tickets(db: Session, skip: int = 0, limit: int = 100):
+def get_tickets(
+    db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, load_schema: Optional[type] = None
+):
     """Lấy danh sách phiếu, mới nhất lên đầu"""
-    return (
-        db.query(WeavingBasketTicket)
-        .order_by(desc(WeavingBasketTicket.id))
-        .offset(skip)
-        .limit(limit)
-        .all()
+    return paginate(
+        _ticket_query(db, load_schema), [(WeavingBasketTicket.id, True)], skip=skip, limit=limit, cursor=cursor
     )
 
 # ============================
 # SEARCH / FILTER
 # ============================
 
-def search_tickets(
-    db: Session,
+def _filter_tickets(
+    query,
     code: Optional[str] = None,
     product_id: Optional[int] = None,
     machine_id: Optional[int] = None,
-    employee_id: Optional[int] = None, # Tìm cả người vào hoặc ra
-    is_finished: Optional[bool] = None, # True: Đã ra rổ, False: Đang chạy
-    skip: int = 0,
-    limit: int = 100
+    employee_id: Optional[int] = None,
+    is_finished: Optional[bool] = None
 ):
-    query = db.query(WeavingBasketTicket)
-
     if code:
         query = query.filter(WeavingBasketTicket.code.ilike(f"%{code}%"))
     
@@ -71,7 +101,49 @@ def search_tickets(
         else:
             query = query.filter(WeavingBasketTicket.time_out.is_(None))
 
-    return query.order_by(desc(WeavingBasketTicket.id)).offset(skip).limit(limit).all()
+    return query
+
+def search_tickets(
+    db: Session,
+    code: Optional[str] = None,
+    product_id: Optional[int] = None,
+    machine_id: Optional[int] = None,
+    employee_id: Optional[int] = None, # Tìm cả người vào hoặc ra
+    is_finished: Optional[bool] = None, # True: Đã ra rổ, False: Đang chạy
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    load_schema: Optional[type] = None
+):
+    query = _filter_tickets(_ticket_query(db, load_schema), code, product_id, machine_id, employee_id, is_finished)
+    return paginate(query, [(WeavingBasketTicket.id, True)], skip=skip, limit=limit, cursor=cursor)
+
+def export_tickets(
+    db: Session,
+    fmt: ExportFormat,
+    code: Optional[str] = None,
+    product_id: Optional[int] = None,
+    machine_id: Optional[int] = None,
+    employee_id: Optional[int] = None,
+    is_finished: Optional[bool] = None
+) -> StreamingResponse:
+    """Xuất phiếu rổ (cùng bộ lọc với search_tickets) ra Excel / CSV, mới nhất lên đầu"""
+    employee_in, employee_out = aliased(Employee), aliased(Employee)
+    query = db.query(WeavingBasketTicket).join(
+        Product, Product.product_id == WeavingBasketTicket.product_id
+    ).join(
+        Machine, Machine.machine_id == WeavingBasketTicket.machine_id
+    ).outerjoin(
+        Batch, Batch.batch_id == WeavingBasketTicket.batch_id
+    ).outerjoin(
+        Basket, Basket.basket_id == WeavingBasketTicket.basket_id
+    ).outerjoin(
+        employee_in, employee_in.employee_id == WeavingBasketTicket.employee_in_id
+    ).outerjoin(
+        employee_out, employee_out.employee_id == WeavingBasketTicket.employee_out_id
+    )
+    query = _filter_tickets(query, code, product_id, machine_id, employee_id, is_finished)
+    return stream_export(query.order_by(WeavingBasketTicket.id.desc()), _ticket_export_columns(employee_in, employee_out), fmt, "phieu_ro_det")
 
 # ============================
 # CREATE (Bắt đầu phiếu)
@@ -87,21 +159,34 @@ def create_ticket(db: Session, ticket_in: WeavingTicketCreate):
     # Nếu rổ đang IN_USE ở phiếu khác chưa đóng thì không được tạo.
     # (Bạn có thể thêm logic check bảng Basket ở đây)
 
-    # 3. Create
-    db_ticket = WeavingBasketTicket(**ticket_in.model_dump())
+    # 3. Line máy phải đang trống (bảng machine_line_occupancy, DB chặn thêm bằng unique khi ghi)
+    if (ticket_in.machine_id, ticket_in.machine_line) in machine_line_occupancy_service.get_busy_lines(
+        db, [(ticket_in.machine_id, ticket_in.machine_line)]
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máy {ticket_in.machine_id} Line {ticket_in.machine_line} đang hoạt động. Vui lòng hạ rổ trước."
+        )
+
+    # 4. Create
+    ticket_data = ticket_in.model_dump()
+    # Schema vẫn nhận yarn_lot_id (tên cũ), model đã đổi sang batch_id
+    ticket_data["batch_id"] = ticket_data.pop("yarn_lot_id", None)
+    db_ticket = WeavingBasketTicket(**ticket_data)
     
     # Set default time_in if not provided
     if not db_ticket.time_in:
         db_ticket.time_in = datetime.now()
 
     db.add(db_ticket)
-    db.commit()
-    db.refresh(db_ticket)
+    db.flush()
+    machine_line_occupancy_service.sync_ticket(db, db_ticket)
     
-    # 4. Update status Basket -> IN_USE (Nếu cần thiết)
+    # 5. Update status Basket -> IN_USE (Nếu cần thiết)
     basket = db.query(Basket).get(ticket_in.basket_id)
     basket.status = "IN_USE"
     db.commit()
+    db.refresh(db_ticket)
     
     return db_ticket
 
@@ -131,6 +216,9 @@ def update_ticket(db: Session, ticket_id: int, ticket_in: WeavingTicketUpdate):
             # Trường hợp hiếm: Không tìm thấy rổ, giữ nguyên net_weight = gross_weight hoặc 0
             ticket_in.net_weight = ticket_in.gross_weight
 
+    # Ghi nhớ phần đóng góp cũ vào sản lượng ngày (để trừ ra nếu phiếu bị sửa / đổi ngày / đổi sản phẩm)
+    old_contribution = weaving_daily_production_service.get_ticket_contribution(db_ticket)
+
     # 3. Cập nhật các trường thông tin
     # exclude_unset=True: Chỉ update những trường client gửi lên, không ghi đè NULL vào trường cũ
     update_data = ticket_in.model_dump(exclude_unset=True)
@@ -152,6 +240,17 @@ def update_ticket(db: Session, ticket_id: int, ticket_in: WeavingTicketUpdate):
             # Hoặc "HOLDING" nếu quy trình là phải nhập kho xong mới Ready
             # basket.status = "HOLDING" 
 
+    # ==================================================================
+    # 6. [QUAN TRỌNG] SẢN LƯỢNG NGÀY: TÍNH LẠI NỀN SAU KHI COMMIT
+    # ==================================================================
+    # Chỉ ghi nhận cặp (ngày, sản phẩm) cũ & mới của phiếu; worker gom các cặp trùng và tính lại sau,
+    # request không chờ tính lại.
+    new_contribution = weaving_daily_production_service.get_ticket_contribution(db_ticket)
+
+    # 7. Giữ / trả line máy theo phiếu (ra rổ -> trả line, đổi máy/line/rổ -> cập nhật)
+    db.flush()
+    machine_line_occupancy_service.sync_ticket(db, db_ticket)
+
     # Lưu thay đổi chính vào DB
     try:
         db.commit()
@@ -160,27 +259,10 @@ def update_ticket(db: Session, ticket_id: int, ticket_in: WeavingTicketUpdate):
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Database commit error: {str(e)}")
 
-    # ==================================================================
-    # 6. [QUAN TRỌNG] TRIGGER TÍNH TOÁN SẢN LƯỢNG NGÀY
-    # ==================================================================
-    # Chỉ chạy khi phiếu đã hoàn thành (có time_out)
-    if db_ticket.time_out:
-        try:
-            # Lấy ngày ra của phiếu (VD: 2023-10-27)
-            target_date = db_ticket.time_out.date()
-            
-            logger.info(f"🔄 Đang tính lại sản lượng cho ngày: {target_date}")
-            
-            # Gọi service thống kê để cập nhật bảng weaving_daily_productions
-            weaving_daily_production_service.calculate_daily_production(
-                db=db, 
-                target_date=target_date
-            )
-        except Exception as e:
-            # Log lỗi nhưng KHÔNG raise Exception để tránh rollback transaction phiếu rổ
-            # Vì phiếu đã lưu thành công rồi, lỗi thống kê có thể chạy lại sau.
-            logger.error(f"⚠️ Lỗi tính toán sản lượng tự động: {e}")
-            print(f"⚠️ Error calculating stats: {e}")
+    if old_contribution != new_contribution:
+        weaving_daily_production_queue.enqueue(
+            contribution[:2] for contribution in (old_contribution, new_contribution) if contribution
+        )
 
     return db_ticket
 
@@ -195,7 +277,13 @@ def delete_ticket(db: Session, ticket_id: int):
 
     # Có thể thêm logic: Không cho xóa nếu phiếu đã hoàn thành (có time_out)
     
+    # Phiếu đã ra rổ bị xóa -> tính lại sản lượng (ngày, sản phẩm) của phiếu sau khi commit
+    contribution = weaving_daily_production_service.get_ticket_contribution(db_ticket)
+
+    machine_line_occupancy_service.release_tickets(db, [db_ticket.id])
     db.delete(db_ticket)
     db.commit()
-    return {"message": "Ticket deleted successfully"}
 
+    if contribution:
+        weaving_daily_production_queue.enqueue([contribution[:2]])
+    return {"message": "Ticket deleted successfully"}
@@ -0,0 +1,99 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services import weaving_daily_production_service
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# HÀNG ĐỢI TÍNH LẠI SẢN LƯỢNG NGÀY (CHẠY NỀN)
+# =========================
+# Sửa / xóa phiếu rổ chỉ ghi cặp (ngày, sản phẩm) bị ảnh hưởng vào hàng đợi sau khi commit phiếu, API trả về ngay.
+# Worker gom các cặp trùng nhau trong WEAVING_PRODUCTION_DEBOUNCE_SECONDS giây (giờ giao ca hàng trăm rổ ra cùng lúc)
+# rồi tính lại từ phiếu đúng các cặp đó: 1 lượt calculate_daily_production mỗi ngày.
+# Hàng đợi nằm trong từng process; nhiều worker cùng tính 1 cặp vẫn ra cùng kết quả (tính lại từ phiếu).
+
+_pending: Dict[date, Set[int]] = defaultdict(set)
+_lock = threading.Lock()
+_dirty_event = threading.Event()
+_stop_event = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+
+def _worker_alive() -> bool:
+    return _worker is not None and _worker.is_alive()
+
+
+def enqueue(keys: Iterable[Tuple[date, int]]) -> None:
+    """
+    Đánh dấu các cặp (ngày, sản phẩm) cần tính lại (gọi SAU khi commit phiếu).
+    Worker không chạy (script, test, tắt bằng cấu hình) -> tính lại ngay tại chỗ.
+    """
+    with _lock:
+        for target_date, product_id in keys:
+            _pending[target_date].add(product_id)
+        if not _pending:
+            return
+    if _worker_alive():
+        _dirty_event.set()
+    else:
+        flush()
+
+
+def flush() -> int:
+    """Tính lại toàn bộ các cặp đang chờ, trả về số cặp đã tính. Ngày bị lỗi được trả lại hàng đợi để thử lại."""
+    global _pending
+    with _lock:
+        batch, _pending = _pending, defaultdict(set)
+
+    done = 0
+    for target_date, product_ids in sorted(batch.items()):
+        db = SessionLocal()
+        try:
+            weaving_daily_production_service.calculate_daily_production(db, target_date, product_ids)
+            done += len(product_ids)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"⚠️ Lỗi tính lại sản lượng ngày {target_date}: {e}")
+            with _lock:
+                _pending[target_date].update(product_ids)
+            _dirty_event.set()
+        finally:
+            db.close()
+    return done
+
+
+def _run(debounce: float):
+    while not _stop_event.is_set():
+        _dirty_event.wait()
+        # Chờ thêm 1 nhịp để gom các phiếu ra rổ liên tiếp
+        _stop_event.wait(debounce)
+        _dirty_event.clear()
+        flush()
+
+
+def start():
+    """Khởi động worker (gọi 1 lần khi ứng dụng startup, debounce <= 0 thì không chạy -> tính ngay sau commit)"""
+    global _worker
+    debounce = settings.WEAVING_PRODUCTION_DEBOUNCE_SECONDS
+    if debounce <= 0 or _worker_alive():
+        return
+    _stop_event.clear()
+    _worker = threading.Thread(target=_run, args=(debounce,), name="weaving-daily-production", daemon=True)
+    _worker.start()
+
+
+def stop():
+    """Dừng worker (gọi khi shutdown), các cặp còn chờ được tính nốt trước khi thoát"""
+    global _worker
+    _stop_event.set()
+    _dirty_event.set()
+    if _worker is not None:
+        _worker.join(timeout=30)
+        _worker = None
+    flush()
\ No newline at end of file
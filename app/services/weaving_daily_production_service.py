@@ -1,15 +1,17 @@
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import Date, cast, distinct, func, or_, and_, desc
-from datetime import date
-from typing import Optional
+from sqlalchemy import Date, distinct, func, or_, and_, desc, delete, insert
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, Optional, Tuple
 
 # Import Models
 from app.models.weaving_basket_ticket import WeavingBasketTicket
-from app.models.weaving_daily_production import WeavingDailyProduction
+from app.models.weaving_daily_production import WeavingDailyProduction, WeavingDailyProductionMachine
 from app.models.product import Product
 
 # Import Schemas
 from app.schemas.weaving_daily_production_schema import WeavingProductionCreate, WeavingProductionUpdate
+from app.db.pagination import paginate
 
 
 # =========================
@@ -18,19 +20,18 @@ from app.schemas.weaving_daily_production_schema import WeavingProductionCreate,
 def get_productions(
     db: Session,
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None
 ):
     """
     Lấy danh sách sản lượng, mặc định sắp xếp ngày mới nhất lên đầu.
     Sử dụng joinedload để lấy luôn thông tin Product đi kèm.
     """
-    return (
+    return paginate(
         db.query(WeavingDailyProduction)
-        .options(joinedload(WeavingDailyProduction.product)) # Eager load Product
-        .order_by(desc(WeavingDailyProduction.date))         # Sắp xếp ngày giảm dần
-        .offset(skip)
-        .limit(limit)
-        .all()
+        .options(joinedload(WeavingDailyProduction.product)), # Eager load Product
+        [(WeavingDailyProduction.date, True), (WeavingDailyProduction.id, True)], # Sắp xếp ngày giảm dần
+        skip=skip, limit=limit, cursor=cursor
     )
 
 
@@ -56,7 +57,8 @@ def search_productions(
     from_date: date | None = None,  # Lọc từ ngày
     to_date: date | None = None,    # Lọc đến ngày
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None
 ):
     # Bắt đầu query và Join với bảng Product để tìm kiếm theo tên/mã sản phẩm
     query = db.query(WeavingDailyProduction).join(WeavingDailyProduction.product)
@@ -83,13 +85,10 @@ def search_productions(
         query = query.filter(WeavingDailyProduction.date <= to_date)
 
     # Trả về kết quả (Sắp xếp ngày mới nhất trước)
-    return (
-        query
-        .options(joinedload(WeavingDailyProduction.product)) # Load dữ liệu bảng Product để hiển thị UI
-        .order_by(desc(WeavingDailyProduction.date))
-        .offset(skip)
-        .limit(limit)
-        .all()
+    return paginate(
+        query.options(joinedload(WeavingDailyProduction.product)), # Load dữ liệu bảng Product để hiển thị UI
+        [(WeavingDailyProduction.date, True), (WeavingDailyProduction.id, True)],
+        skip=skip, limit=limit, cursor=cursor
     )
 
 
@@ -142,65 +141,186 @@ def delete_production(db: Session, production_id: int):
     return True
 
 # =========================
-# CALCULATE DAILY PRODUCTION (TỰ ĐỘNG TÍNH TOÁN)
+# KHOẢNG THỜI GIAN RA RỔ
+# =========================
+def time_out_range(from_date: date, to_date: Optional[date] = None):
+    """
+    Điều kiện lọc time_out theo ngày dạng nửa mở [00:00 from_date, 00:00 ngày sau to_date)
+    thay cho cast(time_out, Date) == ... để dùng được index trên time_out.
+    """
+    start = datetime.combine(from_date, time.min)
+    end = datetime.combine((to_date or from_date) + timedelta(days=1), time.min)
+    return and_(WeavingBasketTicket.time_out >= start, WeavingBasketTicket.time_out < end)
+
+
+# =========================
+# PHẦN ĐÓNG GÓP CỦA 1 PHIẾU
+# =========================
+# Phần đóng góp của 1 phiếu vào sản lượng ngày: (ngày ra, product_id, machine_id, kg, mét).
+# Sửa / xóa phiếu đưa (ngày, sản phẩm) cũ & mới vào hàng đợi tính lại (weaving_daily_production_queue).
+TicketContribution = Tuple[date, int, int, float, float]
+
+def get_ticket_contribution(ticket: WeavingBasketTicket) -> Optional[TicketContribution]:
+    """Phiếu chưa ra rổ (chưa có time_out) thì chưa đóng góp gì"""
+    if not ticket.time_out:
+        return None
+    return (
+        ticket.time_out.date(),
+        ticket.product_id,
+        ticket.machine_id,
+        ticket.net_weight or 0,
+        ticket.length_meters or 0
+    )
+
+
+# =========================
+# CALCULATE DAILY PRODUCTION (TÍNH LẠI TOÀN BỘ - SỬA SAI LỆCH)
 # =========================
-def calculate_daily_production(db: Session, target_date: date):
+def calculate_daily_production(db: Session, target_date: date, product_ids: Optional[Iterable[int]] = None):
     """
-    Tính toán lại sản lượng cho một ngày cụ thể dựa trên các phiếu đã hoàn thành.
+    Tính lại từ đầu sản lượng của một ngày dựa trên các phiếu đã hoàn thành
+    (hàng đợi nền gọi với product_ids = các sản phẩm vừa có phiếu sửa / xóa; gọi không lọc để sửa sai lệch).
+    Dựng lại cả bảng thành viên (ngày, sản phẩm, máy).
+    - product_ids: chỉ tính lại các sản phẩm này. Để trống = toàn bộ sản phẩm trong ngày.
     """
     print(f"🚀 Starting calculation for date: {target_date}")
+    product_ids = set(product_ids) if product_ids is not None else None
 
-    # 1. Query Aggregate từ bảng WeavingBasketTicket
-    # Tính tổng kg, tổng mét và số lượng máy tham gia cho từng sản phẩm trong ngày đó
-    results = (
+    # 1. Query Aggregate từ bảng WeavingBasketTicket theo (sản phẩm, máy)
+    query = (
         db.query(
             WeavingBasketTicket.product_id,
+            WeavingBasketTicket.machine_id,
+            func.count(WeavingBasketTicket.id).label("ticket_count"),
             func.sum(WeavingBasketTicket.net_weight).label("total_kg"),
-            func.sum(WeavingBasketTicket.length_meters).label("total_meters"),
-            func.count(distinct(WeavingBasketTicket.machine_id)).label("active_lines") 
-        )
-        .filter(
-            WeavingBasketTicket.time_out.isnot(None), # Chỉ tính phiếu đã xong
-            cast(WeavingBasketTicket.time_out, Date) == target_date # Lọc theo ngày ra
+            func.sum(WeavingBasketTicket.length_meters).label("total_meters")
         )
-        .group_by(WeavingBasketTicket.product_id)
-        .all()
+        .filter(time_out_range(target_date)) # Lọc theo ngày ra (phiếu chưa xong có time_out NULL nên tự loại)
     )
+    if product_ids is not None:
+        query = query.filter(WeavingBasketTicket.product_id.in_(product_ids))
+
+    machine_rows = query.group_by(WeavingBasketTicket.product_id, WeavingBasketTicket.machine_id).all()
+
+    totals = defaultdict(lambda: [0.0, 0.0, 0])
+    for row in machine_rows:
+        totals[row.product_id][0] += row.total_kg or 0
+        totals[row.product_id][1] += row.total_meters or 0
+        totals[row.product_id][2] += 1
+
+    # 2. Lấy 1 lần các bản ghi đã có của ngày (thay vì SELECT từng sản phẩm)
+    existing_query = db.query(WeavingDailyProduction).filter(WeavingDailyProduction.date == target_date)
+    if product_ids is not None:
+        existing_query = existing_query.filter(WeavingDailyProduction.product_id.in_(product_ids))
+    existing = {r.product_id: r for r in existing_query.all()}
 
-    if not results:
+    if not totals and not existing:
         print("⚠️ No finished tickets found for this date.")
         return {"message": f"No data found for {target_date}"}
 
-    # 2. Lưu vào bảng WeavingDailyProduction
+    # 3. Dựng lại bảng thành viên (ngày, sản phẩm, máy)
+    machine_table = WeavingDailyProductionMachine.__table__
+    delete_stmt = delete(machine_table).where(machine_table.c.date == target_date)
+    if product_ids is not None:
+        delete_stmt = delete_stmt.where(machine_table.c.product_id.in_(product_ids))
+    db.execute(delete_stmt)
+    if machine_rows:
+        db.execute(insert(machine_table), [
+            {
+                "date": target_date,
+                "product_id": row.product_id,
+                "machine_id": row.machine_id,
+                "ticket_count": row.ticket_count
+            }
+            for row in machine_rows
+        ])
+
+    # 4. Lưu vào bảng WeavingDailyProduction
     count_updated = 0
-    for row in results:
-        # Tìm bản ghi cũ xem đã có chưa
-        daily_record = (
-            db.query(WeavingDailyProduction)
-            .filter(
-                WeavingDailyProduction.date == target_date,
-                WeavingDailyProduction.product_id == row.product_id
-            )
-            .first()
-        )
+    for product_id, (total_kg, total_meters, active_lines) in totals.items():
+        daily_record = existing.pop(product_id, None)
 
         if daily_record:
             # Update
-            daily_record.total_kg = row.total_kg or 0
-            daily_record.total_meters = row.total_meters or 0
-            daily_record.active_machine_lines = row.active_lines or 0
+            daily_record.total_kg = total_kg
+            daily_record.total_meters = total_meters
+            daily_record.active_machine_lines = active_lines
         else:
             # Create
             new_record = WeavingDailyProduction(
                 date=target_date,
-                product_id=row.product_id,
-                total_kg=row.total_kg or 0,
-                total_meters=row.total_meters or 0,
-                active_machine_lines=row.active_lines or 0
+                product_id=product_id,
+                total_kg=total_kg,
+                total_meters=total_meters,
+                active_machine_lines=active_lines
             )
             db.add(new_record)
         count_updated += 1
+
+    # 5. Sản phẩm không còn phiếu (phiếu bị xóa / đổi ngày / đổi SP) -> về 0
+    for daily_record in existing.values():
+        daily_record.total_kg = 0
+        daily_record.total_meters = 0
+        daily_record.active_machine_lines = 0
+        count_updated += 1
     
     db.commit()
     print(f"✅ Successfully updated {count_updated} records.")
-    return {"message": f"Updated {count_updated} products for {target_date}"}
\ No newline at end of file
+    return {"message": f"Updated {count_updated} products for {target_date}"}
+
+
+# =========================
+# VERIFY (SO SÁNH SỐ LIỆU DELTA VỚI TÍNH LẠI TOÀN BỘ)
+# =========================
+def verify_daily_production(db: Session, from_date: date, to_date: date, tolerance: float = 1e-6):
+    """
+    So sánh các dòng WeavingDailyProduction (do hàng đợi nền tính lại) với kết quả tính lại từ phiếu
+    trong khoảng [from_date, to_date]. Không ghi gì vào DB.
+    Sai lệch có thể sửa bằng calculate_daily_production (API /calculate-manual).
+    """
+    day_expr = func.date(WeavingBasketTicket.time_out, type_=Date)
+    expected_rows = (
+        db.query(
+            day_expr.label("day"),
+            WeavingBasketTicket.product_id,
+            func.sum(WeavingBasketTicket.net_weight).label("total_kg"),
+            func.sum(WeavingBasketTicket.length_meters).label("total_meters"),
+            func.count(distinct(WeavingBasketTicket.machine_id)).label("active_lines")
+        )
+        .filter(time_out_range(from_date, to_date))
+        .group_by(day_expr, WeavingBasketTicket.product_id)
+        .all()
+    )
+    expected = {
+        (row.day, row.product_id): (row.total_kg or 0, row.total_meters or 0, row.active_lines or 0)
+        for row in expected_rows
+    }
+
+    stored_rows = (
+        db.query(WeavingDailyProduction)
+        .filter(WeavingDailyProduction.date >= from_date, WeavingDailyProduction.date <= to_date)
+        .all()
+    )
+    stored = {
+        (r.date, r.product_id): (r.total_kg or 0, r.total_meters or 0, r.active_machine_lines or 0)
+        for r in stored_rows
+    }
+
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        exp = expected.get(key, (0, 0, 0))
+        cur = stored.get(key, (0, 0, 0))
+        if abs(exp[0] - cur[0]) > tolerance or abs(exp[1] - cur[1]) > tolerance or exp[2] != cur[2]:
+            mismatches.append({
+                "date": key[0],
+                "product_id": key[1],
+                "stored": {"total_kg": cur[0], "total_meters": cur[1], "active_machine_lines": cur[2]},
+                "expected": {"total_kg": exp[0], "total_meters": exp[1], "active_machine_lines": exp[2]}
+            })
+
+    return {
+        "from_date": from_date,
+        "to_date": to_date,
+        "checked": len(set(expected) | set(stored)),
+        "mismatches": mismatches
+    }
\ No newline at end of file
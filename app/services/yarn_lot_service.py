@@ -7,22 +7,17 @@ from datetime import date
 from typing import Optional, List
 
 from app.schemas.yarn_lot_schema import YarnLotCreate, YarnLotUpdate
+from app.db.pagination import paginate
 
 # ============================
 # READ (Danh sách & Chi tiết)
 # ============================
 
-def get_yarn_lots(db: Session, skip: int = 0, limit: int = 100):
+def get_yarn_lots(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
     """
     Lấy danh sách lô sợi, mặc định sắp xếp ID giảm dần (mới nhất lên đầu)
     """
-    return (
-        db.query(YarnLot)
-        .order_by(desc(YarnLot.id))
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
+    return paginate(db.query(YarnLot), [(YarnLot.id, True)], skip=skip, limit=limit, cursor=cursor)
 
 def get_yarn_lot_by_id(db: Session, yarn_lot_id: int):
     """
@@ -118,7 +113,8 @@ def search_yarn_lots(
     to_date: Optional[date] = None,
     note: Optional[str] = None, # Đã sửa từ date -> str
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None
 ):
     query = db.query(YarnLot)
 
@@ -142,4 +138,4 @@ def search_yarn_lots(
         query = query.filter(YarnLot.note.ilike(f"%{note}%"))
 
     # Sắp xếp và phân trang
-    return query.order_by(desc(YarnLot.id)).offset(skip).limit(limit).all()
\ No newline at end of file
+    return paginate(query, [(YarnLot.id, True)], skip=skip, limit=limit, cursor=cursor)
\ No newline at end of file
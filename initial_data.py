@@ -8,11 +8,13 @@ from app.models.shift import Shift
 from app.core.security import get_password_hash
 from app.db.base import Base
 from app.db.session import SessionLocal, engine
+from app.models.inventory_view import create_inventory_views
 
 def init_superuser():
     # [QUAN TRỌNG] Dòng lệnh này sẽ tạo toàn bộ bảng trong Database nếu chưa có
     print("Creating tables in database...")
     Base.metadata.create_all(bind=engine)
+    create_inventory_views(engine)
     
     db: Session = SessionLocal()
     
@@ -1,15 +1,31 @@
 import os
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles # Import này
 # 1. Import CORSMiddleware
 from fastapi.middleware.cors import CORSMiddleware 
 from app.core.config import settings
 from app.api.v1.router import api_router
+from app.services import inventory_reservation_sweeper, purchase_order_reconcile_job, weaving_daily_production_queue
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sweeper nền trả lại các phiếu giữ chỗ tồn kho đã hết hạn
+    inventory_reservation_sweeper.start()
+    # Đối soát SL đã nhận / trạng thái PO hằng đêm
+    purchase_order_reconcile_job.start()
+    # Tính lại sản lượng ngày (ngày, sản phẩm) của các phiếu rổ vừa sửa / xóa
+    weaving_daily_production_queue.start()
+    yield
+    weaving_daily_production_queue.stop()
+    purchase_order_reconcile_job.stop()
+    inventory_reservation_sweeper.stop()
 
 app = FastAPI(
     title="Production Management API",
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # Tạo thư mục static nếu chưa có để tránh lỗi khi khởi động
@@ -29,6 +45,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], # Cho phép các phương thức POST, GET, PUT, DELETE...
     allow_headers=["*"], # Cho phép các header như Authorization (chứa Token)
+    expose_headers=["X-Next-Cursor"], # Cho phép client đọc cursor trang kế tiếp (phân trang keyset)
 )
 # END MIDDLEWARE
 
@@ -0,0 +1,98 @@
+"""create inventory transactions and snapshots tables
+
+Revision ID: 5b1e7d2c9a40
+Revises: e373e4b6fe8a
+Create Date: 2026-10-18 08:12:31.402113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1e7d2c9a40'
+down_revision: Union[str, Sequence[str], None] = 'e373e4b6fe8a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('inventory_transactions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('material_id', sa.Integer(), nullable=False),
+    sa.Column('warehouse_id', sa.Integer(), nullable=False),
+    sa.Column('batch_id', sa.Integer(), nullable=False),
+    sa.Column('quantity_delta', sa.Float(), nullable=False, comment='Dương: tăng tồn, Âm: giảm tồn'),
+    sa.Column('transaction_type', sa.Enum('OPENING', 'RECEIPT', 'EXPORT', 'ADJUSTMENT', 'REVERSAL', name='inventorytransactiontype'), nullable=False),
+    sa.Column('reference_type', sa.String(length=50), nullable=True),
+    sa.Column('reference_id', sa.Integer(), nullable=True),
+    sa.Column('note', sa.String(length=255), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_inventory_transactions_id'), 'inventory_transactions', ['id'], unique=False)
+    op.create_index(op.f('ix_inventory_transactions_material_id'), 'inventory_transactions', ['material_id'], unique=False)
+    op.create_index(op.f('ix_inventory_transactions_batch_id'), 'inventory_transactions', ['batch_id'], unique=False)
+    op.create_index(op.f('ix_inventory_transactions_created_at'), 'inventory_transactions', ['created_at'], unique=False)
+    op.create_index('ix_inv_txn_reference', 'inventory_transactions', ['reference_type', 'reference_id'], unique=False)
+
+    op.create_table('inventory_snapshots',
+    sa.Column('snapshot_id', sa.Integer(), nullable=False),
+    sa.Column('snapshot_at', sa.DateTime(), nullable=False),
+    sa.Column('last_transaction_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('snapshot_id')
+    )
+    op.create_index(op.f('ix_inventory_snapshots_snapshot_id'), 'inventory_snapshots', ['snapshot_id'], unique=False)
+    op.create_index(op.f('ix_inventory_snapshots_snapshot_at'), 'inventory_snapshots', ['snapshot_at'], unique=False)
+
+    op.create_table('inventory_snapshot_lines',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('snapshot_id', sa.Integer(), nullable=False),
+    sa.Column('material_id', sa.Integer(), nullable=False),
+    sa.Column('warehouse_id', sa.Integer(), nullable=False),
+    sa.Column('batch_id', sa.Integer(), nullable=False),
+    sa.Column('quantity_on_hand', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['snapshot_id'], ['inventory_snapshots.snapshot_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_inventory_snapshot_lines_id'), 'inventory_snapshot_lines', ['id'], unique=False)
+    op.create_index(op.f('ix_inventory_snapshot_lines_snapshot_id'), 'inventory_snapshot_lines', ['snapshot_id'], unique=False)
+
+    # Khởi tạo sổ cái: số dư hiện tại của inventory_stocks thành bút toán OPENING
+    op.execute(
+        "INSERT INTO inventory_transactions "
+        "(material_id, warehouse_id, batch_id, quantity_delta, transaction_type, reference_type, note, created_at) "
+        "SELECT material_id, warehouse_id, batch_id, quantity_on_hand, 'OPENING', 'InventoryStock', "
+        "'Số dư đầu kỳ khi khởi tạo sổ cái', now() "
+        "FROM inventory_stocks WHERE quantity_on_hand IS NOT NULL AND quantity_on_hand <> 0"
+    )
+    # Snapshot đầu tiên = số dư đầu kỳ
+    op.execute(
+        "INSERT INTO inventory_snapshots (snapshot_at, last_transaction_id, created_at) "
+        "SELECT now(), COALESCE(MAX(id), 0), now() FROM inventory_transactions"
+    )
+    op.execute(
+        "INSERT INTO inventory_snapshot_lines (snapshot_id, material_id, warehouse_id, batch_id, quantity_on_hand) "
+        "SELECT (SELECT MAX(snapshot_id) FROM inventory_snapshots), material_id, warehouse_id, batch_id, quantity_on_hand "
+        "FROM inventory_stocks WHERE quantity_on_hand IS NOT NULL AND quantity_on_hand <> 0"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_inventory_snapshot_lines_snapshot_id'), table_name='inventory_snapshot_lines')
+    op.drop_index(op.f('ix_inventory_snapshot_lines_id'), table_name='inventory_snapshot_lines')
+    op.drop_table('inventory_snapshot_lines')
+    op.drop_index(op.f('ix_inventory_snapshots_snapshot_at'), table_name='inventory_snapshots')
+    op.drop_index(op.f('ix_inventory_snapshots_snapshot_id'), table_name='inventory_snapshots')
+    op.drop_table('inventory_snapshots')
+    op.drop_index('ix_inv_txn_reference', table_name='inventory_transactions')
+    op.drop_index(op.f('ix_inventory_transactions_created_at'), table_name='inventory_transactions')
+    op.drop_index(op.f('ix_inventory_transactions_batch_id'), table_name='inventory_transactions')
+    op.drop_index(op.f('ix_inventory_transactions_material_id'), table_name='inventory_transactions')
+    op.drop_index(op.f('ix_inventory_transactions_id'), table_name='inventory_transactions')
+    op.drop_table('inventory_transactions')
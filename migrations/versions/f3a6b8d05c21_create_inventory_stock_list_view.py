@@ -0,0 +1,64 @@
+"""create inventory stock list view
+
+Revision ID: f3a6b8d05c21
+Revises: e81f4c6b2d95
+Create Date: 2026-10-18 16:25:37.218804
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a6b8d05c21'
+down_revision: Union[str, Sequence[str], None] = 'e81f4c6b2d95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # View danh sách tồn kho dạng phẳng. Bản chụp của INVENTORY_STOCK_VIEW_SELECT (app/models/inventory_view.py):
+    # 2 nơi phải giống nhau, đổi view về sau thì thêm migration mới thay vì sửa file này.
+    op.execute("""
+        CREATE OR REPLACE VIEW v_inventory_stock_list AS
+        SELECT
+            s.id AS id,
+            s.material_id AS material_id,
+            s.warehouse_id AS warehouse_id,
+            s.batch_id AS batch_id,
+            s.quantity_on_hand AS quantity_on_hand,
+            s.quantity_reserved AS quantity_reserved,
+            s.last_updated AS last_updated,
+            m.material_code AS material_code,
+            m.material_type AS material_type,
+            w.warehouse_name AS warehouse_name,
+            b.internal_batch_code AS internal_batch_code,
+            b.supplier_batch_no AS supplier_batch_no,
+            b.location AS location,
+            b.expiry_date AS expiry_date,
+            b.qc_status AS qc_status,
+            COALESCE(d.received_quantity_cones, 0) AS received_quantity_cones,
+            COALESCE(d.number_of_pallets, 0) AS number_of_pallets,
+            r.receipt_number AS receipt_number,
+            COALESCE(sp.short_name, sp.supplier_name) AS supplier_short_name
+        FROM inventory_stocks s
+        JOIN materials m ON m.id = s.material_id
+        JOIN warehouses w ON w.warehouse_id = s.warehouse_id
+        JOIN batches b ON b.batch_id = s.batch_id
+        LEFT JOIN material_receipt_details d ON d.detail_id = b.receipt_detail_id
+        LEFT JOIN material_receipts r ON r.receipt_id = d.receipt_id
+        LEFT JOIN purchase_orders po ON po.po_id = r.po_header_id
+        LEFT JOIN suppliers sp ON sp.supplier_id = po.vendor_id
+    """)
+
+    # Phục vụ sắp xếp danh sách tồn kho mới cập nhật lên đầu
+    op.create_index('ix_inventory_stocks_last_updated', 'inventory_stocks', ['last_updated', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_inventory_stocks_last_updated', table_name='inventory_stocks')
+    op.execute("DROP VIEW IF EXISTS v_inventory_stock_list")
\ No newline at end of file
@@ -0,0 +1,125 @@
+# =================================================================
+# HẠ TẦNG CHUNG CHO CÁC SCRIPT BENCHMARK (scripts/bench/*.py)
+# - DB mặc định: file SQLite tạm. Đặt BENCH_DATABASE_URL để chạy trên MySQL cục bộ.
+# - Mỗi lần chạy XÓA & TẠO LẠI schema -> tuyệt đối không trỏ vào DB thật.
+# Chạy: python scripts/bench/<ten_script>.py [--rows N]
+# =================================================================
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Iterable, Iterator, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ.setdefault("SECRET_KEY", "bench-secret-key")
+os.environ["DATABASE_URL"] = os.environ.get("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.gettempdir()}/mes-bench.db"
+
+from sqlalchemy import event, insert, text
+
+from app.db.session import engine, SessionLocal
+from app.db.base import Base
+from app.models.inventory_view import create_inventory_views, InventoryStockView
+from app.models.unit import Unit
+from app.models.material import Material
+from app.models.warehouse import Warehouse
+
+
+def reset_schema():
+    """Xóa & tạo lại toàn bộ bảng + view."""
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP VIEW IF EXISTS {InventoryStockView.__table__.name}"))
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    create_inventory_views(engine)
+
+
+def seed_material_warehouse(db, material_count: int = 1):
+    """Tạo 1 đơn vị, `material_count` vật tư và 1 kho. Trả về (list material_id, warehouse_id)."""
+    unit = Unit(unit_name="kg")
+    db.add(unit)
+    db.flush()
+    materials = [
+        Material(material_code=f"M{i:05d}", uom_base_id=unit.unit_id, uom_production_id=unit.unit_id, min_stock_level=100)
+        for i in range(material_count)
+    ]
+    warehouse = Warehouse(warehouse_name="KHO-BENCH")
+    db.add_all(materials + [warehouse])
+    db.commit()
+    return [m.id for m in materials], warehouse.warehouse_id
+
+
+def bulk_insert(model, rows: Iterable[dict], chunk_size: int = 20_000) -> int:
+    """Insert hàng loạt theo lô (executemany), trả về số dòng đã ghi."""
+    total = 0
+    chunk: List[dict] = []
+    with engine.begin() as conn:
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                conn.execute(insert(model), chunk)
+                total += len(chunk)
+                chunk = []
+        if chunk:
+            conn.execute(insert(model), chunk)
+            total += len(chunk)
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+    return total
+
+
+def chunks(items: list, size: int) -> Iterator[list]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def measure(fn: Callable, repeat: int = 5) -> float:
+    """Thời gian chạy trung vị (giây) của fn() qua `repeat` lần."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def explain(stmt) -> List[str]:
+    """Kế hoạch thực thi của câu lệnh (SQLite: EXPLAIN QUERY PLAN, MySQL: EXPLAIN)."""
+    sql = str(stmt.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(prefix + sql).fetchall()
+    if engine.dialect.name == "sqlite":
+        return [row[-1] for row in rows]
+    return [" | ".join(f"{k}={v}" for k, v in row._mapping.items() if v is not None) for row in rows]
+
+
+class StatementCounter:
+    """Đếm số câu SQL gửi xuống DB trong khối `with`."""
+
+    def __init__(self):
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, "before_cursor_execute", self._on_execute)
+        return False
+
+
+def report(title: str, rows: List[tuple]):
+    """In bảng kết quả đơn giản: [(nhãn, giá trị), ...]."""
+    print(f"\n=== {title} ===")
+    width = max(len(str(label)) for label, _ in rows)
+    for label, value in rows:
+        print(f"  {str(label).ljust(width)}  {value}")
\ No newline at end of file
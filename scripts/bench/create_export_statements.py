@@ -0,0 +1,175 @@
+# =================================================================
+# BENCHMARK: SỐ CÂU SQL CỦA create_export THEO SỐ DÒNG PHIẾU XUẤT
+# Mỗi dòng có rổ + máy/line + mã hàng (sinh phiếu rổ dệt) - trường hợp nặng nhất.
+#   - CŨ : vòng lặp từng dòng (get rổ, query phiếu đang chạy trên máy/line, add detail + phiếu rổ dệt, get rổ lần 2)
+#   - MỚI: create_export (1 query IN (...) mỗi loại, detail + phiếu rổ dệt insert executemany)
+# Kỳ vọng: số câu SQL của bản mới không đổi theo số dòng.
+# Chạy: python scripts/bench/create_export_statements.py [--lines 1,10,40,100]
+# =================================================================
+import argparse
+import statistics
+import time
+from datetime import date
+from typing import List
+
+import common
+from sqlalchemy import delete, update
+
+from app.models.basket import Basket, BasketStatus
+from app.models.batch import Batch
+from app.models.employee import Employee
+from app.models.inventory import InventoryStock
+from app.models.machine import Machine
+from app.models.machine_line_occupancy import MachineLineOccupancy
+from app.models.material_export import MaterialExport, MaterialExportDetail
+from app.models.product import Product
+from app.models.weaving_basket_ticket import WeavingBasketTicket
+from app.schemas.material_export_schema import MaterialExportCreate, MaterialExportDetailCreate
+from app.services import machine_line_occupancy_service
+from app.models.inventory_transaction import InventoryTransactionType
+from app.schemas.inventory_schema import InventoryMovement
+from app.services.material_export_service import MaterialExportService
+
+LINES_PER_MACHINE = 8
+
+
+class LegacyExportService(MaterialExportService):
+    """create_export trước khi prefetch: kiểm tra + ghi từng dòng (giữ nguyên thứ tự query để so sánh)."""
+
+    def create_export(self, obj_in: MaterialExportCreate) -> MaterialExport:
+        obj_in.export_code = self._allocate_export_code()
+        db_export = MaterialExport(
+            export_code=obj_in.export_code, export_date=obj_in.export_date,
+            warehouse_id=obj_in.warehouse_id, receiver_id=obj_in.receiver_id
+        )
+        self.db.add(db_export)
+        self.db.flush()
+
+        movements: List[InventoryMovement] = []
+        for detail_in in obj_in.details:
+            basket = self.db.get(Basket, detail_in.basket_id)
+            assert basket is not None and basket.status == BasketStatus.READY
+            busy = self.db.query(WeavingBasketTicket).filter(
+                WeavingBasketTicket.machine_id == detail_in.machine_id,
+                WeavingBasketTicket.machine_line == detail_in.machine_line,
+                WeavingBasketTicket.time_out.is_(None)
+            ).first()
+            assert busy is None
+
+            self.db.add(MaterialExportDetail(
+                export_id=db_export.id, material_id=detail_in.material_id, batch_id=detail_in.batch_id,
+                quantity=detail_in.quantity, machine_id=detail_in.machine_id, machine_line=detail_in.machine_line,
+                product_id=detail_in.product_id, basket_id=detail_in.basket_id
+            ))
+            movements.append(InventoryMovement(
+                material_id=detail_in.material_id, warehouse_id=obj_in.warehouse_id, batch_id=detail_in.batch_id,
+                quantity_delta=-detail_in.quantity, transaction_type=InventoryTransactionType.EXPORT,
+                reference_type="MaterialExport", reference_id=db_export.id
+            ))
+
+            ticket = WeavingBasketTicket(**self._auto_weaving_ticket_row(header_in=obj_in, detail_in=detail_in))
+            self.db.add(ticket)
+            self.db.flush()
+            machine_line_occupancy_service.occupy_tickets_by_code(self.db, [ticket.code])
+
+            basket_to_update = self.db.get(Basket, detail_in.basket_id)
+            basket_to_update.status = BasketStatus.IN_USE
+            self.db.add(basket_to_update)
+
+        self.inventory_service.post_movements(movements, allow_negative=False)
+        self.db.commit()
+        self.db.refresh(db_export)
+        return db_export
+
+
+def seed(max_lines: int):
+    db = common.SessionLocal()
+    material_ids, warehouse_id = common.seed_material_warehouse(db, 1)
+    product = Product(item_code="SP-BENCH")
+    receiver = Employee(full_name="Công nhân Bench", email="bench@local")
+    machines = [Machine(machine_name=f"MAY-{i + 1}") for i in range(-(-max_lines // LINES_PER_MACHINE))]
+    baskets = [Basket(basket_code=f"RO-{i:04d}", tare_weight=1.0) for i in range(max_lines)]
+    db.add_all([product, receiver, *machines, *baskets])
+    db.commit()
+
+    batch = Batch(internal_batch_code="L-BENCH", supplier_batch_no="S-BENCH", material_id=material_ids[0], is_active=True)
+    db.add(batch)
+    db.flush()
+    db.add(InventoryStock(material_id=material_ids[0], warehouse_id=warehouse_id, batch_id=batch.batch_id,
+                          quantity_on_hand=1e9, quantity_reserved=0.0))
+    db.commit()
+    seeded = (material_ids[0], warehouse_id, batch.batch_id, product.product_id, receiver.employee_id,
+              [m.machine_id for m in machines], [b.basket_id for b in baskets])
+    db.close()
+    return seeded
+
+
+def build_request(seeded, lines: int) -> MaterialExportCreate:
+    material_id, warehouse_id, batch_id, product_id, receiver_id, machine_ids, basket_ids = seeded
+    return MaterialExportCreate(
+        export_code="AUTO", export_date=date.today(), warehouse_id=warehouse_id, receiver_id=receiver_id,
+        details=[
+            MaterialExportDetailCreate(
+                material_id=material_id, batch_id=batch_id, quantity=1.0, product_id=product_id,
+                machine_id=machine_ids[i // LINES_PER_MACHINE], machine_line=i % LINES_PER_MACHINE + 1,
+                basket_id=basket_ids[i]
+            )
+            for i in range(lines)
+        ]
+    )
+
+
+def clear_exports():
+    """Xóa phiếu xuất / phiếu rổ dệt đã sinh, trả rổ về READY (tồn đủ lớn nên không cần hoàn)."""
+    with common.engine.begin() as conn:
+        conn.execute(delete(MachineLineOccupancy))
+        conn.execute(delete(WeavingBasketTicket))
+        conn.execute(delete(MaterialExportDetail))
+        conn.execute(delete(MaterialExport))
+        conn.execute(update(Basket).values(status=BasketStatus.READY))
+
+
+def run_case(service_cls, seeded, lines: int, repeat: int):
+    """(thời gian trung vị, số câu SQL của 1 lần tạo phiếu)."""
+    timings = []
+    statements = 0
+    for _ in range(repeat):
+        clear_exports()
+        request = build_request(seeded, lines)
+        db = common.SessionLocal()
+        try:
+            with common.StatementCounter() as counter:
+                started = time.perf_counter()
+                service_cls(db).create_export(request)
+                timings.append(time.perf_counter() - started)
+            statements = counter.count
+        finally:
+            db.close()
+    clear_exports()
+    return statistics.median(timings), statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark số câu SQL của create_export theo số dòng")
+    parser.add_argument("--lines", default="1,10,40,100", help="Danh sách số dòng, cách nhau bởi dấu phẩy")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    sizes = [int(x) for x in args.lines.split(",")]
+
+    common.reset_schema()
+    print(f"Seed {max(sizes)} rổ / {-(-max(sizes) // LINES_PER_MACHINE)} máy ({common.engine.dialect.name})...")
+    seeded = seed(max(sizes))
+
+    rows = []
+    for lines in sizes:
+        legacy_time, legacy_sql = run_case(LegacyExportService, seeded, lines, args.repeat)
+        new_time, new_sql = run_case(MaterialExportService, seeded, lines, args.repeat)
+        rows.append((
+            f"{lines} dòng",
+            f"cũ {legacy_sql} câu / {legacy_time * 1000:.1f} ms  ->  mới {new_sql} câu / {new_time * 1000:.1f} ms"
+        ))
+    common.report("create_export: mỗi dòng có rổ + máy/line + mã hàng", rows)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
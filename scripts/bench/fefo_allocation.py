@@ -0,0 +1,164 @@
+# =================================================================
+# BENCHMARK: PHÂN BỔ FEFO (InventoryAllocationService) vs VÒNG LẶP reserve_stock CŨ
+# Seed mặc định 10.000 lô (50 vật tư x 3 kho), 1 ngày lên máy = 200 dòng nhu cầu.
+#   - CŨ : mỗi dòng 1 lần reserve_stock (query theo vật tư, duyệt theo batch_id, ghi ORM, commit)
+#   - MỚI: allocate() 1 lần cho cả ngày (1 query ứng viên, 1 UPDATE executemany, 1 commit)
+# In thời gian trung vị và số câu SQL.
+# Chạy: python scripts/bench/fefo_allocation.py [--lots 10000] [--lines 200]
+# =================================================================
+import argparse
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+import common
+from sqlalchemy import update
+
+from app.models.batch import Batch, BatchQCStatus
+from app.models.inventory import InventoryStock
+from app.models.warehouse import Warehouse
+from app.schemas.inventory_schema import AllocationDemand, AllocationRequest
+from app.services.inventory_allocation_service import InventoryAllocationService
+
+MATERIALS = 50
+
+
+def seed(lots: int):
+    db = common.SessionLocal()
+    material_ids, warehouse_id = common.seed_material_warehouse(db, MATERIALS)
+    extra = [Warehouse(warehouse_name=f"KHO-{i}") for i in range(2)]
+    db.add_all(extra)
+    db.commit()
+    warehouse_ids = [warehouse_id] + [w.warehouse_id for w in extra]
+    db.close()
+
+    rng = random.Random(11)
+    today = date.today()
+
+    def batch_rows():
+        for i in range(lots):
+            roll = rng.random()
+            if roll < 0.05:
+                qc, expiry = BatchQCStatus.PENDING, today + timedelta(days=rng.randint(1, 365))
+            elif roll < 0.10:
+                qc, expiry = BatchQCStatus.PASS, today - timedelta(days=rng.randint(1, 60))   # đã hết hạn
+            elif roll < 0.20:
+                qc, expiry = BatchQCStatus.PASS, None
+            else:
+                qc, expiry = BatchQCStatus.PASS, today + timedelta(days=rng.randint(1, 365))
+            yield {
+                "internal_batch_code": f"L{i:06d}",
+                "supplier_batch_no": f"S{i:06d}",
+                "material_id": material_ids[i % MATERIALS],
+                "expiry_date": expiry,
+                "qc_status": qc,
+                "is_active": True,
+            }
+
+    common.bulk_insert(Batch, batch_rows())
+
+    def stock_rows():
+        for batch_id in range(1, lots + 1):
+            yield {
+                "material_id": material_ids[(batch_id - 1) % MATERIALS],
+                "warehouse_id": rng.choice(warehouse_ids),
+                "batch_id": batch_id,
+                "quantity_on_hand": round(rng.uniform(20, 200), 2),
+                "quantity_reserved": 0.0,
+            }
+
+    common.bulk_insert(InventoryStock, stock_rows())
+    return material_ids
+
+
+def legacy_reserve_stock(db, material_id: int, quantity_needed: float):
+    """Bản reserve_stock trước khi có bộ phân bổ FEFO (giữ nguyên logic để so sánh)."""
+    stocks = db.query(InventoryStock).filter(
+        InventoryStock.material_id == material_id,
+        InventoryStock.quantity_on_hand > InventoryStock.quantity_reserved
+    ).order_by(InventoryStock.batch_id.asc()).all()
+
+    remaining_need = quantity_needed
+    reserved_logs = []
+    for stock in stocks:
+        if remaining_need <= 0:
+            break
+        available = (stock.quantity_on_hand or 0.0) - (stock.quantity_reserved or 0.0)
+        if available <= 0:
+            continue
+        take = min(available, remaining_need)
+        stock.quantity_reserved = (stock.quantity_reserved or 0.0) + take
+        remaining_need -= take
+        reserved_logs.append({"batch_id": stock.batch_id, "reserved_qty": take})
+        db.add(stock)
+
+    db.commit()
+    return reserved_logs
+
+
+def clear_reservations():
+    with common.engine.begin() as conn:
+        conn.execute(update(InventoryStock).values(quantity_reserved=0.0))
+
+
+def run_case(run, repeat: int):
+    """(thời gian trung vị, số câu SQL của 1 lần chạy). Mỗi lần chạy bắt đầu từ tồn chưa giữ chỗ."""
+    timings = []
+    statements = 0
+    for _ in range(repeat):
+        clear_reservations()
+        db = common.SessionLocal()
+        try:
+            with common.StatementCounter() as counter:
+                started = time.perf_counter()
+                run(db)
+                timings.append(time.perf_counter() - started)
+            statements = counter.count
+        finally:
+            db.close()
+    clear_reservations()
+    return statistics.median(timings), statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark phân bổ FEFO vs vòng lặp reserve_stock cũ")
+    parser.add_argument("--lots", type=int, default=10_000)
+    parser.add_argument("--lines", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    common.reset_schema()
+    print(f"Seed {args.lots:,} lô / {MATERIALS} vật tư / 3 kho ({common.engine.dialect.name})...")
+    material_ids = seed(args.lots)
+
+    rng = random.Random(3)
+    lines = [
+        AllocationDemand(material_id=rng.choice(material_ids), quantity=round(rng.uniform(20, 120), 1), reference=f"Máy {i // 8 + 1} - Line {i % 8 + 1}")
+        for i in range(args.lines)
+    ]
+
+    def legacy(db):
+        for line in lines:
+            legacy_reserve_stock(db, line.material_id, line.quantity)
+
+    def fefo_dry_run(db):
+        InventoryAllocationService(db).allocate(AllocationRequest(lines=lines), reserve=False)
+
+    def fefo_reserve(db):
+        InventoryAllocationService(db).allocate(AllocationRequest(lines=lines), reserve=True)
+
+    legacy_time, legacy_sql = run_case(legacy, args.repeat)
+    dry_time, dry_sql = run_case(fefo_dry_run, args.repeat)
+    reserve_time, reserve_sql = run_case(fefo_reserve, args.repeat)
+
+    common.report(f"{args.lines} dòng nhu cầu trên {args.lots:,} lô", [
+        ("reserve_stock cũ (từng dòng)", f"{legacy_time * 1000:.1f} ms, {legacy_sql} câu SQL"),
+        ("allocate dry run", f"{dry_time * 1000:.1f} ms, {dry_sql} câu SQL"),
+        ("allocate + giữ chỗ", f"{reserve_time * 1000:.1f} ms, {reserve_sql} câu SQL"),
+        ("tăng tốc (giữ chỗ)", f"x{legacy_time / reserve_time:.1f}"),
+    ])
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,151 @@
+# =================================================================
+# BENCHMARK: PHÂN TÍCH TUỔI TỒN (InventoryAgingService) TRÊN 500K DÒNG TỒN
+# Seed mặc định 500.000 lô / dòng tồn (2.000 vật tư x 10 kho) + 200.000 lần xuất trong sổ cái.
+#   - load      : 2 query (dòng tồn + ngày nhập, lịch sử xuất theo Vật tư - Kho) vào DataFrame
+#   - vectorized: compute_aging() (NumPy/pandas)
+#   - từng dòng : cùng phép tính viết bằng vòng lặp Python trên từng dòng (cách làm cũ)
+#   - cache     : lần gọi thứ 2 trong ngày
+# Chạy: python scripts/bench/stock_aging.py [--rows 500000]
+# =================================================================
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+
+import common
+
+from app.models.batch import Batch, BatchQCStatus
+from app.models.inventory import InventoryStock
+from app.models.inventory_transaction import InventoryTransaction, InventoryTransactionType
+from app.models.warehouse import Warehouse
+from app.services.inventory_aging_service import AGING_BUCKET_EDGES, InventoryAgingService, compute_aging
+
+MATERIALS = 2000
+WAREHOUSES = 10
+
+
+def seed(rows: int, exports: int, as_of: date):
+    db = common.SessionLocal()
+    material_ids, warehouse_id = common.seed_material_warehouse(db, MATERIALS)
+    extra = [Warehouse(warehouse_name=f"KHO-{i}") for i in range(WAREHOUSES - 1)]
+    db.add_all(extra)
+    db.commit()
+    warehouse_ids = [warehouse_id] + [w.warehouse_id for w in extra]
+    db.close()
+
+    rng = random.Random(14)
+    now = datetime.combine(as_of, datetime.min.time())
+    placement = [(rng.choice(material_ids), rng.choice(warehouse_ids)) for _ in range(rows)]
+
+    common.bulk_insert(Batch, (
+        {
+            "internal_batch_code": f"L{i:07d}",
+            "supplier_batch_no": f"S{i:07d}",
+            "material_id": placement[i][0],
+            "qc_status": BatchQCStatus.PASS,
+            "is_active": True,
+            "created_at": now - timedelta(days=rng.randint(0, 600)),
+        }
+        for i in range(rows)
+    ))
+    common.bulk_insert(InventoryStock, (
+        {
+            "material_id": placement[i][0],
+            "warehouse_id": placement[i][1],
+            "batch_id": i + 1,
+            "quantity_on_hand": round(rng.uniform(1, 100), 2),
+            "quantity_reserved": 0.0,
+        }
+        for i in range(rows)
+    ))
+
+    def export_rows():
+        for _ in range(exports):
+            batch_id = rng.randint(1, rows)
+            material_id, wh_id = placement[batch_id - 1]
+            yield {
+                "material_id": material_id,
+                "warehouse_id": wh_id,
+                "batch_id": batch_id,
+                "quantity_delta": -round(rng.uniform(1, 10), 2),
+                "transaction_type": InventoryTransactionType.EXPORT,
+                "reference_type": "MaterialExport",
+                "created_at": now - timedelta(days=rng.randint(0, 400), minutes=rng.randint(0, 1440)),
+            }
+
+    common.bulk_insert(InventoryTransaction, export_rows())
+
+
+def aging_row_by_row(df, exports, as_of: date, window_days: int = 90, dead_stock_days: int = 180):
+    """Cùng phép gộp tuổi tồn nhưng duyệt từng dòng bằng Python (để so với compute_aging)."""
+    history = {(e.material_id, e.warehouse_id): e for e in exports.itertuples(index=False)}
+    groups = {}
+    for row in df.itertuples(index=False):
+        received = row.receipt_date if row.receipt_date is not None else row.batch_created_at
+        received = received.date() if isinstance(received, datetime) else received
+        age = max((as_of - received).days, 0)
+        bucket = sum(1 for edge in AGING_BUCKET_EDGES if age > edge)
+
+        g = groups.setdefault((row.material_id, row.warehouse_id), {
+            "quantity_on_hand": 0.0, "buckets": [0.0] * 4, "age_qty": 0.0, "oldest": 0
+        })
+        g["quantity_on_hand"] += row.quantity_on_hand
+        g["buckets"][bucket] += row.quantity_on_hand
+        g["age_qty"] += age * row.quantity_on_hand
+        g["oldest"] = max(g["oldest"], age)
+
+    for key, g in groups.items():
+        export = history.get(key)
+        g["last_export"] = export.last_export_at if export else None
+        g["issued"] = export.issued_in_window if export else 0.0
+        g["average_age"] = g["age_qty"] / g["quantity_on_hand"]
+        daily = g["issued"] / window_days
+        g["days_of_cover"] = g["quantity_on_hand"] / daily if daily else None
+        since = (as_of - g["last_export"].date()).days if g["last_export"] else None
+        g["is_dead_stock"] = g["oldest"] > dead_stock_days and (since is None or since > dead_stock_days)
+    return groups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark phân tích tuổi tồn trên bảng tồn tổng hợp")
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--exports", type=int, default=200_000)
+    args = parser.parse_args()
+
+    as_of = date.today()
+    common.reset_schema()
+    print(f"Seed {args.rows:,} dòng tồn + {args.exports:,} lần xuất ({common.engine.dialect.name})...")
+    seed(args.rows, args.exports, as_of)
+
+    db = common.SessionLocal()
+    service = InventoryAgingService(db)
+
+    started = time.perf_counter()
+    frame, exports = service._load_frames(as_of, 90)
+    load_time = time.perf_counter() - started
+
+    vectorized_time = common.measure(lambda: compute_aging(frame, exports, as_of), repeat=3)
+    result = compute_aging(frame, exports, as_of)
+
+    rows = frame.astype(object).where(frame.notna(), None)
+    started = time.perf_counter()
+    groups = aging_row_by_row(rows, exports, as_of)
+    loop_time = time.perf_counter() - started
+    assert len(groups) == len(result)
+
+    service.get_aging_frame(as_of, refresh=True)
+    cached_time = common.measure(lambda: service.get_aging_frame(as_of), repeat=5)
+    db.close()
+
+    common.report(f"{len(frame):,} dòng tồn -> {len(result):,} nhóm Vật tư - Kho", [
+        ("load (2 query -> DataFrame)", f"{load_time:.2f} s"),
+        ("compute_aging (vectorized)", f"{vectorized_time:.3f} s"),
+        ("vòng lặp từng dòng", f"{loop_time:.3f} s"),
+        ("tăng tốc phần tính toán", f"x{loop_time / vectorized_time:.1f}"),
+        ("gọi lại trong ngày (cache)", f"{cached_time * 1e6:.0f} µs"),
+        ("tồn chết / chậm luân chuyển", f"{int(result['is_dead_stock'].sum())} / {int(result['is_slow_moving'].sum())}"),
+    ])
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,155 @@
+# =================================================================
+# BENCHMARK: XUẤT FILE PHIẾU RỔ DỆT DẠNG STREAM (?format=csv|xlsx)
+# Seed tăng dần (mặc định 100.000 rồi 1.000.000 phiếu), mỗi mốc chạy export_tickets trong
+# 1 process con riêng và đo: thời gian, dung lượng file, RSS cao nhất trong lúc xuất.
+# RSS cao nhất gần như không đổi giữa các mốc = bộ nhớ không tăng theo số dòng.
+# Chạy: python scripts/bench/ticket_export_stream.py [--sizes 100000,1000000] [--formats csv,xlsx]
+# =================================================================
+import argparse
+import asyncio
+import json
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import common
+
+from app.db.export import ExportFormat
+from app.models.employee import Employee
+from app.models.machine import Machine
+from app.models.product import Product
+from app.models.weaving_basket_ticket import WeavingBasketTicket
+from app.services import weaving_basket_ticket_service
+
+
+def seed_base():
+    db = common.SessionLocal()
+    db.add_all([Product(item_code=f"SP{i:03d}") for i in range(50)])
+    db.add_all([Machine(machine_name=f"MAY{i:02d}", total_lines=8) for i in range(20)])
+    db.add_all([Employee(full_name=f"Nguyễn Văn {i}", email=f"nv{i}@bench.local") for i in range(40)])
+    db.commit()
+    db.close()
+
+
+def seed_tickets(start: int, stop: int):
+    rng = random.Random(start)
+    origin = datetime(2025, 1, 1)
+
+    def ticket_rows():
+        for i in range(start, stop):
+            time_in = origin + timedelta(minutes=i)
+            yield {
+                "code": f"T{i:08d}",
+                "product_id": rng.randint(1, 50),
+                "machine_id": rng.randint(1, 20),
+                "machine_line": rng.randint(1, 8),
+                "yarn_load_date": time_in.date(),
+                "time_in": time_in,
+                "employee_in_id": rng.randint(1, 40),
+                "time_out": time_in + timedelta(hours=6) if i % 3 else None,
+                "employee_out_id": rng.randint(1, 40) if i % 3 else None,
+                "gross_weight": 10.5,
+                "net_weight": round(rng.uniform(5, 25), 2),
+                "length_meters": round(rng.uniform(100, 900), 1),
+                "number_of_knots": i % 5,
+            }
+
+    common.bulk_insert(WeavingBasketTicket, ticket_rows())
+
+
+def _current_rss_mib() -> float:
+    """RSS hiện tại (Linux: /proc/self/status), nơi khác lấy RSS đỉnh của process."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RssSampler(threading.Thread):
+    """Lấy mẫu RSS mỗi 20ms ở luồng nền (xlsx ghi hết các dòng trước khi trả chunk đầu tiên)."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = _current_rss_mib()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(0.02):
+            self.peak = max(self.peak, _current_rss_mib())
+
+    def stop(self) -> float:
+        self._stop_event.set()
+        self.join()
+        return max(self.peak, _current_rss_mib())
+
+
+async def _drain(body) -> int:
+    size = 0
+    async for chunk in body:
+        size += len(chunk)
+    return size
+
+
+def measure_export(fmt: str) -> dict:
+    """Chạy trong process con: xuất toàn bộ phiếu, trả về số liệu dạng dict."""
+    db = common.SessionLocal()
+    baseline = _current_rss_mib()
+    sampler = RssSampler()
+    sampler.start()
+    started = time.perf_counter()
+    response = weaving_basket_ticket_service.export_tickets(db, ExportFormat(fmt))
+    size = asyncio.run(_drain(response.body_iterator))
+    elapsed = time.perf_counter() - started
+    peak = sampler.stop()
+    db.close()
+    return {"seconds": elapsed, "bytes": size, "peak_rss_mib": peak, "baseline_rss_mib": baseline}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark xuất file phiếu rổ dệt dạng stream")
+    parser.add_argument("--sizes", default="100000,1000000")
+    parser.add_argument("--formats", default="csv,xlsx")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)   # dùng nội bộ: chạy trong process con
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure_export(args.measure)))
+        return
+
+    sizes = sorted(int(s) for s in args.sizes.split(","))
+    formats = [f.strip() for f in args.formats.split(",")]
+
+    common.reset_schema()
+    seed_base()
+    seeded = 0
+    results = []
+    for size in sizes:
+        print(f"Seed tới {size:,} phiếu ({common.engine.dialect.name})...")
+        seed_tickets(seeded, size)
+        seeded = size
+        for fmt in formats:
+            child = subprocess.run(
+                [sys.executable, __file__, "--measure", fmt],
+                check=True, capture_output=True, text=True
+            )
+            stats = json.loads(child.stdout.strip().splitlines()[-1])
+            results.append((
+                f"{size:>9,} phiếu {fmt}",
+                f"{stats['seconds']:.1f} s ({size / stats['seconds']:,.0f} dòng/s), "
+                f"{stats['bytes'] / 1024 / 1024:.1f} MiB, RSS cao nhất {stats['peak_rss_mib']:.0f} MiB "
+                f"(trước khi xuất {stats['baseline_rss_mib']:.0f} MiB)"
+            ))
+
+    common.report("Xuất phiếu rổ dệt dạng stream", results)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,130 @@
+# =================================================================
+# BENCHMARK: LỌC PHIẾU RỔ DỆT THEO NGÀY RA (time_out)
+# So sánh trên bảng weaving_basket_tickets đã seed (mặc định 1 triệu phiếu):
+#   - TRƯỚC: cast(time_out, Date) == ngày, không có index time_out
+#   - SAU  : khoảng nửa mở time_out_range(ngày) + index (time_out, product_id)
+# In kế hoạch thực thi (EXPLAIN) và thời gian trung vị của truy vấn sản lượng ngày.
+# Chạy: python scripts/bench/ticket_time_out_range.py [--rows 1000000] [--days 365]
+# =================================================================
+import argparse
+import random
+from datetime import date, datetime, timedelta
+
+import common
+from sqlalchemy import Date, cast, func, select
+
+from app.models.machine import Machine
+from app.models.product import Product
+from app.models.weaving_basket_ticket import WeavingBasketTicket
+from app.services.weaving_daily_production_service import time_out_range
+
+PRODUCTS = 200
+MACHINES = 50
+LINES_PER_MACHINE = 8
+
+
+def seed(rows: int, days: int, start_day: date) -> None:
+    db = common.SessionLocal()
+    db.add_all([Product(item_code=f"SP{i:04d}") for i in range(PRODUCTS)])
+    db.add_all([Machine(machine_name=f"MAY{i:03d}", total_lines=LINES_PER_MACHINE) for i in range(MACHINES)])
+    db.commit()
+    db.close()
+
+    rng = random.Random(7)
+    start = datetime.combine(start_day, datetime.min.time())
+    span_seconds = days * 86400
+
+    def ticket_rows():
+        for i in range(rows):
+            time_in = start + timedelta(seconds=rng.randrange(span_seconds))
+            finished = rng.random() < 0.97  # ~3% phiếu đang chạy (time_out NULL)
+            yield {
+                "code": f"T{i:08d}",
+                "product_id": rng.randint(1, PRODUCTS),
+                "machine_id": rng.randint(1, MACHINES),
+                "machine_line": rng.randint(1, LINES_PER_MACHINE),
+                "yarn_load_date": time_in.date(),
+                "time_in": time_in,
+                "time_out": time_in + timedelta(hours=rng.randint(1, 10)) if finished else None,
+                "net_weight": round(rng.uniform(5, 25), 2),
+                "length_meters": round(rng.uniform(100, 900), 1),
+                "number_of_knots": 0,
+            }
+
+    common.bulk_insert(WeavingBasketTicket, ticket_rows())
+
+
+def daily_query(day_filter):
+    # Cùng dạng truy vấn với calculate_daily_production (gom theo sản phẩm & máy)
+    return (
+        select(
+            WeavingBasketTicket.product_id,
+            WeavingBasketTicket.machine_id,
+            func.sum(WeavingBasketTicket.net_weight).label("total_kg"),
+            func.sum(WeavingBasketTicket.length_meters).label("total_meters"),
+        )
+        .where(day_filter)
+        .group_by(WeavingBasketTicket.product_id, WeavingBasketTicket.machine_id)
+    )
+
+
+def run_case(label: str, stmt, repeat: int):
+    def execute():
+        with common.engine.connect() as conn:
+            return conn.execute(stmt).fetchall()
+
+    result_rows = len(execute())
+    seconds = common.measure(execute, repeat)
+    print(f"\n--- {label} ---")
+    for line in common.explain(stmt):
+        print(f"  plan: {line}")
+    print(f"  {result_rows} nhóm, trung vị {seconds * 1000:.1f} ms")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lọc time_out: cast theo ngày vs khoảng nửa mở + index")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    start_day = date(2025, 1, 1)
+    target_day = start_day + timedelta(days=args.days // 2)
+
+    common.reset_schema()
+    print(f"Seed {args.rows:,} phiếu trên {args.days} ngày ({common.engine.dialect.name})...")
+    seed(args.rows, args.days, start_day)
+
+    indexes = [idx for idx in WeavingBasketTicket.__table__.indexes if "time_out" in idx.columns]
+    # SQLite: CAST(... AS DATE) ra số -> dùng date(time_out), cũng là hàm bọc cột như bản cũ
+    if common.engine.dialect.name == "sqlite":
+        cast_filter = func.date(WeavingBasketTicket.time_out) == target_day.isoformat()
+    else:
+        cast_filter = cast(WeavingBasketTicket.time_out, Date) == target_day
+    range_filter = time_out_range(target_day)
+
+    # TRƯỚC: chưa có index time_out
+    for idx in indexes:
+        idx.drop(common.engine)
+    before = run_case("TRƯỚC: cast(time_out, Date), không index", daily_query(cast_filter), args.repeat)
+
+    # SAU: có index (migration e81f4c6b2d95)
+    for idx in indexes:
+        idx.create(common.engine)
+    if common.engine.dialect.name == "sqlite":
+        with common.engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+    cast_indexed = run_case("cast(time_out, Date) + index (vẫn quét toàn bảng)", daily_query(cast_filter), args.repeat)
+    after = run_case("SAU: time_out_range + index", daily_query(range_filter), args.repeat)
+
+    common.report("Tổng kết", [
+        ("trước (cast, không index)", f"{before * 1000:.1f} ms"),
+        ("cast + index", f"{cast_indexed * 1000:.1f} ms"),
+        ("sau (khoảng + index)", f"{after * 1000:.1f} ms"),
+        ("tăng tốc", f"x{before / after:.1f}"),
+    ])
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
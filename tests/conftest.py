@@ -0,0 +1,89 @@
+# =================================================================
+# CẤU HÌNH TEST CHUNG
+# - Mặc định chạy trên file SQLite tạm (không đụng DB thật trong .env).
+# - Đặt TEST_DATABASE_URL (vd: mysql+pymysql://...) để chạy trên MySQL cục bộ.
+# - Mỗi test có schema sạch (drop_all + create_all) và cache trong bộ nhớ được xóa.
+# =================================================================
+import os
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix="mes-tests-")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+# Ghi đè DATABASE_URL (kể cả khi .env có giá trị) để test không bao giờ chạy trên DB thật
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL") or f"sqlite:///{_TMP_DIR}/test.db"
+
+
+import pytest
+from sqlalchemy import event, text
+
+from app.db.session import engine, SessionLocal
+from app.db.base import Base
+from app.models.inventory_view import create_inventory_views, InventoryStockView
+from app.models.unit import Unit
+from app.models.material import Material
+from app.models.warehouse import Warehouse
+from app.services import document_sequence_service, inventory_aging_service, bom_simulation_service
+
+
+def _reset_schema():
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP VIEW IF EXISTS {InventoryStockView.__table__.name}"))
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    create_inventory_views(engine)
+
+
+def _clear_caches():
+    document_sequence_service._blocks.clear()
+    inventory_aging_service._cache.clear()
+    bom_simulation_service.invalidate_simulations()
+
+
+@pytest.fixture
+def db():
+    """Session trên schema sạch cho từng test."""
+    _reset_schema()
+    _clear_caches()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def material_warehouse(db):
+    """1 vật tư (đơn vị kg) + 1 kho. Trả về (material_id, warehouse_id)."""
+    unit = Unit(unit_name="kg")
+    db.add(unit)
+    db.flush()
+    material = Material(material_code="M-TEST", uom_base_id=unit.unit_id, uom_production_id=unit.unit_id, min_stock_level=100)
+    warehouse = Warehouse(warehouse_name="KHO-TEST")
+    db.add_all([material, warehouse])
+    db.commit()
+    return material.id, warehouse.warehouse_id
+
+
+class StatementCounter:
+    """Đếm số câu SQL gửi xuống DB (event before_cursor_execute) trong khối `with`."""
+
+    def __init__(self):
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, "before_cursor_execute", self._on_execute)
+        return False
+
+
+@pytest.fixture
+def count_statements():
+    return StatementCounter
\ No newline at end of file
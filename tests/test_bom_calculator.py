@@ -0,0 +1,139 @@
+# =================================================================
+# TÍNH BOM BẰNG NUMPY (bom_calculator) == LOGIC EXCEL TỪNG DÒNG (BOMService._execute_bom_calculations)
+# =================================================================
+import random
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.models.bom_detail import BOMComponentType, BOMDetail
+from app.models.product import Product
+from app.schemas.bom_schema import BOMBulkRecalculate, BOMDetailCreate, BOMHeaderCreate
+from app.services import bom_calculator
+from app.services.bom_service import BOMService
+
+# Mã sợi không đọc được dtex -> 0 (chữ ở đầu, rỗng, ngắn hơn 5 ký tự)
+YARN_NAMES = ["03300-PES-WEISS", "01100-PES", "00550-PA6", "PES-XXXX", "", "12", "02200"]
+
+
+def _random_boms(rng: random.Random, count: int):
+    """(header, details) ngẫu nhiên: có dòng FILLING, mã sợi lỗi, và BOM toàn chiều dài 0."""
+    boms = []
+    for i in range(count):
+        header = SimpleNamespace(
+            target_weight_gm=round(rng.uniform(20, 120), 2),
+            total_scrap_rate=round(rng.uniform(0, 8), 2),
+            total_shrinkage_rate=round(rng.uniform(0, 5), 2),
+        )
+        zero_length = i % 7 == 0
+        details = [
+            BOMDetailCreate(
+                component_type=rng.choice(list(BOMComponentType)),
+                threads=rng.randint(0, 400),
+                yarn_type_name=rng.choice(YARN_NAMES),
+                twisted=rng.choice([1.0, 1.05, 1.1]),
+                crossweave_rate=round(rng.uniform(0, 20), 3),
+                actual_length_cm=0.0 if zero_length else round(rng.uniform(50, 400), 3),
+            )
+            for _ in range(rng.randint(1, 12))
+        ]
+        boms.append((header, details))
+    return boms
+
+
+def _vectorized(boms):
+    bom_index, flat = [], []
+    for i, (_, details) in enumerate(boms):
+        bom_index += [i] * len(details)
+        flat += details
+    headers = [h for h, _ in boms]
+    return bom_calculator.calculate_boms(
+        bom_index=np.array(bom_index, dtype=np.intp),
+        threads=bom_calculator.to_float_array((d.threads for d in flat), 0.0),
+        dtex=np.array([d.yarn_dtex for d in flat], dtype=float),
+        twisted=bom_calculator.to_float_array((d.twisted for d in flat), 1.0),
+        crossweave_rate=bom_calculator.to_float_array((d.crossweave_rate for d in flat), 0.0),
+        actual_length_cm=bom_calculator.to_float_array((d.actual_length_cm for d in flat), 0.0),
+        filling=bom_calculator.is_filling(d.component_type for d in flat),
+        target_weight_gm=bom_calculator.to_float_array((h.target_weight_gm for h in headers), 0.0),
+        total_scrap_rate=bom_calculator.to_float_array((h.total_scrap_rate for h in headers), 0.0),
+        total_shrinkage_rate=bom_calculator.to_float_array((h.total_shrinkage_rate for h in headers), 0.0),
+    )
+
+
+def _scalar(header, details):
+    return {
+        name: [float(getattr(obj, name)) for obj in BOMService._execute_bom_calculations(header, details)]
+        for name in bom_calculator.BOM_RESULT_FIELDS
+    }
+
+
+def test_vectorized_matches_scalar_exactly():
+    boms = _random_boms(random.Random(23), 300)
+    assert any(d.component_type == BOMComponentType.FILLING for _, details in boms for d in details)
+
+    vectorized = _vectorized(boms)
+
+    expected = {name: [] for name in bom_calculator.BOM_RESULT_FIELDS}
+    for header, details in boms:
+        for name, values in _scalar(header, details).items():
+            expected[name] += values
+    for name in bom_calculator.BOM_RESULT_FIELDS:
+        assert vectorized[name].tolist() == expected[name], name
+
+
+def test_zero_length_bom_has_zero_percentage():
+    header = SimpleNamespace(target_weight_gm=50.0, total_scrap_rate=3.0, total_shrinkage_rate=2.0)
+    details = [
+        BOMDetailCreate(component_type=BOMComponentType.GROUND, threads=100, yarn_type_name="01100-PES"),
+        BOMDetailCreate(component_type=BOMComponentType.FILLING, threads=10, yarn_type_name="03300-PES"),
+    ]
+
+    result = _vectorized([(header, details)])
+
+    assert result["weight_percentage"].tolist() == [0.0, 0.0]
+    assert result["bom_gm"].tolist() == [0.0, 0.0]
+    assert result["weight_per_yarn_gm"].tolist() == _scalar(header, details)["weight_per_yarn_gm"]
+
+
+@pytest.mark.parametrize("name", YARN_NAMES + [None])
+def test_parse_dtex_matches_dict_input_path(name):
+    """Dòng BOM dạng dict (đọc từ DB / Excel): dtex = float(5 ký tự đầu), lỗi -> 0"""
+    header = SimpleNamespace(target_weight_gm=50.0, total_scrap_rate=0.0, total_shrinkage_rate=0.0)
+    row = {"component_type": "GROUND", "material_id": 1, "threads": 10, "yarn_type_name": name,
+           "twisted": 1.0, "crossweave_rate": 0.0, "actual_length_cm": 100.0}
+
+    (detail,) = BOMService._execute_bom_calculations(header, [row])
+
+    assert bom_calculator.parse_dtex(name) == detail.yarn_dtex
+
+
+def test_bulk_recalculate_matches_scalar(db, material_warehouse, count_statements):
+    boms = _random_boms(random.Random(7), 12)
+    products = [Product(item_code=f"SP{i}") for i in range(len(boms))]
+    db.add_all(products)
+    db.commit()
+    for product, (header, details) in zip(products, boms):
+        BOMService.create_bom(db, BOMHeaderCreate(
+            product_id=product.product_id, applicable_year=2026, details=details, **vars(header)
+        ))
+
+    product_ids = [p.product_id for p in products]
+    with count_statements() as counter:
+        result = BOMService.bulk_recalculate(db, BOMBulkRecalculate(
+            product_ids=product_ids, target_weight_gm=75.5, total_scrap_rate=4.25
+        ))
+
+    assert result == {"boms_updated": len(boms), "details_updated": sum(len(d) for _, d in boms)}
+    # 1 query header, 1 query chi tiết, 1 UPDATE header, 1 UPDATE executemany chi tiết
+    assert counter.count == 4
+    for product_id, (header, details) in zip(product_ids, boms):
+        expected = _scalar(SimpleNamespace(
+            target_weight_gm=75.5, total_scrap_rate=4.25, total_shrinkage_rate=header.total_shrinkage_rate
+        ), details)
+        stored = db.query(BOMDetail).populate_existing().join(BOMDetail.header).filter_by(
+            product_id=product_id
+        ).order_by(BOMDetail.detail_id).all()
+        for name in bom_calculator.BOM_RESULT_FIELDS:
+            assert [float(getattr(d, name)) for d in stored] == pytest.approx(expected[name], abs=1e-9), name
\ No newline at end of file
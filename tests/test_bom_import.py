@@ -0,0 +1,163 @@
+# =================================================================
+# IMPORT BOM TỪ EXCEL: dry run không ghi, import lại = cập nhật + tăng version, lỗi -> không ghi sheet nào
+# =================================================================
+import io
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from openpyxl import Workbook
+
+from app.models.bom_detail import BOMDetail
+from app.models.bom_header import BOMHeader
+from app.models.product import Product
+from app.schemas.bom_schema import BOMDetailCreate
+from app.services import import_bom_excel
+from app.services.bom_service import BOMService
+
+YEAR = 2026
+# (loại sợi, số sợi, mã sợi, xoắn, độ dôi, chiều dài thực tế)
+LINES = [
+    ("Ground", 200, "01100-PES", 1.0, 5, 120),
+    ("Filling", 40, "03300-PES", None, None, 300),
+    ("Edge", 12, "00550-PA6", 1.05, 2.5, 125),
+]
+
+
+def _workbook(sheets) -> bytes:
+    """sheets: {tên sheet: (K3, F18, F19, các dòng sợi từ dòng 5)}"""
+    wb = Workbook()
+    wb.remove(wb.active)
+    for name, (target, scrap, shrinkage, lines) in sheets.items():
+        ws = wb.create_sheet(name)
+        ws["K3"], ws["F18"], ws["F19"] = target, scrap, shrinkage
+        for row, (component, threads, yarn, twisted, crossweave, length) in enumerate(lines, start=5):
+            ws.cell(row, 1, component)
+            ws.cell(row, 2, threads)
+            ws.cell(row, 4, yarn)
+            ws.cell(row, 5, twisted)
+            ws.cell(row, 6, crossweave)
+            ws.cell(row, 8, length)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def _written(db):
+    return db.query(Product).count(), db.query(BOMHeader).count(), db.query(BOMDetail).count()
+
+
+def _stored_details(db, item_code):
+    return db.query(BOMDetail).populate_existing().join(BOMDetail.header).join(BOMHeader.product).filter(
+        Product.item_code == item_code
+    ).order_by(BOMDetail.detail_id).all()
+
+
+def _expected(target, scrap, shrinkage, lines):
+    details = [
+        BOMDetailCreate(component_type=c.upper(), threads=t, yarn_type_name=y, twisted=1.0 if tw is None else tw,
+                        crossweave_rate=cw or 0.0, actual_length_cm=length)
+        for c, t, y, tw, cw, length in lines
+    ]
+    header = SimpleNamespace(target_weight_gm=target, total_scrap_rate=scrap, total_shrinkage_rate=shrinkage)
+    return [float(d.bom_gm) for d in BOMService._execute_bom_calculations(header, details)]
+
+
+def test_dry_run_reports_without_writing(db, material_warehouse):
+    source = _workbook({
+        "SP-A": (60, 3, 2, LINES),
+        "SP-B": (45.5, 0, 0, LINES[:2] + [("Lạ", 8, "01100-PES", 1, 0, 100)]),
+        "Hướng dẫn": (None, None, None, []),
+    })
+
+    result = import_bom_excel.import_boms(db, source, YEAR, dry_run=True)
+
+    assert _written(db) == (0, 0, 0)
+    assert (result["total_sheets"], result["valid_sheets"], result["error_sheets"]) == (3, 2, 0)
+    sheets = {s["sheet_name"]: s for s in result["sheets"]}
+    assert [sheets[n]["status"] for n in ("SP-A", "SP-B", "Hướng dẫn")] == ["create", "create", "skipped"]
+    assert sheets["SP-A"]["new_product"] and sheets["SP-A"]["detail_count"] == 3
+    assert sheets["SP-A"]["total_bom_gm"] == round(sum(_expected(60, 3, 2, LINES)), 4)
+    # Loại sợi không nhận ra -> cảnh báo, tính là GROUND
+    assert len(sheets["SP-B"]["warnings"]) == 1
+
+
+def test_import_then_reimport_updates_and_bumps_version(db, material_warehouse):
+    db.add(Product(item_code="SP-A"))
+    db.commit()
+
+    result = import_bom_excel.import_boms(db, _workbook({"SP-A": (60, 3, 2, LINES), "SP-B": (45.5, 0, 0, LINES[:2])}), YEAR)
+
+    assert (result["products_created"], result["boms_created"], result["boms_updated"], result["details_imported"]) == (1, 2, 0, 5)
+    assert _written(db) == (2, 2, 5)
+    assert [float(d.bom_gm) for d in _stored_details(db, "SP-A")] == pytest.approx(_expected(60, 3, 2, LINES), abs=1e-9)
+
+    # Import lại cùng năm: cập nhật header, tăng version, thay toàn bộ chi tiết
+    result = import_bom_excel.import_boms(db, _workbook({"SP-A": (80, 4, 1, LINES[:1])}), YEAR)
+
+    assert (result["products_created"], result["boms_created"], result["boms_updated"]) == (0, 0, 1)
+    header = db.query(BOMHeader).populate_existing().join(BOMHeader.product).filter(Product.item_code == "SP-A").one()
+    assert (header.version, float(header.target_weight_gm)) == (2, 80)
+    assert [float(d.bom_gm) for d in _stored_details(db, "SP-A")] == pytest.approx(_expected(80, 4, 1, LINES[:1]), abs=1e-9)
+    assert _written(db) == (2, 2, 3)
+
+    # Năm khác -> BOM mới
+    result = import_bom_excel.import_boms(db, _workbook({"SP-A": (60, 3, 2, LINES)}), YEAR + 1)
+    assert (result["boms_created"], result["boms_updated"]) == (1, 0)
+
+
+def test_sheet_errors_reject_whole_file(db, material_warehouse):
+    source = _workbook({
+        "SP-A": (60, 3, 2, LINES),
+        "SP-B": ("abc", 0, 0, [("Ground", 1.5, "01100-PES", 1, 0, 100), ("Edge", 10, "00550-PA6", 1, "x", 100)]),
+        "sp-a ": (60, 3, 2, LINES),
+    })
+
+    report = import_bom_excel.import_boms(db, source, YEAR, dry_run=True)
+    errors = {s["sheet_name"]: s["errors"] for s in report["sheets"] if s["status"] == "error"}
+    assert set(errors) == {"SP-B", "sp-a "}
+    assert len(errors["SP-B"]) == 3   # K3, số sợi lẻ, độ dôi không phải số
+
+    with pytest.raises(HTTPException) as exc:
+        import_bom_excel.import_boms(db, source, YEAR)
+    assert exc.value.status_code == 400
+    assert _written(db) == (0, 0, 0)
+
+
+def test_write_failure_rolls_back_everything(db, material_warehouse, monkeypatch):
+    db.add(Product(item_code="SP-A"))
+    db.commit()
+    import_bom_excel.import_boms(db, _workbook({"SP-A": (60, 3, 2, LINES)}), YEAR)
+    before = _written(db)
+
+    real_write = import_bom_excel._write_boms
+
+    def failing_write(*args, **kwargs):
+        real_write(*args, **kwargs)
+        raise RuntimeError("mất kết nối")
+
+    monkeypatch.setattr(import_bom_excel, "_write_boms", failing_write)
+    with pytest.raises(HTTPException) as exc:
+        import_bom_excel.import_boms(db, _workbook({"SP-A": (90, 0, 0, LINES[:1]), "SP-NEW": (50, 0, 0, LINES)}), YEAR)
+
+    assert exc.value.status_code == 500
+    assert _written(db) == before
+    assert db.query(BOMHeader.version).scalar() == 1
+
+
+def test_statement_count_does_not_grow_with_sheets(db, material_warehouse, count_statements):
+    counts = []
+    for prefix, sheet_count in (("A", 3), ("B", 12)):
+        source = _workbook({f"SP-{prefix}{i}": (60 + i, 3, 2, LINES) for i in range(sheet_count)})
+        with count_statements() as counter:
+            import_bom_excel.import_boms(db, source, YEAR, workers=1)
+        counts.append(counter.count)
+    assert counts[0] == counts[1]
+
+
+def test_resolve_year():
+    assert import_bom_excel.resolve_year("BOM YARN 2025.xlsm", None) == 2025
+    assert import_bom_excel.resolve_year("BOM YARN 2025.xlsm", 2027) == 2027
+    with pytest.raises(HTTPException) as exc:
+        import_bom_excel.resolve_year("BOM YARN.xlsm", None)
+    assert exc.value.status_code == 400
\ No newline at end of file
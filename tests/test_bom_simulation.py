@@ -0,0 +1,153 @@
+# =================================================================
+# MÔ PHỎNG ĐỊNH MỨC BOM: chỉ đọc DB, cache theo input, xóa cache khi BOM bị sửa
+# =================================================================
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+
+from app.db.session import engine
+from app.models.bom_detail import BOMComponentType, BOMDetail
+from app.models.bom_header import BOMHeader
+from app.models.product import Product
+from app.schemas.bom_schema import (
+    BOMBulkRecalculate,
+    BOMDetailCreate,
+    BOMDetailSimChange,
+    BOMHeaderCreate,
+    BOMHeaderUpdate,
+    BOMSimulationRequest,
+)
+from app.services import bom_simulation_service
+from app.services.bom_service import BOMService
+
+DETAILS = [
+    BOMDetailCreate(component_type=BOMComponentType.GROUND, threads=200, yarn_type_name="01100-PES", actual_length_cm=120),
+    BOMDetailCreate(component_type=BOMComponentType.FILLING, threads=40, yarn_type_name="03300-PES", actual_length_cm=300),
+    BOMDetailCreate(component_type=BOMComponentType.EDGE, threads=12, yarn_type_name="00550-PA6", actual_length_cm=125),
+]
+
+
+@pytest.fixture
+def bom(db, material_warehouse):
+    product = Product(item_code="SP-1")
+    db.add(product)
+    db.commit()
+    created = BOMService.create_bom(db, BOMHeaderCreate(
+        product_id=product.product_id, applicable_year=2026, target_weight_gm=60,
+        total_scrap_rate=3, total_shrinkage_rate=2, details=DETAILS
+    ))
+    return created.bom_id, [d.detail_id for d in created.bom_details]
+
+
+@pytest.fixture
+def sql_log():
+    """Ghi lại các câu SQL chạy trong test"""
+    statements = []
+
+    def _on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _on_execute)
+    yield statements
+    event.remove(engine, "before_cursor_execute", _on_execute)
+
+
+def _stored(db, bom_id):
+    header = db.query(BOMHeader).populate_existing().filter(BOMHeader.bom_id == bom_id).one()
+    details = db.query(BOMDetail).populate_existing().filter(BOMDetail.bom_id == bom_id).order_by(BOMDetail.detail_id)
+    return (
+        (float(header.target_weight_gm), header.version),
+        [(d.threads, float(d.weight_percentage), float(d.bom_gm)) for d in details],
+    )
+
+
+def test_simulation_only_reads(db, bom, sql_log):
+    bom_id, detail_ids = bom
+    before = _stored(db, bom_id)
+    sql_log.clear()
+
+    result = bom_simulation_service.simulate_bom(db, BOMSimulationRequest(
+        bom_id=bom_id, target_weight_gm=80,
+        detail_changes=[BOMDetailSimChange(detail_id=detail_ids[0], threads=250)],
+        remove_detail_ids=[detail_ids[2]],
+        add_details=[BOMDetailCreate(component_type=BOMComponentType.BINDER, threads=30, yarn_type_name="01100-PES", actual_length_cm=110)],
+    ))
+
+    assert sql_log and all(s.lstrip().upper().startswith("SELECT") for s in sql_log)
+    assert not (db.new or db.dirty or db.deleted)
+    assert _stored(db, bom_id) == before
+    assert [d.detail_id for d in result.details] == [detail_ids[0], detail_ids[1], None]
+    assert result.removed_detail_ids == [detail_ids[2]]
+    assert result.details[0].threads == 250 and result.details[0].delta_bom_gm is not None
+
+
+def test_simulation_matches_stored_formula(db, bom):
+    bom_id, _ = bom
+    header = SimpleNamespace(target_weight_gm=75.0, total_scrap_rate=3.0, total_shrinkage_rate=2.0)
+    expected = BOMService._execute_bom_calculations(header, DETAILS)
+
+    by_id = bom_simulation_service.simulate_bom(db, BOMSimulationRequest(bom_id=bom_id, target_weight_gm=75))
+    adhoc = bom_simulation_service.simulate_bom(db, BOMSimulationRequest(
+        target_weight_gm=75, total_scrap_rate=3, total_shrinkage_rate=2, details=DETAILS
+    ))
+
+    for result in (by_id, adhoc):
+        assert [d.bom_gm for d in result.details] == [float(e.bom_gm) for e in expected]
+        assert [d.weight_percentage for d in result.details] == [float(e.weight_percentage) for e in expected]
+    assert by_id.total_bom_gm == round(sum(float(e.bom_gm) for e in expected), 4)
+    assert by_id.delta_total_bom_gm == round(by_id.total_bom_gm - by_id.base_total_bom_gm, 4)
+
+    # Không đổi gì -> chênh lệch = 0
+    unchanged = bom_simulation_service.simulate_bom(db, BOMSimulationRequest(bom_id=bom_id))
+    assert unchanged.delta_total_bom_gm == 0
+    assert all(d.delta_bom_gm == 0 for d in unchanged.details)
+
+
+def test_cache_hit_skips_database(db, bom, sql_log):
+    bom_id, _ = bom
+    request = BOMSimulationRequest(bom_id=bom_id, total_scrap_rate=5)
+    first = bom_simulation_service.simulate_bom(db, request)
+    sql_log.clear()
+
+    second = bom_simulation_service.simulate_bom(db, BOMSimulationRequest(bom_id=bom_id, total_scrap_rate=5))
+
+    assert (first.cached, second.cached) == (False, True)
+    assert sql_log == []
+    assert second.model_dump(exclude={"cached"}) == first.model_dump(exclude={"cached"})
+
+
+@pytest.mark.parametrize("change", ["update", "bulk", "delete"])
+def test_bom_change_invalidates_cache(db, bom, change):
+    bom_id, _ = bom
+    request = BOMSimulationRequest(bom_id=bom_id, total_scrap_rate=5)
+    first = bom_simulation_service.simulate_bom(db, request)
+
+    if change == "update":
+        BOMService.update_bom(db, bom_id, BOMHeaderUpdate(target_weight_gm=90))
+    elif change == "bulk":
+        product_id = db.get(BOMHeader, bom_id).product_id
+        BOMService.bulk_recalculate(db, BOMBulkRecalculate(product_ids=[product_id], target_weight_gm=90))
+    else:
+        BOMService.delete_bom(db, bom_id)
+        with pytest.raises(HTTPException) as exc:
+            bom_simulation_service.simulate_bom(db, request)
+        assert exc.value.status_code == 404
+        return
+
+    second = bom_simulation_service.simulate_bom(db, request)
+    assert not second.cached
+    assert (first.target_weight_gm, second.target_weight_gm) == (60, 90)
+    assert second.total_bom_gm == pytest.approx(first.total_bom_gm * 1.5, abs=1e-3)
+
+
+def test_invalid_requests(db, bom):
+    bom_id, _ = bom
+    with pytest.raises(HTTPException) as exc:
+        bom_simulation_service.simulate_bom(db, BOMSimulationRequest(target_weight_gm=50))
+    assert exc.value.status_code == 400
+
+    with pytest.raises(HTTPException) as exc:
+        bom_simulation_service.simulate_bom(db, BOMSimulationRequest(bom_id=bom_id, remove_detail_ids=[999]))
+    assert exc.value.status_code == 400
\ No newline at end of file
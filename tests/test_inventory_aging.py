@@ -0,0 +1,93 @@
+# =================================================================
+# TUỔI TỒN / HÀNG CHẬM LUÂN CHUYỂN (compute_aging + InventoryAgingService)
+# =================================================================
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from app.models.batch import Batch
+from app.models.employee import Employee
+from app.schemas.material_export_schema import MaterialExportCreate, MaterialExportDetailCreate
+from app.schemas.material_receipt_schema import MaterialReceiptCreate, MaterialReceiptDetailCreate
+from app.services.inventory_aging_service import AGING_BUCKETS, InventoryAgingService, compute_aging
+from app.services.material_export_service import MaterialExportService
+from app.services.material_receipt_service import MaterialReceiptService
+
+AS_OF = date(2026, 6, 30)
+
+
+def _stock(ages, material_id=1, warehouse_id=1, quantity=10.0):
+    return pd.DataFrame([
+        {
+            "material_id": material_id, "warehouse_id": warehouse_id, "material_code": "M", "warehouse_name": "K",
+            "quantity_on_hand": quantity, "receipt_date": AS_OF - timedelta(days=age), "batch_created_at": None,
+        }
+        for age in ages
+    ])
+
+
+def _exports(rows):
+    return pd.DataFrame(rows, columns=["material_id", "warehouse_id", "last_export_at", "issued_in_window"])
+
+
+@pytest.mark.parametrize("age, bucket", [
+    (0, "age_0_30"), (30, "age_0_30"), (31, "age_31_90"), (90, "age_31_90"),
+    (91, "age_91_180"), (180, "age_91_180"), (181, "age_over_180"),
+])
+def test_bucket_edges(age, bucket):
+    (row,) = compute_aging(_stock([age]), _exports([]), AS_OF).to_dict("records")
+
+    assert {name: row[name] for name in AGING_BUCKETS} == {name: 10.0 if name == bucket else 0.0 for name in AGING_BUCKETS}
+    assert row["oldest_age_days"] == age
+
+
+def test_exports_are_merged_per_material_warehouse():
+    stock = pd.concat([_stock([10, 200]), _stock([200], material_id=2), _stock([5], material_id=3)])
+    exports = _exports([
+        # Vật tư 1: xuất từ lô đã hết tồn (không còn dòng tồn) vẫn được tính
+        (1, 1, datetime(2026, 6, 30, 8), 90.0),
+        # Vật tư 2: lần xuất cuối đã quá 180 ngày
+        (2, 1, datetime(2025, 12, 1), 0.0),
+        # Không còn tồn -> không có dòng kết quả
+        (4, 1, datetime(2026, 6, 1), 50.0),
+    ])
+
+    result = compute_aging(stock, exports, AS_OF).set_index("material_id")
+
+    assert list(result.index) == [1, 2, 3]
+    assert result.loc[1, "issued_in_window"] == 90
+    assert result.loc[1, "last_export_date"] == date(2026, 6, 30)
+    assert result.loc[1, "days_of_cover"] == pytest.approx(20.0)   # 20 / (90 / 90)
+    assert not result.loc[1, "is_slow_moving"] and not result.loc[1, "is_dead_stock"]
+    assert result.loc[2, "is_dead_stock"] and result.loc[2, "days_since_last_export"] == 211
+    assert result.loc[3, "issued_in_window"] == 0 and pd.isna(result.loc[3, "last_export_date"])
+    assert result.loc[3, "is_slow_moving"]
+
+
+def test_fully_consumed_batch_still_counts_as_movement(db, material_warehouse):
+    """Xuất hết lô cũ (FIFO) hôm nay -> vật tư đang luân chuyển, không bị đánh dấu chậm / tồn chết."""
+    material_id, warehouse_id = material_warehouse
+    today = date.today()
+    receipts = MaterialReceiptService(db)
+    for days_ago, lot in ((200, "S-OLD"), (10, "S-NEW")):
+        receipts.create(MaterialReceiptCreate(
+            receipt_number="AUTO", receipt_date=today - timedelta(days=days_ago), warehouse_id=warehouse_id,
+            details=[MaterialReceiptDetailCreate(material_id=material_id, received_quantity_kg=100, supplier_batch_no=lot)],
+        ))
+    old_batch = db.query(Batch.batch_id).filter(Batch.supplier_batch_no == "S-OLD").scalar()
+    receiver = Employee(full_name="NV 1", email="nv1@test.local")
+    db.add(receiver)
+    db.commit()
+    MaterialExportService(db).create_export(MaterialExportCreate(
+        export_code="AUTO", export_date=today, warehouse_id=warehouse_id, receiver_id=receiver.employee_id,
+        details=[MaterialExportDetailCreate(material_id=material_id, batch_id=old_batch, quantity=100)],
+    ))
+
+    report = InventoryAgingService(db).get_aging_report(as_of=today, refresh=True)
+
+    (item,) = report["items"]
+    assert item["quantity_on_hand"] == 100 and item["batch_count"] == 1
+    assert item["issued_in_window"] == 100
+    assert item["last_export_date"] == today
+    assert not item["is_slow_moving"] and not item["is_dead_stock"]
\ No newline at end of file
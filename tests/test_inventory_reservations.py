@@ -0,0 +1,128 @@
+# =================================================================
+# PHIẾU GIỮ CHỖ: sweeper trả lại tồn khả dụng, chặn xóa phiếu nhập của lô đã giữ chỗ
+# =================================================================
+from datetime import date, datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.batch import Batch, BatchQCStatus
+from app.models.inventory import InventoryStock
+from app.models.inventory_reservation import InventoryReservation, ReservationStatus
+from app.models.inventory_summary import InventoryWarehouseSummary
+from app.schemas.inventory_schema import AllocationDemand, ReservationCreate
+from app.schemas.material_receipt_schema import MaterialReceiptCreate, MaterialReceiptDetailCreate
+from app.services import inventory_reservation_sweeper
+from app.services.inventory_reservation_service import InventoryReservationService
+from app.services.material_receipt_service import MaterialReceiptService
+
+
+@pytest.fixture
+def two_batches(db, material_warehouse):
+    """2 lô QC PASS, mỗi lô 10 kg: lô 1 hết hạn sớm hơn (được FEFO lấy trước)."""
+    material_id, warehouse_id = material_warehouse
+    batch_ids = []
+    for code, days in (("L1", 3), ("L2", 9)):
+        batch = Batch(internal_batch_code=code, supplier_batch_no=code, material_id=material_id,
+                      qc_status=BatchQCStatus.PASS, expiry_date=date.today() + timedelta(days=days))
+        db.add(batch)
+        db.flush()
+        db.add(InventoryStock(material_id=material_id, warehouse_id=warehouse_id, batch_id=batch.batch_id,
+                              quantity_on_hand=10, quantity_reserved=0))
+        batch_ids.append(batch.batch_id)
+    db.commit()
+    return material_id, warehouse_id, batch_ids
+
+
+def _reserved(db):
+    return [
+        s.quantity_reserved
+        for s in db.query(InventoryStock).populate_existing().order_by(InventoryStock.batch_id)
+    ]
+
+
+def test_release_expired_restores_quantity_reserved(db, two_batches):
+    material_id, _, _ = two_batches
+    service = InventoryReservationService(db)
+    kept = service.create(ReservationCreate(owner="A", lines=[AllocationDemand(material_id=material_id, quantity=12)]))
+    expiring = service.create(ReservationCreate(owner="B", ttl_minutes=1, lines=[AllocationDemand(material_id=material_id, quantity=3)]))
+    assert _reserved(db) == [10, 5]
+
+    released = service.release_expired(now=datetime.now() + timedelta(minutes=5))
+
+    assert released == 1
+    assert _reserved(db) == [10, 2]
+    statuses = dict(db.query(InventoryReservation.id, InventoryReservation.status))
+    assert statuses == {kept.id: ReservationStatus.ACTIVE, expiring.id: ReservationStatus.EXPIRED}
+    # Quét lại không trả lại lần 2
+    assert service.release_expired(now=datetime.now() + timedelta(minutes=5)) == 0
+    assert _reserved(db) == [10, 2]
+
+
+def test_release_expired_processes_every_batch(db, two_batches):
+    material_id, _, _ = two_batches
+    service = InventoryReservationService(db)
+    for owner in ("A", "B", "C"):
+        service.create(ReservationCreate(owner=owner, ttl_minutes=1, lines=[AllocationDemand(material_id=material_id, quantity=4)]))
+    assert _reserved(db) == [10, 2]
+
+    assert service.release_expired(now=datetime.now() + timedelta(minutes=5), batch_size=2) == 3
+    assert _reserved(db) == [0, 0]
+
+
+
+def test_release_expired_keeps_summary_in_line_with_clamped_stock_rows(db, two_batches):
+    material_id, warehouse_id, batch_ids = two_batches
+    service = InventoryReservationService(db)
+    service.create(ReservationCreate(owner="A", ttl_minutes=1, lines=[AllocationDemand(material_id=material_id, quantity=12)]))
+    assert _reserved(db) == [10, 2]
+
+    # Sửa tay: lô 1 chỉ còn giữ 4 kg (tổng hợp sửa theo: 4 + 2)
+    db.query(InventoryStock).filter(InventoryStock.batch_id == batch_ids[0]).update({InventoryStock.quantity_reserved: 4})
+    db.query(InventoryWarehouseSummary).filter(
+        InventoryWarehouseSummary.material_id == material_id, InventoryWarehouseSummary.warehouse_id == warehouse_id
+    ).update({InventoryWarehouseSummary.quantity_reserved: 6})
+    db.commit()
+
+    assert service.release_expired(now=datetime.now() + timedelta(minutes=5)) == 1
+
+    assert _reserved(db) == [0, 0]
+    summary = db.query(InventoryWarehouseSummary).populate_existing().filter(
+        InventoryWarehouseSummary.material_id == material_id, InventoryWarehouseSummary.warehouse_id == warehouse_id
+    ).one()
+    assert summary.quantity_reserved == pytest.approx(0)     # chỉ trừ 4 + 2 đã thực trả, không trừ đủ 12
+
+def test_sweep_once_uses_its_own_session(db, two_batches):
+    material_id, _, _ = two_batches
+    reservation = InventoryReservationService(db).create(
+        ReservationCreate(owner="A", ttl_minutes=1, lines=[AllocationDemand(material_id=material_id, quantity=6)])
+    )
+    db.query(InventoryReservation).filter(InventoryReservation.id == reservation.id).update(
+        {InventoryReservation.expires_at: datetime.now() - timedelta(minutes=1)}
+    )
+    db.commit()
+
+    assert inventory_reservation_sweeper.sweep_once() == 1
+    assert _reserved(db) == [0, 0]
+
+
+def test_receipt_delete_blocked_while_batch_has_reservation_lines(db, material_warehouse):
+    material_id, warehouse_id = material_warehouse
+    receipts = MaterialReceiptService(db)
+    receipt = receipts.create(MaterialReceiptCreate(
+        receipt_number="PN1", receipt_date=date(2026, 1, 1), warehouse_id=warehouse_id,
+        details=[MaterialReceiptDetailCreate(material_id=material_id, received_quantity_kg=10, supplier_batch_no="S1")],
+    ))
+    detail_id = receipt.details[0].detail_id
+    db.query(Batch).update({Batch.qc_status: BatchQCStatus.PASS})
+    db.commit()
+    reservations = InventoryReservationService(db)
+    reservation = reservations.create(ReservationCreate(owner="A", lines=[AllocationDemand(material_id=material_id, quantity=3)]))
+    # Phiếu đã hủy vẫn còn dòng trỏ tới dòng tồn -> vẫn phải chặn
+    reservations.release(reservation.id)
+
+    for delete in (lambda: receipts.delete(receipt.receipt_id), lambda: receipts.delete_detail(detail_id)):
+        with pytest.raises(HTTPException) as exc:
+            delete()
+        assert exc.value.status_code == 400
+        db.rollback()
\ No newline at end of file
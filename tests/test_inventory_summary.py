@@ -0,0 +1,114 @@
+# =================================================================
+# BẢNG TỔNG HỢP TỒN: cộng dồn theo biến động phải khớp dựng lại toàn bộ
+# =================================================================
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.models.batch import Batch, BatchQCStatus
+from app.models.inventory import InventoryStock
+from app.models.inventory_summary import InventoryMaterialSummary, InventoryWarehouseSummary
+from app.models.material import Material
+from app.models.warehouse import Warehouse
+from app.schemas.inventory_schema import AllocationDemand, InventoryAdjustment, ReservationCreate
+from app.schemas.material_export_schema import MaterialExportCreate, MaterialExportDetailCreate
+from app.schemas.material_receipt_schema import MaterialReceiptCreate, MaterialReceiptDetailCreate
+from app.services.inventory_reservation_service import InventoryReservationService
+from app.services.inventory_service import InventoryService
+from app.services.inventory_summary_service import InventorySummaryService
+from app.services.material_export_service import MaterialExportService
+from app.services.material_receipt_service import MaterialReceiptService
+
+
+def _snapshot(db):
+    """Tổng hợp hiện tại, bỏ các dòng đã về 0 (dựng lại không sinh dòng cho vật tư không còn tồn)."""
+    materials = {
+        r.material_id: (pytest.approx(r.quantity_on_hand), pytest.approx(r.quantity_reserved))
+        for r in db.query(InventoryMaterialSummary).populate_existing()
+        if abs(r.quantity_on_hand or 0) > 1e-9 or abs(r.quantity_reserved or 0) > 1e-9
+    }
+    warehouses = {
+        (r.material_id, r.warehouse_id): (pytest.approx(r.quantity_on_hand), pytest.approx(r.quantity_reserved))
+        for r in db.query(InventoryWarehouseSummary).populate_existing()
+        if abs(r.quantity_on_hand or 0) > 1e-9 or abs(r.quantity_reserved or 0) > 1e-9
+    }
+    return materials, warehouses
+
+
+def test_summary_deltas_match_full_rebuild(db, material_warehouse):
+    material_id, warehouse_id = material_warehouse
+    unit_id = db.get(Material, material_id).uom_base_id
+    second_material = Material(material_code="M-2", uom_base_id=unit_id, uom_production_id=unit_id, min_stock_level=5)
+    second_warehouse = Warehouse(warehouse_name="KHO-2")
+    db.add_all([second_material, second_warehouse])
+    db.commit()
+    material_ids = [material_id, second_material.id]
+    warehouse_ids = [warehouse_id, second_warehouse.warehouse_id]
+
+    # 1. Nhập kho: 4 phiếu, mỗi phiếu 1 kho, mỗi vật tư 1 lô
+    receipts = MaterialReceiptService(db)
+    created = []
+    for i in range(4):
+        created.append(receipts.create(MaterialReceiptCreate(
+            receipt_number=f"PN{i}",
+            receipt_date=date(2026, 1, 1),
+            warehouse_id=warehouse_ids[i % 2],
+            details=[
+                MaterialReceiptDetailCreate(material_id=mid, received_quantity_kg=40 + 10 * i, supplier_batch_no=f"S{i}-{mid}")
+                for mid in material_ids
+            ],
+        )))
+    db.query(Batch).update({Batch.qc_status: BatchQCStatus.PASS, Batch.expiry_date: date.today() + timedelta(days=30)})
+    db.commit()
+
+    def stock_of(receipt_index, material_index):
+        detail_id = created[receipt_index].details[material_index].detail_id
+        return db.query(Batch.batch_id).filter(Batch.receipt_detail_id == detail_id).scalar()
+
+    # 2. Giữ chỗ: 1 phiếu hết hạn, 1 phiếu hủy tay, 1 phiếu được xuất
+    reservations = InventoryReservationService(db)
+    reservations.create(ReservationCreate(owner="A", ttl_minutes=1, lines=[AllocationDemand(material_id=material_ids[0], quantity=15)]))
+    released = reservations.create(ReservationCreate(owner="B", lines=[AllocationDemand(material_id=material_ids[1], quantity=25)]))
+    consumed = reservations.create(ReservationCreate(
+        owner="C", lines=[AllocationDemand(material_id=material_ids[0], quantity=30, warehouse_id=warehouse_ids[0])]
+    ))
+    reservations.release(released.id)
+    reservations.release_expired(now=datetime.now() + timedelta(minutes=5))
+    consumed_batch = consumed.lines[0].batch_id
+
+    # 3. Xuất kho: theo phiếu giữ chỗ (xuất ít hơn phần giữ) + xuất thường
+    exports = MaterialExportService(db)
+    exports.create_export(MaterialExportCreate(
+        export_code="AUTO", warehouse_id=warehouse_ids[0], receiver_id=1, reservation_id=consumed.id,
+        details=[MaterialExportDetailCreate(material_id=material_ids[0], batch_id=consumed_batch, quantity=20)],
+    ))
+    exports.create_export(MaterialExportCreate(
+        export_code="AUTO", warehouse_id=warehouse_ids[1], receiver_id=1,
+        details=[MaterialExportDetailCreate(material_id=material_ids[1], batch_id=stock_of(1, 1), quantity=12.5)],
+    ))
+
+    # 4. Giữ chỗ còn hiệu lực + điều chỉnh tồn + nhập rồi xóa 1 phiếu nhập
+    inventory = InventoryService(db)
+    inventory.reserve_stock(material_ids[1], 7)
+    inventory.adjust_stock(InventoryAdjustment(
+        material_id=material_ids[0], warehouse_id=warehouse_ids[1], batch_id=stock_of(3, 0), new_quantity=33
+    ))
+    unused = receipts.create(MaterialReceiptCreate(
+        receipt_number="PN-XOA", receipt_date=date(2026, 1, 5), warehouse_id=warehouse_ids[1],
+        details=[MaterialReceiptDetailCreate(material_id=material_ids[1], received_quantity_kg=9, supplier_batch_no="S-XOA")],
+    ))
+    receipts.delete(unused.receipt_id)
+
+    incremental = _snapshot(db)
+    assert incremental[0], "bảng tổng hợp phải có dữ liệu"
+
+    InventorySummaryService(db).rebuild()
+    db.commit()
+    assert _snapshot(db) == incremental
+
+    # Đối chiếu thêm với SUM trực tiếp trên inventory_stocks
+    for mid in material_ids:
+        stocks = db.query(InventoryStock).filter(InventoryStock.material_id == mid).all()
+        on_hand = sum(s.quantity_on_hand or 0 for s in stocks)
+        reserved = sum(s.quantity_reserved or 0 for s in stocks)
+        assert incremental[0][mid] == (pytest.approx(on_hand), pytest.approx(reserved))
\ No newline at end of file
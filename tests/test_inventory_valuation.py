@@ -0,0 +1,97 @@
+# =================================================================
+# GIÁ TRỊ TỒN: giá lô theo PO, bình quân gia quyền di động, định giá lại khi sửa giá PO
+# =================================================================
+from datetime import date
+
+import pytest
+
+from app.models.batch import Batch, BatchQCStatus
+from app.models.inventory_summary import InventoryMaterialSummary
+from app.models.purchase_order import PurchaseOrderDetail, PurchaseOrderHeader
+from app.models.supplier import Supplier
+from app.schemas.material_export_schema import MaterialExportCreate, MaterialExportDetailCreate
+from app.schemas.material_receipt_schema import MaterialReceiptCreate, MaterialReceiptDetailCreate
+from app.schemas.purchase_order_schema import PODetailUpdate, POHeaderUpdate
+from app.services.inventory_service import InventoryService
+from app.services.inventory_valuation_service import InventoryValuationService
+from app.services.material_export_service import MaterialExportService
+from app.services.material_receipt_service import MaterialReceiptService
+from app.services.purchase_order_service import PurchaseOrderService
+
+
+@pytest.fixture
+def two_receipts(db, material_warehouse):
+    """
+    PO1: đơn giá 2, tỷ giá 1 -> lô 1 giá 2.  PO2: đơn giá 5, tỷ giá 2 -> lô 2 giá 10.
+    Nhập 100 kg mỗi PO rồi xuất 50 kg từ lô 1.
+    """
+    material_id, warehouse_id = material_warehouse
+    supplier = Supplier(supplier_name="NCC Test", short_name="NCC", email="ncc@test.local")
+    db.add(supplier)
+    db.flush()
+    po_ids = []
+    for number, price, rate in (("PO1", 2.0, 1.0), ("PO2", 5.0, 2.0)):
+        po = PurchaseOrderHeader(po_number=number, vendor_id=supplier.supplier_id, exchange_rate=rate, order_date=date(2026, 1, 1))
+        db.add(po)
+        db.flush()
+        db.add(PurchaseOrderDetail(po_id=po.po_id, material_id=material_id, quantity=1000, unit_price=price, line_total=1000 * price))
+        po_ids.append(po.po_id)
+    db.commit()
+
+    receipts = MaterialReceiptService(db)
+    for po_id in po_ids:
+        receipts.create(MaterialReceiptCreate(
+            receipt_number="AUTO", receipt_date=date(2026, 1, 2), warehouse_id=warehouse_id, po_header_id=po_id,
+            details=[MaterialReceiptDetailCreate(material_id=material_id, received_quantity_kg=100)],
+        ))
+    db.query(Batch).update({Batch.qc_status: BatchQCStatus.PASS})
+    db.commit()
+    return material_id, warehouse_id, po_ids
+
+
+def _average(db):
+    summary = db.query(InventoryMaterialSummary).populate_existing().one()
+    return summary.quantity_on_hand, pytest.approx(summary.stock_value), pytest.approx(summary.average_unit_cost)
+
+
+def _export_from_first_batch(db, material_id, warehouse_id, quantity):
+    first_batch = db.query(Batch.batch_id).order_by(Batch.batch_id).first()[0]
+    MaterialExportService(db).create_export(MaterialExportCreate(
+        export_code="AUTO", export_date=date(2026, 1, 3), warehouse_id=warehouse_id, receiver_id=1,
+        details=[MaterialExportDetailCreate(material_id=material_id, batch_id=first_batch, quantity=quantity)],
+    ))
+
+
+def test_receipts_use_po_batch_cost_and_exports_leave_at_average(db, two_receipts):
+    material_id, warehouse_id, _ = two_receipts
+    assert [cost for (cost,) in db.query(Batch.unit_cost).order_by(Batch.batch_id)] == [2.0, 10.0]
+    # (100*2 + 100*10) / 200 = 6
+    assert _average(db) == (200, 1200, 6)
+
+    _export_from_first_batch(db, material_id, warehouse_id, 50)
+
+    assert _average(db) == (150, 900, 6)
+    report = InventoryValuationService(db).get_report()
+    # FIFO theo lô: 50*2 + 100*10; bình quân: 150*6
+    assert report["total_fifo_value"] == pytest.approx(1100)
+    assert report["total_moving_average_value"] == pytest.approx(900)
+
+
+def test_po_price_and_rate_corrections_revalue_and_match_replay(db, two_receipts):
+    material_id, warehouse_id, po_ids = two_receipts
+    _export_from_first_batch(db, material_id, warehouse_id, 50)
+    purchase_orders = PurchaseOrderService(db)
+
+    # Sửa đơn giá PO1: 2 -> 4 => (100*4 + 100*10) / 200 = 7, xuất 50 theo giá 7
+    detail = db.query(PurchaseOrderDetail).filter(PurchaseOrderDetail.po_id == po_ids[0]).one()
+    purchase_orders.update_item(po_ids[0], detail.detail_id, PODetailUpdate(unit_price=4.0))
+    assert [cost for (cost,) in db.query(Batch.unit_cost).order_by(Batch.batch_id)] == [4.0, 10.0]
+    assert _average(db) == (150, 1050, 7)
+
+    # Sửa tỷ giá PO2: 2 -> 1 => lô 2 giá 5, (100*4 + 100*5) / 200 = 4.5
+    purchase_orders.update(purchase_orders.get(po_ids[1]), POHeaderUpdate(exchange_rate=1.0))
+    assert _average(db) == (150, 675, 4.5)
+
+    # Chạy lại toàn bộ từ sổ cái cho cùng kết quả
+    InventoryService(db).rebuild_stock_projection()
+    assert _average(db) == (150, 675, 4.5)
\ No newline at end of file
@@ -0,0 +1,161 @@
+# =================================================================
+# SỐ CÂU SQL MỖI ENDPOINT DANH SÁCH
+# Gọi endpoint + serialize theo response_model (giống FastAPI), đếm câu SQL ở trang 1 dòng
+# và trang N dòng. Số câu phải KHÔNG tăng theo số dòng (bắt lỗi N+1 lazy load).
+# =================================================================
+import inspect
+from datetime import date, datetime, timedelta
+
+import pytest
+from fastapi import Response
+from pydantic import TypeAdapter
+from pydantic.fields import FieldInfo
+
+from app.api.v1.endpoints import inventorys, material_exports, material_receipts, weaving_basket_tickets
+from app.models.basket import Basket
+from app.models.batch import Batch
+from app.models.employee import Employee
+from app.models.inventory import InventoryStock
+from app.models.machine import Machine
+from app.models.material import Material
+from app.models.product import Product
+from app.models.standard import Standard
+from app.models.weaving_basket_ticket import WeavingBasketTicket
+from app.schemas.material_export_schema import MaterialExportCreate, MaterialExportDetailCreate
+from app.schemas.material_receipt_schema import MaterialReceiptCreate, MaterialReceiptDetailCreate
+from app.services.inventory_service import InventoryService
+from app.services.material_export_service import MaterialExportService
+from app.services.material_receipt_service import MaterialReceiptService
+
+PAGE_N = 8
+
+
+@pytest.fixture
+def seeded(db, material_warehouse):
+    """PAGE_N phiếu nhập / xuất / phiếu rổ dệt, mỗi dòng trỏ tới vật tư, sản phẩm, rổ, nhân viên KHÁC nhau."""
+    material_id, warehouse_id = material_warehouse
+    base_material = db.get(Material, material_id)
+    materials = [
+        Material(material_code=f"M{i}", uom_base_id=base_material.uom_base_id, uom_production_id=base_material.uom_production_id)
+        for i in range(PAGE_N)
+    ]
+    employees = [Employee(full_name=f"NV {i}", email=f"nv{i}@test.local") for i in range(PAGE_N * 2)]
+    products = [Product(item_code=f"SP{i}") for i in range(PAGE_N)]
+    baskets = [Basket(basket_code=f"R{i}", tare_weight=1) for i in range(PAGE_N)]
+    db.add_all(materials + employees + products + baskets + [Machine(machine_name="MAY-1")])
+    db.flush()
+    standards = [
+        Standard(product_id=p.product_id, width_mm="25", thickness_mm="1", breaking_strength_dan="100",
+                 elongation_at_load_percent="10", weft_density="10", weight_gm="20")
+        for p in products
+    ]
+    db.add_all(standards)
+    db.commit()
+
+    receipts = MaterialReceiptService(db)
+    for i, material in enumerate(materials):
+        receipts.create(MaterialReceiptCreate(
+            receipt_number=f"PN{i}",
+            receipt_date=date(2026, 1, 1),
+            warehouse_id=warehouse_id,
+            details=[
+                MaterialReceiptDetailCreate(material_id=material.id, received_quantity_kg=50, supplier_batch_no=f"S{i}-{j}")
+                for j in range(2)
+            ],
+        ))
+
+    exports = MaterialExportService(db)
+    for material in materials:
+        batch_id = db.query(Batch.batch_id).filter(Batch.material_id == material.id).first()[0]
+        exports.create_export(MaterialExportCreate(
+            export_code="AUTO",
+            export_date=date(2026, 1, 2),
+            warehouse_id=warehouse_id,
+            receiver_id=employees[0].employee_id,
+            details=[MaterialExportDetailCreate(material_id=material.id, batch_id=batch_id, quantity=1)],
+        ))
+
+    started = datetime(2026, 1, 3, 6, 0)
+    db.add_all([
+        WeavingBasketTicket(
+            code=f"T{i}",
+            product_id=products[i].product_id,
+            standard_id=standards[i].standard_id,
+            machine_id=1,
+            machine_line=i + 1,
+            yarn_load_date=started.date(),
+            basket_id=baskets[i].basket_id,
+            time_in=started + timedelta(minutes=i),
+            employee_in_id=employees[i].employee_id,
+            time_out=started + timedelta(hours=8, minutes=i),
+            employee_out_id=employees[PAGE_N + i].employee_id,
+            net_weight=10,
+            length_meters=100,
+        )
+        for i in range(PAGE_N)
+    ])
+    db.commit()
+    return db
+
+
+def _route(endpoint):
+    for module in (inventorys, material_exports, material_receipts, weaving_basket_tickets):
+        for route in module.router.routes:
+            if route.endpoint is endpoint:
+                return route
+    raise LookupError(endpoint.__name__)
+
+
+def _call(endpoint, db, limit: int):
+    """Gọi endpoint như FastAPI: tham số Query(...) lấy giá trị mặc định, rồi serialize theo response_model."""
+    kwargs = {"db": db, "response": Response(), "skip": 0, "limit": limit}
+    for name, param in inspect.signature(endpoint).parameters.items():
+        if name not in kwargs:
+            default = param.default
+            kwargs[name] = default.default if isinstance(default, FieldInfo) else default
+    items = endpoint(**kwargs)
+    return TypeAdapter(_route(endpoint).response_model).validate_python(items, from_attributes=True)
+
+
+@pytest.mark.parametrize("endpoint", [
+    material_receipts.read_receipts,
+    material_exports.read_exports,
+    weaving_basket_tickets.read_weaving_tickets,
+    inventorys.read_inventories,
+    inventorys.read_inventories_flat,
+], ids=lambda endpoint: endpoint.__name__)
+def test_statement_count_does_not_grow_with_page_size(seeded, count_statements, endpoint):
+    counts = {}
+    for limit in (1, PAGE_N):
+        seeded.expunge_all()  # identity map trống -> mọi quan hệ phải được load lại
+        with count_statements() as counter:
+            rows = _call(endpoint, seeded, limit)
+        assert len(rows) == limit
+        counts[limit] = counter.count
+
+    assert counts[PAGE_N] == counts[1], f"{endpoint.__name__}: {counts[1]} câu SQL ở 1 dòng, {counts[PAGE_N]} câu ở {PAGE_N} dòng"
+
+
+@pytest.mark.parametrize("search", [None, "S3-"])
+def test_inventory_list_pages_follow_the_flat_view(seeded, search):
+    """GET /inventorys/ lọc & phân trang trên view rồi mới load ORM theo id: cùng dòng, cùng thứ tự với /flat."""
+    # Ghi last_updated qua SQLAlchemy (SQLite lưu CURRENT_TIMESTAMP của server_default khác định dạng tham số
+    # -> so sánh keyset sai trên SQLite, MySQL không bị); từng cặp dòng trùng thời điểm để thử cột id phân định
+    for i, stock in enumerate(seeded.query(InventoryStock).order_by(InventoryStock.id)):
+        stock.last_updated = datetime(2026, 1, 5) + timedelta(minutes=i // 2)
+    seeded.commit()
+
+    service = InventoryService(seeded)
+    expected = [row.id for row in service.get_list(limit=100, search=search)]
+
+    collected, cursor = [], None
+    while True:
+        page = service.get_multi(limit=3, search=search, cursor=cursor)
+        collected += [stock.id for stock in page]
+        cursor = page.next_cursor
+        if not cursor:
+            break
+
+    assert collected == expected
+    if search:
+        assert len(page) == 2 and all(stock.batch.supplier_batch_no.startswith(search) for stock in page)
\ No newline at end of file
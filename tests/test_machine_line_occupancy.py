@@ -0,0 +1,131 @@
+# =================================================================
+# LINE MÁY ĐANG CHẠY (machine_line_occupancy): 1 line chỉ 1 phiếu rổ dệt đang mở
+# =================================================================
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.basket import Basket
+from app.models.batch import Batch
+from app.models.employee import Employee
+from app.models.machine import Machine
+from app.models.machine_line_occupancy import MachineLineOccupancy
+from app.models.product import Product
+from app.models.standard import Standard
+from app.models.weaving_basket_ticket import WeavingBasketTicket
+from app.schemas.material_export_schema import MaterialExportCreate, MaterialExportDetailCreate
+from app.schemas.weaving_basket_ticket_schema import WeavingTicketCreate, WeavingTicketUpdate
+from app.services import machine_line_occupancy_service, weaving_basket_ticket_service
+from app.services.material_export_service import MaterialExportService
+
+
+@pytest.fixture
+def loom(db):
+    """1 máy 4 line, 3 rổ, 1 sản phẩm + tiêu chuẩn, 1 công nhân."""
+    product = Product(item_code="SP-1")
+    machine = Machine(machine_name="MAY-1", total_lines=4)
+    employee = Employee(full_name="NV 1", email="nv1@test.local")
+    baskets = [Basket(basket_code=f"R{i}", tare_weight=1) for i in range(3)]
+    db.add_all([product, machine, employee, *baskets])
+    db.flush()
+    standard = Standard(product_id=product.product_id, width_mm="25", thickness_mm="1", breaking_strength_dan="100",
+                        elongation_at_load_percent="10", weft_density="10", weight_gm="20")
+    db.add(standard)
+    db.commit()
+    return {
+        "product_id": product.product_id,
+        "standard_id": standard.standard_id,
+        "machine_id": machine.machine_id,
+        "employee_id": employee.employee_id,
+        "basket_ids": [b.basket_id for b in baskets],
+    }
+
+
+def _open_ticket(db, loom, code, line, basket_index=0):
+    return weaving_basket_ticket_service.create_ticket(db, WeavingTicketCreate(
+        code=code, product_id=loom["product_id"], standard_id=loom["standard_id"],
+        machine_id=loom["machine_id"], machine_line=line, yarn_load_date=date(2026, 1, 1),
+        basket_id=loom["basket_ids"][basket_index], employee_in_id=loom["employee_id"],
+    ))
+
+
+def _occupied(db):
+    return {
+        (r.machine_line, r.ticket_id)
+        for r in db.query(MachineLineOccupancy.machine_line, MachineLineOccupancy.ticket_id)
+    }
+
+
+def test_second_open_ticket_on_line_is_rejected(db, loom):
+    first = _open_ticket(db, loom, "T1", line=1)
+    assert _occupied(db) == {(1, first.id)}
+
+    with pytest.raises(HTTPException) as exc:
+        _open_ticket(db, loom, "T2", line=1, basket_index=1)
+    assert exc.value.status_code == 400
+
+    # Line khác vẫn mở được
+    other = _open_ticket(db, loom, "T3", line=2, basket_index=1)
+    assert _occupied(db) == {(1, first.id), (2, other.id)}
+
+
+def test_unique_constraint_rejects_race(db, loom, monkeypatch):
+    """Bỏ qua bước kiểm tra trước (2 request chạy đua) -> unique (máy, line) chặn, phiếu thứ 2 không được ghi."""
+    first = _open_ticket(db, loom, "T1", line=1)
+    monkeypatch.setattr(machine_line_occupancy_service, "get_busy_lines", lambda db, machine_lines: set())
+
+    with pytest.raises(HTTPException) as exc:
+        _open_ticket(db, loom, "T2", line=1, basket_index=1)
+    assert exc.value.status_code == 400
+    assert [t.code for t in db.query(WeavingBasketTicket)] == ["T1"]
+    assert _occupied(db) == {(1, first.id)}
+
+
+def test_closing_or_deleting_ticket_releases_line(db, loom):
+    first = _open_ticket(db, loom, "T1", line=1)
+    weaving_basket_ticket_service.update_ticket(db, first.id, WeavingTicketUpdate(employee_out_id=loom["employee_id"]))
+    assert _occupied(db) == set()
+
+    second = _open_ticket(db, loom, "T2", line=1, basket_index=1)
+    # Chuyển line -> line cũ được trả
+    weaving_basket_ticket_service.update_ticket(db, second.id, WeavingTicketUpdate(machine_line=3))
+    assert _occupied(db) == {(3, second.id)}
+
+    weaving_basket_ticket_service.delete_ticket(db, second.id)
+    assert _occupied(db) == set()
+
+
+def test_export_rejects_busy_line(db, loom, material_warehouse):
+    material_id, warehouse_id = material_warehouse
+    batch = Batch(internal_batch_code="L1", supplier_batch_no="S1", material_id=material_id)
+    db.add(batch)
+    db.commit()
+    _open_ticket(db, loom, "T1", line=1)
+
+    def line(line_no, basket_index):
+        return MaterialExportDetailCreate(
+            material_id=material_id, batch_id=batch.batch_id, quantity=1, product_id=loom["product_id"],
+            machine_id=loom["machine_id"], machine_line=line_no, basket_id=loom["basket_ids"][basket_index],
+        )
+
+    exports = MaterialExportService(db)
+    # Line đang có phiếu; 2 dòng cùng line trong 1 phiếu xuất (dòng sau thấy line đã bị dòng trước giữ)
+    for details in ([line(1, 1)], [line(2, 1), line(2, 2)]):
+        with pytest.raises(HTTPException) as exc:
+            exports.create_export(MaterialExportCreate(
+                export_code="AUTO", export_date=date(2026, 1, 2), warehouse_id=warehouse_id,
+                receiver_id=loom["employee_id"], details=details,
+            ))
+        assert exc.value.status_code == 400
+    assert {line_no for line_no, _ in _occupied(db)} == {1}
+
+
+def test_floor_map_lists_every_line(db, loom):
+    ticket = _open_ticket(db, loom, "T1", line=2)
+
+    (machine,) = machine_line_occupancy_service.get_floor_map(db)
+
+    assert machine["busy_lines"] == 1
+    assert [(l["machine_line"], l["busy"]) for l in machine["lines"]] == [(1, False), (2, True), (3, False), (4, False)]
+    assert machine["lines"][1]["ticket_code"] == ticket.code
\ No newline at end of file
@@ -0,0 +1,204 @@
+# =================================================================
+# CHỐNG XUẤT ÂM KHI NHIỀU PHIẾU XUẤT CÙNG TRỪ 1 LÔ
+# - SQLite (mặc định): dựng đúng thứ tự chạy đua - phiếu A đã đọc & kiểm tra tồn, phiếu B trừ và commit,
+#   rồi A mới UPDATE. UPDATE có điều kiện của post_movements phải chặn A; đối chứng: cách cũ
+#   (đọc - so sánh - ghi, UPDATE không điều kiện) trong cùng kịch bản bị xuất âm.
+# - MySQL (TEST_DATABASE_URL): stress test nhiều luồng, khóa dòng tồn bằng SELECT ... FOR UPDATE.
+#   SQLite ghi tuần tự từ lệnh INSERT đầu tiên của phiếu xuất nên stress test không chứng minh được gì -> bỏ qua.
+# Chạy với `pytest -s` để xem throughput.
+# =================================================================
+import threading
+import time
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event, func, update
+
+from app.db.session import engine, SessionLocal
+from app.models.batch import Batch
+from app.models.employee import Employee
+from app.models.inventory import InventoryStock
+from app.models.inventory_transaction import InventoryTransactionType
+from app.models.material_export import MaterialExport
+from app.schemas.inventory_schema import InventoryMovement
+from app.schemas.material_export_schema import MaterialExportCreate, MaterialExportDetailCreate
+from app.schemas.material_receipt_schema import MaterialReceiptCreate, MaterialReceiptDetailCreate
+from app.services.inventory_service import InventoryService
+from app.services.material_export_service import MaterialExportService
+from app.services.material_receipt_service import MaterialReceiptService
+
+THREADS = 8
+EXPORTS_PER_THREAD = 10
+INITIAL_QTY = 100.0
+EXPORT_QTY = 3.0
+RACE_QTY = 60.0
+
+
+def _receive_batch(db, material_id, warehouse_id) -> int:
+    receipt = MaterialReceiptService(db).create(MaterialReceiptCreate(
+        receipt_number="PN-STRESS",
+        receipt_date=date(2026, 1, 1),
+        warehouse_id=warehouse_id,
+        details=[MaterialReceiptDetailCreate(material_id=material_id, received_quantity_kg=INITIAL_QTY, supplier_batch_no="S-STRESS")],
+    ))
+    return db.query(Batch.batch_id).filter(Batch.receipt_detail_id == receipt.details[0].detail_id).scalar()
+
+
+def _on_hand(batch_id) -> float:
+    check = SessionLocal()
+    try:
+        return check.query(InventoryStock.quantity_on_hand).filter(InventoryStock.batch_id == batch_id).scalar()
+    finally:
+        check.close()
+
+
+def _export_movement(material_id, warehouse_id, batch_id) -> InventoryMovement:
+    return InventoryMovement(
+        material_id=material_id, warehouse_id=warehouse_id, batch_id=batch_id,
+        quantity_delta=-RACE_QTY, transaction_type=InventoryTransactionType.EXPORT
+    )
+
+
+def _race(material_id, warehouse_id, batch_id, export_a):
+    """
+    Chạy export_a(session) nhưng chen phiếu B (trừ RACE_QTY + commit) vào ngay trước lệnh UPDATE tồn đầu tiên của A,
+    tức là sau khi A đã đọc & kiểm tra tồn. Trả về lỗi của A (None nếu A thành công).
+    """
+    armed = {"on": True}
+
+    def _before_update(conn, cursor, statement, parameters, context, executemany):
+        if armed["on"] and statement.lstrip().upper().startswith("UPDATE INVENTORY_STOCKS"):
+            armed["on"] = False
+            other = SessionLocal()
+            try:
+                InventoryService(other).post_movements([_export_movement(material_id, warehouse_id, batch_id)], allow_negative=False)
+                other.commit()
+            finally:
+                other.close()
+
+    session = SessionLocal()
+    event.listen(engine, "before_cursor_execute", _before_update)
+    try:
+        export_a(session)
+        session.commit()
+        return None
+    except HTTPException as e:
+        session.rollback()
+        return e
+    finally:
+        event.remove(engine, "before_cursor_execute", _before_update)
+        session.close()
+
+
+sqlite_only = pytest.mark.skipif(engine.dialect.name != "sqlite", reason="Dựng thứ tự chạy đua trong 1 luồng (MySQL: FOR UPDATE sẽ chờ nhau)")
+
+
+@sqlite_only
+def test_conditional_update_blocks_stale_check(db, material_warehouse):
+    material_id, warehouse_id = material_warehouse
+    batch_id = _receive_batch(db, material_id, warehouse_id)
+    db.close()
+
+    error = _race(material_id, warehouse_id, batch_id, lambda session: InventoryService(session).post_movements(
+        [_export_movement(material_id, warehouse_id, batch_id)], allow_negative=False
+    ))
+
+    # A đọc thấy 100 >= 60 nhưng khi UPDATE tồn chỉ còn 40 -> bị chặn, chỉ phiếu B được ghi
+    assert error is not None and error.status_code == 400
+    assert _on_hand(batch_id) == pytest.approx(INITIAL_QTY - RACE_QTY)
+
+
+@sqlite_only
+def test_unguarded_read_check_write_oversells(db, material_warehouse):
+    """Đối chứng: cách trừ tồn cũ (đọc - so sánh - UPDATE không điều kiện) trong cùng kịch bản bị xuất âm."""
+    material_id, warehouse_id = material_warehouse
+    batch_id = _receive_batch(db, material_id, warehouse_id)
+    db.close()
+
+    def legacy_export(session):
+        stock = session.query(InventoryStock).filter(InventoryStock.batch_id == batch_id).with_for_update().one()
+        if stock.quantity_on_hand < RACE_QTY:
+            raise HTTPException(status_code=400, detail="Không đủ tồn kho")
+        session.execute(
+            update(InventoryStock.__table__).where(InventoryStock.__table__.c.id == stock.id)
+            .values(quantity_on_hand=InventoryStock.__table__.c.quantity_on_hand - RACE_QTY)
+        )
+
+    error = _race(material_id, warehouse_id, batch_id, legacy_export)
+
+    assert error is None
+    assert _on_hand(batch_id) == pytest.approx(INITIAL_QTY - 2 * RACE_QTY)   # -20: xuất âm
+
+
+@pytest.mark.skipif(engine.dialect.name != "mysql", reason="Cần TEST_DATABASE_URL trỏ tới MySQL (khóa dòng FOR UPDATE)")
+def test_concurrent_exports_never_oversell(db, material_warehouse):
+    material_id, warehouse_id = material_warehouse
+    batch_id = _receive_batch(db, material_id, warehouse_id)
+    receiver = Employee(full_name="NV 1", email="nv1@test.local")
+    db.add(receiver)
+    db.commit()
+    receiver_id = receiver.employee_id
+    db.close()
+
+    results = {"ok": 0, "rejected": 0}
+    errors = []
+    lock = threading.Lock()
+    start_gate = threading.Barrier(THREADS)
+
+    def worker():
+        start_gate.wait()
+        for _ in range(EXPORTS_PER_THREAD):
+            session = SessionLocal()
+            try:
+                MaterialExportService(session).create_export(MaterialExportCreate(
+                    export_code="AUTO",
+                    export_date=date(2026, 1, 2),
+                    warehouse_id=warehouse_id,
+                    receiver_id=receiver_id,
+                    details=[MaterialExportDetailCreate(material_id=material_id, batch_id=batch_id, quantity=EXPORT_QTY)],
+                ))
+                with lock:
+                    results["ok"] += 1
+            except HTTPException as e:
+                session.rollback()
+                with lock:
+                    if e.status_code == 400:
+                        results["rejected"] += 1
+                    else:
+                        errors.append(e.detail)
+            except Exception as e:
+                session.rollback()
+                with lock:
+                    errors.append(repr(e))
+            finally:
+                session.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    attempts = THREADS * EXPORTS_PER_THREAD
+    print(f"\n[{engine.dialect.name}] {attempts} phiếu xuất / {THREADS} luồng trong {elapsed:.2f}s "
+          f"-> {attempts / elapsed:.1f} phiếu/s (thành công {results['ok']}, từ chối {results['rejected']})")
+
+    assert not errors, errors
+    assert results["ok"] + results["rejected"] == attempts
+
+    check = SessionLocal()
+    try:
+        on_hand = check.query(InventoryStock.quantity_on_hand).filter(InventoryStock.batch_id == batch_id).scalar()
+        export_count = check.query(func.count(MaterialExport.id)).scalar()
+    finally:
+        check.close()
+
+    # Không xuất âm và không "mất" phiếu: tồn cuối = tồn đầu - tổng các phiếu thành công
+    assert on_hand >= 0
+    assert results["ok"] == export_count
+    assert on_hand == pytest.approx(INITIAL_QTY - results["ok"] * EXPORT_QTY)
+    # Cầu vượt cung -> phải xuất hết phần xuất được rồi mới từ chối
+    assert results["ok"] == int(INITIAL_QTY // EXPORT_QTY)
\ No newline at end of file
@@ -0,0 +1,134 @@
+# =================================================================
+# NHẬP PACKING LIST: kiểm tra cả file trước, lỗi 1 dòng / lỗi giữa chừng -> không ghi dòng nào
+# =================================================================
+import io
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+from openpyxl import Workbook
+from sqlalchemy.orm import Query
+
+from app.models.batch import Batch
+from app.models.inventory import InventoryStock
+from app.models.inventory_transaction import InventoryTransaction
+from app.models.material_receipt import MaterialReceiptDetail
+from app.models.purchase_order import PurchaseOrderDetail, PurchaseOrderHeader
+from app.models.supplier import Supplier
+from app.schemas.material_receipt_schema import MaterialReceiptCreate
+from app.services.material_receipt_service import MaterialReceiptService
+
+
+@pytest.fixture
+def receipt(db, material_warehouse):
+    """Phiếu nhập rỗng gắn PO 1000 kg cho vật tư M-TEST."""
+    material_id, warehouse_id = material_warehouse
+    supplier = Supplier(supplier_name="NCC Test", short_name="NCC", email="ncc@test.local")
+    db.add(supplier)
+    db.flush()
+    po = PurchaseOrderHeader(po_number="PO1", vendor_id=supplier.supplier_id, exchange_rate=1, order_date=date(2026, 1, 1))
+    db.add(po)
+    db.flush()
+    db.add(PurchaseOrderDetail(po_id=po.po_id, material_id=material_id, quantity=1000, unit_price=3, line_total=3000))
+    db.commit()
+    return MaterialReceiptService(db).create(MaterialReceiptCreate(
+        receipt_number="AUTO", receipt_date=date(2026, 1, 2), warehouse_id=warehouse_id, po_header_id=po.po_id
+    ))
+
+
+def _written(db):
+    return (
+        db.query(MaterialReceiptDetail).count(),
+        db.query(Batch).count(),
+        db.query(InventoryStock).count(),
+        db.query(InventoryTransaction).count(),
+        db.query(PurchaseOrderDetail.received_quantity).scalar() or 0,
+    )
+
+
+def test_invalid_rows_reject_the_whole_file(db, receipt):
+    service = MaterialReceiptService(db)
+    content = (
+        "material_code,supplier_batch_no,received_quantity_kg,expiry_date,location\n"
+        "M-TEST,L1,100,2027-01-01,A1\n"
+        "M-TEST,L1,5,,\n"                      # trùng lô NCC với dòng 2
+        "KHONG-CO,L2,abc,31/02/2026,\n"        # sai vật tư, số lượng, ngày
+        "M-TEST,L3,40,,\n"
+    ).encode()
+
+    report = service.import_packing_list(receipt.receipt_id, "packing.csv", content, dry_run=True)
+    assert report["valid_rows"] == 2
+    assert {(e["row"], e["column"]) for e in report["errors"]} == {
+        (3, "supplier_batch_no"), (4, "material_code"), (4, "received_quantity_kg"), (4, "expiry_date")
+    }
+    assert _written(db) == (0, 0, 0, 0, 0)
+
+    with pytest.raises(HTTPException) as exc:
+        service.import_packing_list(receipt.receipt_id, "packing.csv", content)
+    assert exc.value.status_code == 400
+    assert len(exc.value.detail["errors"]) == 4
+    assert _written(db) == (0, 0, 0, 0, 0)
+
+
+def test_failure_during_write_rolls_everything_back(db, receipt, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("mất kết nối")
+
+    # Bước cuối cùng (sau khi đã insert chi tiết, lô, tồn kho, sổ cái) bị lỗi
+    monkeypatch.setattr(MaterialReceiptService, "_refresh_po", fail)
+    content = "material_code,supplier_batch_no,received_quantity_kg\nM-TEST,L1,100\nM-TEST,L2,50\n".encode()
+
+    with pytest.raises(HTTPException) as exc:
+        MaterialReceiptService(db).import_packing_list(receipt.receipt_id, "packing.csv", content)
+    assert exc.value.status_code == 500
+    assert _written(db) == (0, 0, 0, 0, 0)
+
+
+def test_valid_xlsx_imports_every_row_in_one_go(db, receipt):
+    workbook = Workbook()
+    sheet = workbook.active
+    # Tiêu đề tiếng Việt giống file xuất phiếu nhập
+    sheet.append(["Mã vật tư", "Lô NCC", "SL thực nhập (kg)", "Số cuộn", "Hạn dùng", "Vị trí"])
+    for i in range(30):
+        sheet.append(["M-TEST", f"L{i:03d}", 10.0, 4, date(2027, 1, 1 + i % 28), f"B{i % 9}"])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+
+    result = MaterialReceiptService(db).import_packing_list(receipt.receipt_id, "packing.xlsx", buffer.getvalue())
+
+    assert result["imported_rows"] == 30
+    assert _written(db) == (30, 30, 30, 30, pytest.approx(300))
+    assert len({code for (code,) in db.query(Batch.internal_batch_code)}) == 30
+    batch = db.query(Batch).filter(Batch.supplier_batch_no == "L001").one()
+    assert (batch.expiry_date, batch.location) == (date(2027, 1, 2), "B1")
+
+
+def test_receipt_is_locked_only_right_before_a_real_write(db, receipt, monkeypatch):
+    calls = []
+    with_for_update = Query.with_for_update
+    validate = MaterialReceiptService._validate_packing_list
+
+    def spy_lock(query, *args, **kwargs):
+        calls.append("lock")
+        return with_for_update(query, *args, **kwargs)
+
+    def spy_validate(service, records):
+        calls.append("validate")
+        return validate(service, records)
+
+    monkeypatch.setattr(Query, "with_for_update", spy_lock)
+    monkeypatch.setattr(MaterialReceiptService, "_validate_packing_list", spy_validate)
+    service = MaterialReceiptService(db)
+    valid = "material_code,supplier_batch_no,received_quantity_kg\nM-TEST,L1,100\n".encode()
+    invalid = "material_code,supplier_batch_no,received_quantity_kg\nKHONG-CO,L1,100\n".encode()
+
+    # dry-run và file lỗi: đọc & kiểm tra xong là trả về, không khóa phiếu
+    service.import_packing_list(receipt.receipt_id, "packing.csv", valid, dry_run=True)
+    with pytest.raises(HTTPException):
+        service.import_packing_list(receipt.receipt_id, "packing.csv", invalid)
+    assert calls == ["validate", "validate"]
+
+    calls.clear()
+    service.import_packing_list(receipt.receipt_id, "packing.csv", valid)
+    assert calls[:2] == ["validate", "lock"]       # khóa phiếu sau khi kiểm tra xong, trước khi ghi
+    assert _written(db) == (1, 1, 1, 1, pytest.approx(100))
\ No newline at end of file
@@ -0,0 +1,128 @@
+# =================================================================
+# ĐỐI CHIẾU 3 BÊN PO - TỜ KHAI - PHIẾU NHẬP
+# =================================================================
+from datetime import date
+
+import pytest
+
+from app.models.material import Material
+from app.models.purchase_order import POStatus, PurchaseOrderDetail, PurchaseOrderHeader
+from app.models.purchase_order_match import MatchStatus, PurchaseOrderMatch
+from app.models.supplier import Supplier
+from app.schemas.import_declaration_schema import ImportDeclarationCreate, ImportDetailCreate, ImportType
+from app.schemas.material_receipt_schema import MaterialReceiptCreate, MaterialReceiptDetailCreate
+from app.schemas.purchase_order_schema import POHeaderUpdate
+from app.services.import_declaration_service import ImportDeclarationService
+from app.services.material_receipt_service import MaterialReceiptService
+from app.services.purchase_order_match_service import PurchaseOrderMatchService
+from app.services.purchase_order_service import PurchaseOrderService
+
+
+@pytest.fixture
+def purchase_order(db, material_warehouse):
+    """PO đã gửi NCC: M-TEST 500 kg + M-2 200 kg; thêm vật tư M-3 không có trên PO."""
+    material_id, warehouse_id = material_warehouse
+    unit_id = db.get(Material, material_id).uom_base_id
+    second = Material(material_code="M-2", uom_base_id=unit_id, uom_production_id=unit_id)
+    third = Material(material_code="M-3", uom_base_id=unit_id, uom_production_id=unit_id)
+    supplier = Supplier(supplier_name="NCC Test", short_name="NCC", email="ncc@test.local")
+    db.add_all([second, third, supplier])
+    db.flush()
+    po = PurchaseOrderHeader(po_number="PO1", vendor_id=supplier.supplier_id, exchange_rate=1,
+                             order_date=date(2026, 1, 1), status=POStatus.SENT)
+    db.add(po)
+    db.flush()
+    line = PurchaseOrderDetail(po_id=po.po_id, material_id=material_id, quantity=500, unit_price=3, line_total=1500)
+    db.add_all([line, PurchaseOrderDetail(po_id=po.po_id, material_id=second.id, quantity=200, unit_price=3, line_total=600)])
+    db.commit()
+    return (material_id, second.id, third.id), warehouse_id, po.po_id, line.detail_id
+
+
+def _matches(db, po_id):
+    rows = db.query(PurchaseOrderMatch).populate_existing().filter(PurchaseOrderMatch.po_id == po_id)
+    return {
+        r.material_id: (r.ordered_quantity, r.declared_quantity, r.received_quantity, r.status)
+        for r in rows
+    }
+
+
+def _receive(db, warehouse_id, po_id, declaration_id, lines):
+    return MaterialReceiptService(db).create(MaterialReceiptCreate(
+        receipt_number="AUTO", receipt_date=date(2026, 1, 2), warehouse_id=warehouse_id,
+        po_header_id=po_id, declaration_id=declaration_id,
+        details=[MaterialReceiptDetailCreate(material_id=m, received_quantity_kg=q) for m, q in lines],
+    ))
+
+
+@pytest.mark.parametrize("ordered, declared, received, expected", [
+    (500, 500, 500, MatchStatus.MATCHED),
+    (500, 300, 100, MatchStatus.PENDING),
+    (500, 0, 0, MatchStatus.PENDING),
+    (500, 600, 0, MatchStatus.OVER_DECLARED),
+    (500, 300, 400, MatchStatus.OVER_RECEIVED),
+    (0, 100, 0, MatchStatus.NOT_ON_PO),
+    (0, 0, 50, MatchStatus.NOT_ON_PO),
+])
+def test_status_rule(ordered, declared, received, expected):
+    assert PurchaseOrderMatchService._status_for(ordered, declared, received) == expected
+
+
+def test_match_lines_follow_documents(db, purchase_order):
+    (m1, m2, m3), warehouse_id, po_id, m1_line = purchase_order
+
+    # PO chưa có tờ khai (mua trong nước) -> không đối chiếu
+    _receive(db, warehouse_id, po_id, None, [(m1, 100)])
+    assert _matches(db, po_id) == {}
+
+    declaration = ImportDeclarationService(db).create(ImportDeclarationCreate(
+        declaration_no="TK-1", declaration_date=date(2026, 1, 2), type_of_import=ImportType.E31,
+        details=[ImportDetailCreate(material_id=m1, quantity=500, unit_price=3, po_detail_id=m1_line)],
+    ))
+    assert _matches(db, po_id) == {
+        m1: (500, 500, 100, MatchStatus.PENDING),
+        m2: (200, 0, 0, MatchStatus.PENDING),
+    }
+
+    # Dòng tờ khai không ghi po_detail_id: tính cho PO duy nhất của các phiếu nhập dùng tờ khai
+    ImportDeclarationService(db).add_detail(
+        declaration.id, ImportDetailCreate(material_id=m2, quantity=250, unit_price=3)
+    )
+    assert _matches(db, po_id)[m2] == (200, 0, 0, MatchStatus.PENDING)
+    _receive(db, warehouse_id, po_id, declaration.id, [(m1, 400), (m3, 10)])
+    assert _matches(db, po_id) == {
+        m1: (500, 500, 500, MatchStatus.MATCHED),
+        m2: (200, 250, 0, MatchStatus.OVER_DECLARED),
+        m3: (0, 0, 10, MatchStatus.NOT_ON_PO),
+    }
+
+    _receive(db, warehouse_id, po_id, declaration.id, [(m1, 20)])
+    assert _matches(db, po_id)[m1] == (500, 500, 520, MatchStatus.OVER_RECEIVED)
+
+    summary = PurchaseOrderMatchService(db).get_summary()
+    assert (summary["total_lines"], summary["mismatch_lines"], summary["mismatch_purchase_orders"]) == (3, 3, 1)
+
+    # Hủy PO -> bỏ khỏi bảng đối chiếu; mở lại -> tính lại
+    po_service = PurchaseOrderService(db)
+    po_service.update(po_service.get(po_id), POHeaderUpdate(status=POStatus.CANCELLED))
+    assert _matches(db, po_id) == {}
+    po_service.update(po_service.get(po_id), POHeaderUpdate(status=POStatus.PARTIAL))
+    assert len(_matches(db, po_id)) == 3
+
+
+def test_rebuild_matches_incremental_refresh(db, purchase_order):
+    (m1, m2, _), warehouse_id, po_id, m1_line = purchase_order
+    declaration = ImportDeclarationService(db).create(ImportDeclarationCreate(
+        declaration_no="TK-1", declaration_date=date(2026, 1, 2), type_of_import=ImportType.E31,
+        details=[ImportDetailCreate(material_id=m1, quantity=450, unit_price=3, po_detail_id=m1_line)],
+    ))
+    _receive(db, warehouse_id, po_id, declaration.id, [(m1, 300), (m2, 50)])
+    incremental = _matches(db, po_id)
+
+    db.query(PurchaseOrderMatch).delete()
+    db.commit()
+    result = PurchaseOrderMatchService(db).rebuild(batch_size=1)
+
+    assert result["inserted"] == len(incremental) == 2
+    assert _matches(db, po_id) == incremental
+    again = PurchaseOrderMatchService(db).rebuild()
+    assert (again["inserted"], again["updated"], again["deleted"]) == (0, 0, 0)
\ No newline at end of file
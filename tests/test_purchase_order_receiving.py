@@ -0,0 +1,124 @@
+# =================================================================
+# PO: SL đã nhận + trạng thái được tính lại theo tập từ phiếu nhập
+# =================================================================
+from datetime import date
+
+import pytest
+from sqlalchemy import update
+
+from app.models.material import Material
+from app.models.purchase_order import POStatus, PurchaseOrderDetail, PurchaseOrderHeader
+from app.models.supplier import Supplier
+from app.schemas.material_receipt_schema import (
+    MaterialReceiptCreate,
+    MaterialReceiptDetailCreate,
+    MaterialReceiptDetailUpdate,
+    MaterialReceiptUpdate,
+)
+from app.services.material_receipt_service import MaterialReceiptService
+from app.services.purchase_order_receiving_service import PurchaseOrderReceivingService
+
+
+@pytest.fixture
+def purchase_orders(db, material_warehouse):
+    """2 PO đã gửi NCC, mỗi PO: M-TEST 500 kg + M-2 200 kg."""
+    material_id, warehouse_id = material_warehouse
+    unit_id = db.get(Material, material_id).uom_base_id
+    second = Material(material_code="M-2", uom_base_id=unit_id, uom_production_id=unit_id)
+    supplier = Supplier(supplier_name="NCC Test", short_name="NCC", email="ncc@test.local")
+    db.add_all([second, supplier])
+    db.flush()
+    po_ids = []
+    for number in ("PO1", "PO2"):
+        po = PurchaseOrderHeader(po_number=number, vendor_id=supplier.supplier_id, exchange_rate=1,
+                                 order_date=date(2026, 1, 1), status=POStatus.SENT)
+        db.add(po)
+        db.flush()
+        db.add_all([
+            PurchaseOrderDetail(po_id=po.po_id, material_id=material_id, quantity=500, unit_price=3, line_total=1500),
+            PurchaseOrderDetail(po_id=po.po_id, material_id=second.id, quantity=200, unit_price=3, line_total=600),
+        ])
+        po_ids.append(po.po_id)
+    db.commit()
+    return (material_id, second.id), warehouse_id, po_ids
+
+
+def _state(db, po_id):
+    po = db.query(PurchaseOrderHeader).populate_existing().filter(PurchaseOrderHeader.po_id == po_id).one()
+    received = [
+        q for (q,) in db.query(PurchaseOrderDetail.received_quantity)
+        .filter(PurchaseOrderDetail.po_id == po_id).order_by(PurchaseOrderDetail.detail_id)
+    ]
+    return po.status, received
+
+
+@pytest.mark.parametrize("current, lines, expected", [
+    (POStatus.DRAFT, [(500, 0), (200, 0)], POStatus.DRAFT),
+    (POStatus.SENT, [(500, 0), (200, 0)], POStatus.CONFIRMED),
+    (POStatus.SENT, [(500, 100), (200, 0)], POStatus.PARTIAL),
+    (POStatus.PARTIAL, [(500, 500), (200, 200)], POStatus.COMPLETED),
+    (POStatus.COMPLETED, [(500, 500), (200, 150)], POStatus.PARTIAL),
+])
+def test_status_rule(current, lines, expected):
+    assert PurchaseOrderReceivingService._status_for(current, lines) == expected
+
+
+def test_receipt_changes_recompute_received_and_status(db, purchase_orders):
+    (m1, m2), warehouse_id, (po1, po2) = purchase_orders
+    receipts = MaterialReceiptService(db)
+
+    first = receipts.create(MaterialReceiptCreate(
+        receipt_number="AUTO", receipt_date=date(2026, 1, 2), warehouse_id=warehouse_id, po_header_id=po1,
+        details=[MaterialReceiptDetailCreate(material_id=m1, received_quantity_kg=100) for _ in range(4)],
+    ))
+    assert _state(db, po1) == (POStatus.PARTIAL, [400, 0])
+
+    receipts.add_detail(first.receipt_id, MaterialReceiptDetailCreate(material_id=m2, received_quantity_kg=200))
+    receipts.create(MaterialReceiptCreate(
+        receipt_number="AUTO", receipt_date=date(2026, 1, 3), warehouse_id=warehouse_id, po_header_id=po1,
+        details=[MaterialReceiptDetailCreate(material_id=m1, received_quantity_kg=100)],
+    ))
+    assert _state(db, po1) == (POStatus.COMPLETED, [500, 200])
+
+    receipts.update_detail(first.details[0].detail_id, MaterialReceiptDetailUpdate(received_quantity_kg=95))
+    assert _state(db, po1) == (POStatus.PARTIAL, [495, 200])
+
+    # Đổi PO của phiếu -> tính lại cả PO cũ và PO mới
+    receipts.update(first.receipt_id, MaterialReceiptUpdate(po_header_id=po2))
+    assert _state(db, po1) == (POStatus.PARTIAL, [100, 0])
+    assert _state(db, po2) == (POStatus.PARTIAL, [395, 200])
+
+    receipts.delete(first.receipt_id)
+    assert _state(db, po2) == (POStatus.CONFIRMED, [0, 0])
+
+
+def test_cancelled_po_keeps_status(db, purchase_orders):
+    (m1, _), warehouse_id, (po1, _) = purchase_orders
+    db.execute(update(PurchaseOrderHeader).where(PurchaseOrderHeader.po_id == po1).values(status=POStatus.CANCELLED))
+    db.commit()
+
+    MaterialReceiptService(db).create(MaterialReceiptCreate(
+        receipt_number="AUTO", receipt_date=date(2026, 1, 2), warehouse_id=warehouse_id, po_header_id=po1,
+        details=[MaterialReceiptDetailCreate(material_id=m1, received_quantity_kg=500)],
+    ))
+    assert _state(db, po1) == (POStatus.CANCELLED, [500, 0])
+
+
+def test_reconcile_repairs_drift(db, purchase_orders):
+    (m1, _), warehouse_id, (po1, po2) = purchase_orders
+    MaterialReceiptService(db).create(MaterialReceiptCreate(
+        receipt_number="AUTO", receipt_date=date(2026, 1, 2), warehouse_id=warehouse_id, po_header_id=po1,
+        details=[MaterialReceiptDetailCreate(material_id=m1, received_quantity_kg=120)],
+    ))
+    db.execute(update(PurchaseOrderDetail).values(received_quantity=999))
+    db.execute(update(PurchaseOrderHeader).values(status=POStatus.DRAFT))
+    db.commit()
+
+    result = PurchaseOrderReceivingService(db).reconcile(batch_size=1)
+
+    assert result["po_checked"] == 2
+    assert _state(db, po1) == (POStatus.PARTIAL, [120, 0])
+    assert _state(db, po2) == (POStatus.DRAFT, [0, 0])
+    # Chạy lại không còn gì để sửa
+    again = PurchaseOrderReceivingService(db).reconcile()
+    assert (again["lines_updated"], again["status_updated"]) == (0, 0)
\ No newline at end of file
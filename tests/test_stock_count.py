@@ -0,0 +1,100 @@
+# =================================================================
+# KIỂM KÊ: ghi sổ chênh lệch đúng theo số đếm, đóng phiên, chặn xóa phiếu nhập của lô đang kiểm kê
+# =================================================================
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.batch import Batch
+from app.models.inventory import InventoryStock
+from app.models.inventory_transaction import InventoryTransaction, InventoryTransactionType
+from app.schemas.material_receipt_schema import MaterialReceiptCreate, MaterialReceiptDetailCreate
+from app.schemas.stock_count_schema import StockCountCreate, StockCountEntry, StockCountSubmit
+from app.services.material_receipt_service import MaterialReceiptService
+from app.services.stock_count_service import StockCountService
+
+
+@pytest.fixture
+def counted_warehouse(db, material_warehouse):
+    """3 lô trong kho (100 / 50 / 30 kg) và 1 phiên kiểm kê mở cho toàn kho."""
+    material_id, warehouse_id = material_warehouse
+    receipt = MaterialReceiptService(db).create(MaterialReceiptCreate(
+        receipt_number="AUTO", receipt_date=date(2026, 1, 2), warehouse_id=warehouse_id,
+        details=[MaterialReceiptDetailCreate(material_id=material_id, received_quantity_kg=q) for q in (100, 50, 30)],
+    ))
+    batches = db.query(Batch).order_by(Batch.batch_id).all()
+    session = StockCountService(db).create(StockCountCreate(warehouse_id=warehouse_id))
+    return material_id, warehouse_id, receipt, batches, session
+
+
+def _on_hand(db):
+    return {s.batch_id: s.quantity_on_hand for s in db.query(InventoryStock).populate_existing()}
+
+
+def _posted_variances(db, session_id):
+    return {
+        t.batch_id: t.quantity_delta
+        for t in db.query(InventoryTransaction).filter(
+            InventoryTransaction.reference_type == "StockCount",
+            InventoryTransaction.reference_id == session_id,
+        )
+        if t.transaction_type == InventoryTransactionType.ADJUSTMENT
+    }
+
+
+def test_post_records_counted_variances_only(db, counted_warehouse):
+    material_id, _, _, batches, session = counted_warehouse
+    found = Batch(internal_batch_code="X-PHAT-SINH", supplier_batch_no="S", material_id=material_id)
+    db.add(found)
+    db.commit()
+    service = StockCountService(db)
+
+    result = service.submit_counts(session.id, StockCountSubmit(entries=[
+        StockCountEntry(batch_code=batches[0].internal_batch_code, counted_quantity=60),
+        StockCountEntry(batch_code=batches[0].internal_batch_code, counted_quantity=35),   # cùng lượt -> cộng: 95
+        StockCountEntry(batch_id=batches[1].batch_id, counted_quantity=50),
+        StockCountEntry(batch_code="KHONG-CO", counted_quantity=1),
+        StockCountEntry(batch_code="X-PHAT-SINH", counted_quantity=7),
+    ]))
+    assert result["unknown_batches"] == ["KHONG-CO"]
+    assert result["inserted"] == 1
+    # Lượt đếm thứ 2 cộng dồn vào lô 2
+    service.submit_counts(session.id, StockCountSubmit(
+        entries=[StockCountEntry(batch_id=batches[1].batch_id, counted_quantity=5)], accumulate=True
+    ))
+
+    posted = service.post(session.id)
+
+    # Lô 1: 95 - 100; lô 2: 50 + 5 - 50; lô 3 chưa đếm -> giữ nguyên
+    assert _posted_variances(db, session.id) == {batches[0].batch_id: -5, batches[1].batch_id: 5, found.batch_id: 7}
+    assert posted["adjusted_lines"] == 3
+    assert posted["total_variance"] == pytest.approx(7)
+    assert _on_hand(db) == {batches[0].batch_id: 95, batches[1].batch_id: 55, batches[2].batch_id: 30, found.batch_id: 7}
+
+    with pytest.raises(HTTPException) as exc:
+        service.post(session.id)
+    assert exc.value.status_code == 400
+
+
+def test_post_zero_uncounted_writes_off_missing_batches(db, counted_warehouse):
+    _, _, _, batches, session = counted_warehouse
+    service = StockCountService(db)
+    service.submit_counts(session.id, StockCountSubmit(entries=[StockCountEntry(batch_id=batches[0].batch_id, counted_quantity=100)]))
+
+    service.post(session.id, zero_uncounted=True)
+
+    # Lô 1 khớp -> không ghi; lô 2, 3 không đếm được -> về 0
+    assert _posted_variances(db, session.id) == {batches[1].batch_id: -50, batches[2].batch_id: -30}
+    assert _on_hand(db) == {batches[0].batch_id: 100, batches[1].batch_id: 0, batches[2].batch_id: 0}
+
+
+def test_receipt_delete_blocked_while_batch_is_in_a_count_session(db, counted_warehouse):
+    _, _, receipt, _, _ = counted_warehouse
+    receipts = MaterialReceiptService(db)
+
+    for delete in (lambda: receipts.delete(receipt.receipt_id), lambda: receipts.delete_detail(receipt.details[0].detail_id)):
+        with pytest.raises(HTTPException) as exc:
+            delete()
+        assert exc.value.status_code == 400
+        db.rollback()
\ No newline at end of file
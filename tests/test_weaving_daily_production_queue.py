@@ -0,0 +1,132 @@
+# =================================================================
+# HÀNG ĐỢI TÍNH LẠI SẢN LƯỢNG NGÀY: sửa / xóa phiếu rổ chỉ xếp hàng (ngày, sản phẩm),
+# worker gom các cặp trùng rồi tính lại 1 lượt mỗi ngày
+# =================================================================
+from datetime import date, datetime
+
+import pytest
+
+from app.core.config import settings
+from app.models.basket import Basket
+from app.models.employee import Employee
+from app.models.machine import Machine
+from app.models.product import Product
+from app.models.standard import Standard
+from app.models.weaving_daily_production import WeavingDailyProduction
+from app.schemas.weaving_basket_ticket_schema import WeavingTicketCreate, WeavingTicketUpdate
+from app.services import weaving_basket_ticket_service, weaving_daily_production_queue, weaving_daily_production_service
+
+DAY = date(2026, 1, 3)
+
+
+@pytest.fixture
+def loom(db):
+    """1 máy 4 line, 4 rổ (bì 1 kg), 2 sản phẩm + tiêu chuẩn, 1 công nhân."""
+    products = [Product(item_code=f"SP-{i}") for i in range(2)]
+    machine = Machine(machine_name="MAY-1", total_lines=4)
+    employee = Employee(full_name="NV 1", email="nv1@test.local")
+    baskets = [Basket(basket_code=f"R{i}", tare_weight=1) for i in range(4)]
+    db.add_all([*products, machine, employee, *baskets])
+    db.flush()
+    standards = [
+        Standard(product_id=p.product_id, width_mm="25", thickness_mm="1", breaking_strength_dan="100",
+                 elongation_at_load_percent="10", weft_density="10", weight_gm="20")
+        for p in products
+    ]
+    db.add_all(standards)
+    db.commit()
+    return {
+        "product_ids": [p.product_id for p in products],
+        "standard_ids": [s.standard_id for s in standards],
+        "machine_id": machine.machine_id,
+        "employee_id": employee.employee_id,
+        "basket_ids": [b.basket_id for b in baskets],
+    }
+
+
+@pytest.fixture(autouse=True)
+def _empty_queue():
+    weaving_daily_production_queue._pending.clear()
+    yield
+    weaving_daily_production_queue._pending.clear()
+
+
+def _open_and_close(db, loom, line, kg, product_index=0):
+    ticket = weaving_basket_ticket_service.create_ticket(db, WeavingTicketCreate(
+        code=f"T{line}", product_id=loom["product_ids"][product_index], standard_id=loom["standard_ids"][product_index],
+        machine_id=loom["machine_id"], machine_line=line, yarn_load_date=date(2026, 1, 1),
+        basket_id=loom["basket_ids"][line - 1], employee_in_id=loom["employee_id"],
+    ))
+    return weaving_basket_ticket_service.update_ticket(db, ticket.id, WeavingTicketUpdate(
+        time_out=datetime(2026, 1, 3, 14, line), employee_out_id=loom["employee_id"],
+        gross_weight=kg + 1, length_meters=kg * 10
+    ))
+
+
+def _stored(db):
+    db.expire_all()
+    return {r.product_id: r.total_kg for r in db.query(WeavingDailyProduction)}
+
+
+def test_ticket_changes_only_queue_keys_and_flush_merges_them(db, loom, monkeypatch):
+    calls = []
+    calculate = weaving_daily_production_service.calculate_daily_production
+
+    def spy(session, target_date, product_ids=None):
+        calls.append((target_date, set(product_ids)))
+        return calculate(session, target_date, product_ids)
+
+    monkeypatch.setattr(weaving_daily_production_service, "calculate_daily_production", spy)
+    # Giả lập worker đang chạy: request chỉ xếp hàng, không tính lại
+    monkeypatch.setattr(weaving_daily_production_queue, "_worker_alive", lambda: True)
+    product_a, product_b = loom["product_ids"]
+
+    _open_and_close(db, loom, 1, 10)
+    _open_and_close(db, loom, 2, 20)
+    moved = _open_and_close(db, loom, 3, 30)
+    weaving_basket_ticket_service.update_ticket(db, moved.id, WeavingTicketUpdate(
+        product_id=product_b, standard_id=loom["standard_ids"][1]
+    ))
+
+    assert _stored(db) == {}
+    assert dict(weaving_daily_production_queue._pending) == {DAY: {product_a, product_b}}
+
+    assert weaving_daily_production_queue.flush() == 2
+    assert calls == [(DAY, {product_a, product_b})]
+    assert _stored(db) == {product_a: pytest.approx(30), product_b: pytest.approx(30)}
+
+    weaving_basket_ticket_service.delete_ticket(db, moved.id)
+    assert weaving_daily_production_queue.flush() == 1
+    assert _stored(db) == {product_a: pytest.approx(30), product_b: 0}
+    assert weaving_daily_production_service.verify_daily_production(db, DAY, DAY)["mismatches"] == []
+
+
+def test_failed_recalculation_stays_queued(db, loom, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("mất kết nối")
+
+    monkeypatch.setattr(weaving_daily_production_queue, "_worker_alive", lambda: True)
+    _open_and_close(db, loom, 1, 10)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(weaving_daily_production_service, "calculate_daily_production", fail)
+        assert weaving_daily_production_queue.flush() == 0
+    assert dict(weaving_daily_production_queue._pending) == {DAY: {loom["product_ids"][0]}}
+
+    assert weaving_daily_production_queue.flush() == 1
+    assert _stored(db) == {loom["product_ids"][0]: pytest.approx(10)}
+
+
+def test_worker_thread_recalculates_after_debounce(db, loom, monkeypatch):
+    monkeypatch.setattr(settings, "WEAVING_PRODUCTION_DEBOUNCE_SECONDS", 0.05)
+    weaving_daily_production_queue.start()
+    try:
+        assert weaving_daily_production_queue._worker_alive()
+        _open_and_close(db, loom, 1, 10)
+        _open_and_close(db, loom, 2, 20)
+    finally:
+        # Dừng worker: phần còn chờ được tính nốt
+        weaving_daily_production_queue.stop()
+
+    assert not weaving_daily_production_queue._pending
+    assert _stored(db) == {loom["product_ids"][0]: pytest.approx(30)}
\ No newline at end of file